@@ -1,12 +1,11 @@
 import logging
 from datetime import datetime, timedelta
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
 from telegram import Update
 from telegram.ext import CallbackContext, ContextTypes
 
 # Importação corrigida e explícita
-from database.database import get_db, listar_todos_objetivos_ativos, atualizar_valor_objetivo
+from database.database import get_async_db, listar_todos_objetivos_ativos, atualizar_valor_objetivo
 from models import Lancamento, Usuario, Objetivo
 
 logger = logging.getLogger(__name__)
@@ -19,16 +18,16 @@ async def check_budget_overrun(context: CallbackContext):
     user_telegram_id = job_data["user_telegram_id"]
     budget_limit = job_data["budget_limit"]
     
-    db: Session = next(get_db())
     try:
         start_of_month = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         
-        total_expenses_query = db.query(func.sum(Lancamento.valor)).join(Usuario).filter(
+        total_expenses_query = select(func.sum(Lancamento.valor)).join(Usuario).filter(
             Usuario.telegram_id == user_telegram_id,
             Lancamento.tipo == 'Saída',
             Lancamento.data_transacao >= start_of_month
         )
-        total = total_expenses_query.scalar() or 0.0
+        async with get_async_db() as db:
+            total = (await db.execute(total_expenses_query)).scalar() or 0.0
 
         if total > budget_limit:
             await context.bot.send_message(
@@ -38,8 +37,6 @@ async def check_budget_overrun(context: CallbackContext):
             )
     except Exception as e:
         logging.error(f"Erro dentro do job check_budget_overrun: {e}", exc_info=True)
-    finally:
-        db.close()
 
 async def schedule_alerts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Agenda um alerta de orçamento diário para o usuário."""
@@ -79,28 +76,24 @@ async def checar_objetivos_semanal(context: ContextTypes.DEFAULT_TYPE):
     Job que roda semanalmente para checar o progresso das metas de todos os usuários.
     """
     logger.info("Executando job semanal de verificação de metas...")
-    objetivos_ativos = listar_todos_objetivos_ativos()
+    objetivos_ativos = await listar_todos_objetivos_ativos()
     
     for objetivo in objetivos_ativos:
         try:
-            db: Session = next(get_db())
-            total_entradas_query = db.query(func.sum(Lancamento.valor)).filter(
+            # Entradas e saídas desde a criação da meta, em uma única ida ao banco
+            totais_query = select(
+                func.sum(Lancamento.valor).filter(Lancamento.tipo == 'Entrada'),
+                func.sum(Lancamento.valor).filter(Lancamento.tipo == 'Saída'),
+            ).filter(
                 Lancamento.id_usuario == objetivo.id_usuario,
-                Lancamento.tipo == 'Entrada',
                 Lancamento.data_transacao >= objetivo.criado_em
             )
-            total_saidas_query = db.query(func.sum(Lancamento.valor)).filter(
-                Lancamento.id_usuario == objetivo.id_usuario,
-                Lancamento.tipo == 'Saída',
-                Lancamento.data_transacao >= objetivo.criado_em
-            )
-            total_entradas = total_entradas_query.scalar() or 0.0
-            total_saidas = total_saidas_query.scalar() or 0.0
-            economia_atual = float(total_entradas - total_saidas)
-            db.close()
+            async with get_async_db() as db:
+                total_entradas, total_saidas = (await db.execute(totais_query)).one()
+            economia_atual = float((total_entradas or 0) - (total_saidas or 0))
 
             if economia_atual > float(objetivo.valor_atual):
-                 atualizar_valor_objetivo(objetivo.id, economia_atual)
+                 await atualizar_valor_objetivo(objetivo.id, economia_atual)
                  objetivo.valor_atual = economia_atual
 
             if objetivo.valor_atual >= objetivo.valor_meta:
@@ -14,10 +14,12 @@ from telegram.ext import (
 
 # --- IMPORTS DO PROJETO ---
 import config
-from database.database import get_db, popular_dados_iniciais, criar_tabelas
+from database.database import get_db, popular_dados_iniciais, criar_tabelas, fechar_conexoes_async
 from models import *
 from alerts import schedule_alerts, checar_objetivos_semanal
-from jobs import agendar_notificacoes_diarias
+from jobs import (
+    agendar_notificacoes_diarias, registrar_metricas_pool, pre_renderizar_relatorios_mensais, podar_cache_respostas_ia
+)
 
 # --- IMPORTS DOS HANDLERS (AGORA ORGANIZADOS) ---
 from gerente_financeiro.handlers import (
@@ -36,8 +38,10 @@ from gerente_financeiro.metas_handler import (
 )
 from gerente_financeiro.onboarding_handler import configurar_conv
 from gerente_financeiro.editing_handler import edit_conv
-from gerente_financeiro.graficos import grafico_conv
+from gerente_financeiro.graficos import grafico_conv, dashboard_command
 from gerente_financeiro.relatorio_handler import relatorio_handler
+from gerente_financeiro.fila_relatorios import encerrar_fila_relatorios
+from gerente_financeiro.servico_graficos import aquecer_pool_graficos, encerrar_pool_graficos
 from gerente_financeiro.manual_entry_handler import manual_entry_conv
 from gerente_financeiro.contact_handler import contact_conv
 from gerente_financeiro.delete_user_handler import delete_user_conv
@@ -64,6 +68,12 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
         except Exception as e:
             logger.error(f"Failed to send error message to user: {e}")
 
+async def post_shutdown(application: Application) -> None:
+    """Libera as conexões do pool assíncrono e os workers de gráficos e relatórios quando o bot é encerrado."""
+    encerrar_fila_relatorios()
+    await fechar_conexoes_async()
+    encerrar_pool_graficos()
+
 def main() -> None:
     """Função principal que monta e executa o bot."""
     logger.info("Iniciando o bot...")
@@ -88,7 +98,7 @@ def main() -> None:
         return
 
     # Construção da Aplicação do Bot
-    application = ApplicationBuilder().token(config.TELEGRAM_TOKEN).build()
+    application = ApplicationBuilder().token(config.TELEGRAM_TOKEN).post_shutdown(post_shutdown).build()
     logger.info("Aplicação do bot criada.")
 
     
@@ -116,6 +126,7 @@ def main() -> None:
     # Handlers de Comando (CommandHandler)
     application.add_handler(relatorio_handler)  # É um CommandHandler, não uma conversa
     application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("dashboard", dashboard_command))
     application.add_handler(CommandHandler("alerta", schedule_alerts))
     application.add_handler(CommandHandler("metas", listar_metas_command))
     application.add_handler(CommandHandler("agendar", agendamento_start))
@@ -135,8 +146,19 @@ def main() -> None:
     job_queue = application.job_queue
     job_queue.run_daily(checar_objetivos_semanal, time=time(hour=10, minute=0), days=(6,), name="checar_metas_semanalmente")
     job_queue.run_daily(agendar_notificacoes_diarias, time=time(hour=1, minute=0), name="agendador_mestre_diario")
-    logger.info("Jobs de metas e agendamentos configurados.")
+    job_queue.run_repeating(registrar_metricas_pool, interval=600, first=60, name="metricas_pool_db")
+    # Sem tzinfo o PTB agenda em UTC; com ele, a hora bate com a janela checada em jobs.py
+    job_queue.run_daily(
+        pre_renderizar_relatorios_mensais,
+        time=time(hour=config.RELATORIO_PRE_RENDER_INICIO, minute=0, tzinfo=config.RELATORIO_PRE_RENDER_FUSO),
+        name="pre_render_relatorios"
+    )
+    job_queue.run_daily(podar_cache_respostas_ia, time=time(hour=4, minute=30), name="podar_cache_ia")
+    logger.info("Jobs de metas, agendamentos e relatórios configurados.")
     
+    # Sobe os workers de gráficos antes do primeiro pedido
+    aquecer_pool_graficos()
+
     # Inicia o bot
     logger.info("Bot pronto. Iniciando polling...")
     application.run_polling()
@@ -1,6 +1,7 @@
 # Arquivo: config.py
 
 import os
+from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
 load_dotenv()
 import logging
@@ -36,6 +37,46 @@ GOOGLE_CSE_ID = os.getenv("GOOGLE_CSE_ID")
 DATABASE_URL = os.getenv("DATABASE_URL")
 GOOGLE_APPLICATION_CREDENTIALS = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 
+# ----- POOL DE CONEXÕES DO BANCO (ENGINE ASSÍNCRONO) -----
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "10"))          # segundos aguardando uma conexão livre
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))        # segundos até reciclar uma conexão
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+
+# ----- GATEWAY DA IA (TODAS AS CHAMADAS AO GEMINI) -----
+IA_CONCORRENCIA_GLOBAL = int(os.getenv("IA_CONCORRENCIA_GLOBAL", "16"))          # chamadas simultâneas ao Gemini no bot inteiro
+IA_CONCORRENCIA_POR_USUARIO = int(os.getenv("IA_CONCORRENCIA_POR_USUARIO", "4"))  # chamadas simultâneas de um mesmo usuário
+IA_FILA_MAX = int(os.getenv("IA_FILA_MAX", "200"))                   # pedidos aguardando a vez antes de recusar novos
+IA_PRAZO_PADRAO = float(os.getenv("IA_PRAZO_PADRAO", "60"))          # segundos por pedido (espera + tentativas)
+IA_TIMEOUT_TENTATIVA = float(os.getenv("IA_TIMEOUT_TENTATIVA", "45"))   # segundos por chamada individual
+IA_TENTATIVAS = int(os.getenv("IA_TENTATIVAS", "3"))                 # tentativas em 429/5xx/timeout
+IA_BACKOFF_BASE = float(os.getenv("IA_BACKOFF_BASE", "1"))           # segundos; dobra a cada tentativa
+IA_BACKOFF_MAX = float(os.getenv("IA_BACKOFF_MAX", "30"))
+IA_DISJUNTOR_FALHAS = int(os.getenv("IA_DISJUNTOR_FALHAS", "5"))     # falhas seguidas que abrem o disjuntor
+IA_DISJUNTOR_TEMPO = float(os.getenv("IA_DISJUNTOR_TEMPO", "30"))    # segundos recusando antes da chamada de teste
+IA_STREAMING = os.getenv("IA_STREAMING", "false").lower() in ("1", "true", "sim")   # /gerente exibe a resposta enquanto é gerada
+IA_STREAMING_INTERVALO = float(os.getenv("IA_STREAMING_INTERVALO", "1.5"))  # segundos entre edições da mensagem (Telegram: ~1 edição/s por chat)
+IA_CACHE_TTL_HORAS = float(os.getenv("IA_CACHE_TTL_HORAS", "720"))            # validade das respostas guardadas (OCR, fatura, extrato)
+IA_CACHE_MAX_REGISTROS = int(os.getenv("IA_CACHE_MAX_REGISTROS", "20000"))    # respostas mantidas no banco; acima disso saem as menos acessadas
+IA_CACHE_MAX_MEMORIA = int(os.getenv("IA_CACHE_MAX_MEMORIA", "500"))          # respostas mantidas também em memória (LRU)
+
+# ----- ANÁLISE DE EXTRATOS PELA IA -----
+EXTRATO_LLM_TENTATIVAS = int(os.getenv("EXTRATO_LLM_TENTATIVAS", "3"))       # tentativas por chunk com resposta sem JSON válido
+EXTRATO_LLM_PRAZO = float(os.getenv("EXTRATO_LLM_PRAZO", "180"))           # segundos por chunk (documentos grandes esperam mais)
+
+# ----- RENDERIZAÇÃO DE GRÁFICOS -----
+GRAFICOS_WORKERS = int(os.getenv("GRAFICOS_WORKERS", "2"))   # processos dedicados a desenhar gráficos
+
+# ----- GERAÇÃO DE RELATÓRIOS EM PDF -----
+RELATORIO_WORKERS = int(os.getenv("RELATORIO_WORKERS", "2"))       # relatórios gerados simultaneamente
+RELATORIO_FILA_MAX = int(os.getenv("RELATORIO_FILA_MAX", "100"))   # pedidos aguardando antes de recusar novos
+# Fuso da janela noturna: o agendamento e a checagem da janela usam o mesmo relógio
+RELATORIO_PRE_RENDER_FUSO = ZoneInfo(os.getenv("RELATORIO_PRE_RENDER_FUSO", "America/Sao_Paulo"))
+RELATORIO_PRE_RENDER_INICIO = int(os.getenv("RELATORIO_PRE_RENDER_INICIO", "2"))   # hora em que o job noturno começa
+RELATORIO_PRE_RENDER_FIM = int(os.getenv("RELATORIO_PRE_RENDER_FIM", "6"))         # hora em que ele para (retoma na noite seguinte)
+RELATORIO_PRE_RENDER_INTERVALO = float(os.getenv("RELATORIO_PRE_RENDER_INTERVALO", "3"))   # pausa em segundos entre relatórios
+
 # ----- ADICIONANDO VARIÁVEL DE CHAVE PIX E CONTATO -----
 SENDER_EMAIL = os.getenv("SENDER_EMAIL")
 EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
@@ -1,14 +1,23 @@
 # database/database.py
+import hashlib
 import logging
+import re
+import unicodedata
+from contextlib import asynccontextmanager
+from decimal import Decimal
 from typing import List
-from sqlalchemy import create_engine, func
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import create_engine, delete, event, func, literal, select, text, update
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert as pg_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
 from models import Base, Lancamento, Usuario, Categoria, Subcategoria, Objetivo
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import config
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import selectinload
 from sqlalchemy import func, and_
-from models import Lancamento, Usuario, Categoria, Subcategoria, Objetivo, ItemLancamento
+from models import Lancamento, Usuario, Categoria, Subcategoria, Objetivo, ItemLancamento, PerfilImportacaoCSV, RelatorioMensal, RespostaIACache
 
 class DatabaseError(Exception):
     """Exceção personalizada para erros de banco de dados."""
@@ -19,53 +28,132 @@ class ServiceError(Exception):
     pass
 
 # --- Configuração da Conexão com SQLAlchemy ---
+# O engine síncrono fica restrito à inicialização (criação de tabelas e dados
+# iniciais). Todo o tráfego dos handlers e jobs passa pelo engine assíncrono
+# (asyncpg), para que uma consulta lenta não bloqueie o event loop do bot.
 engine = None
 SessionLocal = None
+async_engine = None
+AsyncSessionLocal = None
+
+# Contadores do pool assíncrono, alimentados pelos eventos do SQLAlchemy.
+_metricas_pool = {
+    "conexoes_criadas": 0,
+    "checkouts": 0,
+    "checkins": 0,
+    "invalidacoes": 0,
+}
+
+
+def _montar_url_async(url: str):
+    """Converte a DATABASE_URL (psycopg2) para o driver asyncpg."""
+    url_async = make_url(url).set(drivername="postgresql+asyncpg")
+    # Parâmetros específicos do libpq não são aceitos pelo asyncpg.
+    parametros = {k: v for k, v in url_async.query.items() if k not in ("client_encoding", "sslmode")}
+    return url_async.set(query=parametros)
+
+
+def _registrar_metricas_pool(engine_async) -> None:
+    """Conecta os listeners de eventos do pool aos contadores de métricas."""
+    pool = engine_async.sync_engine.pool
+
+    @event.listens_for(pool, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        _metricas_pool["conexoes_criadas"] += 1
+
+    @event.listens_for(pool, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        _metricas_pool["checkouts"] += 1
+
+    @event.listens_for(pool, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        _metricas_pool["checkins"] += 1
+
+    @event.listens_for(pool, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        _metricas_pool["invalidacoes"] += 1
+
 
 try:
     if not config.DATABASE_URL:
         raise ValueError("DATABASE_URL não configurada em config.py")
 
-    engine = create_engine(config.DATABASE_URL, client_encoding='utf8')
+    engine = create_engine(config.DATABASE_URL, client_encoding='utf8', pool_pre_ping=True)
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
     
     with engine.connect() as connection:
         logging.info("✅ Conexão com o banco de dados estabelecida com sucesso!")
 
+    async_engine = create_async_engine(
+        _montar_url_async(config.DATABASE_URL),
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+        pool_recycle=config.DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        connect_args={
+            "command_timeout": config.DB_STATEMENT_TIMEOUT_MS / 1000 + 5,
+            "server_settings": {
+                "statement_timeout": str(config.DB_STATEMENT_TIMEOUT_MS),
+                "idle_in_transaction_session_timeout": str(config.DB_STATEMENT_TIMEOUT_MS * 4),
+                "application_name": "gerente_vdm",
+                "client_encoding": "utf8",
+            },
+        },
+    )
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+    _registrar_metricas_pool(async_engine)
+
 except Exception as e:
     logging.critical(f"❌ ERRO CRÍTICO AO CONFIGURAR O BANCO DE DADOS: {e}")
     engine = None
+    async_engine = None
+    AsyncSessionLocal = None
 
 
-def deletar_todos_dados_usuario(telegram_id: int) -> bool:
+async def deletar_todos_dados_usuario(telegram_id: int) -> bool:
     """
     Encontra um usuário pelo seu telegram_id e deleta o registro dele.
     Devido ao cascade, todos os dados associados (lançamentos, metas, etc.)
     serão deletados automaticamente.
     """
-    db = next(get_db())
-    try:
-        # Encontra o usuário para garantir que ele exista
-        usuario_a_deletar = db.query(Usuario).filter(Usuario.telegram_id == telegram_id).first()
-        
-        if usuario_a_deletar:
-            # A mágica acontece aqui!
-            db.delete(usuario_a_deletar)
-            db.commit()
-            logging.info(f"Todos os dados do usuário com telegram_id {telegram_id} foram deletados com sucesso.")
-            return True
-        else:
-            logging.warning(f"Tentativa de deletar dados de um usuário inexistente: {telegram_id}")
-            return False
+    async with get_async_db() as db:
+        try:
+            # Encontra o usuário para garantir que ele exista
+            usuario_a_deletar = (await db.execute(
+                select(Usuario).filter(Usuario.telegram_id == telegram_id)
+            )).scalars().first()
             
-    except Exception as e:
-        db.rollback()
-        logging.error(f"Erro CRÍTICO ao deletar dados do usuário {telegram_id}: {e}", exc_info=True)
-        return False
-    finally:
-        db.close()    
+            if usuario_a_deletar:
+                # A mágica acontece aqui!
+                await db.delete(usuario_a_deletar)
+                await db.commit()
+                logging.info(f"Todos os dados do usuário com telegram_id {telegram_id} foram deletados com sucesso.")
+                return True
+            else:
+                logging.warning(f"Tentativa de deletar dados de um usuário inexistente: {telegram_id}")
+                return False
+                
+        except Exception as e:
+            await db.rollback()
+            logging.error(f"Erro CRÍTICO ao deletar dados do usuário {telegram_id}: {e}", exc_info=True)
+            return False
 
 # --- Funções Auxiliares ---
+# O create_all não altera tabelas existentes: colunas e índices adicionados
+# depois da criação inicial entram aqui, sempre de forma idempotente.
+MIGRACOES_INCREMENTAIS = [
+    "ALTER TABLE lancamentos ADD COLUMN IF NOT EXISTS id_externo VARCHAR",
+    "CREATE INDEX IF NOT EXISTS ix_lancamentos_conta_id_externo "
+    "ON lancamentos (id_conta, id_externo) WHERE id_externo IS NOT NULL",
+    "ALTER TABLE lancamentos ADD COLUMN IF NOT EXISTS fingerprint VARCHAR(40)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_lancamentos_fingerprint "
+    "ON lancamentos (fingerprint) WHERE fingerprint IS NOT NULL",
+    # Relatórios e gráficos agregam sempre "lançamentos do usuário entre duas datas"
+    "CREATE INDEX IF NOT EXISTS ix_lancamentos_usuario_data "
+    "ON lancamentos (id_usuario, data_transacao)",
+]
+
 def criar_tabelas():
     if not engine:
         logging.error("Engine do banco de dados não inicializada. Tabelas não podem ser criadas.")
@@ -73,12 +161,15 @@ def criar_tabelas():
     try:
         logging.info("Verificando e criando tabelas a partir dos modelos...")
         Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            for comando in MIGRACOES_INCREMENTAIS:
+                conn.execute(text(comando))
         logging.info("Tabelas prontas.")
     except Exception as e:
         logging.error(f"Erro ao criar tabelas: {e}")
 
 def get_db():
-    """Fornece uma sessão do banco de dados."""
+    """Fornece uma sessão síncrona do banco de dados (usada apenas na inicialização)."""
     if not SessionLocal:
         logging.error("A sessão do banco de dados não foi inicializada.")
         raise ConnectionError("A conexão com o banco de dados falhou na inicialização.")
@@ -88,15 +179,49 @@ def get_db():
     finally:
         db.close()
 
-def get_or_create_user(db_session: Session, telegram_id: int, full_name: str) -> Usuario:
+@asynccontextmanager
+async def get_async_db():
+    """
+    Fornece uma AsyncSession (asyncpg) para uso dentro dos handlers e jobs.
+    A conexão só é retirada do pool na primeira consulta e é devolvida ao
+    sair do bloco `async with`; uma transação pendente é desfeita no fechamento.
+    """
+    if not AsyncSessionLocal:
+        logging.error("A sessão assíncrona do banco de dados não foi inicializada.")
+        raise ConnectionError("A conexão com o banco de dados falhou na inicialização.")
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def obter_metricas_pool() -> dict:
+    """Retorna o estado atual do pool assíncrono e os contadores acumulados."""
+    if not async_engine:
+        return {}
+    pool = async_engine.sync_engine.pool
+    return {
+        "tamanho": pool.size(),
+        "em_uso": pool.checkedout(),
+        "ociosas": pool.checkedin(),
+        "overflow": pool.overflow(),
+        **_metricas_pool,
+    }
+
+async def fechar_conexoes_async():
+    """Fecha todas as conexões do pool assíncrono (chamado no desligamento do bot)."""
+    if async_engine:
+        await async_engine.dispose()
+        logging.info(f"Pool assíncrono encerrado. Métricas finais: {obter_metricas_pool()}")
+
+async def get_or_create_user(db_session: AsyncSession, telegram_id: int, full_name: str) -> Usuario:
     """Busca um usuário pelo telegram_id ou cria um novo se não existir."""
-    user = db_session.query(Usuario).filter(Usuario.telegram_id == telegram_id).first()
+    user = (await db_session.execute(
+        select(Usuario).filter(Usuario.telegram_id == telegram_id)
+    )).scalars().first()
     if not user:
         logging.info(f"Criando novo usuário para telegram_id: {telegram_id}")
         user = Usuario(telegram_id=telegram_id, nome_completo=full_name)
         db_session.add(user)
-        db_session.commit()
-        db_session.refresh(user)
+        await db_session.commit()
+        await db_session.refresh(user)
     return user
 
 def popular_dados_iniciais(db_session: Session):
@@ -147,129 +272,134 @@ def popular_dados_iniciais(db_session: Session):
     logging.info("Verificação de dados iniciais concluída.")
     
 
-def criar_novo_objetivo(telegram_user_id: int, descricao: str, valor_meta: float, data_final: datetime.date) -> Objetivo | str | None:
-    db = next(get_db())
-    try:
-        usuario = db.query(Usuario).filter(Usuario.telegram_id == telegram_user_id).first()
-        if not usuario:
-            logging.error(f"Usuário com telegram_id {telegram_user_id} não encontrado para criar objetivo.")
+async def criar_novo_objetivo(telegram_user_id: int, descricao: str, valor_meta: float, data_final: datetime.date) -> Objetivo | str | None:
+    async with get_async_db() as db:
+        try:
+            usuario = (await db.execute(
+                select(Usuario).filter(Usuario.telegram_id == telegram_user_id)
+            )).scalars().first()
+            if not usuario:
+                logging.error(f"Usuário com telegram_id {telegram_user_id} não encontrado para criar objetivo.")
+                return None
+            meta_existente = (await db.execute(
+                select(Objetivo).filter(
+                    Objetivo.id_usuario == usuario.id,
+                    func.lower(Objetivo.descricao) == func.lower(descricao)
+                )
+            )).scalars().first()
+            if meta_existente:
+                logging.warning(f"Tentativa de criar meta duplicada: '{descricao}' para o usuário {telegram_user_id}")
+                return "DUPLICATE"
+            novo_objetivo = Objetivo(
+                id_usuario=usuario.id,
+                descricao=descricao,
+                valor_meta=valor_meta,
+                data_meta=data_final,
+                valor_atual=0.0
+            )
+            db.add(novo_objetivo)
+            await db.commit()
+            await db.refresh(novo_objetivo)
+            logging.info(f"Novo objetivo '{descricao}' criado para o usuário {telegram_user_id}.")
+            return novo_objetivo
+        except Exception as e:
+            await db.rollback()
+            logging.error(f"Erro ao criar objetivo no DB: {e}", exc_info=True)
             return None
-        meta_existente = db.query(Objetivo).filter(
-            Objetivo.id_usuario == usuario.id,
-            func.lower(Objetivo.descricao) == func.lower(descricao)
-        ).first()
-        if meta_existente:
-            logging.warning(f"Tentativa de criar meta duplicada: '{descricao}' para o usuário {telegram_user_id}")
-            return "DUPLICATE"
-        novo_objetivo = Objetivo(
-            id_usuario=usuario.id,
-            descricao=descricao,
-            valor_meta=valor_meta,
-            data_meta=data_final,
-            valor_atual=0.0
-        )
-        db.add(novo_objetivo)
-        db.commit()
-        db.refresh(novo_objetivo)
-        logging.info(f"Novo objetivo '{descricao}' criado para o usuário {telegram_user_id}.")
-        return novo_objetivo
-    except Exception as e:
-        db.rollback()
-        logging.error(f"Erro ao criar objetivo no DB: {e}", exc_info=True)
-        return None
-    finally:
-        db.close()
 
-def listar_objetivos_usuario(telegram_user_id: int):
-    db = next(get_db())
-    try:
-        usuario = db.query(Usuario).filter(Usuario.telegram_id == telegram_user_id).first()
+async def listar_objetivos_usuario(telegram_user_id: int):
+    async with get_async_db() as db:
+        usuario = (await db.execute(
+            select(Usuario).filter(Usuario.telegram_id == telegram_user_id)
+        )).scalars().first()
         if not usuario:
             return []
-        return db.query(Objetivo).filter(Objetivo.id_usuario == usuario.id).order_by(Objetivo.data_meta.asc()).all()
-    finally:
-        db.close()
-
-def deletar_objetivo_por_id(objetivo_id: int, telegram_user_id: int) -> bool:
-    db = next(get_db())
-    try:
-        objetivo_para_deletar = db.query(Objetivo).join(Usuario).filter(
-            Objetivo.id == objetivo_id,
-            Usuario.telegram_id == telegram_user_id
-        ).first()
-        if objetivo_para_deletar:
-            db.delete(objetivo_para_deletar)
-            db.commit()
-            logging.info(f"Objetivo {objetivo_id} deletado com sucesso pelo usuário {telegram_user_id}.")
-            return True
-        else:
-            logging.warning(f"Falha ao deletar objetivo {objetivo_id}. Motivo: Não encontrado ou permissão negada para o usuário {telegram_user_id}.")
+        resultado = await db.execute(
+            select(Objetivo).filter(Objetivo.id_usuario == usuario.id).order_by(Objetivo.data_meta.asc())
+        )
+        return resultado.scalars().all()
+
+async def deletar_objetivo_por_id(objetivo_id: int, telegram_user_id: int) -> bool:
+    async with get_async_db() as db:
+        try:
+            objetivo_para_deletar = (await db.execute(
+                select(Objetivo).join(Usuario).filter(
+                    Objetivo.id == objetivo_id,
+                    Usuario.telegram_id == telegram_user_id
+                )
+            )).scalars().first()
+            if objetivo_para_deletar:
+                await db.delete(objetivo_para_deletar)
+                await db.commit()
+                logging.info(f"Objetivo {objetivo_id} deletado com sucesso pelo usuário {telegram_user_id}.")
+                return True
+            else:
+                logging.warning(f"Falha ao deletar objetivo {objetivo_id}. Motivo: Não encontrado ou permissão negada para o usuário {telegram_user_id}.")
+                return False
+        except Exception as e:
+            await db.rollback()
+            logging.error(f"Erro ao deletar objetivo {objetivo_id} no DB: {e}", exc_info=True)
             return False
-    except Exception as e:
-        db.rollback()
-        logging.error(f"Erro ao deletar objetivo {objetivo_id} no DB: {e}", exc_info=True)
-        return False
-    finally:
-        db.close()
 
 # --- FUNÇÕES ADICIONADAS PARA OS ALERTAS ---
 
-def listar_todos_objetivos_ativos():
+async def listar_todos_objetivos_ativos():
     """Busca todos os objetivos de todos os usuários que ainda estão ativos."""
-    db = next(get_db())
-    try:
-        return db.query(Objetivo).join(Usuario).filter(Objetivo.data_meta >= datetime.now().date()).all()
-    except Exception as e:
-        logging.error(f"Erro ao listar todos os objetivos ativos: {e}", exc_info=True)
-        return []
-    finally:
-        db.close()
+    async with get_async_db() as db:
+        try:
+            resultado = await db.execute(
+                select(Objetivo).join(Usuario)
+                .filter(Objetivo.data_meta >= datetime.now().date())
+                .options(selectinload(Objetivo.usuario))
+            )
+            return resultado.scalars().all()
+        except Exception as e:
+            logging.error(f"Erro ao listar todos os objetivos ativos: {e}", exc_info=True)
+            return []
 
-def atualizar_valor_objetivo(objetivo_id: int, novo_valor: float):
+async def atualizar_valor_objetivo(objetivo_id: int, novo_valor: float):
     """Atualiza o valor atual de um objetivo."""
-    db = next(get_db())
-    try:
-        objetivo = db.query(Objetivo).filter(Objetivo.id == objetivo_id).first()
-        if objetivo:
-            objetivo.valor_atual = novo_valor
-            db.commit()
-            return True
-        return False
-    except Exception as e:
-        db.rollback()
-        logging.error(f"Erro ao atualizar valor do objetivo {objetivo_id}: {e}", exc_info=True)
-        return False
-    finally:
-        db.close()
+    async with get_async_db() as db:
+        try:
+            objetivo = await db.get(Objetivo, objetivo_id)
+            if objetivo:
+                objetivo.valor_atual = novo_valor
+                await db.commit()
+                return True
+            return False
+        except Exception as e:
+            await db.rollback()
+            logging.error(f"Erro ao atualizar valor do objetivo {objetivo_id}: {e}", exc_info=True)
+            return False
 
-def atualizar_objetivo_por_id(objetivo_id: int, telegram_user_id: int, novo_valor: float, nova_data: datetime.date) -> Objetivo | None:
+async def atualizar_objetivo_por_id(objetivo_id: int, telegram_user_id: int, novo_valor: float, nova_data: datetime.date) -> Objetivo | None:
     """Atualiza o valor e a data de uma meta específica."""
-    db = next(get_db())
-    try:
-        # Garante que o usuário só pode editar suas próprias metas
-        objetivo_para_atualizar = db.query(Objetivo).join(Usuario).filter(
-            Objetivo.id == objetivo_id,
-            Usuario.telegram_id == telegram_user_id
-        ).first()
-
-        if objetivo_para_atualizar:
-            objetivo_para_atualizar.valor_meta = novo_valor
-            objetivo_para_atualizar.data_meta = nova_data
-            db.commit()
-            db.refresh(objetivo_para_atualizar)
-            logging.info(f"Objetivo {objetivo_id} atualizado com sucesso pelo usuário {telegram_user_id}.")
-            return objetivo_para_atualizar
-        else:
-            logging.warning(f"Falha ao atualizar objetivo {objetivo_id}. Motivo: Não encontrado ou permissão negada para o usuário {telegram_user_id}.")
+    async with get_async_db() as db:
+        try:
+            # Garante que o usuário só pode editar suas próprias metas
+            objetivo_para_atualizar = (await db.execute(
+                select(Objetivo).join(Usuario).filter(
+                    Objetivo.id == objetivo_id,
+                    Usuario.telegram_id == telegram_user_id
+                )
+            )).scalars().first()
+
+            if objetivo_para_atualizar:
+                objetivo_para_atualizar.valor_meta = novo_valor
+                objetivo_para_atualizar.data_meta = nova_data
+                await db.commit()
+                await db.refresh(objetivo_para_atualizar)
+                logging.info(f"Objetivo {objetivo_id} atualizado com sucesso pelo usuário {telegram_user_id}.")
+                return objetivo_para_atualizar
+            else:
+                logging.warning(f"Falha ao atualizar objetivo {objetivo_id}. Motivo: Não encontrado ou permissão negada para o usuário {telegram_user_id}.")
+                return None
+        except Exception as e:
+            await db.rollback()
+            logging.error(f"Erro ao atualizar objetivo {objetivo_id} no DB: {e}", exc_info=True)
             return None
-    except Exception as e:
-        db.rollback()
-        logging.error(f"Erro ao atualizar objetivo {objetivo_id} no DB: {e}", exc_info=True)
-        return None
-    finally:
-        db.close()
 
-def buscar_lancamentos_usuario(
+async def buscar_lancamentos_usuario(
     telegram_user_id: int,
     limit: int = 10,
     query: str = None,
@@ -279,116 +409,523 @@ def buscar_lancamentos_usuario(
     data_fim: datetime = None,
     tipo: str = None,
     id_conta: int = None,
-    forma_pagamento: str = None
+    forma_pagamento: str = None,
+    valor_minimo: float = None,
+    valor_maximo: float = None
 ) -> List[Lancamento]:
     """
     Busca lançamentos para um usuário, com filtros avançados.
     """
-    db = next(get_db())
-    try:
-        # Busca o usuário para garantir que ele existe
-        usuario = db.query(Usuario).filter(Usuario.telegram_id == telegram_user_id).first()
-        if not usuario:
+    async with get_async_db() as db:
+        try:
+            # Busca o usuário para garantir que ele existe
+            usuario = (await db.execute(
+                select(Usuario).filter(Usuario.telegram_id == telegram_user_id)
+            )).scalars().first()
+            if not usuario:
+                return []
+
+            # Inicia a query base. Os relacionamentos são carregados com selectinload,
+            # já que a AsyncSession não permite lazy loading fora do contexto async.
+            base_query = select(Lancamento).filter(Lancamento.id_usuario == usuario.id).options(
+                selectinload(Lancamento.categoria),
+                selectinload(Lancamento.subcategoria),
+                selectinload(Lancamento.itens)
+            )
+
+            # --- APLICAÇÃO CORRETA E INDEPENDENTE DOS FILTROS ---
+
+            # Filtro 1: Por tipo ('Entrada' ou 'Saída')
+            if tipo:
+                base_query = base_query.filter(Lancamento.tipo == tipo)
+
+            # Filtro 2: Por ID específico do lançamento
+            if lancamento_id:
+                base_query = base_query.filter(Lancamento.id == lancamento_id)
+
+            # Filtro 3: Por texto de busca (na descrição ou nos itens)
+            if query:
+                base_query = base_query.filter(
+                    (Lancamento.descricao.ilike(f'%{query}%')) |
+                    (Lancamento.itens.any(ItemLancamento.nome_item.ilike(f'%{query}%')))
+                )
+
+            # Filtro 4: Por nome da categoria
+            if categoria_nome:
+                base_query = base_query.join(Lancamento.categoria).filter(
+                    Categoria.nome.ilike(f'%{categoria_nome}%')
+                )
+
+            # Filtro 5: Por data de início
+            if data_inicio:
+                base_query = base_query.filter(Lancamento.data_transacao >= data_inicio)
+
+            # Filtro 6: Por data de fim
+            if data_fim:
+                base_query = base_query.filter(Lancamento.data_transacao <= data_fim)
+
+            # Filtro 7: Por ID da conta (se necessário)
+            if id_conta:
+                base_query = base_query.filter(Lancamento.id_conta == id_conta)
+
+            if forma_pagamento:
+                # Usamos ilike para ser case-insensitive (não importa se é 'pix' ou 'PIX')
+                base_query = base_query.filter(Lancamento.forma_pagamento.ilike(f'%{forma_pagamento}%'))        
+
+            # Filtro 8: Por faixa de valor (em módulo, independente do sinal gravado)
+            if valor_minimo is not None:
+                base_query = base_query.filter(func.abs(Lancamento.valor) >= valor_minimo)
+            if valor_maximo is not None:
+                base_query = base_query.filter(func.abs(Lancamento.valor) <= valor_maximo)
+
+            # Retorna o resultado final, ordenado por data e com limite aplicado.
+            # Como o filtro de itens usa EXISTS (any), não há linhas duplicadas a remover.
+            resultado = await db.execute(
+                base_query.order_by(Lancamento.data_transacao.desc()).limit(limit)
+            )
+            return resultado.scalars().all()
+
+        except Exception as e:
+            logging.error(f"Erro ao buscar lançamentos no banco de dados: {e}", exc_info=True)
             return []
 
-        # Inicia a query base, já otimizando para carregar os relacionamentos
-        base_query = db.query(Lancamento).filter(Lancamento.id_usuario == usuario.id).options(
-            joinedload(Lancamento.categoria),
-            joinedload(Lancamento.subcategoria),
-            joinedload(Lancamento.itens)
-        )
+async def atualizar_lancamento_por_id(lancamento_id: int, telegram_user_id: int, dados: dict):
+    """Atualiza um lançamento específico, verificando a permissão do usuário."""
+    async with get_async_db() as db:
+        try:
+            lancamento = (await db.execute(
+                select(Lancamento).join(Usuario).filter(
+                    Lancamento.id == lancamento_id,
+                    Usuario.telegram_id == telegram_user_id
+                )
+            )).scalars().first()
+            
+            if lancamento:
+                for key, value in dados.items():
+                    setattr(lancamento, key, value)
+                await db.commit()
+                return lancamento
+            return None
+        except Exception as e:
+            await db.rollback()
+            logging.error(f"Erro ao atualizar lançamento {lancamento_id}: {e}", exc_info=True)
+            return None
 
-        # --- APLICAÇÃO CORRETA E INDEPENDENTE DOS FILTROS ---
+async def deletar_lancamento_por_id(lancamento_id: int, telegram_user_id: int) -> bool:
+    """Deleta um lançamento específico, verificando a permissão do usuário."""
+    async with get_async_db() as db:
+        try:
+            lancamento = (await db.execute(
+                select(Lancamento).join(Usuario).filter(
+                    Lancamento.id == lancamento_id,
+                    Usuario.telegram_id == telegram_user_id
+                )
+            )).scalars().first()
+            
+            if lancamento:
+                await db.delete(lancamento)
+                await db.commit()
+                return True
+            return False
+        except Exception as e:
+            await db.rollback()
+            logging.error(f"Erro ao deletar lançamento {lancamento_id}: {e}", exc_info=True)
+            return False
 
-        # Filtro 1: Por tipo ('Entrada' ou 'Saída')
-        if tipo:
-            base_query = base_query.filter(Lancamento.tipo == tipo)
+async def buscar_perfil_csv(telegram_user_id: int, assinatura: str) -> dict | None:
+    """
+    Retorna o mapeamento de colunas salvo para a assinatura de cabeçalho.
+    Prefere o perfil do próprio usuário; senão usa o mais utilizado por outros
+    usuários do mesmo banco (o layout do CSV é o mesmo para todos).
+    """
+    async with get_async_db() as db:
+        try:
+            perfis = (await db.execute(
+                select(PerfilImportacaoCSV, Usuario.telegram_id)
+                .join(Usuario)
+                .filter(PerfilImportacaoCSV.assinatura == assinatura)
+                .order_by(PerfilImportacaoCSV.usos.desc())
+            )).all()
+            for perfil, telegram_id in perfis:
+                if telegram_id == telegram_user_id:
+                    return perfil.mapeamento
+            return perfis[0][0].mapeamento if perfis else None
+        except Exception as e:
+            logging.error(f"Erro ao buscar perfil de CSV {assinatura}: {e}", exc_info=True)
+            return None
 
-        # Filtro 2: Por ID específico do lançamento
-        if lancamento_id:
-            base_query = base_query.filter(Lancamento.id == lancamento_id)
+async def salvar_perfil_csv(telegram_user_id: int, assinatura: str, mapeamento: dict) -> None:
+    """Cria ou atualiza o perfil de importação CSV do usuário para a assinatura informada."""
+    async with get_async_db() as db:
+        try:
+            usuario = (await db.execute(
+                select(Usuario).filter(Usuario.telegram_id == telegram_user_id)
+            )).scalars().first()
+            if not usuario:
+                return
+            perfil = (await db.execute(
+                select(PerfilImportacaoCSV).filter(
+                    PerfilImportacaoCSV.id_usuario == usuario.id,
+                    PerfilImportacaoCSV.assinatura == assinatura
+                )
+            )).scalars().first()
+            if perfil:
+                perfil.mapeamento = mapeamento
+                perfil.usos = (perfil.usos or 0) + 1
+            else:
+                db.add(PerfilImportacaoCSV(id_usuario=usuario.id, assinatura=assinatura, mapeamento=mapeamento))
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logging.error(f"Erro ao salvar perfil de CSV {assinatura}: {e}", exc_info=True)
+
+
+# --- IMPORTAÇÃO EM LOTE COM DEDUPLICAÇÃO POR FINGERPRINT ---
+
+# Ordem das colunas nas tuplas aceitas por inserir_lancamentos_em_lote (o fingerprint é calculado aqui)
+COLUNAS_LANCAMENTO_LOTE = (
+    'id_usuario', 'descricao', 'valor', 'tipo', 'data_transacao', 'forma_pagamento',
+    'id_conta', 'id_categoria', 'id_subcategoria', 'id_externo',
+)
+LOTE_INSERCAO = 1000  # linhas por INSERT (asyncpg aceita até 32767 parâmetros por comando)
+LIMIAR_COPY = 1000    # a partir daqui compensa o COPY para uma tabela temporária
+
+def _normalizar_descricao(descricao: str) -> str:
+    """Minúsculas, sem acentos e só letras/números, para que variações de formatação não mudem o hash."""
+    sem_acento = unicodedata.normalize('NFKD', descricao or '').encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', ' ', sem_acento.lower()).strip()
+
+def _centavos(valor) -> int:
+    return int((Decimal(str(valor)) * 100).quantize(Decimal(1)))
+
+def calcular_fingerprint(id_usuario: int, id_conta: int | None, data_transacao: datetime, valor,
+                         descricao: str, ocorrencia: int = 0, id_externo: str | None = None) -> str:
+    """
+    Hash que identifica um lançamento importado. Quando o banco fornece um
+    identificador próprio (FITID do OFX), ele é usado no lugar do conteúdo.
+    `ocorrencia` distingue transações idênticas dentro do mesmo arquivo
+    (ex.: dois cafés iguais no mesmo dia), que devem ser mantidas.
+    """
+    if id_externo:
+        base = f"{id_usuario}|{id_conta}|ext|{id_externo}"
+    else:
+        base = (
+            f"{id_usuario}|{id_conta}|{data_transacao.strftime('%Y-%m-%d')}|{_centavos(valor)}|"
+            f"{_normalizar_descricao(descricao)}|{ocorrencia}"
+        )
+    return hashlib.sha1(base.encode('utf-8')).hexdigest()
+
+def atribuir_fingerprints(linhas: List[tuple]) -> List[tuple]:
+    """Acrescenta o fingerprint ao fim de cada tupla, numerando as repetições do mesmo conteúdo."""
+    ocorrencias: dict = {}
+    resultado = []
+    for linha in linhas:
+        campos = dict(zip(COLUNAS_LANCAMENTO_LOTE, linha))
+        chave = (campos['id_usuario'], campos['id_conta'], campos['data_transacao'].date(),
+                 campos['valor'], _normalizar_descricao(campos['descricao']), campos['id_externo'])
+        ocorrencia = ocorrencias.get(chave, 0)
+        ocorrencias[chave] = ocorrencia + 1
+        fingerprint = calcular_fingerprint(
+            campos['id_usuario'], campos['id_conta'], campos['data_transacao'], campos['valor'],
+            campos['descricao'], ocorrencia, campos['id_externo']
+        )
+        resultado.append(tuple(linha) + (fingerprint,))
+    return resultado
 
-        # Filtro 3: Por texto de busca (na descrição ou nos itens)
-        if query:
-            base_query = base_query.outerjoin(Lancamento.itens).filter(
-                (Lancamento.descricao.ilike(f'%{query}%')) |
-                (Lancamento.itens.any(ItemLancamento.nome_item.ilike(f'%{query}%')))
+async def _descartar_existentes_sem_fingerprint(db: AsyncSession, linhas: List[tuple]) -> List[tuple]:
+    """
+    Remove do lote as linhas que já existem entre os lançamentos sem fingerprint
+    (lançamentos manuais e importações anteriores a ele), com os mesmos critérios
+    da antiga verificação linha a linha: mesmo FITID na conta ou, sem FITID, mesma
+    conta, dia, valor e tipo com a descrição importada contida na existente.
+    Cada lançamento existente absorve no máximo uma linha do lote.
+    """
+    campos = [dict(zip(COLUNAS_LANCAMENTO_LOTE, linha)) for linha in linhas]
+    existentes_por_fitid: set = set()
+    existentes_por_conteudo: dict = {}
+    for id_usuario in {c['id_usuario'] for c in campos}:
+        do_usuario = [c for c in campos if c['id_usuario'] == id_usuario]
+        contas = {c['id_conta'] for c in do_usuario if c['id_conta'] is not None}
+        if not contas:
+            continue
+        inicio = min(c['data_transacao'] for c in do_usuario).replace(hour=0, minute=0, second=0, microsecond=0)
+        fim = max(c['data_transacao'] for c in do_usuario).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        existentes = (await db.execute(
+            select(Lancamento.id_conta, Lancamento.data_transacao, Lancamento.valor, Lancamento.tipo,
+                   Lancamento.descricao, Lancamento.id_externo)
+            .filter(
+                Lancamento.id_usuario == id_usuario,
+                Lancamento.fingerprint.is_(None),
+                Lancamento.id_conta.in_(contas),
+                Lancamento.data_transacao >= inicio,
+                Lancamento.data_transacao < fim
             )
-
-        # Filtro 4: Por nome da categoria
-        if categoria_nome:
-            base_query = base_query.join(Lancamento.categoria).filter(
-                Categoria.nome.ilike(f'%{categoria_nome}%')
+        )).all()
+        for e in existentes:
+            if e.id_externo:
+                existentes_por_fitid.add((id_usuario, e.id_conta, e.id_externo))
+            chave = (id_usuario, e.id_conta, e.data_transacao.date(), _centavos(e.valor), e.tipo)
+            existentes_por_conteudo.setdefault(chave, []).append(_normalizar_descricao(e.descricao))
+
+    restantes = []
+    for linha, c in zip(linhas, campos):
+        if c['id_externo']:
+            chave_fitid = (c['id_usuario'], c['id_conta'], c['id_externo'])
+            if chave_fitid in existentes_por_fitid:
+                existentes_por_fitid.discard(chave_fitid)
+                continue
+        else:
+            candidatas = existentes_por_conteudo.get(
+                (c['id_usuario'], c['id_conta'], c['data_transacao'].date(), _centavos(c['valor']), c['tipo']), []
             )
+            descricao = _normalizar_descricao(c['descricao'])
+            encontrada = next((i for i, existente in enumerate(candidatas) if descricao in existente), None)
+            if encontrada is not None:
+                del candidatas[encontrada]
+                continue
+        restantes.append(linha)
+    return restantes
+
+async def _inserir_via_values(db: AsyncSession, linhas: List[tuple], colunas: tuple) -> List[tuple]:
+    inseridos: List[tuple] = []
+    for inicio in range(0, len(linhas), LOTE_INSERCAO):
+        stmt = (
+            pg_insert(Lancamento)
+            .values([dict(zip(colunas, linha)) for linha in linhas[inicio:inicio + LOTE_INSERCAO]])
+            .on_conflict_do_nothing(
+                index_elements=[Lancamento.fingerprint],
+                index_where=Lancamento.fingerprint.isnot(None)
+            )
+            .returning(Lancamento.id, Lancamento.fingerprint)
+        )
+        inseridos.extend((await db.execute(stmt)).all())
+    return inseridos
+
+async def _inserir_via_copy(db: AsyncSession, linhas: List[tuple], colunas: tuple) -> List[tuple]:
+    lista_colunas = ', '.join(colunas)
+    # A tabela temporária vive na conexão e é esvaziada a cada commit; o CREATE via
+    # SQLAlchemy garante que o COPY abaixo rode dentro da mesma transação.
+    await db.execute(text(
+        f"CREATE TEMP TABLE IF NOT EXISTS staging_lancamentos ON COMMIT DELETE ROWS "
+        f"AS SELECT {lista_colunas} FROM lancamentos WITH NO DATA"
+    ))
+    await db.execute(text("TRUNCATE staging_lancamentos"))
+
+    conexao = await db.connection()
+    conexao_asyncpg = (await conexao.get_raw_connection()).driver_connection
+    await conexao_asyncpg.copy_records_to_table('staging_lancamentos', records=linhas, columns=list(colunas))
+
+    resultado = await db.execute(text(
+        f"INSERT INTO lancamentos ({lista_colunas}) SELECT {lista_colunas} FROM staging_lancamentos "
+        f"ON CONFLICT (fingerprint) WHERE fingerprint IS NOT NULL DO NOTHING RETURNING id, fingerprint"
+    ))
+    return list(resultado.all())
+
+async def inserir_lancamentos_em_lote(db: AsyncSession, linhas: List[tuple]) -> List[tuple]:
+    """
+    Grava lançamentos importados a partir de tuplas na ordem de COLUNAS_LANCAMENTO_LOTE,
+    sem passar pelo ORM. Lotes grandes vão por COPY para uma tabela temporária; os
+    pequenos, por INSERT ... VALUES. Em ambos os casos os duplicados (mesmo
+    fingerprint) são descartados pelo banco; os que repetem lançamentos sem
+    fingerprint são descartados antes, numa única consulta. Retorna pares
+    (id, tupla original) dos lançamentos efetivamente inseridos; o commit fica com quem chama.
+    """
+    if not linhas:
+        return []
+    colunas = COLUNAS_LANCAMENTO_LOTE + ('fingerprint',)
+    linhas_completas = atribuir_fingerprints(linhas)
+    linhas_completas = await _descartar_existentes_sem_fingerprint(db, linhas_completas)
+    if not linhas_completas:
+        logging.info(f"Importação em lote: todas as {len(linhas)} linhas já existiam.")
+        return []
+    if len(linhas_completas) >= LIMIAR_COPY:
+        retornados = await _inserir_via_copy(db, linhas_completas, colunas)
+    else:
+        retornados = await _inserir_via_values(db, linhas_completas, colunas)
+    por_fingerprint = {linha[-1]: linha[:-1] for linha in linhas_completas}
+    inseridos = [(id_lancamento, por_fingerprint[fingerprint]) for id_lancamento, fingerprint in retornados]
+    logging.info(f"Importação em lote: {len(inseridos)} de {len(linhas)} lançamentos inseridos.")
+    return inseridos
 
-        # Filtro 5: Por data de início
-        if data_inicio:
-            base_query = base_query.filter(Lancamento.data_transacao >= data_inicio)
-
-        # Filtro 6: Por data de fim
-        if data_fim:
-            base_query = base_query.filter(Lancamento.data_transacao <= data_fim)
 
-        # Filtro 7: Por ID da conta (se necessário)
-        if id_conta:
-            base_query = base_query.filter(Lancamento.id_conta == id_conta)
 
-        if id_conta:
-            base_query = base_query.filter(Lancamento.id_conta == id_conta)
+# --- RELATÓRIOS MENSAIS PRÉ-RENDERIZADOS ---
 
-        if forma_pagamento:
-            # Usamos ilike para ser case-insensitive (não importa se é 'pix' ou 'PIX')
-            base_query = base_query.filter(Lancamento.forma_pagamento.ilike(f'%{forma_pagamento}%'))        
+# Períodos anteriores, de mesma duração, comparados com o do relatório (tendências e médias).
+# A assinatura do PDF guardado cobre essa janela, e services lê o valor daqui.
+PERIODOS_ANTERIORES_RELATORIO = 3
 
-        # Retorna o resultado final, ordenado por data e com limite aplicado.
-        # O .distinct() é crucial para evitar duplicatas quando há join com os itens.
-        return base_query.distinct().order_by(Lancamento.data_transacao.desc()).limit(limit).all()
+async def _assinatura_relatorio(db: AsyncSession, usuario: Usuario, mes: int, ano: int, versao_template: str) -> str:
+    """
+    Resumo de tudo o que entra no PDF de um mês: os lançamentos da janela do relatório,
+    o nome do usuário e a versão do template. Calculado no banco, sem carregar as linhas.
+    """
+    data_alvo = datetime(ano, mes, 1)
+    inicio = data_alvo - relativedelta(months=PERIODOS_ANTERIORES_RELATORIO)
+    fim = data_alvo + relativedelta(months=1)
+    linha = func.concat_ws(
+        ':', Lancamento.id, Lancamento.valor, Lancamento.tipo, Lancamento.data_transacao, Lancamento.id_categoria
+    )
+    total, resumo = (await db.execute(
+        select(func.count(Lancamento.id), func.md5(func.string_agg(linha, aggregate_order_by(literal(','), Lancamento.id))))
+        .filter(
+            Lancamento.id_usuario == usuario.id,
+            Lancamento.data_transacao >= inicio,
+            Lancamento.data_transacao < fim
+        )
+    )).one()
+    return hashlib.sha1(f"{versao_template}|{usuario.nome_completo}|{total}|{resumo}".encode('utf-8')).hexdigest()
+
+async def calcular_assinatura_relatorio(telegram_user_id: int, mes: int, ano: int, versao_template: str) -> str | None:
+    async with get_async_db() as db:
+        usuario = (await db.execute(
+            select(Usuario).filter(Usuario.telegram_id == telegram_user_id)
+        )).scalars().first()
+        if not usuario:
+            return None
+        return await _assinatura_relatorio(db, usuario, mes, ano, versao_template)
 
-    except Exception as e:
-        logging.error(f"Erro ao buscar lançamentos no banco de dados: {e}", exc_info=True)
-        return []
-    finally:
-        db.close()
+async def buscar_relatorio_pronto(telegram_user_id: int, mes: int, ano: int, versao_template: str) -> dict | None:
+    """
+    Retorna id, file_id do Telegram e nome do usuário do PDF guardado para o mês,
+    desde que ele ainda corresponda aos dados atuais. Não carrega os bytes do PDF.
+    """
+    async with get_async_db() as db:
+        try:
+            usuario = (await db.execute(
+                select(Usuario).filter(Usuario.telegram_id == telegram_user_id)
+            )).scalars().first()
+            if not usuario:
+                return None
+            relatorio = (await db.execute(
+                select(RelatorioMensal.id, RelatorioMensal.assinatura, RelatorioMensal.telegram_file_id).filter(
+                    RelatorioMensal.id_usuario == usuario.id,
+                    RelatorioMensal.ano == ano,
+                    RelatorioMensal.mes == mes
+                )
+            )).first()
+            if relatorio is None:
+                return None
+            if relatorio.assinatura != await _assinatura_relatorio(db, usuario, mes, ano, versao_template):
+                logging.info(f"Relatório {mes}/{ano} do usuário {telegram_user_id} desatualizado; será gerado novamente.")
+                return None
+            return {"id": relatorio.id, "telegram_file_id": relatorio.telegram_file_id, "nome_completo": usuario.nome_completo}
+        except Exception as e:
+            logging.error(f"Erro ao buscar relatório pronto {mes}/{ano} do usuário {telegram_user_id}: {e}", exc_info=True)
+            return None
 
-def atualizar_lancamento_por_id(lancamento_id: int, telegram_user_id: int, dados: dict):
-    """Atualiza um lançamento específico, verificando a permissão do usuário."""
-    db = next(get_db())
-    try:
-        lancamento = db.query(Lancamento).join(Usuario).filter(
-            Lancamento.id == lancamento_id,
-            Usuario.telegram_id == telegram_user_id
-        ).first()
-        
-        if lancamento:
-            for key, value in dados.items():
-                setattr(lancamento, key, value)
-            db.commit()
-            return lancamento
-        return None
-    except Exception as e:
-        db.rollback()
-        logging.error(f"Erro ao atualizar lançamento {lancamento_id}: {e}", exc_info=True)
-        return None
-    finally:
-        db.close()
+async def carregar_pdf_relatorio(relatorio_id: int) -> bytes | None:
+    async with get_async_db() as db:
+        return (await db.execute(
+            select(RelatorioMensal.pdf).filter(RelatorioMensal.id == relatorio_id)
+        )).scalar_one_or_none()
+
+async def salvar_relatorio_pronto(telegram_user_id: int, mes: int, ano: int, assinatura: str, pdf: bytes) -> int | None:
+    """Grava (ou substitui) o PDF do mês do usuário. Retorna o id do registro."""
+    async with get_async_db() as db:
+        try:
+            usuario = (await db.execute(
+                select(Usuario).filter(Usuario.telegram_id == telegram_user_id)
+            )).scalars().first()
+            if not usuario:
+                return None
+            valores = {
+                "assinatura": assinatura,
+                "pdf": pdf,
+                "telegram_file_id": None,
+                "gerado_em": datetime.now(timezone.utc).replace(tzinfo=None),
+            }
+            relatorio_id = (await db.execute(
+                pg_insert(RelatorioMensal)
+                .values(id_usuario=usuario.id, ano=ano, mes=mes, **valores)
+                .on_conflict_do_update(constraint='uq_relatorio_mensal_usuario_periodo', set_=valores)
+                .returning(RelatorioMensal.id)
+            )).scalar_one()
+            await db.commit()
+            return relatorio_id
+        except Exception as e:
+            await db.rollback()
+            logging.error(f"Erro ao salvar relatório {mes}/{ano} do usuário {telegram_user_id}: {e}", exc_info=True)
+            return None
 
-def deletar_lancamento_por_id(lancamento_id: int, telegram_user_id: int) -> bool:
-    """Deleta um lançamento específico, verificando a permissão do usuário."""
-    db = next(get_db())
-    try:
-        lancamento = db.query(Lancamento).join(Usuario).filter(
-            Lancamento.id == lancamento_id,
-            Usuario.telegram_id == telegram_user_id
-        ).first()
-        
-        if lancamento:
-            db.delete(lancamento)
-            db.commit()
-            return True
-        return False
-    except Exception as e:
-        db.rollback()
-        logging.error(f"Erro ao deletar lançamento {lancamento_id}: {e}", exc_info=True)
-        return False
-    finally:
-        db.close()
\ No newline at end of file
+async def registrar_file_id_relatorio(relatorio_id: int, file_id: str | None) -> None:
+    """Guarda (ou limpa, com None) o file_id do Telegram do PDF já enviado uma vez."""
+    async with get_async_db() as db:
+        await db.execute(
+            update(RelatorioMensal).where(RelatorioMensal.id == relatorio_id).values(telegram_file_id=file_id)
+        )
+        await db.commit()
+
+async def listar_usuarios_sem_relatorio(mes: int, ano: int) -> List[int]:
+    """telegram_ids dos usuários com lançamentos no mês e sem PDF guardado para ele."""
+    data_alvo = datetime(ano, mes, 1)
+    tem_lancamentos = select(Lancamento.id).filter(
+        Lancamento.id_usuario == Usuario.id,
+        Lancamento.data_transacao >= data_alvo,
+        Lancamento.data_transacao < data_alvo + relativedelta(months=1)
+    ).exists()
+    tem_relatorio = select(RelatorioMensal.id).filter(
+        RelatorioMensal.id_usuario == Usuario.id,
+        RelatorioMensal.ano == ano,
+        RelatorioMensal.mes == mes
+    ).exists()
+    async with get_async_db() as db:
+        resultado = await db.execute(
+            select(Usuario.telegram_id).filter(tem_lancamentos, ~tem_relatorio).order_by(Usuario.id)
+        )
+        return list(resultado.scalars().all())
+
+async def buscar_resposta_ia_cache(chave: str, criado_desde: datetime) -> str | None:
+    """Resposta guardada para a chave, se criada depois de `criado_desde`; registra o acesso."""
+    async with get_async_db() as db:
+        resposta = (await db.execute(
+            update(RespostaIACache)
+            .where(RespostaIACache.chave == chave, RespostaIACache.criado_em >= criado_desde)
+            .values(
+                ultimo_acesso=datetime.now(timezone.utc).replace(tzinfo=None),
+                acessos=RespostaIACache.acessos + 1
+            )
+            .returning(RespostaIACache.resposta)
+        )).scalar_one_or_none()
+        await db.commit()
+        return resposta
+
+async def salvar_resposta_ia_cache(chave: str, tarefa: str, modelo: str, resposta: str) -> None:
+    """Grava (ou renova) a resposta da IA para a chave."""
+    agora = datetime.now(timezone.utc).replace(tzinfo=None)
+    valores = {"tarefa": tarefa, "modelo": modelo, "resposta": resposta, "criado_em": agora, "ultimo_acesso": agora}
+    async with get_async_db() as db:
+        await db.execute(
+            pg_insert(RespostaIACache)
+            .values(chave=chave, acessos=0, **valores)
+            .on_conflict_do_update(index_elements=[RespostaIACache.chave], set_=valores)
+        )
+        await db.commit()
+
+async def podar_cache_respostas_ia(ttl_horas: float, max_registros: int) -> int:
+    """Apaga as respostas vencidas e, acima do limite, as acessadas há mais tempo. Retorna quantas saíram."""
+    validade = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=ttl_horas)
+    async with get_async_db() as db:
+        vencidas = (await db.execute(
+            delete(RespostaIACache).where(RespostaIACache.criado_em < validade)
+        )).rowcount
+        excedentes = select(RespostaIACache.chave).order_by(
+            RespostaIACache.ultimo_acesso.desc()
+        ).offset(max_registros).scalar_subquery()
+        removidas = (await db.execute(
+            delete(RespostaIACache).where(RespostaIACache.chave.in_(excedentes))
+        )).rowcount
+        await db.commit()
+        return vencidas + removidas
+
+async def remover_relatorios_antigos(meses_mantidos: int = 12) -> int:
+    """Apaga os PDFs guardados de meses mais antigos que a janela mantida."""
+    limite = datetime.now() - relativedelta(months=meses_mantidos)
+    async with get_async_db() as db:
+        resultado = await db.execute(
+            delete(RelatorioMensal).where(
+                RelatorioMensal.ano * 12 + RelatorioMensal.mes < limite.year * 12 + limite.month
+            )
+        )
+        await db.commit()
+        return resultado.rowcount
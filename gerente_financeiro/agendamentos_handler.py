@@ -6,7 +6,9 @@ from telegram.ext import (
     MessageHandler, filters
 )
 
-from database.database import get_db, get_or_create_user
+from sqlalchemy import select
+
+from database.database import get_async_db, get_or_create_user
 from models import Categoria, Agendamento, Usuario
 from .handlers import cancel, criar_teclado_colunas
 
@@ -74,9 +76,8 @@ async def ask_valor(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     try:
         valor = float(update.message.text.replace(',', '.'))
         context.user_data['novo_agendamento']['valor'] = valor
-        db = next(get_db())
-        categorias = db.query(Categoria).order_by(Categoria.nome).all()
-        db.close()
+        async with get_async_db() as db:
+            categorias = (await db.execute(select(Categoria).order_by(Categoria.nome))).scalars().all()
         botoes = [InlineKeyboardButton(c.nome, callback_data=f"ag_cat_{c.id}") for c in categorias]
         teclado = criar_teclado_colunas(botoes, 2)
         teclado.append([InlineKeyboardButton("🏷️ Sem Categoria", callback_data="ag_cat_0")])
@@ -189,34 +190,32 @@ async def save_agendamento(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     await query.answer()
     await query.edit_message_text("💾 Salvando agendamento...")
 
-    db = next(get_db())
     try:
         user_info = query.from_user
-        usuario_db = get_or_create_user(db, user_info.id, user_info.full_name)
         data = context.user_data['novo_agendamento']
-
-        novo_agendamento = Agendamento(
-            id_usuario=usuario_db.id,
-            descricao=data['descricao'],
-            valor=data['valor'],
-            tipo=data['tipo'],
-            id_categoria=data.get('id_categoria'),
-            data_primeiro_evento=data['data_primeiro_evento'],
-            proxima_data_execucao=data['data_primeiro_evento'],
-            frequencia=data['frequencia'],
-            total_parcelas=data.get('total_parcelas'),
-            parcela_atual=0,
-            ativo=True
-        )
-        db.add(novo_agendamento)
-        db.commit()
+        async with get_async_db() as db:
+            usuario_db = await get_or_create_user(db, user_info.id, user_info.full_name)
+
+            novo_agendamento = Agendamento(
+                id_usuario=usuario_db.id,
+                descricao=data['descricao'],
+                valor=data['valor'],
+                tipo=data['tipo'],
+                id_categoria=data.get('id_categoria'),
+                data_primeiro_evento=data['data_primeiro_evento'],
+                proxima_data_execucao=data['data_primeiro_evento'],
+                frequencia=data['frequencia'],
+                total_parcelas=data.get('total_parcelas'),
+                parcela_atual=0,
+                ativo=True
+            )
+            db.add(novo_agendamento)
+            await db.commit()
         await query.edit_message_text("✅ Agendamento criado com sucesso!")
     except Exception as e:
-        db.rollback()
         logger.error(f"Erro ao salvar agendamento: {e}", exc_info=True)
         await query.edit_message_text("❌ Erro ao salvar o agendamento.")
     finally:
-        db.close()
         context.user_data.clear()
     return ConversationHandler.END
 
@@ -224,10 +223,13 @@ async def listar_agendamentos(update: Update, context: ContextTypes.DEFAULT_TYPE
     query = update.callback_query
     user_id = query.from_user.id
     
-    db = next(get_db())
-    usuario_db = get_or_create_user(db, user_id, "")
-    agendamentos = db.query(Agendamento).filter(Agendamento.id_usuario == usuario_db.id, Agendamento.ativo == True).order_by(Agendamento.proxima_data_execucao.asc()).all()
-    db.close()
+    async with get_async_db() as db:
+        usuario_db = await get_or_create_user(db, user_id, "")
+        agendamentos = (await db.execute(
+            select(Agendamento)
+            .filter(Agendamento.id_usuario == usuario_db.id, Agendamento.ativo == True)
+            .order_by(Agendamento.proxima_data_execucao.asc())
+        )).scalars().all()
 
     if not agendamentos:
         await query.edit_message_text("Você não tem nenhum agendamento ativo.")
@@ -258,25 +260,26 @@ async def cancelar_agendamento_callback(update: Update, context: ContextTypes.DE
     agendamento_id = int(query.data.split('_')[-1])
     user_id = query.from_user.id
 
-    db = next(get_db())
     try:
-        ag_para_cancelar = db.query(Agendamento).join(Usuario).filter(
-            Agendamento.id == agendamento_id,
-            Usuario.telegram_id == user_id
-        ).first()
+        async with get_async_db() as db:
+            ag_para_cancelar = (await db.execute(
+                select(Agendamento).join(Usuario).filter(
+                    Agendamento.id == agendamento_id,
+                    Usuario.telegram_id == user_id
+                )
+            )).scalars().first()
+
+            if ag_para_cancelar:
+                ag_para_cancelar.ativo = False
+                await db.commit()
 
         if ag_para_cancelar:
-            ag_para_cancelar.ativo = False
-            db.commit()
             await query.edit_message_text("✅ Agendamento cancelado com sucesso.", reply_markup=None)
         else:
             await query.edit_message_text("❌ Erro: Agendamento não encontrado ou você não tem permissão.", reply_markup=None)
     except Exception as e:
-        db.rollback()
         logger.error(f"Erro ao cancelar agendamento {agendamento_id}: {e}", exc_info=True)
         await query.edit_message_text("❌ Ocorreu um erro inesperado.", reply_markup=None)
-    finally:
-        db.close()
 
 agendamento_conv = ConversationHandler(
     entry_points=[CallbackQueryHandler(agendamento_menu_callback, pattern='^agendamento_novo$')],
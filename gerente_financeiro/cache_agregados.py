@@ -0,0 +1,151 @@
+# gerente_financeiro/cache_agregados.py
+"""
+Cache TTL + LRU dos dados agregados por usuário e período (gráficos, relatórios).
+
+Cada entrada guarda apenas o resultado compacto de uma agregação SQL, com
+chave (telegram_id, chave_da_consulta). A expiração é por entrada e a
+invalidação, disparada pelos ganchos de escrita de lançamentos, atinge só
+as entradas do usuário que mudou.
+"""
+import logging
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL_SEGUNDOS = 300
+CACHE_MAX_ENTRADAS = 1000
+CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+Chave = Tuple[int, Hashable]
+
+
+class _Entrada:
+    __slots__ = ("dados", "expira_em", "hits", "tamanho")
+
+    def __init__(self, dados: Any, tamanho: int):
+        self.dados = dados
+        self.expira_em = time.monotonic() + CACHE_TTL_SEGUNDOS
+        self.hits = 0
+        self.tamanho = tamanho
+
+
+_entradas: "OrderedDict[Chave, _Entrada]" = OrderedDict()
+_chaves_por_usuario: Dict[int, Set[Chave]] = {}
+# Incrementada a cada invalidação: um cálculo iniciado antes dela não é guardado
+_geracao: Dict[int, int] = {}
+_total_bytes = 0
+_contadores = {"hits": 0, "misses": 0, "expiradas": 0, "evictions": 0, "invalidacoes": 0}
+
+
+def _estimar_tamanho(obj: Any) -> int:
+    """Tamanho aproximado em bytes de listas/tuplas/dicts de valores simples."""
+    tamanho = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        tamanho += sum(_estimar_tamanho(k) + _estimar_tamanho(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        tamanho += sum(_estimar_tamanho(item) for item in obj)
+    return tamanho
+
+
+def _remover(chave: Chave) -> None:
+    global _total_bytes
+    entrada = _entradas.pop(chave, None)
+    if entrada is None:
+        return
+    _total_bytes -= entrada.tamanho
+    chaves = _chaves_por_usuario.get(chave[0])
+    if chaves is not None:
+        chaves.discard(chave)
+        if not chaves:
+            del _chaves_por_usuario[chave[0]]
+
+
+def _evict() -> None:
+    while _entradas and (len(_entradas) > CACHE_MAX_ENTRADAS or _total_bytes > CACHE_MAX_BYTES):
+        chave = next(iter(_entradas))
+        _remover(chave)
+        _contadores["evictions"] += 1
+
+
+def obter(telegram_id: int, chave: Hashable) -> Optional[Any]:
+    """Retorna os dados em cache ou None (ausentes ou expirados)."""
+    chave_completa = (telegram_id, chave)
+    entrada = _entradas.get(chave_completa)
+    if entrada is None:
+        _contadores["misses"] += 1
+        return None
+    if entrada.expira_em <= time.monotonic():
+        _remover(chave_completa)
+        _contadores["expiradas"] += 1
+        _contadores["misses"] += 1
+        return None
+    _entradas.move_to_end(chave_completa)
+    entrada.hits += 1
+    _contadores["hits"] += 1
+    return entrada.dados
+
+
+def guardar(telegram_id: int, chave: Hashable, dados: Any) -> None:
+    global _total_bytes
+    chave_completa = (telegram_id, chave)
+    _remover(chave_completa)
+    entrada = _Entrada(dados, _estimar_tamanho(dados))
+    _entradas[chave_completa] = entrada
+    _chaves_por_usuario.setdefault(telegram_id, set()).add(chave_completa)
+    _total_bytes += entrada.tamanho
+    _evict()
+
+
+async def obter_ou_calcular(telegram_id: int, chave: Hashable, calcular: Callable[[], Awaitable[Any]]) -> Any:
+    """Retorna do cache ou aguarda `calcular()` e guarda o resultado."""
+    dados = obter(telegram_id, chave)
+    if dados is not None:
+        return dados
+    geracao = _geracao.get(telegram_id, 0)
+    dados = await calcular()
+    # Se o usuário gravou algo enquanto a consulta rodava, o resultado já nasce velho
+    if _geracao.get(telegram_id, 0) == geracao:
+        guardar(telegram_id, chave, dados)
+    return dados
+
+
+def invalidar_usuario(telegram_id: int) -> None:
+    """Descarta todas as entradas de um usuário (chamado após gravar lançamentos)."""
+    _geracao[telegram_id] = _geracao.get(telegram_id, 0) + 1
+    chaves = _chaves_por_usuario.get(telegram_id)
+    if not chaves:
+        return
+    for chave in list(chaves):
+        _remover(chave)
+    _contadores["invalidacoes"] += 1
+    logger.debug(f"Agregados em cache do usuário {telegram_id} invalidados.")
+
+
+def get_cache_stats(max_entradas: int = 20) -> Dict[str, Any]:
+    """Estatísticas globais e das entradas mais acessadas."""
+    hits, misses = _contadores["hits"], _contadores["misses"]
+    agora = time.monotonic()
+    mais_acessadas = sorted(_entradas.items(), key=lambda item: item[1].hits, reverse=True)[:max_entradas]
+    return {
+        **_contadores,
+        "hit_rate": hits / (hits + misses) if (hits + misses) > 0 else 0,
+        "entradas": len(_entradas),
+        "usuarios": len(_chaves_por_usuario),
+        "bytes": _total_bytes,
+        "max_entradas": CACHE_MAX_ENTRADAS,
+        "max_bytes": CACHE_MAX_BYTES,
+        "ttl_segundos": CACHE_TTL_SEGUNDOS,
+        "por_entrada": [
+            {
+                "usuario": telegram_id,
+                "chave": chave,
+                "hits": entrada.hits,
+                "bytes": entrada.tamanho,
+                "expira_em_s": round(entrada.expira_em - agora, 1),
+            }
+            for (telegram_id, chave), entrada in mais_acessadas
+        ],
+    }
@@ -0,0 +1,139 @@
+# gerente_financeiro/cache_respostas_ia.py
+"""
+Cache das respostas da IA para tarefas determinísticas: OCR de cupons, leitura de
+faturas e análise/categorização de extratos.
+
+A resposta depende só do prompt (texto extraído + categorias + instruções), então
+o mesmo cupom reenviado ou o mesmo extrato reimportado não precisa pagar o Gemini
+de novo. A chave é o sha256 de tarefa + versão da tarefa + modelo + prompt
+completo: mudar o template muda o prompt e, com ele, a chave.
+
+As respostas ficam no banco (sobrevivem a reinícios), com validade de
+IA_CACHE_TTL_HORAS e no máximo IA_CACHE_MAX_REGISTROS linhas (podadas pelo job
+diário), e as mais recentes também num LRU em memória. Só entram respostas com um
+JSON válido, para que uma resposta malformada não seja repetida para sempre.
+"""
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+import config
+from database.database import buscar_resposta_ia_cache, salvar_resposta_ia_cache, podar_cache_respostas_ia
+from . import gateway_ia
+
+logger = logging.getLogger(__name__)
+
+# Aumente a versão de uma tarefa quando a interpretação da resposta mudar sem o prompt mudar
+VERSOES_TAREFA = {
+    "ocr": 1,
+    "fatura": 1,
+    "extrato": 1,
+    "categorizacao": 1,
+}
+
+# chave -> (resposta, instante de criação em time.time())
+_memoria: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+_contadores = {"hits_memoria": 0, "hits_banco": 0, "misses": 0, "gravacoes": 0, "descartadas": 0, "erros": 0}
+
+
+def calcular_chave(tarefa: str, modelo: str, prompt: str) -> str:
+    conteudo = f"{tarefa}\x1f{VERSOES_TAREFA[tarefa]}\x1f{modelo}\x1f{prompt}"
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+
+def _tem_json_valido(texto: str) -> bool:
+    match = re.search(r'\{.*\}', texto or "", re.DOTALL)
+    if not match:
+        return False
+    try:
+        json.loads(match.group(0))
+        return True
+    except json.JSONDecodeError:
+        return False
+
+
+def _ttl_segundos() -> float:
+    return config.IA_CACHE_TTL_HORAS * 3600
+
+
+def _buscar_em_memoria(chave: str) -> Optional[str]:
+    item = _memoria.get(chave)
+    if item is None:
+        return None
+    resposta, criado_em = item
+    if time.time() - criado_em > _ttl_segundos():
+        del _memoria[chave]
+        return None
+    _memoria.move_to_end(chave)
+    return resposta
+
+
+def _guardar_em_memoria(chave: str, resposta: str, criado_em: Optional[float] = None) -> None:
+    _memoria[chave] = (resposta, criado_em or time.time())
+    _memoria.move_to_end(chave)
+    while len(_memoria) > config.IA_CACHE_MAX_MEMORIA:
+        _memoria.popitem(last=False)
+
+
+async def gerar_texto_em_cache(tarefa: str, prompt: str, *, modelo: Optional[str] = None, **kwargs) -> str:
+    """
+    Como gateway_ia.gerar_texto, mas devolve a resposta guardada se o mesmo prompt
+    já foi respondido para a tarefa. Os demais argumentos vão para o gateway.
+    """
+    modelo = modelo or config.GEMINI_MODEL_NAME
+    chave = calcular_chave(tarefa, modelo, prompt)
+
+    resposta = _buscar_em_memoria(chave)
+    if resposta is not None:
+        _contadores["hits_memoria"] += 1
+        logger.info(f"Cache IA: resposta de '{tarefa}' vinda da memória.")
+        return resposta
+
+    try:
+        validade = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=_ttl_segundos())
+        resposta = await buscar_resposta_ia_cache(chave, validade)
+    except Exception as e:
+        # Sem o cache a tarefa continua funcionando, só mais cara
+        _contadores["erros"] += 1
+        logger.warning(f"Cache IA indisponível na leitura ({tarefa}): {e}")
+        resposta = None
+    if resposta is not None:
+        _contadores["hits_banco"] += 1
+        logger.info(f"Cache IA: resposta de '{tarefa}' vinda do banco.")
+        _guardar_em_memoria(chave, resposta)
+        return resposta
+
+    _contadores["misses"] += 1
+    resposta = await gateway_ia.gerar_texto(prompt, modelo=modelo, **kwargs)
+    if not _tem_json_valido(resposta):
+        _contadores["descartadas"] += 1
+        return resposta
+
+    _guardar_em_memoria(chave, resposta)
+    try:
+        await salvar_resposta_ia_cache(chave, tarefa, modelo, resposta)
+        _contadores["gravacoes"] += 1
+    except Exception as e:
+        _contadores["erros"] += 1
+        logger.warning(f"Cache IA indisponível na gravação ({tarefa}): {e}")
+    return resposta
+
+
+async def podar_cache() -> int:
+    """Remove do banco as respostas vencidas e as excedentes; retorna quantas saíram."""
+    return await podar_cache_respostas_ia(config.IA_CACHE_TTL_HORAS, config.IA_CACHE_MAX_REGISTROS)
+
+
+def get_cache_stats() -> Dict[str, float]:
+    hits = _contadores["hits_memoria"] + _contadores["hits_banco"]
+    consultas = hits + _contadores["misses"]
+    return {
+        "em_memoria": len(_memoria),
+        **_contadores,
+        "taxa_acerto": round(hits / consultas, 3) if consultas else 0.0,
+    }
@@ -0,0 +1,272 @@
+# gerente_financeiro/contexto_cache.py
+"""
+Cache por usuário do contexto financeiro usado pelo /gerente.
+
+O snapshot de cada usuário (lançamentos já serializados + resumo mensal) é
+montado uma única vez a partir do banco e depois mantido de forma incremental
+pelos pontos que inserem, editam ou apagam lançamentos. Assim cada pergunta ao
+gerente não precisa recarregar todo o histórico nem refazer o resumo.
+"""
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.database import COLUNAS_LANCAMENTO_LOTE
+from models import Categoria, Conta, Lancamento, Objetivo, Usuario
+from . import cache_agregados
+
+logger = logging.getLogger(__name__)
+
+# Limites do LRU: quantidade de usuários e total de lançamentos em memória
+CACHE_MAX_USUARIOS = 200
+CACHE_MAX_LANCAMENTOS = 100_000
+
+_snapshots: "OrderedDict[int, SnapshotContexto]" = OrderedDict()
+_total_lancamentos = 0
+# telegram_id -> nº de alterações recebidas enquanto um snapshot está sendo montado
+_construindo: Dict[int, int] = {}
+_nomes_categoria: Dict[int, str] = {}
+_cache_contadores = {"hits": 0, "misses": 0, "reconstrucoes": 0, "atualizacoes": 0, "evictions": 0}
+
+
+class SnapshotContexto:
+    """Lançamentos serializados e resumo mensal de um usuário."""
+
+    def __init__(self):
+        self.lancamentos: Dict[int, Dict[str, Any]] = {}
+        self.resumo_mensal: Dict[str, Dict[str, float]] = {}
+        self._qtd_por_mes: Dict[str, int] = {}
+        self._json_chave = None
+        self._json: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.lancamentos)
+
+    def _somar(self, entrada: Dict[str, Any], sinal: int) -> None:
+        mes_ano = entrada["_mes"]
+        valores = self.resumo_mensal.setdefault(mes_ano, {"receitas": 0.0, "despesas": 0.0})
+        campo = "receitas" if entrada["tipo"] == "Entrada" else "despesas"
+        valores[campo] += sinal * entrada["valor"]
+        self._qtd_por_mes[mes_ano] = self._qtd_por_mes.get(mes_ano, 0) + sinal
+        if self._qtd_por_mes[mes_ano] <= 0:
+            del self._qtd_por_mes[mes_ano]
+            del self.resumo_mensal[mes_ano]
+
+    def aplicar(self, lancamento_id: int, entrada: Optional[Dict[str, Any]]) -> None:
+        """Insere/atualiza (entrada) ou remove (entrada=None) um lançamento."""
+        antiga = self.lancamentos.pop(lancamento_id, None)
+        if antiga is not None:
+            self._somar(antiga, -1)
+        if entrada is not None:
+            self.lancamentos[lancamento_id] = entrada
+            self._somar(entrada, +1)
+        self._json_chave = None
+
+    def renderizar(self, contas: List[str], metas: List[Dict[str, str]]) -> str:
+        data_atual = datetime.now().strftime('%d/%m/%Y')
+        chave = (data_atual, tuple(contas), tuple(tuple(m.values()) for m in metas))
+        if self._json_chave == chave:
+            return self._json
+
+        if not self.lancamentos:
+            self._json = json.dumps({"resumo": "Nenhum dado financeiro encontrado."}, indent=2, ensure_ascii=False)
+        else:
+            ordenados = sorted(self.lancamentos.items(), key=lambda item: (item[1]["_dt"], item[0]))
+            data_minima = ordenados[0][1]["_dt"].strftime('%d/%m/%Y')
+            data_maxima = ordenados[-1][1]["_dt"].strftime('%d/%m/%Y')
+            contexto_completo = {
+                "informacoes_gerais": {
+                    "data_atual": data_atual,
+                    "periodo_disponivel": f"{data_minima} a {data_maxima}",
+                    "contas_cadastradas": contas,
+                    "metas_financeiras": metas
+                },
+                "resumo_por_mes": {
+                    mes: {"receitas": f"R$ {v['receitas']:.2f}", "despesas": f"R$ {v['despesas']:.2f}"}
+                    for mes, v in sorted(self.resumo_mensal.items())
+                },
+                "todos_lancamentos": [
+                    {k: v for k, v in entrada.items() if not k.startswith("_")}
+                    for _, entrada in ordenados
+                ]
+            }
+            self._json = json.dumps(contexto_completo, indent=2, ensure_ascii=False)
+        self._json_chave = chave
+        return self._json
+
+
+def _entrada(data_transacao: datetime, descricao: str, valor, tipo: str,
+             id_categoria: Optional[int], forma_pagamento: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Entrada do snapshot para um lançamento. Retorna None se a categoria for desconhecida."""
+    if id_categoria is not None and id_categoria not in _nomes_categoria:
+        return None
+    return {
+        "data": data_transacao.strftime('%Y-%m-%d'),  # Formato ISO para facilitar o parse
+        "descricao": descricao,
+        "valor": float(valor),
+        "tipo": tipo,
+        "categoria": _nomes_categoria.get(id_categoria, "Sem Categoria"),
+        "conta": forma_pagamento,
+        "_dt": data_transacao,
+        "_mes": data_transacao.strftime('%Y-%m'),
+    }
+
+
+def _serializar(lancamento: Lancamento) -> Optional[Dict[str, Any]]:
+    """Converte um Lancamento para a entrada do snapshot."""
+    return _entrada(
+        lancamento.data_transacao, lancamento.descricao, lancamento.valor, lancamento.tipo,
+        lancamento.id_categoria, lancamento.forma_pagamento
+    )
+
+
+def _serializar_linha(linha: tuple) -> Optional[Dict[str, Any]]:
+    """Converte uma tupla de importação (ordem de COLUNAS_LANCAMENTO_LOTE) para a entrada do snapshot."""
+    campos = dict(zip(COLUNAS_LANCAMENTO_LOTE, linha))
+    return _entrada(
+        campos['data_transacao'], campos['descricao'], campos['valor'], campos['tipo'],
+        campos['id_categoria'], campos['forma_pagamento']
+    )
+
+
+def _evict() -> None:
+    global _total_lancamentos
+    while _snapshots and (len(_snapshots) > CACHE_MAX_USUARIOS or _total_lancamentos > CACHE_MAX_LANCAMENTOS):
+        telegram_id, snapshot = _snapshots.popitem(last=False)
+        _total_lancamentos -= len(snapshot)
+        _cache_contadores["evictions"] += 1
+        logger.debug(f"Snapshot de contexto do usuário {telegram_id} removido do cache (LRU).")
+
+
+async def _montar_snapshot(db: AsyncSession, usuario: Usuario) -> SnapshotContexto:
+    categorias = (await db.execute(select(Categoria.id, Categoria.nome))).all()
+    _nomes_categoria.update({id_cat: nome for id_cat, nome in categorias})
+
+    lancamentos = (await db.execute(
+        select(Lancamento).filter(Lancamento.id_usuario == usuario.id)
+    )).scalars().all()
+
+    snapshot = SnapshotContexto()
+    for lancamento in lancamentos:
+        snapshot.aplicar(lancamento.id, _serializar(lancamento))
+    return snapshot
+
+
+async def obter_contexto_financeiro(db: AsyncSession, usuario: Usuario) -> str:
+    """Retorna o JSON de contexto do usuário, montando o snapshot apenas se ele não estiver em cache."""
+    global _total_lancamentos
+    telegram_id = usuario.telegram_id
+
+    snapshot = _snapshots.get(telegram_id)
+    if snapshot is not None:
+        _snapshots.move_to_end(telegram_id)
+        _cache_contadores["hits"] += 1
+    else:
+        _cache_contadores["misses"] += 1
+        _construindo.setdefault(telegram_id, 0)
+        alteracoes_inicio = _construindo[telegram_id]
+        try:
+            snapshot = await _montar_snapshot(db, usuario)
+        finally:
+            alteracoes_fim = _construindo.pop(telegram_id, None)
+        _cache_contadores["reconstrucoes"] += 1
+
+        # Só guarda o snapshot se nenhum lançamento mudou enquanto ele era montado
+        if alteracoes_fim == alteracoes_inicio and telegram_id not in _snapshots:
+            _snapshots[telegram_id] = snapshot
+            _total_lancamentos += len(snapshot)
+            _evict()
+
+    # Contas e metas são poucas e mudam por outros fluxos: sempre lidas do banco
+    contas_db = (await db.execute(select(Conta.nome).filter(Conta.id_usuario == usuario.id))).scalars().all()
+    metas_db = (await db.execute(select(Objetivo).filter(Objetivo.id_usuario == usuario.id))).scalars().all()
+    metas_financeiras = [
+        {"descricao": o.descricao, "valor_meta": f"R$ {o.valor_meta:.2f}", "valor_atual": f"R$ {o.valor_atual:.2f}"}
+        for o in metas_db
+    ]
+    return snapshot.renderizar(list(contas_db), metas_financeiras)
+
+
+# =============================================================================
+#  GANCHOS DE ATUALIZAÇÃO INCREMENTAL
+#  Devem ser chamados depois do commit que alterou os lançamentos. Também
+#  descartam os agregados em cache (gráficos) do mesmo usuário.
+# =============================================================================
+
+def _registrar_entradas(telegram_id: int, pares: Iterable[Tuple[int, Optional[Dict[str, Any]]]]) -> None:
+    global _total_lancamentos
+    cache_agregados.invalidar_usuario(telegram_id)
+    if telegram_id in _construindo:
+        _construindo[telegram_id] += 1
+    snapshot = _snapshots.get(telegram_id)
+    if snapshot is None:
+        return
+
+    antes = len(snapshot)
+    for lancamento_id, entrada in pares:
+        if entrada is None:
+            # Categoria nova que ainda não conhecemos: mais simples remontar na próxima pergunta
+            _total_lancamentos += len(snapshot) - antes
+            invalidar_contexto(telegram_id)
+            return
+        snapshot.aplicar(lancamento_id, entrada)
+    _total_lancamentos += len(snapshot) - antes
+    _cache_contadores["atualizacoes"] += 1
+    _evict()
+
+
+def registrar_lancamentos(telegram_id: int, lancamentos: Iterable[Lancamento]) -> None:
+    """Insere ou atualiza lançamentos no snapshot do usuário, se ele estiver em cache."""
+    _registrar_entradas(telegram_id, ((lancamento.id, _serializar(lancamento)) for lancamento in lancamentos))
+
+
+def registrar_linhas(telegram_id: int, inseridos: Iterable[Tuple[int, tuple]]) -> None:
+    """
+    Acrescenta ao snapshot os lançamentos importados em lote: pares (id, tupla) como
+    devolvidos por inserir_lancamentos_em_lote, sem recarregar nada do banco.
+    """
+    _registrar_entradas(telegram_id, ((lancamento_id, _serializar_linha(linha)) for lancamento_id, linha in inseridos))
+
+
+def remover_lancamento(telegram_id: int, lancamento_id: int) -> None:
+    """Remove um lançamento apagado do snapshot do usuário."""
+    global _total_lancamentos
+    cache_agregados.invalidar_usuario(telegram_id)
+    if telegram_id in _construindo:
+        _construindo[telegram_id] += 1
+    snapshot = _snapshots.get(telegram_id)
+    if snapshot is None:
+        return
+
+    antes = len(snapshot)
+    snapshot.aplicar(lancamento_id, None)
+    _total_lancamentos += len(snapshot) - antes
+    _cache_contadores["atualizacoes"] += 1
+    _evict()
+
+
+def invalidar_contexto(telegram_id: int) -> None:
+    """Descarta o snapshot do usuário (ex.: exclusão de todos os dados)."""
+    global _total_lancamentos
+    cache_agregados.invalidar_usuario(telegram_id)
+    if telegram_id in _construindo:
+        _construindo[telegram_id] += 1
+    snapshot = _snapshots.pop(telegram_id, None)
+    if snapshot is not None:
+        _total_lancamentos -= len(snapshot)
+
+
+def get_contexto_cache_stats() -> Dict[str, Any]:
+    """Retorna estatísticas do cache de contexto."""
+    return {
+        "usuarios": len(_snapshots),
+        "lancamentos": _total_lancamentos,
+        "max_usuarios": CACHE_MAX_USUARIOS,
+        "max_lancamentos": CACHE_MAX_LANCAMENTOS,
+        **_cache_contadores,
+    }
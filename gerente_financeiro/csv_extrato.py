@@ -0,0 +1,275 @@
+# gerente_financeiro/csv_extrato.py
+"""
+Importação determinística de extratos CSV.
+
+Infere quais colunas são data, descrição, valor (ou débito/crédito) e tipo,
+a partir do cabeçalho e de uma amostra das linhas. O mapeamento encontrado é
+guardado por assinatura de cabeçalho (ver `buscar_perfil_csv`), então o mesmo
+layout de banco não precisa ser inferido de novo nos meses seguintes. A IA só
+entra quando o arquivo não pode ser mapeado.
+"""
+import csv
+import hashlib
+import io
+import logging
+import re
+import unicodedata
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional, Tuple
+
+from database.database import buscar_perfil_csv, salvar_perfil_csv
+
+logger = logging.getLogger(__name__)
+
+VERSAO_MAPEAMENTO = 1
+LINHAS_AMOSTRA = 50
+TAXA_MINIMA_VALIDAS = 0.8   # fração da amostra que precisa ser interpretável na coluna
+
+FORMATOS_DATA = ['%d/%m/%Y', '%d/%m/%y', '%Y-%m-%d', '%d-%m-%Y', '%d.%m.%Y', '%Y/%m/%d']
+
+PALAVRAS_DATA = ('data', 'date', 'dt ')
+PALAVRAS_DESCRICAO = ('descri', 'historico', 'lancamento', 'estabelecimento', 'detalhe', 'memo', 'titulo', 'transacao')
+PALAVRAS_VALOR = ('valor', 'value', 'amount', 'quantia', 'montante')
+PALAVRAS_DEBITO = ('debit', 'saida', 'retirada')
+PALAVRAS_CREDITO = ('credit', 'entrada', 'deposito')
+PALAVRAS_TIPO = ('tipo', 'natureza', 'd/c', 'c/d', 'dc')
+PALAVRAS_IGNORADAS = ('saldo', 'balance', 'limite')
+
+_PADRAO_NUMERO = re.compile(r'^[-+(]?\s*(R\$)?\s*[-+]?[\d.,]*\d\)?\s*[CD]?$', re.IGNORECASE)
+
+
+def _normalizar(texto: str) -> str:
+    sem_acento = unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'\s+', ' ', sem_acento.strip().lower())
+
+
+def _decodificar(file_bytes: bytes) -> str:
+    for encoding in ('utf-8-sig', 'cp1252', 'latin-1'):
+        try:
+            return file_bytes.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    raise ValueError("Não foi possível decodificar o arquivo CSV")
+
+
+def _detectar_delimitador(texto: str) -> str:
+    linhas = [l for l in texto.splitlines()[:10] if l.strip()]
+    melhor, melhor_pontuacao = ';', 0
+    for delim in (';', ',', '\t', '|'):
+        contagens = [len(next(csv.reader([l], delimiter=delim))) for l in linhas]
+        if not contagens:
+            continue
+        # Prefere o delimitador que gera o mesmo número (>1) de colunas em mais linhas
+        mais_comum = max(set(contagens), key=contagens.count)
+        pontuacao = contagens.count(mais_comum) * (mais_comum if mais_comum > 1 else 0)
+        if pontuacao > melhor_pontuacao:
+            melhor, melhor_pontuacao = delim, pontuacao
+    return melhor
+
+
+def _parse_data(valor: str, formato: str) -> Optional[datetime]:
+    try:
+        return datetime.strptime(valor.strip()[:10], formato)
+    except ValueError:
+        return None
+
+
+def _parse_valor(valor: str, decimal: str) -> Optional[Decimal]:
+    """Converte '1.234,56', '-1,234.56', '(12,00)', 'R$ 10,00 D' em Decimal com sinal."""
+    texto = valor.strip()
+    if not texto or not _PADRAO_NUMERO.match(texto):
+        return None
+    negativo = texto.startswith('-') or (texto.startswith('(') and texto.endswith(')')) or texto.upper().endswith('D')
+    digitos = re.sub(r'[^\d.,]', '', texto)
+    if decimal == ',':
+        digitos = digitos.replace('.', '').replace(',', '.')
+    else:
+        digitos = digitos.replace(',', '')
+    try:
+        numero = Decimal(digitos)
+    except InvalidOperation:
+        return None
+    return -numero if negativo else numero
+
+
+def _detectar_decimal(valores: List[str]) -> str:
+    virgula = sum(1 for v in valores if re.search(r',\d{1,2}\s*[CD]?\)?$', v.strip(), re.IGNORECASE))
+    ponto = sum(1 for v in valores if re.search(r'\.\d{1,2}\s*[CD]?\)?$', v.strip(), re.IGNORECASE))
+    return ',' if virgula >= ponto else '.'
+
+
+def ler_csv(file_bytes: bytes) -> Tuple[List[str], List[List[str]]]:
+    """
+    Retorna (cabeçalho, linhas). Pula linhas de preâmbulo (nome do banco, agência...)
+    escolhendo como cabeçalho a primeira linha seguida de uma linha com data.
+    """
+    texto = _decodificar(file_bytes)
+    delimitador = _detectar_delimitador(texto)
+    linhas = [l for l in csv.reader(io.StringIO(texto), delimiter=delimitador, skipinitialspace=True) if any(c.strip() for c in l)]
+
+    for i in range(min(len(linhas) - 1, 15)):
+        proxima = linhas[i + 1]
+        if any(_parse_data(c, f) for c in proxima for f in FORMATOS_DATA) \
+                and not any(_parse_data(c, f) for c in linhas[i] for f in FORMATOS_DATA):
+            cabecalho = [c.strip() for c in linhas[i]]
+            return cabecalho, [l for l in linhas[i + 1:] if len(l) >= len(cabecalho) - 1]
+    return [], []
+
+
+def assinatura_cabecalho(cabecalho: List[str]) -> str:
+    """Identifica o layout do banco pelo cabeçalho normalizado."""
+    base = '|'.join(_normalizar(c) for c in cabecalho)
+    return hashlib.sha1(base.encode('utf-8')).hexdigest()[:16]
+
+
+def _colunas_por_nome(cabecalho_norm: List[str], palavras: Tuple[str, ...], usadas: set) -> List[int]:
+    return [
+        i for i, nome in enumerate(cabecalho_norm)
+        if i not in usadas
+        and any(p in f"{nome} " for p in palavras)
+        and not any(p in nome for p in PALAVRAS_IGNORADAS)
+    ]
+
+
+def _taxa(amostra: List[List[str]], indice: int, teste) -> float:
+    valores = [l[indice] for l in amostra if indice < len(l) and l[indice].strip()]
+    if not valores:
+        return 0.0
+    return sum(1 for v in valores if teste(v)) / len(valores)
+
+
+def inferir_mapeamento(cabecalho: List[str], linhas: List[List[str]]) -> Optional[Dict]:
+    """Descobre o papel de cada coluna. Retorna None se o layout não for reconhecido."""
+    if not cabecalho or not linhas:
+        return None
+    amostra = linhas[:LINHAS_AMOSTRA]
+    cabecalho_norm = [_normalizar(c) for c in cabecalho]
+    usadas: set = set()
+    mapeamento: Dict = {"versao": VERSAO_MAPEAMENTO}
+
+    # --- Data: coluna + formato com maior taxa de conversão ---
+    candidatas = _colunas_por_nome(cabecalho_norm, PALAVRAS_DATA, usadas) or range(len(cabecalho))
+    melhor = (0.0, None, None)
+    for i in candidatas:
+        for formato in FORMATOS_DATA:
+            taxa = _taxa(amostra, i, lambda v, f=formato: _parse_data(v, f) is not None)
+            if taxa > melhor[0]:
+                melhor = (taxa, i, formato)
+    if melhor[0] < TAXA_MINIMA_VALIDAS:
+        return None
+    mapeamento["data"], mapeamento["formato_data"] = melhor[1], melhor[2]
+    usadas.add(melhor[1])
+
+    # --- Valor único, ou par débito/crédito ---
+    def _numerica(i: int) -> bool:
+        return _taxa(amostra, i, lambda v: _parse_valor(v, '.') is not None) >= TAXA_MINIMA_VALIDAS
+
+    colunas_valor = [i for i in _colunas_por_nome(cabecalho_norm, PALAVRAS_VALOR, usadas) if _numerica(i)]
+    colunas_debito = _colunas_por_nome(cabecalho_norm, PALAVRAS_DEBITO, usadas)
+    colunas_credito = _colunas_por_nome(cabecalho_norm, PALAVRAS_CREDITO, usadas)
+    if colunas_valor:
+        mapeamento["valor"] = colunas_valor[0]
+        usadas.add(colunas_valor[0])
+    elif colunas_debito and colunas_credito:
+        mapeamento["debito"], mapeamento["credito"] = colunas_debito[0], colunas_credito[0]
+        usadas.update((colunas_debito[0], colunas_credito[0]))
+    else:
+        return None
+
+    colunas_numericas = [mapeamento[k] for k in ("valor", "debito", "credito") if k in mapeamento]
+    mapeamento["decimal"] = _detectar_decimal([l[i] for l in amostra for i in colunas_numericas if i < len(l)])
+
+    # --- Tipo D/C (opcional) ---
+    for i in _colunas_por_nome(cabecalho_norm, PALAVRAS_TIPO, usadas):
+        valores = {_normalizar(l[i]) for l in amostra if i < len(l) and l[i].strip()}
+        if valores and len(valores) <= 4:
+            mapeamento["tipo"] = i
+            usadas.add(i)
+            break
+
+    # --- Descrição: por nome ou a coluna de texto mais longa ---
+    colunas_desc = _colunas_por_nome(cabecalho_norm, PALAVRAS_DESCRICAO, usadas)
+    if not colunas_desc:
+        texto = [i for i in range(len(cabecalho)) if i not in usadas and not _numerica(i)]
+        colunas_desc = sorted(texto, key=lambda i: -sum(len(l[i]) for l in amostra if i < len(l)))
+    if not colunas_desc:
+        return None
+    mapeamento["descricao"] = colunas_desc[0]
+    return mapeamento
+
+
+def _tipo_por_coluna(valor: str) -> Optional[str]:
+    texto = _normalizar(valor)
+    if texto in ('c', 'cr', 'credito', 'entrada', '+'):
+        return 'Entrada'
+    if texto in ('d', 'db', 'debito', 'saida', '-'):
+        return 'Saída'
+    return None
+
+
+def aplicar_mapeamento(linhas: List[List[str]], mapeamento: Dict) -> List[Dict]:
+    """Converte as linhas em transações; linhas de saldo/total que não convertem são ignoradas."""
+    transacoes = []
+    decimal = mapeamento["decimal"]
+    for linha in linhas:
+        try:
+            data = _parse_data(linha[mapeamento["data"]], mapeamento["formato_data"])
+            if "valor" in mapeamento:
+                valor = _parse_valor(linha[mapeamento["valor"]], decimal)
+            else:
+                debito = _parse_valor(linha[mapeamento["debito"]], decimal) or Decimal(0)
+                credito = _parse_valor(linha[mapeamento["credito"]], decimal) or Decimal(0)
+                valor = credito - abs(debito)
+            descricao = linha[mapeamento["descricao"]].strip()
+        except IndexError:
+            continue
+        if not data or valor is None or valor == 0 or not descricao:
+            continue
+        if _normalizar(descricao).startswith(PALAVRAS_IGNORADAS):
+            continue
+
+        tipo = _tipo_por_coluna(linha[mapeamento["tipo"]]) if "tipo" in mapeamento and mapeamento["tipo"] < len(linha) else None
+        transacoes.append({
+            "data": data.strftime('%d/%m/%Y'),
+            "descricao": descricao,
+            "valor": float(abs(valor)),
+            "tipo_transacao": tipo or ("Entrada" if valor > 0 else "Saída"),
+        })
+    return transacoes
+
+
+async def importar_csv_estruturado(file_bytes: bytes, telegram_user_id: int) -> Optional[List[Dict]]:
+    """
+    Tenta importar o CSV sem IA: usa o perfil salvo para o cabeçalho ou infere um novo.
+    Retorna None quando o arquivo não pode ser mapeado (o fluxo cai para a IA).
+    """
+    try:
+        cabecalho, linhas = ler_csv(file_bytes)
+    except (ValueError, csv.Error) as e:
+        logger.warning(f"CSV não pôde ser lido de forma estruturada: {e}")
+        return None
+    if not cabecalho:
+        return None
+
+    assinatura = assinatura_cabecalho(cabecalho)
+    mapeamento = await buscar_perfil_csv(telegram_user_id, assinatura)
+    if mapeamento and mapeamento.get("versao") == VERSAO_MAPEAMENTO:
+        transacoes = aplicar_mapeamento(linhas, mapeamento)
+        if len(transacoes) >= TAXA_MINIMA_VALIDAS * len(linhas):
+            logger.info(f"CSV importado com perfil salvo {assinatura}: {len(transacoes)} transações.")
+            await salvar_perfil_csv(telegram_user_id, assinatura, mapeamento)
+            return transacoes
+        logger.warning(f"Perfil salvo {assinatura} não serviu para este arquivo. Inferindo novamente.")
+
+    mapeamento = inferir_mapeamento(cabecalho, linhas)
+    if not mapeamento:
+        logger.info(f"Layout de CSV não reconhecido (assinatura {assinatura}).")
+        return None
+    transacoes = aplicar_mapeamento(linhas, mapeamento)
+    if not transacoes:
+        return None
+
+    logger.info(f"Novo perfil de CSV {assinatura} inferido: {mapeamento}")
+    await salvar_perfil_csv(telegram_user_id, assinatura, mapeamento)
+    return transacoes
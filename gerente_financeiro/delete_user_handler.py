@@ -6,6 +6,7 @@ from telegram.ext import (
 
 # Importando a função que vamos criar no próximo passo
 from database.database import deletar_todos_dados_usuario
+from . import contexto_cache
 from .handlers import cancel # Reutilizamos a função de cancelamento
 
 logger = logging.getLogger(__name__)
@@ -53,7 +54,8 @@ async def handle_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE
         await query.edit_message_text("Processando sua solicitação... ⏳")
         
         # Chama a função do banco de dados para fazer a exclusão
-        sucesso = deletar_todos_dados_usuario(telegram_id=user_id)
+        sucesso = await deletar_todos_dados_usuario(telegram_id=user_id)
+        contexto_cache.invalidar_contexto(user_id)
         
         if sucesso:
             await query.edit_message_text(
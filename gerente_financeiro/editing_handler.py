@@ -5,11 +5,14 @@ from telegram.ext import (
     ContextTypes, ConversationHandler, CommandHandler, CallbackQueryHandler, MessageHandler, filters
 )
 
+from sqlalchemy import select
+
 from database.database import (
-    buscar_lancamentos_usuario, deletar_lancamento_por_id, atualizar_lancamento_por_id, get_db
+    buscar_lancamentos_usuario, deletar_lancamento_por_id, atualizar_lancamento_por_id, get_async_db
 )
 from models import Categoria, Subcategoria
 from .handlers import cancel, criar_teclado_colunas
+from . import contexto_cache
 
 logger = logging.getLogger(__name__)
 
@@ -55,7 +58,7 @@ async def choose_search_method(update: Update, context: ContextTypes.DEFAULT_TYP
         return AWAIT_SEARCH_QUERY
 
     if method == "last":
-        lancamentos = buscar_lancamentos_usuario(query.from_user.id, limit=5)
+        lancamentos = await buscar_lancamentos_usuario(query.from_user.id, limit=5)
         if not lancamentos:
             await query.edit_message_text("Não encontrei nenhum lançamento recente.")
             return ConversationHandler.END
@@ -74,7 +77,7 @@ async def choose_search_method(update: Update, context: ContextTypes.DEFAULT_TYP
 async def list_search_results(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Recebe o termo de busca, lista os resultados e pede a seleção."""
     search_term = update.message.text
-    lancamentos = buscar_lancamentos_usuario(update.effective_user.id, limit=5, query=search_term)
+    lancamentos = await buscar_lancamentos_usuario(update.effective_user.id, limit=5, query=search_term)
 
     if not lancamentos:
         await update.message.reply_text(
@@ -141,7 +144,7 @@ async def select_lancamento_to_edit(update: Update, context: ContextTypes.DEFAUL
         return ConversationHandler.END
 
     lanc_id = int(query.data.split('_')[1])
-    resultados = buscar_lancamentos_usuario(query.from_user.id, lancamento_id=lanc_id)
+    resultados = await buscar_lancamentos_usuario(query.from_user.id, lancamento_id=lanc_id)
 
     if not resultados:
         await query.edit_message_text("❌ Erro: Lançamento não encontrado.")
@@ -179,21 +182,24 @@ async def choose_field_to_edit(update: Update, context: ContextTypes.DEFAULT_TYP
         # Remove os campos auxiliares antes de salvar
         data_to_update = {k: v for k, v in context.user_data['edit_data'].items() if k not in ['id', 'categoria_nome', 'subcategoria_nome']}
         
-        atualizado = atualizar_lancamento_por_id(lanc_id, query.from_user.id, data_to_update)
+        atualizado = await atualizar_lancamento_por_id(lanc_id, query.from_user.id, data_to_update)
+        if atualizado:
+            contexto_cache.registrar_lancamentos(query.from_user.id, [atualizado])
         msg = "✅ Lançamento atualizado com sucesso!" if atualizado else "❌ Erro ao salvar."
         await query.edit_message_text(msg)
         return ConversationHandler.END
 
     if field == "delete":
-        deletado = deletar_lancamento_por_id(context.user_data['edit_data']['id'], query.from_user.id)
+        deletado = await deletar_lancamento_por_id(context.user_data['edit_data']['id'], query.from_user.id)
+        if deletado:
+            contexto_cache.remover_lancamento(query.from_user.id, context.user_data['edit_data']['id'])
         msg = "🗑️ Lançamento apagado com sucesso!" if deletado else "❌ Erro ao apagar."
         await query.edit_message_text(msg)
         return ConversationHandler.END
     
     if field == "categoria":
-        db = next(get_db())
-        categorias = db.query(Categoria).order_by(Categoria.nome).all()
-        db.close()
+        async with get_async_db() as db:
+            categorias = (await db.execute(select(Categoria).order_by(Categoria.nome))).scalars().all()
         botoes = [InlineKeyboardButton(c.nome, callback_data=f"newcat_{c.id}") for c in categorias]
         teclado = criar_teclado_colunas(botoes, 2)
         await query.edit_message_text("Selecione a nova categoria:", reply_markup=InlineKeyboardMarkup(teclado))
@@ -236,15 +242,15 @@ async def receive_new_category(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
     category_id = int(query.data.split('_')[1])
     
-    db = next(get_db())
-    categoria_obj = db.query(Categoria).filter(Categoria.id == category_id).first()
+    async with get_async_db() as db:
+        categoria_obj = await db.get(Categoria, category_id)
+        subcategorias = (await db.execute(
+            select(Subcategoria).filter(Subcategoria.id_categoria == category_id).order_by(Subcategoria.nome)
+        )).scalars().all()
     
     context.user_data['edit_data']['id_categoria'] = category_id
     context.user_data['edit_data']['categoria_nome'] = categoria_obj.nome
     
-    subcategorias = db.query(Subcategoria).filter(Subcategoria.id_categoria == category_id).order_by(Subcategoria.nome).all()
-    db.close()
-    
     if not subcategorias:
         context.user_data['edit_data']['id_subcategoria'] = None
         context.user_data['edit_data']['subcategoria_nome'] = ""
@@ -269,9 +275,8 @@ async def receive_new_subcategory(update: Update, context: ContextTypes.DEFAULT_
         context.user_data['edit_data']['id_subcategoria'] = None
         context.user_data['edit_data']['subcategoria_nome'] = ""
     else:
-        db = next(get_db())
-        sub_obj = db.query(Subcategoria).filter(Subcategoria.id == subcategory_id).first()
-        db.close()
+        async with get_async_db() as db:
+            sub_obj = await db.get(Subcategoria, subcategory_id)
         context.user_data['edit_data']['id_subcategoria'] = subcategory_id
         context.user_data['edit_data']['subcategoria_nome'] = sub_obj.nome
 
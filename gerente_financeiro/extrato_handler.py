@@ -1,6 +1,8 @@
+import asyncio
 import logging
 import json
 import re
+import time
 import pdfplumber
 import io
 import csv
@@ -9,18 +11,24 @@ from decimal import Decimal, InvalidOperation
 from typing import List, Dict, Optional, Tuple
 
 from PyPDF2 import PdfReader
-import google.generativeai as genai
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import (
     ContextTypes, ConversationHandler, CommandHandler, CallbackQueryHandler, MessageHandler, filters
 )
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_
+from sqlalchemy.orm import selectinload
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 import config
-from database.database import get_db, get_or_create_user
+from database.database import get_async_db, get_or_create_user, inserir_lancamentos_em_lote
 from models import Lancamento, Categoria, Subcategoria, Conta, Usuario
 from .handlers import cancel, enviar_texto_em_blocos
-from .prompts import PROMPT_ANALISE_EXTRATO
+from . import contexto_cache
+from . import gateway_ia
+from .prompts import PROMPT_ANALISE_EXTRATO, PROMPT_CATEGORIZAR_DESCRICOES
+from .cache_respostas_ia import gerar_texto_em_cache
+from .ofx_parser import decodificar_ofx, extrair_transacoes_ofx
+from .csv_extrato import importar_csv_estruturado
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +39,11 @@ logger = logging.getLogger(__name__)
     AWAIT_CONFIRMATION
 ) = range(900, 903)
 
+# --- PARÂMETROS DA ANÁLISE EM PARTES (CHUNKS) ---
+TAMANHO_CHUNK_EXTRATO = 4000          # caracteres por parte enviada à IA
+INTERVALO_MIN_PROGRESSO = 2.0         # segundos entre edições da mensagem de progresso
+TAMANHO_LOTE_CATEGORIZACAO = 100      # descrições por chamada de categorização
+
 
 class ProcessadorDeDocumentos: # É uma boa prática agrupar funções relacionadas em uma classe
 
@@ -159,16 +172,10 @@ class ProcessadorDeDocumentos: # É uma boa prática agrupar funções relaciona
             logger.error(f"Erro ao processar CSV: {e}")
             raise
     
-    def processar_ofx(self, file_bytes: bytes) -> str:
-        """Processa arquivos OFX."""
+    def processar_ofx(self, file_bytes: bytes) -> List[Dict]:
+        """Processa arquivos OFX, retornando as transações já estruturadas (sem IA)."""
         try:
-            encodings = ['latin-1', 'utf-8', 'cp1252']
-            for encoding in encodings:
-                try:
-                    return file_bytes.decode(encoding, errors='replace')
-                except UnicodeDecodeError:
-                    continue
-            raise ValueError("Não foi possível decodificar o arquivo OFX")
+            return extrair_transacoes_ofx(file_bytes)
         except Exception as e:
             logger.error(f"Erro ao processar OFX: {e}")
             raise
@@ -284,6 +291,150 @@ class ExtratoValidator:
         return True, f"Consistência OK - {len(transacoes)} transações, correspondência {taxa_correspondencia:.1%}"
 
 
+# --- ANÁLISE CONCORRENTE DOS CHUNKS ---
+
+def dividir_texto_em_chunks(texto: str, tamanho_max: int) -> List[str]:
+    """Divide o texto em pedaços de até ~tamanho_max caracteres, quebrando em linhas."""
+    chunks = []
+    current_chunk = ""
+    for line in texto.split('\n'):
+        if len(current_chunk) + len(line) + 1 > tamanho_max:
+            chunks.append(current_chunk)
+            current_chunk = line
+        else:
+            current_chunk += "\n" + line
+    if current_chunk:
+        chunks.append(current_chunk)
+    return chunks
+
+
+class ProgressoThrottled:
+    """Edita a mensagem de progresso no máximo uma vez a cada `intervalo` segundos."""
+
+    def __init__(self, message, total: int, intervalo: float = INTERVALO_MIN_PROGRESSO):
+        self.message = message
+        self.total = total
+        self.intervalo = intervalo
+        self.concluidos = 0
+        self._ultima_edicao = 0.0
+        self._ultimo_texto = None
+
+    async def avancar(self) -> None:
+        self.concluidos += 1
+        agora = time.monotonic()
+        if self.concluidos < self.total and agora - self._ultima_edicao < self.intervalo:
+            return
+        texto = f"🧠 Analisando com a IA... {self.concluidos} de {self.total} partes concluídas."
+        if texto == self._ultimo_texto:
+            return
+        self._ultima_edicao = agora
+        self._ultimo_texto = texto
+        try:
+            await self.message.edit_text(texto)
+        except BadRequest as e:
+            # Progresso é apenas informativo: "message is not modified" e afins não interrompem a análise
+            logger.debug(f"Falha ao atualizar progresso do extrato: {e}")
+
+
+async def _gerar_json_ia(usuario_id: int, prompt: str, rotulo: str, tarefa: str = "extrato") -> Optional[Dict]:
+    """
+    Chama a IA pelo gateway e retorna o JSON da resposta (ou None se não vier um JSON válido).
+    Respostas válidas ficam no cache da `tarefa`, então reimportar o mesmo documento não
+    chama a IA de novo. Falhas transitórias já são repetidas pelo gateway; aqui só se
+    repete resposta malformada.
+    Se o gateway recusar o pedido (IA sobrecarregada), o erro sobe e a análise é interrompida.
+    """
+    tentativas = config.EXTRATO_LLM_TENTATIVAS
+    for tentativa in range(1, tentativas + 1):
+        response_text = ""
+        try:
+            response_text = await gerar_texto_em_cache(
+                tarefa, prompt, usuario_id=usuario_id, prazo=config.EXTRATO_LLM_PRAZO
+            )
+            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+            if not json_match:
+                raise ValueError("Resposta da IA sem JSON")
+            return json.loads(json_match.group(0))
+        except gateway_ia.IAIndisponivelError:
+            raise
+        except Exception as e:
+            logger.warning(
+                f"Erro ao processar {rotulo} (tentativa {tentativa}/{tentativas}): {e}. "
+                f"Resposta da IA: {response_text[:200]}"
+            )
+            if tentativa < tentativas:
+                await asyncio.sleep(2 ** (tentativa - 1))
+    logger.error(f"{rotulo.capitalize()} descartado após {tentativas} tentativas.")
+    return None
+
+
+async def analisar_chunks_em_paralelo(usuario_id: int, prompts: List[str], message) -> List[Dict]:
+    """
+    Analisa todos os chunks concorrentemente (limitado pelo gateway a
+    IA_CONCORRENCIA_POR_USUARIO) e junta as transações na ordem original do documento.
+    """
+    progresso = ProgressoThrottled(message, len(prompts))
+    await message.edit_text(f"🧠 Analisando {len(prompts)} parte(s) do documento com a IA...")
+
+    async def _processar(indice: int, prompt: str) -> List[Dict]:
+        try:
+            dados_chunk = await _gerar_json_ia(usuario_id, prompt, f"o chunk {indice + 1}")
+            return (dados_chunk or {}).get("transacoes") or []
+        finally:
+            await progresso.avancar()
+
+    tarefas = [asyncio.ensure_future(_processar(i, p)) for i, p in enumerate(prompts)]
+    try:
+        resultados = await asyncio.gather(*tarefas)
+    except gateway_ia.IAIndisponivelError:
+        # IA sobrecarregada: desiste do documento inteiro em vez de insistir nos demais chunks
+        for tarefa in tarefas:
+            tarefa.cancel()
+        raise
+    return [transacao for transacoes_chunk in resultados for transacao in transacoes_chunk]
+
+
+async def categorizar_transacoes(
+    usuario_id: int, transacoes: List[Dict], categorias_contexto: str,
+    categorias_conhecidas: Optional[Dict[str, Tuple[str, str]]] = None
+) -> None:
+    """
+    Preenche categoria/subcategoria de transações já estruturadas (OFX/CSV).
+    Descrições que o usuário já categorizou antes (`categorias_conhecidas`) não
+    vão para a IA; das demais, só as distintas são enviadas. O que ela não
+    devolver cai na categorização por palavras-chave.
+    """
+    sugestoes: Dict[str, Tuple[str, str]] = dict(categorias_conhecidas or {})
+    descricoes = [d for d in dict.fromkeys(t["descricao"] for t in transacoes) if d not in sugestoes]
+
+    async def _processar_lote(inicio: int) -> None:
+        lote = descricoes[inicio:inicio + TAMANHO_LOTE_CATEGORIZACAO]
+        prompt = PROMPT_CATEGORIZAR_DESCRICOES.format(
+            categorias_disponiveis=categorias_contexto,
+            descricoes="\n".join(f"{i}. {d}" for i, d in enumerate(lote))
+        )
+        try:
+            dados = await _gerar_json_ia(
+                usuario_id, prompt, f"o lote de categorização {inicio // TAMANHO_LOTE_CATEGORIZACAO + 1}", tarefa="categorizacao"
+            )
+        except gateway_ia.IAIndisponivelError:
+            # Sem IA, o lote cai na categorização por palavras-chave
+            return
+        for item in (dados or {}).get("categorias", []):
+            try:
+                descricao = lote[int(item["i"])]
+            except (KeyError, ValueError, TypeError, IndexError):
+                continue
+            sugestoes[descricao] = (item.get("categoria_sugerida", ""), item.get("subcategoria_sugerida", ""))
+
+    await asyncio.gather(*(_processar_lote(i) for i in range(0, len(descricoes), TAMANHO_LOTE_CATEGORIZACAO)))
+
+    for transacao in transacoes:
+        categoria, subcategoria = sugestoes.get(transacao["descricao"]) or categorizar_transacao_automatica(transacao["descricao"])
+        transacao["categoria_sugerida"] = categoria
+        transacao["subcategoria_sugerida"] = subcategoria
+
+
 # --- FUNÇÕES DO FLUXO ---
 
 async def extrato_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -320,6 +471,7 @@ async def processar_extrato_arquivo(update: Update, context: ContextTypes.DEFAUL
         file_bytearray = await telegram_file.download_as_bytearray()
         
         texto_bruto = ""
+        transacoes_estruturadas = None
         
         # Extração de texto bruto unificada
         await message.edit_text("🔎 Extraindo texto do documento...")
@@ -329,8 +481,12 @@ async def processar_extrato_arquivo(update: Update, context: ContextTypes.DEFAUL
                 texto_bruto += page.extract_text() or ""
         elif mime_type == 'text/csv' or file_name.endswith('.csv'):
             texto_bruto = file_bytearray.decode('utf-8', errors='replace')
+            # Layout reconhecido (perfil salvo ou inferido) dispensa a IA na extração
+            transacoes_estruturadas = await importar_csv_estruturado(bytes(file_bytearray), update.effective_user.id)
         elif mime_type in ['application/x-ofx', 'text/plain'] or file_name.endswith('.ofx'):
-            texto_bruto = file_bytearray.decode('latin-1', errors='replace')
+            texto_bruto = decodificar_ofx(bytes(file_bytearray))
+            # OFX já traz as transações estruturadas: a IA só é usada se o arquivo não puder ser lido
+            transacoes_estruturadas = ProcessadorDeDocumentos().processar_ofx(bytes(file_bytearray))
         else:
             await message.edit_text("❌ Formato de arquivo não suportado. Envie um arquivo PDF, CSV ou OFX.")
             return AWAIT_EXTRATO_FILE
@@ -341,55 +497,49 @@ async def processar_extrato_arquivo(update: Update, context: ContextTypes.DEFAUL
 
         # Busca categorias para o prompt da IA
         await message.edit_text("📚 Buscando categorias para análise...")
-        db: Session = next(get_db())
-        try:
-            user_db = get_or_create_user(db, update.effective_user.id, update.effective_user.full_name)
-            categorias_db = db.query(Categoria).options(joinedload(Categoria.subcategorias)).all()
-            categorias_formatadas = [f"- {cat.nome}: ({', '.join(sub.nome for sub in cat.subcategorias)})" for cat in categorias_db]
-            categorias_contexto = "\n".join(categorias_formatadas)
-        finally:
-            db.close()
+        async with get_async_db() as db:
+            user_db = await get_or_create_user(db, update.effective_user.id, update.effective_user.full_name)
+            categorias_db = (await db.execute(
+                select(Categoria).options(selectinload(Categoria.subcategorias))
+            )).scalars().all()
+            categorias_conhecidas = {}
+            if transacoes_estruturadas:
+                # Reaproveita a categoria que o usuário já usou para a mesma descrição
+                descricoes = {t["descricao"] for t in transacoes_estruturadas}
+                resultado = await db.execute(
+                    select(Lancamento.descricao, Categoria.nome, Subcategoria.nome)
+                    .join(Categoria, Lancamento.id_categoria == Categoria.id)
+                    .outerjoin(Subcategoria, Lancamento.id_subcategoria == Subcategoria.id)
+                    .filter(Lancamento.id_usuario == user_db.id, Lancamento.descricao.in_(descricoes))
+                    .order_by(Lancamento.data_transacao.asc())
+                )
+                categorias_conhecidas = {desc: (cat, sub or "") for desc, cat, sub in resultado.all()}
+        categorias_formatadas = [f"- {cat.nome}: ({', '.join(sub.nome for sub in cat.subcategorias)})" for cat in categorias_db]
+        categorias_contexto = "\n".join(categorias_formatadas)
+
+        if transacoes_estruturadas:
+            await message.edit_text(
+                f"⚡ {len(transacoes_estruturadas)} transações lidas diretamente do arquivo. Categorizando..."
+            )
+            await categorizar_transacoes(update.effective_user.id, transacoes_estruturadas, categorias_contexto, categorias_conhecidas)
+            context.user_data['dados_extrato'] = {"transacoes": transacoes_estruturadas}
+            await mostrar_selecao_conta(update, message, len(transacoes_estruturadas))
+            return AWAIT_CONTA_ASSOCIADA
 
             # --- LÓGICA DE CHUNKING PARA EVITAR TIMEOUT ---
         await message.edit_text("🧠 Dividindo o documento para análise... Isso pode levar um momento.")
         
-        # Divide o texto em pedaços de ~4000 caracteres, quebrando em linhas.
-        chunks = []
-        current_chunk = ""
-        for line in texto_bruto.split('\n'):
-            if len(current_chunk) + len(line) + 1 > 4000:
-                chunks.append(current_chunk)
-                current_chunk = line
-            else:
-                current_chunk += "\n" + line
-        if current_chunk:
-            chunks.append(current_chunk)
-
-        todas_as_transacoes = []
-        model = genai.GenerativeModel(config.GEMINI_MODEL_NAME)
-
-        for i, chunk in enumerate(chunks):
-            await message.edit_text(f"🧠 Analisando parte {i+1} de {len(chunks)} com a IA...")
-            
-            prompt = PROMPT_ANALISE_EXTRATO.format(
+        chunks = dividir_texto_em_chunks(texto_bruto, TAMANHO_CHUNK_EXTRATO)
+        prompts = [
+            PROMPT_ANALISE_EXTRATO.format(
                 texto_extrato=chunk,
                 categorias_disponiveis=categorias_contexto,
                 ano_atual=datetime.now().year,
                 nome_usuario=user_db.nome_completo
             )
-            
-            try:
-                ia_response = await model.generate_content_async(prompt)
-                response_text = ia_response.text
-                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                
-                if json_match:
-                    dados_chunk = json.loads(json_match.group(0))
-                    if transacoes_chunk := dados_chunk.get("transacoes"):
-                        todas_as_transacoes.extend(transacoes_chunk)
-            except Exception as e:
-                logger.warning(f"Erro ao processar o chunk {i+1}: {e}. Resposta da IA: {response_text[:200]}")
-                continue # Pula para o próximo chunk em caso de erro
+            for chunk in chunks
+        ]
+        todas_as_transacoes = await analisar_chunks_em_paralelo(update.effective_user.id, prompts, message)
 
         if not todas_as_transacoes:
             await message.edit_text("🤔 A IA não encontrou nenhuma transação válida no extrato.")
@@ -402,150 +552,37 @@ async def processar_extrato_arquivo(update: Update, context: ContextTypes.DEFAUL
         await mostrar_selecao_conta(update, message, len(todas_as_transacoes))
         return AWAIT_CONTA_ASSOCIADA
         
+    except gateway_ia.IAIndisponivelError:
+        await message.edit_text(gateway_ia.MENSAGEM_INDISPONIVEL)
+        return ConversationHandler.END
     except Exception as e:
         logger.error(f"Erro CRÍTICO no processamento do arquivo de extrato: {e}", exc_info=True)
         await message.edit_text("❌ Ops! Ocorreu um erro inesperado ao processar seu arquivo.")
         return ConversationHandler.END
 
-        # Prompt aprimorado para a IA
-        await message.edit_text("🧠 Enviando para análise da IA...")
-        model = genai.GenerativeModel(config.GEMINI_MODEL_NAME)
-        
-        prompt_aprimorado = f"""
-ANÁLISE DE EXTRATO BANCÁRIO - {tipo_arquivo}
-
-INSTRUÇÕES CRÍTICAS:
-1. Seja EXTREMAMENTE PRECISO na extração de dados
-2. Valores devem ser extraídos EXATAMENTE como aparecem
-3. Datas devem estar no formato DD/MM/AAAA
-4. Categorize com base EXATAMENTE nas categorias fornecidas
-5. Tipo de transação: "Entrada" para créditos, "Saída" para débitos
-
-VALORES DETECTADOS NO ARQUIVO (para validação):
-{valores_brutos[:20]}  # Primeiros 20 valores
-
-CATEGORIAS DISPONÍVEIS:
-{categorias_contexto}
-
-DADOS DO EXTRATO:
-{texto_bruto}
-
-RETORNE UM JSON VÁLIDO com esta estrutura EXATA:
-{{
-    "metadados": {{
-        "tipo_arquivo": "{tipo_arquivo}",
-        "total_linhas_processadas": 0,
-        "periodo_inicio": "DD/MM/AAAA",
-        "periodo_fim": "DD/MM/AAAA"
-    }},
-    "transacoes": [
-        {{
-            "data": "DD/MM/AAAA",
-            "descricao": "Descrição exata da transação",
-            "valor": 0.00,
-            "tipo_transacao": "Entrada" ou "Saída",
-            "categoria_sugerida": "Nome da categoria",
-            "subcategoria_sugerida": "Nome da subcategoria",
-            "observacoes": "Observações relevantes se houver"
-        }}
-    ]
-}}
-"""
-        
-        ia_response = await model.generate_content_async(prompt_aprimorado)
-        
-        # Extrai e valida JSON
-        response_text = ia_response.text
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if not json_match:
-            logger.error(f"Nenhum JSON encontrado na resposta da IA")
-            await message.edit_text("❌ IA não retornou dados válidos. Tente outro arquivo.")
-            return AWAIT_EXTRATO_FILE
-
-        try:
-            dados_extrato = json.loads(json_match.group(0))
-        except json.JSONDecodeError as e:
-            logger.error(f"Erro ao decodificar JSON: {e}")
-            await message.edit_text("❌ Resposta da IA em formato inválido. Tente novamente.")
-            return AWAIT_EXTRATO_FILE
-
-        # Validação rigorosa
-        await message.edit_text("✅ Validando dados extraídos...")
-        validator = ExtratoValidator()
-        
-        transacoes = dados_extrato.get('transacoes', [])
-        if not transacoes:
-            await message.edit_text("❌ Nenhuma transação válida encontrada.")
-            return AWAIT_EXTRATO_FILE
-        
-        # Valida cada transação
-        transacoes_validas = []
-        erros_validacao = []
-        
-        for i, transacao in enumerate(transacoes):
-            valida, motivo = validator.validar_transacao(transacao)
-            if valida:
-                transacoes_validas.append(transacao)
-            else:
-                erros_validacao.append(f"Transação {i+1}: {motivo}")
-        
-        if not transacoes_validas:
-            await message.edit_text(
-                f"❌ Nenhuma transação válida encontrada.\n\n"
-                f"Erros:\n" + "\n".join(erros_validacao[:5])
-            )
-            return AWAIT_EXTRATO_FILE
-        
-        # Validação de consistência
-        dados_extrato['transacoes'] = transacoes_validas
-        consistente, motivo_consistencia = validator.validar_consistencia_extrato(dados_extrato, valores_brutos)
-        
-        if not consistente:
-            await message.edit_text(f"⚠️ Problema de consistência: {motivo_consistencia}")
-            # Mas continua o processo para o usuário decidir
-        
-        # Salva os dados validados
-        context.user_data['dados_extrato'] = dados_extrato
-        context.user_data['info_validacao'] = {
-            'total_original': len(transacoes),
-            'total_validas': len(transacoes_validas),
-            'erros': erros_validacao,
-            'consistencia': motivo_consistencia
-        }
-        
-        # Mostra seleção de conta
-        await mostrar_selecao_conta(update, message, len(transacoes_validas))
-        return AWAIT_CONTA_ASSOCIADA
-        
-    except Exception as e:
-        logger.error(f"Erro crítico no processamento: {e}", exc_info=True)
-        await message.edit_text(f"❌ Erro inesperado: {str(e)}")
-        return AWAIT_EXTRATO_FILE
-
 
 async def mostrar_selecao_conta(update: Update, message, num_transacoes: int):
     """Mostra opções de conta para associar o extrato."""
-    db = next(get_db())
-    try:
-        user_db = get_or_create_user(db, update.effective_user.id, update.effective_user.full_name)
-        contas = db.query(Conta).filter(
-            Conta.id_usuario == user_db.id,
-            Conta.tipo != 'Cartão de Crédito'
-        ).all()
-
-        if not contas:
-            await message.edit_text("Você não tem contas cadastradas. Use `/configurar` para adicionar uma.")
-            return
-
-        botoes = [[InlineKeyboardButton(c.nome, callback_data=f"extrato_conta_{c.id}")] for c in contas]
-        await message.edit_text(
-            f"🏦 Análise concluída! Encontrei <b>{num_transacoes}</b> transações.\n\n"
-            "A qual das suas contas este extrato pertence?",
-            reply_markup=InlineKeyboardMarkup(botoes),
-            parse_mode='HTML'
-        )
-    finally:
-        db.close()
+    async with get_async_db() as db:
+        user_db = await get_or_create_user(db, update.effective_user.id, update.effective_user.full_name)
+        contas = (await db.execute(
+            select(Conta).filter(
+                Conta.id_usuario == user_db.id,
+                Conta.tipo != 'Cartão de Crédito'
+            )
+        )).scalars().all()
+
+    if not contas:
+        await message.edit_text("Você não tem contas cadastradas. Use `/configurar` para adicionar uma.")
+        return
+
+    botoes = [[InlineKeyboardButton(c.nome, callback_data=f"extrato_conta_{c.id}")] for c in contas]
+    await message.edit_text(
+        f"🏦 Análise concluída! Encontrei <b>{num_transacoes}</b> transações.\n\n"
+        "A qual das suas contas este extrato pertence?",
+        reply_markup=InlineKeyboardMarkup(botoes),
+        parse_mode='HTML'
+    )
 
 
 async def associar_conta_e_confirmar_extrato(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -625,81 +662,66 @@ async def salvar_transacoes_extrato_em_lote(update: Update, context: ContextType
         await query.edit_message_text("❌ Erro: Dados da sessão perdidos. Operação cancelada.")
         return ConversationHandler.END
 
-    db: Session = next(get_db())
     try:
-        user_info = query.from_user
-        usuario_db = get_or_create_user(db, user_info.id, user_info.full_name)
-        conta_selecionada = db.query(Conta).filter(Conta.id == conta_id).one()
+        async with get_async_db() as db:
+            user_info = query.from_user
+            usuario_db = await get_or_create_user(db, user_info.id, user_info.full_name)
+            conta_selecionada = (await db.execute(select(Conta).filter(Conta.id == conta_id))).scalar_one()
 
-        categorias_map = {cat.nome.lower(): cat.id for cat in db.query(Categoria).all()}
-        subcategorias_map = {(sub.id_categoria, sub.nome.lower()): sub.id for sub in db.query(Subcategoria).all()}
+            categorias_map = {cat.nome.lower(): cat.id for cat in (await db.execute(select(Categoria))).scalars()}
+            subcategorias_map = {(sub.id_categoria, sub.nome.lower()): sub.id for sub in (await db.execute(select(Subcategoria))).scalars()}
 
-        novos_lancamentos = []
-        duplicatas_ignoradas = 0
-        transacoes_para_salvar = dados_extrato.get('transacoes', [])
+            linhas = []
+            transacoes_para_salvar = dados_extrato.get('transacoes', [])
         
-        for transacao in transacoes_para_salvar:
-            try:
-                data_obj = datetime.strptime(transacao['data'], '%d/%m/%Y')
-                valor = float(transacao['valor'])
-                descricao = transacao.get('descricao', 'Transação de Extrato').strip()
+            for transacao in transacoes_para_salvar:
+                try:
+                    data_obj = datetime.strptime(transacao['data'], '%d/%m/%Y')
+                    valor = float(transacao['valor'])
+                    descricao = transacao.get('descricao', 'Transação de Extrato').strip()
                 
-                lancamento_existente = db.query(Lancamento).filter(
-                    and_(
-                        Lancamento.id_usuario == usuario_db.id,
-                        Lancamento.id_conta == conta_id,
-                        Lancamento.data_transacao == data_obj,
-                        Lancamento.descricao.ilike(f'%{descricao}%'),
-                        Lancamento.valor == valor,
-                        Lancamento.tipo == transacao.get('tipo_transacao')
-                    )
-                ).first()
+                    cat_nome = transacao.get('categoria_sugerida', '').lower().strip()
+                    id_categoria = categorias_map.get(cat_nome)
                 
-                if lancamento_existente:
-                    duplicatas_ignoradas += 1
+                    id_subcategoria = None
+                    if id_categoria:
+                        sub_nome = transacao.get('subcategoria_sugerida', '').lower().strip()
+                        id_subcategoria = subcategorias_map.get((id_categoria, sub_nome))
+
+                    # Ordem de COLUNAS_LANCAMENTO_LOTE
+                    linhas.append((
+                        usuario_db.id,
+                        descricao,
+                        valor,
+                        transacao.get('tipo_transacao', 'Saída'),
+                        data_obj,
+                        conta_selecionada.nome,
+                        conta_id,
+                        id_categoria,
+                        id_subcategoria,
+                        transacao.get('fitid'),
+                    ))
+                except Exception as e:
+                    logger.error(f"Erro ao processar transação individual: {transacao} | Erro: {e}")
                     continue
-                
-                cat_nome = transacao.get('categoria_sugerida', '').lower().strip()
-                id_categoria = categorias_map.get(cat_nome)
-                
-                id_subcategoria = None
-                if id_categoria:
-                    sub_nome = transacao.get('subcategoria_sugerida', '').lower().strip()
-                    id_subcategoria = subcategorias_map.get((id_categoria, sub_nome))
-
-                novo_lancamento = Lancamento(
-                    id_usuario=usuario_db.id,
-                    descricao=descricao,
-                    valor=valor,
-                    tipo=transacao.get('tipo_transacao', 'Saída'),
-                    data_transacao=data_obj,
-                    id_conta=conta_id,
-                    forma_pagamento=conta_selecionada.nome,
-                    id_categoria=id_categoria,
-                    id_subcategoria=id_subcategoria,
-                    observacoes=transacao.get('observacoes', '')
-                )
-                novos_lancamentos.append(novo_lancamento)
-            except Exception as e:
-                logger.error(f"Erro ao processar transação individual: {transacao} | Erro: {e}")
-                continue
 
-        if novos_lancamentos:
-            db.add_all(novos_lancamentos)
-            db.commit()
-        
-        await query.edit_message_text(
-            f"✅ Importação Concluída!\n\n"
-            f"• Novas transações salvas: <b>{len(novos_lancamentos)}</b>\n"
-            f"• Duplicatas ignoradas: <b>{duplicatas_ignoradas}</b>",
-            parse_mode='HTML'
-        )
+            # Duplicatas (reimportação do mesmo extrato ou lançamentos já digitados) são descartadas no lote
+            inseridos = await inserir_lancamentos_em_lote(db, linhas)
+            duplicatas_ignoradas = len(linhas) - len(inseridos)
+            if inseridos:
+                await db.commit()
+                contexto_cache.registrar_linhas(user_info.id, inseridos)
+        
+            await query.edit_message_text(
+                f"✅ Importação Concluída!\n\n"
+                f"• Novas transações salvas: <b>{len(inseridos)}</b>\n"
+                f"• Duplicatas ignoradas: <b>{duplicatas_ignoradas}</b>",
+                parse_mode='HTML'
+            )
     except Exception as e:
-        db.rollback()
         logger.error(f"Erro ao salvar transações em lote: {e}", exc_info=True)
         await query.edit_message_text("❌ Ocorreu um erro grave ao tentar salvar as transações.")
     finally:
-        db.close()
         context.user_data.clear()
 
     return ConversationHandler.END
@@ -887,13 +909,15 @@ def log_extrato_processamento(user_id: int, tipo_arquivo: str, num_transacoes: i
                 f"Transações: {num_transacoes}, Sucesso: {sucesso}")
 
 
-def obter_estatisticas_extrato(db: Session, user_id: int) -> Dict:
+async def obter_estatisticas_extrato(db: AsyncSession, user_id: int) -> Dict:
     """Obtém estatísticas de extratos importados pelo usuário."""
     try:
-        total_importados = db.query(Lancamento).filter(
-            Lancamento.id_usuario == user_id,
-            Lancamento.origem == 'Extrato Importado'
-        ).count()
+        total_importados = (await db.execute(
+            select(func.count(Lancamento.id)).filter(
+                Lancamento.id_usuario == user_id,
+                Lancamento.origem == 'Extrato Importado'
+            )
+        )).scalar()
         
         return {
             'total_importados': total_importados,
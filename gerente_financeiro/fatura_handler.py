@@ -1,22 +1,23 @@
 import logging
 import json
 import re
-from datetime import datetime, timedelta
+from datetime import datetime
 import io
 
 from PyPDF2 import PdfReader
-import google.generativeai as genai
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     ContextTypes, ConversationHandler, CommandHandler, CallbackQueryHandler, MessageHandler, filters
 )
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, extract
+from sqlalchemy.orm import selectinload
+from sqlalchemy import select
 
-import config
-from database.database import get_db, get_or_create_user
-from models import Lancamento, Categoria, Subcategoria, Conta, Usuario
+from database.database import get_async_db, get_or_create_user, inserir_lancamentos_em_lote
+from models import Categoria, Subcategoria, Conta, Usuario
 from .handlers import cancel  # Reutilizando a função de cancelamento
+from . import contexto_cache
+from . import gateway_ia
+from .cache_respostas_ia import gerar_texto_em_cache
 
 logger = logging.getLogger(__name__)
 
@@ -111,28 +112,25 @@ async def processar_fatura_pdf(update: Update, context: ContextTypes.DEFAULT_TYP
 
         # Buscar categorias para o prompt da IA
         await message.edit_text("📚 Buscando categorias para análise...")
-        db: Session = next(get_db())
-        try:
-            categorias_db = db.query(Categoria).all()
-            categorias_formatadas = [
-                f"- {cat.nome}: ({', '.join(sub.nome for sub in cat.subcategorias)})" for cat in categorias_db
-            ]
-            categorias_contexto = "\n".join(categorias_formatadas)
-        finally:
-            db.close()
+        async with get_async_db() as db:
+            categorias_db = (await db.execute(
+                select(Categoria).options(selectinload(Categoria.subcategorias))
+            )).scalars().all()
+        categorias_formatadas = [
+            f"- {cat.nome}: ({', '.join(sub.nome for sub in cat.subcategorias)})" for cat in categorias_db
+        ]
+        categorias_contexto = "\n".join(categorias_formatadas)
 
         # Chamar a IA para análise
         await message.edit_text("🧠 Enviando para análise da IA... Isso pode levar um momento.")
-        model = genai.GenerativeModel(config.GEMINI_MODEL_NAME)
         prompt = PROMPT_ANALISE_FATURA.format(
             texto_fatura=texto_fatura,
             categorias_disponiveis=categorias_contexto,
             ano_atual=datetime.now().year
         )
-        ia_response = await model.generate_content_async(prompt)
+        response_text = await gerar_texto_em_cache("fatura", prompt, usuario_id=update.effective_user.id)
 
         # Limpar e decodificar a resposta JSON
-        response_text = ia_response.text
         json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
         if not json_match:
             logger.error(f"Nenhum JSON encontrado na resposta da IA para fatura: {response_text}")
@@ -153,31 +151,33 @@ async def processar_fatura_pdf(update: Update, context: ContextTypes.DEFAULT_TYP
         context.user_data['dados_fatura'] = dados_fatura
 
         # Perguntar a qual conta associar
-        db = next(get_db())
-        try:
-            user_db = get_or_create_user(db, update.effective_user.id, update.effective_user.full_name)
-            cartoes = db.query(Conta).filter(
-                Conta.id_usuario == user_db.id,
-                Conta.tipo == 'Cartão de Crédito'
-            ).all()
-
-            if not cartoes:
-                await message.edit_text(
-                    "Você não tem nenhum cartão de crédito cadastrado. Use `/configurar` para adicionar um e tente novamente."
+        async with get_async_db() as db:
+            user_db = await get_or_create_user(db, update.effective_user.id, update.effective_user.full_name)
+            cartoes = (await db.execute(
+                select(Conta).filter(
+                    Conta.id_usuario == user_db.id,
+                    Conta.tipo == 'Cartão de Crédito'
                 )
-                return ConversationHandler.END
+            )).scalars().all()
 
-            botoes = [[InlineKeyboardButton(c.nome, callback_data=f"fatura_conta_{c.id}")] for c in cartoes]
+        if not cartoes:
             await message.edit_text(
-                f"💳 Análise concluída! Encontrei <b>{len(dados_fatura['transacoes'])}</b> transações.\n\n"
-                "A qual dos seus cartões cadastrados esta fatura pertence?",
-                reply_markup=InlineKeyboardMarkup(botoes),
-                parse_mode='HTML'
+                "Você não tem nenhum cartão de crédito cadastrado. Use `/configurar` para adicionar um e tente novamente."
             )
-            return AWAIT_CONTA_ASSOCIADA
-        finally:
-            db.close()
+            return ConversationHandler.END
+
+        botoes = [[InlineKeyboardButton(c.nome, callback_data=f"fatura_conta_{c.id}")] for c in cartoes]
+        await message.edit_text(
+            f"💳 Análise concluída! Encontrei <b>{len(dados_fatura['transacoes'])}</b> transações.\n\n"
+            "A qual dos seus cartões cadastrados esta fatura pertence?",
+            reply_markup=InlineKeyboardMarkup(botoes),
+            parse_mode='HTML'
+        )
+        return AWAIT_CONTA_ASSOCIADA
 
+    except gateway_ia.IAIndisponivelError:
+        await message.edit_text(gateway_ia.MENSAGEM_INDISPONIVEL)
+        return ConversationHandler.END
     except Exception as e:
         logger.error(f"Erro CRÍTICO no processamento da fatura: {e}", exc_info=True)
         await message.edit_text("❌ Ops! Ocorreu um erro inesperado ao processar sua fatura.")
@@ -240,7 +240,8 @@ async def associar_conta_e_confirmar(update: Update, context: ContextTypes.DEFAU
 
 async def salvar_transacoes_em_lote(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """
-    Salva todas as transações extraídas no banco de dados, com verificação de duplicidade.
+    Salva todas as transações extraídas no banco de dados. Transações já importadas
+    (mesmo fingerprint) ou já lançadas à mão no cartão são descartadas, então reenviar a fatura é seguro.
     """
     query = update.callback_query
     await query.answer()
@@ -253,92 +254,70 @@ async def salvar_transacoes_em_lote(update: Update, context: ContextTypes.DEFAUL
         await query.edit_message_text("❌ Erro: Dados da sessão perdidos. Operação cancelada.")
         return ConversationHandler.END
 
-    db: Session = next(get_db())
     try:
-        user_info = query.from_user
-        usuario_db = get_or_create_user(db, user_info.id, user_info.full_name)
-        
-        # --- LÓGICA DE VERIFICAÇÃO DE DUPLICIDADE ---
-        vencimento_str = dados_fatura.get("vencimento_fatura_sugerido")
-        if vencimento_str:
-            try:
-                vencimento_data = datetime.strptime(vencimento_str, '%d/%m/%Y')
-                # As transações de uma fatura geralmente ocorrem no mês anterior ao vencimento
-                data_referencia = vencimento_data - timedelta(days=15)
-                mes_fatura = data_referencia.month
-                ano_fatura = data_referencia.year
-
-                lancamentos_existentes = db.query(Lancamento).filter(
-                    and_(
-                        Lancamento.id_usuario == usuario_db.id,
-                        Lancamento.id_conta == conta_id,
-                        extract('month', Lancamento.data_transacao) == mes_fatura,
-                        extract('year', Lancamento.data_transacao) == ano_fatura
-                    )
-                ).count()
-
-                # Se já existem mais de 5 lançamentos, é muito provável que a fatura já foi importada
-                if lancamentos_existentes > 5:
-                    await query.edit_message_text(
-                        f"⚠️ <b>Fatura Duplicada!</b>\n\n"
-                        f"Parece que você já importou os lançamentos para o mês de referência <b>{data_referencia.strftime('%B de %Y')}</b> neste cartão.\n\n"
-                        "Operação cancelada para evitar duplicidade.",
-                        parse_mode='HTML'
-                    )
-                    return ConversationHandler.END
-            except (ValueError, TypeError) as e:
-                logger.warning(f"Data de vencimento da fatura em formato inválido: {vencimento_str}. Erro: {e}. Pulando verificação de duplicidade.")
+        async with get_async_db() as db:
+            user_info = query.from_user
+            usuario_db = await get_or_create_user(db, user_info.id, user_info.full_name)
         
-        # --- LÓGICA DE SALVAMENTO ---
-        conta_selecionada = db.query(Conta).filter(Conta.id == conta_id).one()
-        categorias_map = {cat.nome.lower(): cat.id for cat in db.query(Categoria).all()}
-        subcategorias_map = {(sub.id_categoria, sub.nome.lower()): sub.id for sub in db.query(Subcategoria).all()}
-
-        novos_lancamentos = []
-        for transacao in dados_fatura.get('transacoes', []):
-            try:
-                data_obj = datetime.strptime(transacao['data'], '%d/%m/%Y')
-            except (ValueError, TypeError):
-                logger.warning(f"Data de transação inválida na fatura: {transacao.get('data')}. Usando data atual.")
-                data_obj = datetime.now()
-
-            cat_nome_lower = transacao.get('categoria_sugerida', '').lower()
-            id_categoria = categorias_map.get(cat_nome_lower)
+            # --- LÓGICA DE SALVAMENTO ---
+            conta_selecionada = (await db.execute(select(Conta).filter(Conta.id == conta_id))).scalar_one()
+            categorias_map = {cat.nome.lower(): cat.id for cat in (await db.execute(select(Categoria))).scalars()}
+            subcategorias_map = {(sub.id_categoria, sub.nome.lower()): sub.id for sub in (await db.execute(select(Subcategoria))).scalars()}
+
+            linhas = []
+            for transacao in dados_fatura.get('transacoes', []):
+                try:
+                    data_obj = datetime.strptime(transacao['data'], '%d/%m/%Y')
+                except (ValueError, TypeError):
+                    logger.warning(f"Data de transação inválida na fatura: {transacao.get('data')}. Usando data atual.")
+                    data_obj = datetime.now()
+
+                cat_nome_lower = transacao.get('categoria_sugerida', '').lower()
+                id_categoria = categorias_map.get(cat_nome_lower)
             
-            id_subcategoria = None
-            if id_categoria:
-                sub_nome_lower = transacao.get('subcategoria_sugerida', '').lower()
-                id_subcategoria = subcategorias_map.get((id_categoria, sub_nome_lower))
-
-            novo_lancamento = Lancamento(
-                id_usuario=usuario_db.id,
-                descricao=transacao.get('descricao', 'Lançamento de fatura'),
-                valor=float(transacao.get('valor', 0.0)),
-                tipo='Saída',
-                data_transacao=data_obj,
-                forma_pagamento=conta_selecionada.nome,
-                id_conta=conta_id,
-                id_categoria=id_categoria,
-                id_subcategoria=id_subcategoria
-            )
-            novos_lancamentos.append(novo_lancamento)
-
-        if novos_lancamentos:
-            db.add_all(novos_lancamentos)
-            db.commit()
-            await query.edit_message_text(
-                f"✅ Sucesso! <b>{len(novos_lancamentos)}</b> transações foram importadas da sua fatura.",
-                parse_mode='HTML'
-            )
-        else:
-            await query.edit_message_text("🤔 Nenhuma transação válida foi encontrada para salvar.")
+                id_subcategoria = None
+                if id_categoria:
+                    sub_nome_lower = transacao.get('subcategoria_sugerida', '').lower()
+                    id_subcategoria = subcategorias_map.get((id_categoria, sub_nome_lower))
+
+                # Ordem de COLUNAS_LANCAMENTO_LOTE
+                linhas.append((
+                    usuario_db.id,
+                    transacao.get('descricao', 'Lançamento de fatura'),
+                    float(transacao.get('valor', 0.0)),
+                    'Saída',
+                    data_obj,
+                    conta_selecionada.nome,
+                    conta_id,
+                    id_categoria,
+                    id_subcategoria,
+                    None,
+                ))
+
+            inseridos = await inserir_lancamentos_em_lote(db, linhas)
+            duplicatas_ignoradas = len(linhas) - len(inseridos)
+
+            if inseridos:
+                await db.commit()
+                contexto_cache.registrar_linhas(user_info.id, inseridos)
+                await query.edit_message_text(
+                    f"✅ Sucesso! <b>{len(inseridos)}</b> transações foram importadas da sua fatura.\n"
+                    f"• Duplicatas ignoradas: <b>{duplicatas_ignoradas}</b>",
+                    parse_mode='HTML'
+                )
+            elif duplicatas_ignoradas:
+                await query.edit_message_text(
+                    f"⚠️ <b>Fatura já importada!</b>\n\n"
+                    f"Todas as <b>{duplicatas_ignoradas}</b> transações já estavam salvas neste cartão. Nada foi duplicado.",
+                    parse_mode='HTML'
+                )
+            else:
+                await query.edit_message_text("🤔 Nenhuma transação válida foi encontrada para salvar.")
 
     except Exception as e:
-        db.rollback()
         logger.error(f"Erro ao salvar transações em lote: {e}", exc_info=True)
         await query.edit_message_text("❌ Ocorreu um erro grave ao tentar salvar as transações.")
     finally:
-        db.close()
         context.user_data.clear()
 
     return ConversationHandler.END
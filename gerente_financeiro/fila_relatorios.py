@@ -0,0 +1,138 @@
+# gerente_financeiro/fila_relatorios.py
+"""
+Fila de geração de relatórios em PDF.
+
+Renderizar o template e rodar o WeasyPrint leva segundos de CPU por relatório.
+Os pedidos de /relatorio entram numa fila limitada e são consumidos por um
+número fixo de tarefas; a etapa de PDF roda num pool de processos dedicado.
+Assim, uma rajada de pedidos no início do mês vira espera na fila, e não um
+bot travado para todos os usuários.
+"""
+import asyncio
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Awaitable, Callable, Hashable, List, Optional, Set
+
+import config
+from . import relatorio_pdf
+
+logger = logging.getLogger(__name__)
+
+Tarefa = Callable[[], Awaitable[None]]
+
+_pool: Optional[ProcessPoolExecutor] = None
+_fila: Optional[asyncio.Queue] = None
+_consumidores: List[asyncio.Task] = []
+
+# Chaves aguardando na fila, na ordem de chegada, e as que já estão sendo geradas
+_pendentes: "OrderedDict[Hashable, None]" = OrderedDict()
+_em_andamento: Set[Hashable] = set()
+_contadores = {"enfileirados": 0, "concluidos": 0, "falhas": 0, "recusados": 0}
+
+
+def _inicializar_worker() -> None:
+    """Roda uma vez em cada worker: compila o template e interpreta CSS e fontes."""
+    relatorio_pdf.carregar_ativos()
+
+
+def _obter_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # 'spawn' evita herdar por fork as conexões abertas do pool do banco
+        _pool = ProcessPoolExecutor(
+            max_workers=config.RELATORIO_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_inicializar_worker,
+        )
+        logger.info(f"Pool de relatórios iniciado com {config.RELATORIO_WORKERS} workers.")
+    return _pool
+
+
+async def executar_no_pool(funcao, *args):
+    """Executa uma função de CPU (picklável) num worker do pool de relatórios."""
+    global _pool
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_obter_pool(), funcao, *args)
+    except BrokenProcessPool:
+        # Um worker morreu (ex.: falta de memória): recria o pool e tenta uma vez mais
+        logger.error("Pool de relatórios quebrado. Recriando workers...", exc_info=True)
+        _pool = None
+        return await loop.run_in_executor(_obter_pool(), funcao, *args)
+
+
+async def _consumir() -> None:
+    while True:
+        chave, tarefa = await _fila.get()
+        _pendentes.pop(chave, None)
+        _em_andamento.add(chave)
+        try:
+            await tarefa()
+            _contadores["concluidos"] += 1
+        except Exception:
+            _contadores["falhas"] += 1
+            logger.error(f"Falha na tarefa de relatório {chave}", exc_info=True)
+        finally:
+            _em_andamento.discard(chave)
+            _fila.task_done()
+
+
+def _garantir_consumidores() -> None:
+    global _fila
+    if _fila is None:
+        _fila = asyncio.Queue(maxsize=config.RELATORIO_FILA_MAX)
+    while len(_consumidores) < config.RELATORIO_WORKERS:
+        _consumidores.append(asyncio.create_task(_consumir()))
+
+
+def posicao_na_fila(chave: Hashable) -> Optional[int]:
+    """Posição (1 = próximo) de um pedido aguardando, 0 se já está em geração, None se ausente."""
+    if chave in _em_andamento:
+        return 0
+    for posicao, pendente in enumerate(_pendentes, start=1):
+        if pendente == chave:
+            return posicao
+    return None
+
+
+def enfileirar(chave: Hashable, tarefa: Tarefa) -> int:
+    """
+    Coloca a tarefa na fila e retorna sua posição.
+    Levanta asyncio.QueueFull quando a fila atingiu o limite configurado.
+    """
+    _garantir_consumidores()
+    try:
+        _fila.put_nowait((chave, tarefa))
+    except asyncio.QueueFull:
+        _contadores["recusados"] += 1
+        raise
+    _pendentes[chave] = None
+    _contadores["enfileirados"] += 1
+    return len(_pendentes)
+
+
+def get_fila_stats() -> dict:
+    return {
+        "aguardando": len(_pendentes),
+        "em_andamento": len(_em_andamento),
+        "max_fila": config.RELATORIO_FILA_MAX,
+        "workers": config.RELATORIO_WORKERS,
+        **_contadores,
+    }
+
+
+def encerrar_fila_relatorios() -> None:
+    """Cancela os consumidores e encerra os workers (chamado no desligamento do bot)."""
+    global _pool, _fila
+    for tarefa in _consumidores:
+        tarefa.cancel()
+    _consumidores.clear()
+    _pendentes.clear()
+    _em_andamento.clear()
+    _fila = None
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
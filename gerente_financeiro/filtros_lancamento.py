@@ -0,0 +1,368 @@
+# gerente_financeiro/filtros_lancamento.py
+"""
+Interpretação de perguntas em português para filtros de lançamentos.
+
+`interpretar_filtros` lê do texto o período ("mês passado", "últimos 15 dias",
+"em março", "entre 10 e 20/05"), o tipo, a conta ("no Nubank"), a forma de
+pagamento, a categoria, a faixa de valor ("acima de 100 reais"), a quantidade
+("últimos 5 lançamentos") e o termo de busca ("com uber"), e devolve exatamente
+os argumentos nomeados de database.buscar_lancamentos_usuario.
+
+É puro (sem banco nem I/O): contas e categorias são passadas por quem chama.
+Os padrões são compilados uma vez, na importação do módulo.
+"""
+import re
+import unicodedata
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from dateutil.relativedelta import relativedelta
+
+MESES = {
+    'janeiro': 1, 'fevereiro': 2, 'marco': 3, 'abril': 4, 'maio': 5, 'junho': 6,
+    'julho': 7, 'agosto': 8, 'setembro': 9, 'outubro': 10, 'novembro': 11, 'dezembro': 12,
+}
+
+# Categorias procuradas quando quem chama não informa as do banco
+CATEGORIAS_PADRAO = ['Lazer', 'Alimentação', 'Transporte', 'Moradia', 'Saúde', 'Receitas', 'Compras']
+
+FORMAS_PAGAMENTO = [
+    (re.compile(r'\bpix\b'), 'Pix'),
+    (re.compile(r'\b(?:cartao de credito|no credito|credito)\b'), 'Crédito'),
+    (re.compile(r'\b(?:cartao de debito|no debito|debito)\b'), 'Débito'),
+    (re.compile(r'\b(?:dinheiro|especie)\b'), 'Dinheiro'),
+    (re.compile(r'\bboleto\b'), 'Boleto'),
+]
+
+PALAVRAS_GASTOS = re.compile(r'\b(?:gastos?|gastei|despesas?|saidas?|paguei)\b')
+PALAVRAS_RECEITAS = re.compile(r'\b(?:receitas|entradas?|ganhei|recebi)\b')
+
+# Os padrões trabalham sobre o texto em minúsculas e sem acentos
+_DATA = r'(\d{1,2})/(\d{1,2})(?:/(\d{2}|\d{4}))?'
+_MES = '|'.join(MESES)
+_NUMERO = r'(\d{1,3}(?:\.\d{3})+(?:,\d{1,2})?|\d+(?:[.,]\d{1,2})?)'
+_MOEDA = r'(?:r\$\s*)?' + _NUMERO + r'(?:\s*(?:reais|real|conto|pila))?'
+_UNIDADES = r'(?:dias?|semanas?|mes|meses|anos?|lancamentos?|transac\w*|gastos?|compras?)'
+
+RE_ENTRE_DATAS = re.compile(
+    r'\b(?:entre|de|do dia)\s+(?:o dia\s+)?(\d{1,2})(?:/(\d{1,2})(?:/(\d{2}|\d{4}))?)?\s+(?:e|a|ate)\s+(?:o dia\s+)?' + _DATA + r'\b'
+)
+RE_ENTRE_DIAS_DO_MES = re.compile(
+    r'\b(?:entre|de|do dia)\s+(?:o dia\s+)?(\d{1,2})\s+(?:e|a|ate)\s+(?:o dia\s+)?(\d{1,2})\s+de\s+(' + _MES + r')(?:\s+de\s+(\d{4}))?\b'
+)
+RE_ULTIMOS_PERIODO = re.compile(r'\b(?:ultim[oa]s|nos ultimos|nas ultimas)\s+(\d+)\s+(dias?|semanas?|mes|meses)\b')
+RE_DESDE = re.compile(r'\b(?:desde|a partir de)\s+(?:o dia\s+)?' + _DATA + r'\b')
+RE_DATA_UNICA = re.compile(r'\b(?:em|no dia|dia|de|do dia)\s+' + _DATA + r'\b')
+RE_ANO = re.compile(r'\b(?:em|de|no ano de|durante)\s+(20\d{2})\b')
+RE_DIA_DO_MES = re.compile(r'\bdia\s+(\d{1,2})\b(?!\s*/)')
+RE_MES_NOMEADO = re.compile(r'\b(' + _MES + r')(?:\s*(?:de|/)\s*(\d{4}))?\b')
+RE_RELATIVOS: List[Tuple[re.Pattern, str]] = [
+    (re.compile(r'\banteontem\b'), 'anteontem'),
+    (re.compile(r'\bontem\b'), 'ontem'),
+    (re.compile(r'\bhoje\b'), 'hoje'),
+    (re.compile(r'\bsemana (?:passada|anterior)\b'), 'semana_passada'),
+    (re.compile(r'\b(?:n?est|n?ess)a semana\b'), 'semana_atual'),
+    (re.compile(r'\bmes (?:passado|anterior)\b|\bultimo mes\b'), 'mes_passado'),
+    (re.compile(r'\b(?:n?este|n?esse) mes\b|\bmes atual\b'), 'mes_atual'),
+    (re.compile(r'\bano (?:passado|anterior)\b'), 'ano_passado'),
+    (re.compile(r'\b(?:n?este|n?esse) ano\b|\bano atual\b'), 'ano_atual'),
+]
+
+RE_VALOR_ENTRE = re.compile(
+    r'\bentre\s+(?:r\$\s*)?' + _NUMERO + r'\s+e\s+(?:r\$\s*)?' + _NUMERO + r'\s*(?:reais|real)?\b(?!\s*/)'
+)
+RE_VALOR_MINIMO = re.compile(
+    r'\b(?:acima de|mais de|maior(?:es)? que|maior(?:es)? do que|superior(?:es)? a|a partir de|pelo menos|no minimo)\s+'
+    + _MOEDA + r'(?!\s*/)(?!\d)(?!\s+' + _UNIDADES + r')'
+)
+RE_VALOR_MAXIMO = re.compile(
+    r'\b(?:abaixo de|menos de|menor(?:es)? que|menor(?:es)? do que|inferior(?:es)? a|no maximo)\s+'
+    + _MOEDA + r'(?!\s*/)(?!\d)(?!\s+' + _UNIDADES + r')'
+    + r'|\bate\s+(?:r\$\s*' + _NUMERO + r'|' + _NUMERO + r'\s*(?:reais|real))'
+)
+
+RE_QUANTIDADE = re.compile(
+    r'\b(?:ultim[oa]s|primeir[oa]s)\s+(\d{1,3})\b(?!\s+(?:dias?|semanas?|mes|meses|anos?)\b)'
+    r'|\b(\d{1,3})\s+(?:ultim[oa]s\s+)?(?:lancamentos?|transac\w*|movimentac\w*|gastos|despesas|compras|receitas|entradas)\b'
+)
+RE_ULTIMO_UNICO = re.compile(r'\bultim[oa]\s+(?:lancamento|transacao|movimentacao|compra|gasto|despesa|receita|entrada)\b')
+
+RE_TERMO_BUSCA = re.compile(r'\b(?:com|no|na|em|de)\s+([a-z0-9][a-z0-9 ]*)')
+RE_FIM_DO_TERMO = re.compile(
+    r'\s+(?:em|no|na|nos|nas|neste|nesse|nesta|nessa|este|esse|esta|essa|hoje|ontem|anteontem|'
+    r'semana|mes|ano|ultim\w*|desde|ate|entre|acima|abaixo|mais|menos|pelo|por|pra|para|de|do|da)\b.*$'
+)
+# Preposição que acompanha um trecho interpretado ("em setembro", "no Nubank", "de ontem")
+# e que sai junto com ele, para não sobrar como termo de busca
+RE_PREPOSICAO_ANTES = re.compile(r'\b(?:em|no|na|nos|nas|de|do|da|dos|das|com|pelo|pela|pro|pra|para)\s+$')
+PALAVRAS_VAZIAS = {
+    'em', 'no', 'na', 'nos', 'nas', 'de', 'do', 'da', 'dos', 'das', 'com', 'pelo', 'pela', 'pro', 'pra', 'para',
+    'o', 'a', 'os', 'as', 'um', 'uma', 'e', 'meu', 'meus', 'minha', 'minhas', 'que', 'qual', 'quais',
+}
+PALAVRAS_NAO_TERMO = {
+    'hoje', 'ontem', 'anteontem', 'semana', 'mes', 'ano', 'gastos', 'gasto', 'despesas', 'despesa',
+    'lancamentos', 'lancamento', 'receitas', 'entradas', 'cartao', 'conta', 'total', 'media',
+    'tudo', 'todos', 'todas', 'mim', 'voce', 'vc', 'novo', 'nova',
+}
+
+LIMITE_MAXIMO = 50
+
+
+def sem_acentos(texto: str) -> str:
+    """Minúsculas sem acentos, preservando o comprimento (os índices valem para o texto original)."""
+    return ''.join(unicodedata.normalize('NFD', c)[0] for c in texto.lower())
+
+
+def _numero(texto: str) -> float:
+    if ',' in texto:
+        return float(texto.replace('.', '').replace(',', '.'))
+    if re.fullmatch(r'\d{1,3}(?:\.\d{3})+', texto):
+        return float(texto.replace('.', ''))
+    return float(texto)
+
+
+def _ano(texto: Optional[str], hoje: datetime) -> int:
+    if not texto:
+        return hoje.year
+    ano = int(texto)
+    return ano + 2000 if ano < 100 else ano
+
+
+def _data(dia: str, mes: str, ano: Optional[str], hoje: datetime) -> Optional[datetime]:
+    """Data de 'DD/MM[/AA]'. Sem ano, uma data ainda no futuro é a do ano passado."""
+    try:
+        data = datetime(_ano(ano, hoje), int(mes), int(dia))
+    except ValueError:
+        return None
+    if not ano and data > hoje:
+        data = data.replace(year=data.year - 1)
+    return data
+
+
+def _fim_do_dia(data: datetime) -> datetime:
+    return data.replace(hour=23, minute=59, second=59, microsecond=999999)
+
+
+def _intervalo_relativo(chave: str, hoje: datetime) -> Tuple[datetime, Optional[datetime]]:
+    inicio_hoje = hoje.replace(hour=0, minute=0, second=0, microsecond=0)
+    if chave == 'hoje':
+        return inicio_hoje, None
+    if chave in ('ontem', 'anteontem'):
+        dia = inicio_hoje - timedelta(days=1 if chave == 'ontem' else 2)
+        return dia, _fim_do_dia(dia)
+    if chave == 'semana_atual':
+        return inicio_hoje - timedelta(days=hoje.weekday()), None
+    if chave == 'semana_passada':
+        inicio = inicio_hoje - timedelta(days=hoje.weekday() + 7)
+        return inicio, _fim_do_dia(inicio + timedelta(days=6))
+    if chave == 'mes_atual':
+        return inicio_hoje.replace(day=1), None
+    if chave == 'mes_passado':
+        inicio = inicio_hoje.replace(day=1) - relativedelta(months=1)
+        return inicio, _fim_do_dia(inicio + relativedelta(months=1) - timedelta(days=1))
+    if chave == 'ano_atual':
+        return inicio_hoje.replace(month=1, day=1), None
+    inicio = inicio_hoje.replace(year=hoje.year - 1, month=1, day=1)
+    return inicio, _fim_do_dia(inicio.replace(month=12, day=31))
+
+
+class _Texto:
+    """Texto normalizado do qual os trechos já interpretados vão sendo apagados."""
+
+    def __init__(self, original: str):
+        self.original = original
+        self.normalizado = sem_acentos(original)
+
+    def buscar(self, padrao: re.Pattern) -> Optional[re.Match]:
+        match = padrao.search(self.normalizado)
+        if match:
+            self.apagar(*match.span())
+        return match
+
+    def apagar(self, inicio: int, fim: int) -> None:
+        """Apaga o trecho e a preposição que o acompanha ("em setembro", "no Nubank")."""
+        antes = RE_PREPOSICAO_ANTES.search(self.normalizado[:inicio])
+        if antes:
+            inicio = antes.start()
+        self.normalizado = self.normalizado[:inicio] + ' ' * (fim - inicio) + self.normalizado[fim:]
+
+
+def _periodo(texto: _Texto, hoje: datetime) -> Dict[str, datetime]:
+    match = texto.buscar(RE_ENTRE_DATAS)
+    if match:
+        dia1, mes1, ano1, dia2, mes2, ano2 = match.groups()
+        fim = _data(dia2, mes2, ano2, hoje)
+        # Sem ano, o início fica no ano do fim ("de 20/12 a 05/01" atravessa a virada)
+        inicio = fim and _data(dia1, mes1 or mes2, ano1 or str(fim.year), hoje)
+        if inicio and fim:
+            if inicio > fim and not ano1:
+                inicio = _data(dia1, mes1 or mes2, str(fim.year - 1), hoje)
+            inicio, fim = min(inicio, fim), max(inicio, fim)
+            return {'data_inicio': inicio, 'data_fim': _fim_do_dia(fim)}
+
+    match = texto.buscar(RE_ENTRE_DIAS_DO_MES)
+    if match:
+        dia1, dia2, nome_mes, ano = match.groups()
+        mes = str(MESES[nome_mes])
+        inicio, fim = _data(dia1, mes, ano, hoje), _data(dia2, mes, ano, hoje)
+        if inicio and fim:
+            inicio, fim = min(inicio, fim), max(inicio, fim)
+            return {'data_inicio': inicio, 'data_fim': _fim_do_dia(fim)}
+
+    match = texto.buscar(RE_ULTIMOS_PERIODO)
+    if match:
+        quantidade, unidade = max(int(match.group(1)), 1), match.group(2)
+        inicio_hoje = hoje.replace(hour=0, minute=0, second=0, microsecond=0)
+        if unidade.startswith('dia'):
+            return {'data_inicio': inicio_hoje - timedelta(days=quantidade - 1)}
+        if unidade.startswith('semana'):
+            return {'data_inicio': inicio_hoje - timedelta(weeks=quantidade) + timedelta(days=1)}
+        return {'data_inicio': inicio_hoje - relativedelta(months=quantidade) + timedelta(days=1)}
+
+    match = texto.buscar(RE_DESDE)
+    if match:
+        inicio = _data(*match.groups(), hoje)
+        if inicio:
+            return {'data_inicio': inicio}
+
+    match = texto.buscar(RE_DATA_UNICA)
+    if match:
+        dia = _data(*match.groups(), hoje)
+        if dia:
+            return {'data_inicio': dia, 'data_fim': _fim_do_dia(dia)}
+
+    match = texto.buscar(RE_MES_NOMEADO)
+    if match:
+        nome_mes, ano = match.groups()
+        inicio = datetime(_ano(ano, hoje), MESES[nome_mes], 1)
+        if not ano and inicio > hoje:
+            inicio = inicio.replace(year=inicio.year - 1)
+        return {'data_inicio': inicio, 'data_fim': _fim_do_dia(inicio + relativedelta(months=1) - timedelta(days=1))}
+
+    for padrao, chave in RE_RELATIVOS:
+        if texto.buscar(padrao):
+            inicio, fim = _intervalo_relativo(chave, hoje)
+            return {'data_inicio': inicio, 'data_fim': fim} if fim else {'data_inicio': inicio}
+
+    match = texto.buscar(RE_ANO)
+    if match:
+        ano = int(match.group(1))
+        return {'data_inicio': datetime(ano, 1, 1), 'data_fim': _fim_do_dia(datetime(ano, 12, 31))}
+
+    match = texto.buscar(RE_DIA_DO_MES)
+    if match:
+        dia = _data(match.group(1), str(hoje.month), str(hoje.year), hoje)
+        if dia is None or dia > hoje:
+            # "dia 25" em 10/03: o dia 25 que já passou é o de fevereiro
+            anterior = hoje.replace(day=1) - timedelta(days=1)
+            dia = _data(match.group(1), str(anterior.month), str(anterior.year), hoje)
+        if dia:
+            return {'data_inicio': dia, 'data_fim': _fim_do_dia(dia)}
+    return {}
+
+
+def _valores(texto: _Texto) -> Dict[str, float]:
+    filtros = {}
+    match = texto.buscar(RE_VALOR_ENTRE)
+    if match:
+        minimo, maximo = sorted((_numero(match.group(1)), _numero(match.group(2))))
+        return {'valor_minimo': minimo, 'valor_maximo': maximo}
+    match = texto.buscar(RE_VALOR_MINIMO)
+    if match:
+        filtros['valor_minimo'] = _numero(match.group(1))
+    match = texto.buscar(RE_VALOR_MAXIMO)
+    if match:
+        filtros['valor_maximo'] = _numero(next(grupo for grupo in match.groups() if grupo))
+    return filtros
+
+
+def _nome_encontrado(texto: _Texto, nomes: Iterable[str]) -> Optional[str]:
+    """O nome (de conta ou categoria) mais longo citado no texto."""
+    for nome in sorted(nomes, key=len, reverse=True):
+        if nome and texto.buscar(re.compile(r'\b' + re.escape(sem_acentos(nome)) + r'\b')):
+            return nome
+    return None
+
+
+def _termo_busca(texto: _Texto) -> Optional[str]:
+    for match in RE_TERMO_BUSCA.finditer(texto.normalizado):
+        normalizado = RE_FIM_DO_TERMO.sub('', match.group(1)).strip()
+        palavras = normalizado.split()
+        if not palavras or normalizado.isdigit() or all(
+            palavra in PALAVRAS_NAO_TERMO or palavra in PALAVRAS_VAZIAS for palavra in palavras
+        ):
+            continue
+        # Devolve o trecho como o usuário escreveu (com acentos) para o ILIKE
+        inicio = match.start(1)
+        termo = texto.original[inicio:inicio + len(normalizado)].lower()
+        texto.apagar(match.start(), inicio + len(normalizado))
+        return termo
+    return None
+
+
+def interpretar_filtros(
+    texto: str,
+    contas: Sequence[Tuple[int, str]] = (),
+    categorias: Optional[Iterable[str]] = None,
+    hoje: Optional[datetime] = None,
+) -> dict:
+    """
+    Filtros da pergunta como argumentos de buscar_lancamentos_usuario:
+    limit, query, categoria_nome, data_inicio, data_fim (inclusiva), tipo, id_conta,
+    forma_pagamento, valor_minimo e valor_maximo. Só as chaves encontradas são devolvidas.
+
+    `contas` são pares (id, nome) das contas do usuário; `categorias`, os nomes a
+    procurar (CATEGORIAS_PADRAO se omitido).
+    """
+    return interpretar_pergunta(texto, contas, categorias, hoje)[0]
+
+
+def interpretar_pergunta(
+    texto: str,
+    contas: Sequence[Tuple[int, str]] = (),
+    categorias: Optional[Iterable[str]] = None,
+    hoje: Optional[datetime] = None,
+) -> Tuple[dict, str]:
+    """
+    Como `interpretar_filtros`, mas devolve também o que sobrou da pergunta (minúsculas,
+    sem acentos) depois de apagados os trechos interpretados. Quem precisa saber se a
+    pergunta foi entendida por inteiro olha as palavras que sobraram.
+    """
+    hoje = hoje or datetime.now()
+    trabalho = _Texto(texto or "")
+    filtros: dict = {}
+
+    # A ordem importa: cada trecho interpretado é apagado antes do passo seguinte,
+    # para que "entre 10 e 20/05" não vire faixa de valor nem "15 dias" vire quantidade.
+    filtros.update(_periodo(trabalho, hoje))
+    filtros.update(_valores(trabalho))
+
+    match = trabalho.buscar(RE_QUANTIDADE)
+    if match:
+        filtros['limit'] = min(int(match.group(1) or match.group(2)), LIMITE_MAXIMO)
+    elif trabalho.buscar(RE_ULTIMO_UNICO):
+        filtros['limit'] = 1
+
+    if PALAVRAS_GASTOS.search(trabalho.normalizado):
+        filtros['tipo'] = 'Saída'
+    elif PALAVRAS_RECEITAS.search(trabalho.normalizado):
+        filtros['tipo'] = 'Entrada'
+
+    nomes_contas = {nome: id_conta for id_conta, nome in contas}
+    conta = _nome_encontrado(trabalho, nomes_contas)
+    if conta:
+        filtros['id_conta'] = nomes_contas[conta]
+    else:
+        for padrao, forma in FORMAS_PAGAMENTO:
+            if trabalho.buscar(padrao):
+                filtros['forma_pagamento'] = forma
+                break
+
+    categoria = _nome_encontrado(trabalho, categorias if categorias is not None else CATEGORIAS_PADRAO)
+    if categoria:
+        filtros['categoria_nome'] = categoria
+
+    termo = _termo_busca(trabalho)
+    if termo:
+        filtros['query'] = termo
+    return filtros, trabalho.normalizado
@@ -0,0 +1,383 @@
+# gerente_financeiro/gateway_ia.py
+"""
+Porta única de acesso ao Gemini.
+
+Todos os módulos chamam a IA por `gerar_texto`, que concentra o que antes cada
+handler fazia (ou deixava de fazer) por conta própria:
+
+- uma instância de GenerativeModel por nome de modelo, reaproveitada;
+- limite de chamadas simultâneas global e por usuário;
+- fila de espera limitada: com ela cheia, o pedido é recusado na hora;
+- prazo por pedido (espera pela vez + tentativas), em vez de esperar para sempre;
+- novas tentativas com backoff exponencial em 429/5xx/timeouts, e uma pausa
+  compartilhada após 429 para que todos os pedidos desacelerem juntos;
+- disjuntor: após várias falhas seguidas, recusa tudo por alguns segundos e
+  depois deixa passar uma única chamada de teste.
+
+`gerar_texto_em_partes` faz o mesmo em modo streaming, entregando o texto à
+medida que o modelo o gera.
+
+Quando o Gemini fica lento, o bot recusa pedidos de propósito (IAIndisponivelError)
+em vez de acumular milhares de corrotinas penduradas.
+"""
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+import config
+from database.database import ServiceError
+
+logger = logging.getLogger(__name__)
+
+MENSAGEM_INDISPONIVEL = "🧠 A IA está sobrecarregada no momento. Tente novamente em alguns instantes."
+
+# Erros em que vale tentar de novo: limite de taxa, falhas do servidor e timeouts
+ERROS_TRANSITORIOS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+    asyncio.TimeoutError,
+)
+ERROS_LIMITE_TAXA = (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+
+
+class IAIndisponivelError(ServiceError):
+    """A IA não pôde atender o pedido: disjuntor aberto, fila cheia ou prazo esgotado."""
+    pass
+
+
+class Disjuntor:
+    """Circuit breaker simples: fechado -> aberto após falhas seguidas -> meio-aberto (uma chamada de teste)."""
+
+    def __init__(self, limite_falhas: int, tempo_aberto: float):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self.falhas_seguidas = 0
+        self.aberto_ate = 0.0
+        self.teste_em_curso = False
+
+    @property
+    def estado(self) -> str:
+        if self.falhas_seguidas < self.limite_falhas:
+            return "fechado"
+        return "aberto" if time.monotonic() < self.aberto_ate else "meio-aberto"
+
+    def recusando(self) -> bool:
+        """True enquanto o disjuntor estiver aberto ou com a chamada de teste em andamento."""
+        estado = self.estado
+        return estado == "aberto" or (estado == "meio-aberto" and self.teste_em_curso)
+
+    def permitir(self) -> bool:
+        """Reserva a vez de chamar a IA; no estado meio-aberto, só uma chamada passa."""
+        estado = self.estado
+        if estado == "fechado":
+            return True
+        if estado == "aberto" or self.teste_em_curso:
+            return False
+        self.teste_em_curso = True
+        return True
+
+    def registrar_sucesso(self) -> None:
+        if self.falhas_seguidas >= self.limite_falhas:
+            logger.info("Disjuntor da IA fechado: o Gemini voltou a responder.")
+        self.falhas_seguidas = 0
+        self.teste_em_curso = False
+
+    def registrar_falha(self) -> None:
+        self.falhas_seguidas += 1
+        self.teste_em_curso = False
+        if self.falhas_seguidas >= self.limite_falhas:
+            self.aberto_ate = time.monotonic() + self.tempo_aberto
+            logger.warning(
+                f"Disjuntor da IA aberto por {self.tempo_aberto:.0f}s após {self.falhas_seguidas} falhas seguidas."
+            )
+
+    def liberar_teste(self) -> None:
+        """Devolve a vez de teste quando a chamada terminou sem sucesso nem falha (ex.: cancelada)."""
+        self.teste_em_curso = False
+
+
+_modelos: Dict[str, genai.GenerativeModel] = {}
+_disjuntor = Disjuntor(config.IA_DISJUNTOR_FALHAS, config.IA_DISJUNTOR_TEMPO)
+
+_semaforo_global: Optional[asyncio.Semaphore] = None
+_semaforos_usuario: Dict[int, asyncio.Semaphore] = {}
+_pedidos_usuario: Dict[int, int] = {}   # pedidos em curso por usuário, para descartar semáforos ociosos
+_aguardando = 0
+_em_curso = 0
+
+# Pausa adaptativa compartilhada: cresce a cada 429 e diminui a cada sucesso
+_pausa = 0.0
+_pausa_ate = 0.0
+
+_contadores = {"chamadas": 0, "sucessos": 0, "falhas_transitorias": 0, "recusados": 0, "prazos_esgotados": 0}
+
+
+def obter_modelo(nome: Optional[str] = None) -> genai.GenerativeModel:
+    """Instância reaproveitada do modelo (o padrão é config.GEMINI_MODEL_NAME)."""
+    nome = nome or config.GEMINI_MODEL_NAME
+    modelo = _modelos.get(nome)
+    if modelo is None:
+        modelo = _modelos[nome] = genai.GenerativeModel(nome)
+    return modelo
+
+
+def _obter_semaforo_global() -> asyncio.Semaphore:
+    global _semaforo_global
+    if _semaforo_global is None:
+        _semaforo_global = asyncio.Semaphore(config.IA_CONCORRENCIA_GLOBAL)
+    return _semaforo_global
+
+
+@asynccontextmanager
+async def _vez_do_usuario(usuario_id: Optional[int]):
+    """Limita as chamadas simultâneas de um mesmo usuário (ex.: os chunks de um extrato)."""
+    if usuario_id is None:
+        yield
+        return
+    semaforo = _semaforos_usuario.get(usuario_id)
+    if semaforo is None:
+        semaforo = _semaforos_usuario[usuario_id] = asyncio.Semaphore(config.IA_CONCORRENCIA_POR_USUARIO)
+    _pedidos_usuario[usuario_id] = _pedidos_usuario.get(usuario_id, 0) + 1
+    try:
+        async with semaforo:
+            yield
+    finally:
+        _pedidos_usuario[usuario_id] -= 1
+        if not _pedidos_usuario[usuario_id]:
+            del _pedidos_usuario[usuario_id]
+            _semaforos_usuario.pop(usuario_id, None)
+
+
+def _restante(limite: float) -> float:
+    return limite - time.monotonic()
+
+
+def _recusar(motivo: str, contador: str = "recusados") -> IAIndisponivelError:
+    _contadores[contador] += 1
+    logger.warning(f"Pedido à IA recusado: {motivo}")
+    return IAIndisponivelError(motivo)
+
+
+def _registrar_limite_taxa() -> None:
+    global _pausa, _pausa_ate
+    _pausa = min(max(_pausa * 2, config.IA_BACKOFF_BASE), config.IA_BACKOFF_MAX)
+    _pausa_ate = max(_pausa_ate, time.monotonic() + _pausa)
+    logger.warning(f"Gemini limitou a taxa (429). Pausando novas chamadas por {_pausa:.1f}s.")
+
+
+def _registrar_sucesso() -> None:
+    global _pausa
+    _pausa = _pausa / 2 if _pausa >= config.IA_BACKOFF_BASE else 0.0
+    _contadores["sucessos"] += 1
+    _disjuntor.registrar_sucesso()
+
+
+async def _aguardar_pausa(limite: float) -> None:
+    espera = _pausa_ate - time.monotonic()
+    if espera <= 0:
+        return
+    if espera >= _restante(limite):
+        raise _recusar("pausa por limite de taxa maior que o prazo do pedido", "prazos_esgotados")
+    await asyncio.sleep(espera)
+
+
+@asynccontextmanager
+async def _vez_na_fila(usuario_id: Optional[int], prazo: float):
+    """Reserva uma vaga no limite global (e no do usuário) e entrega o instante-limite do pedido."""
+    global _aguardando, _em_curso
+    if _disjuntor.recusando():
+        raise _recusar("disjuntor aberto")
+
+    async with _vez_do_usuario(usuario_id):
+        if _aguardando >= config.IA_FILA_MAX:
+            raise _recusar(f"{_aguardando} pedidos já aguardando")
+
+        limite = time.monotonic() + prazo
+        semaforo = _obter_semaforo_global()
+        _aguardando += 1
+        try:
+            await asyncio.wait_for(semaforo.acquire(), timeout=prazo)
+        except asyncio.TimeoutError:
+            raise _recusar("prazo esgotado aguardando a vez", "prazos_esgotados") from None
+        finally:
+            _aguardando -= 1
+
+        _em_curso += 1
+        try:
+            yield limite
+        finally:
+            _em_curso -= 1
+            semaforo.release()
+
+
+async def gerar_texto(
+    prompt,
+    *,
+    usuario_id: Optional[int] = None,
+    prazo: Optional[float] = None,
+    tentativas: Optional[int] = None,
+    modelo: Optional[str] = None,
+) -> str:
+    """
+    Envia o prompt ao Gemini e retorna o texto da resposta.
+
+    `prazo` (segundos) conta a partir do momento em que o pedido disputa a vez com
+    os dos outros usuários; a espera na fila do próprio usuário fica de fora.
+    Levanta IAIndisponivelError quando o pedido é recusado ou o prazo se esgota;
+    outros erros da API (ex.: prompt inválido, resposta bloqueada) sobem como antes.
+    """
+    instancia = obter_modelo(modelo)
+    async with _vez_na_fila(usuario_id, prazo or config.IA_PRAZO_PADRAO) as limite:
+        return await _chamar_com_tentativas(instancia, prompt, limite, tentativas or config.IA_TENTATIVAS)
+
+
+async def gerar_texto_em_partes(
+    prompt,
+    *,
+    usuario_id: Optional[int] = None,
+    prazo: Optional[float] = None,
+    tentativas: Optional[int] = None,
+    modelo: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """
+    Como `gerar_texto`, mas em streaming: entrega cada trecho de texto assim que chega.
+
+    A vaga na fila fica reservada até o fim do streaming. Só há nova tentativa se a
+    falha acontecer antes do primeiro trecho; depois dele, o corte vira
+    IAIndisponivelError (o chamador já exibiu parte da resposta). Use com
+    `contextlib.aclosing` para liberar a vaga se parar de consumir no meio.
+    """
+    instancia = obter_modelo(modelo)
+    tentativas = tentativas or config.IA_TENTATIVAS
+    async with _vez_na_fila(usuario_id, prazo or config.IA_PRAZO_PADRAO) as limite:
+        for tentativa in range(1, tentativas + 1):
+            timeout = await _preparar_tentativa(limite)
+            recebeu_texto = False
+            registrado = False
+            try:
+                resposta = await asyncio.wait_for(
+                    instancia.generate_content_async(prompt, stream=True, request_options={"timeout": timeout}),
+                    timeout=timeout,
+                )
+                trechos = resposta.__aiter__()
+                while True:
+                    # O timeout vale para o intervalo entre trechos, limitado ao prazo do pedido
+                    timeout = min(config.IA_TIMEOUT_TENTATIVA, _restante(limite))
+                    if timeout <= 0:
+                        raise asyncio.TimeoutError()
+                    try:
+                        trecho = await asyncio.wait_for(trechos.__anext__(), timeout=timeout)
+                    except StopAsyncIteration:
+                        break
+                    texto = _texto_do_trecho(trecho)
+                    if texto:
+                        recebeu_texto = True
+                        yield texto
+                _registrar_sucesso()
+                registrado = True
+                return
+            except ERROS_TRANSITORIOS as e:
+                registrado = True
+                if recebeu_texto:
+                    _registrar_falha_transitoria(e, tentativa, tentativas)
+                    raise _recusar("streaming interrompido no meio da resposta") from e
+                await _apos_falha_transitoria(e, tentativa, tentativas, limite)
+                continue
+            except google_exceptions.GoogleAPICallError:
+                _disjuntor.registrar_sucesso()
+                registrado = True
+                raise
+            finally:
+                if not registrado:
+                    _disjuntor.liberar_teste()
+        raise _recusar("nenhuma tentativa disponível")
+
+
+def _texto_do_trecho(trecho) -> str:
+    # Trechos sem texto (ex.: só o motivo de término) levantam ValueError em `.text`
+    try:
+        return trecho.text
+    except ValueError:
+        return ""
+
+
+async def _preparar_tentativa(limite: float) -> float:
+    """Respeita a pausa por 429 e o disjuntor; retorna o timeout desta tentativa."""
+    await _aguardar_pausa(limite)
+    if not _disjuntor.permitir():
+        raise _recusar("disjuntor aberto")
+
+    timeout = min(config.IA_TIMEOUT_TENTATIVA, _restante(limite))
+    if timeout <= 0:
+        _disjuntor.liberar_teste()
+        raise _recusar("prazo esgotado antes da chamada", "prazos_esgotados")
+    _contadores["chamadas"] += 1
+    return timeout
+
+
+def _registrar_falha_transitoria(e: Exception, tentativa: int, tentativas: int) -> None:
+    _contadores["falhas_transitorias"] += 1
+    _disjuntor.registrar_falha()
+    if isinstance(e, ERROS_LIMITE_TAXA):
+        _registrar_limite_taxa()
+    logger.warning(f"Falha transitória na IA (tentativa {tentativa}/{tentativas}): {type(e).__name__}: {e}")
+
+
+async def _apos_falha_transitoria(e: Exception, tentativa: int, tentativas: int, limite: float) -> None:
+    """Registra a falha e aguarda o backoff; levanta IAIndisponivelError se não houver nova tentativa."""
+    _registrar_falha_transitoria(e, tentativa, tentativas)
+    # Full jitter: espalha as novas tentativas para não voltarem todas juntas
+    espera = random.uniform(0, min(config.IA_BACKOFF_MAX, config.IA_BACKOFF_BASE * 2 ** (tentativa - 1)))
+    if tentativa == tentativas:
+        raise _recusar(f"{tentativas} tentativas falharam") from e
+    if espera >= _restante(limite):
+        raise _recusar("prazo esgotado entre tentativas", "prazos_esgotados") from e
+    await asyncio.sleep(espera)
+
+
+async def _chamar_com_tentativas(instancia: genai.GenerativeModel, prompt, limite: float, tentativas: int) -> str:
+    for tentativa in range(1, tentativas + 1):
+        timeout = await _preparar_tentativa(limite)
+        registrado = False
+        try:
+            resposta = await asyncio.wait_for(
+                instancia.generate_content_async(prompt, request_options={"timeout": timeout}),
+                timeout=timeout,
+            )
+            _registrar_sucesso()
+            registrado = True
+        except ERROS_TRANSITORIOS as e:
+            registrado = True
+            await _apos_falha_transitoria(e, tentativa, tentativas, limite)
+            continue
+        except google_exceptions.GoogleAPICallError:
+            # A API respondeu (ex.: prompt inválido): o serviço está de pé
+            _disjuntor.registrar_sucesso()
+            registrado = True
+            raise
+        finally:
+            if not registrado:
+                _disjuntor.liberar_teste()
+        return resposta.text
+    raise _recusar("nenhuma tentativa disponível")
+
+
+def get_gateway_stats() -> dict:
+    return {
+        "em_curso": _em_curso,
+        "aguardando": _aguardando,
+        "disjuntor": _disjuntor.estado,
+        "pausa_s": round(max(_pausa_ate - time.monotonic(), 0.0), 1),
+        **_contadores,
+    }
@@ -1,21 +1,23 @@
 # gerente_financeiro/graficos.py
+import asyncio
 import logging
-from contextlib import contextmanager
 from enum import IntEnum
-from functools import lru_cache
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from typing import Optional, Dict, Any, List, Tuple
+from dateutil.relativedelta import relativedelta
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
 from telegram.ext import (
     ContextTypes,
     ConversationHandler,
     CommandHandler,
     CallbackQueryHandler,
 )
-from telegram.error import TelegramError
+from telegram.error import BadRequest, TelegramError
 
-from database.database import get_db, DatabaseError, ServiceError  # Agora importando do database.py
+from database.database import get_async_db, DatabaseError, ServiceError  # Agora importando do database.py
 from . import services
+from . import servico_graficos
+from . import cache_agregados
 
 logger = logging.getLogger(__name__)
 
@@ -25,26 +27,21 @@ class ChartStates(IntEnum):
 
 # Mapeamento explícito dos parâmetros de cada gráfico
 CHART_PARAMS = {
-    "grafico_categoria_pizza": {"agrupar_por": "categoria", "tipo_grafico": "pizza"},
-    "grafico_categoria_barra_h": {"agrupar_por": "categoria", "tipo_grafico": "barra_h"},
-    "grafico_data_linha": {"agrupar_por": "data", "tipo_grafico": "linha"},
-    "grafico_fluxo_caixa_area": {"agrupar_por": "fluxo_caixa", "tipo_grafico": "area"},
-    "grafico_projecao_barra_linha": {"agrupar_por": "projecao", "tipo_grafico": "barra_linha"},
-    "grafico_forma_pagamento_pizza": {"agrupar_por": "forma_pagamento", "tipo_grafico": "pizza"},
+    "grafico_categoria_pizza": {"agrupar_por": "categoria", "tipo_grafico": "pizza", "titulo": "Despesas por Categoria"},
+    "grafico_categoria_barra_h": {"agrupar_por": "categoria", "tipo_grafico": "barra_h", "titulo": "Despesas por Categoria (Barras)"},
+    "grafico_data_linha": {"agrupar_por": "data", "tipo_grafico": "linha", "titulo": "Evolução do Saldo"},
+    "grafico_fluxo_caixa_area": {"agrupar_por": "fluxo_caixa", "tipo_grafico": "area", "titulo": "Fluxo de Caixa"},
+    "grafico_projecao_barra_linha": {"agrupar_por": "projecao", "tipo_grafico": "barra_linha", "titulo": "Projeção de Gastos"},
+    "grafico_forma_pagamento_pizza": {"agrupar_por": "forma_pagamento", "tipo_grafico": "pizza", "titulo": "Gastos por Forma de Pagamento"},
 }
 
-# Cache para lançamentos (5 minutos de TTL)
-CACHE_TTL_MINUTES = 5
-_cache_timestamps = {}
-
-@contextmanager
-def get_db_context():
-    """Context manager para garantir fechamento da conexão com BD."""
-    db = next(get_db())
-    try:
-        yield db
-    finally:
-        db.close()
+# Períodos oferecidos no menu (callback_data = "grafico_periodo_<chave>")
+PERIODOS_GRAFICO = {
+    "mes": "Mês atual",
+    "trimestre": "Últimos 3 meses",
+    "ano": "Ano atual",
+}
+PERIODO_PADRAO = "mes"
 
 def validate_user_request(user_id: Optional[int], action: str) -> bool:
     """
@@ -61,60 +58,81 @@ def validate_user_request(user_id: Optional[int], action: str) -> bool:
         logger.warning(f"User ID inválido: {user_id}")
         return False
     
-    if action not in CHART_PARAMS and action not in ["grafico_fechar", "grafico_voltar"]:
+    periodo = action.removeprefix("grafico_periodo_") if action.startswith("grafico_periodo_") else None
+    if action not in CHART_PARAMS and action not in ["grafico_fechar", "grafico_voltar"] and periodo not in PERIODOS_GRAFICO:
         logger.warning(f"Ação desconhecida: {action}")
         return False
     
     return True
 
-@lru_cache(maxsize=100)
-def get_cached_lancamentos(user_id: int, cache_key: str) -> Optional[List]:
-    """
-    Cache simples para lançamentos usando LRU cache.
-    
-    Args:
-        user_id: ID do usuário
-        cache_key: Chave única para o cache (baseada em timestamp)
-        
-    Returns:
-        Lista de lançamentos ou None
-    """
-    # O cache real é feito pelo decorator @lru_cache
-    # Esta função será chamada apenas quando necessário
-    with get_db_context() as db:
-        return services.buscar_lancamentos_com_relacionamentos(db, user_id)
+def resolver_periodo(chave: str, hoje: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    """Converte a chave do menu em um intervalo [início, fim) alinhado a meses."""
+    hoje = hoje or datetime.now()
+    inicio_mes = hoje.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if chave == "trimestre":
+        return inicio_mes - relativedelta(months=2), inicio_mes + relativedelta(months=1)
+    if chave == "ano":
+        return inicio_mes.replace(month=1), inicio_mes.replace(month=1) + relativedelta(years=1)
+    return inicio_mes, inicio_mes + relativedelta(months=1)
+
+def interpretar_intervalo(args: List[str]) -> Optional[Tuple[datetime, datetime]]:
+    """Lê '/grafico DD/MM/AAAA DD/MM/AAAA' (datas inclusivas)."""
+    if len(args) != 2:
+        return None
+    try:
+        inicio, fim = (datetime.strptime(a, '%d/%m/%Y') for a in args)
+    except ValueError:
+        return None
+    if fim < inicio:
+        inicio, fim = fim, inicio
+    return inicio, fim + timedelta(days=1)
+
+def rotulo_intervalo(inicio: datetime, fim: datetime) -> str:
+    return f"{inicio.strftime('%d/%m/%Y')} a {(fim - timedelta(days=1)).strftime('%d/%m/%Y')}"
+
+def periodo_selecionado(context: ContextTypes.DEFAULT_TYPE) -> Tuple[datetime, datetime, str]:
+    """Período escolhido pelo usuário nesta conversa (início, fim exclusivo, rótulo)."""
+    personalizado = context.user_data.get('grafico_intervalo')
+    if personalizado:
+        inicio, fim = personalizado
+        return inicio, fim, rotulo_intervalo(inicio, fim)
+    chave = context.user_data.get('grafico_periodo', PERIODO_PADRAO)
+    inicio, fim = resolver_periodo(chave)
+    return inicio, fim, PERIODOS_GRAFICO[chave]
 
-def get_cache_key(user_id: int) -> str:
+async def get_cached_dados_grafico(user_id: int, agregacao: str,
+                                   data_inicio: datetime, data_fim: datetime) -> Optional[List]:
     """
-    Gera uma chave de cache baseada no tempo (TTL de 5 minutos).
+    Totais agregados de um gráfico, via cache TTL+LRU por usuário e período.
     
     Args:
         user_id: ID do usuário
+        agregacao: Agregação SQL ('categoria', 'forma_pagamento' ou 'dia')
+        data_inicio: Início do período (inclusivo)
+        data_fim: Fim do período (exclusivo)
         
     Returns:
-        Chave de cache única
+        Lista de tuplas agregadas (ver services.agregar_dados_grafico) ou None
     """
-    now = datetime.now()
-    
-    # Verifica se precisa invalidar cache do usuário
-    if user_id in _cache_timestamps:
-        last_update = _cache_timestamps[user_id]
-        if now - last_update > timedelta(minutes=CACHE_TTL_MINUTES):
-            # Cache expirado, limpa a entrada específica
-            get_cached_lancamentos.cache_clear()
-            del _cache_timestamps[user_id]
-    
-    # Atualiza timestamp
-    _cache_timestamps[user_id] = now
-    
-    # Retorna chave baseada em intervalos de 5 minutos
-    interval = now.replace(second=0, microsecond=0)
-    interval = interval.replace(minute=(interval.minute // CACHE_TTL_MINUTES) * CACHE_TTL_MINUTES)
-    
-    return f"{user_id}_{interval.isoformat()}"
+    async def calcular():
+        async with get_async_db() as db:
+            return await services.agregar_dados_grafico(db, user_id, agregacao, data_inicio, data_fim)
+
+    return await cache_agregados.obter_ou_calcular(
+        user_id, ("grafico", agregacao, data_inicio, data_fim), calcular
+    )
 
 async def show_chart_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Exibe o menu de gráficos com layout otimizado."""
+    if update.message:
+        # /grafico DD/MM/AAAA DD/MM/AAAA define um intervalo personalizado
+        context.user_data.pop('grafico_intervalo', None)
+        intervalo = interpretar_intervalo(context.args or [])
+        if intervalo:
+            context.user_data['grafico_intervalo'] = intervalo
+    _, _, rotulo_periodo = periodo_selecionado(context)
+    periodo_atual = None if context.user_data.get('grafico_intervalo') else context.user_data.get('grafico_periodo', PERIODO_PADRAO)
+
     keyboard = [
         [
             InlineKeyboardButton("🍕 Desp. por Categoria", callback_data="grafico_categoria_pizza"),
@@ -128,13 +146,18 @@ async def show_chart_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             InlineKeyboardButton("🔮 Projeção de Gastos", callback_data="grafico_projecao_barra_linha"),
             InlineKeyboardButton("💳 Gastos por Pagamento", callback_data="grafico_forma_pagamento_pizza")
         ],
+        [
+            InlineKeyboardButton(("✅ " if chave == periodo_atual else "") + rotulo, callback_data=f"grafico_periodo_{chave}")
+            for chave, rotulo in PERIODOS_GRAFICO.items()
+        ],
         [InlineKeyboardButton("❌ Fechar", callback_data="grafico_fechar")]
     ]
     
     text = (
         "📊 <b>Painel de Visualização</b>\n"
+        f"📅 Período: <b>{rotulo_periodo}</b>\n"
         "Escolha uma análise para gerar:\n\n"
-        "💡 <i>Tip: Os gráficos são gerados com base nos seus lançamentos mais recentes</i>"
+        "💡 <i>Tip: Use /grafico DD/MM/AAAA DD/MM/AAAA para um intervalo personalizado</i>"
     )
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -186,6 +209,11 @@ async def chart_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
     if action == "grafico_voltar":
         return await show_chart_menu(update, context)
 
+    if action.startswith("grafico_periodo_"):
+        context.user_data.pop('grafico_intervalo', None)
+        context.user_data['grafico_periodo'] = action.removeprefix("grafico_periodo_")
+        return await show_chart_menu(update, context)
+
     # Processamento de gráficos
     try:
         params = CHART_PARAMS.get(action)
@@ -210,14 +238,22 @@ async def chart_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
             parse_mode='HTML'
         )
         
-        # Busca dados com cache
-        cache_key = get_cache_key(user_id)
-        lancamentos = get_cached_lancamentos(user_id, cache_key)
+        # A projeção é sempre do mês corrente; os demais usam o período escolhido
+        if agrupar_por == "projecao":
+            data_inicio, data_fim = resolver_periodo("mes")
+            rotulo_periodo = PERIODOS_GRAFICO["mes"]
+        else:
+            data_inicio, data_fim, rotulo_periodo = periodo_selecionado(context)
+
+        # Busca os totais agregados no banco, com cache
+        dados = await get_cached_dados_grafico(
+            user_id, services.AGREGACAO_POR_AGRUPAMENTO[agrupar_por], data_inicio, data_fim
+        )
         
-        if not lancamentos:
+        if not dados:
             await query.edit_message_text(
                 "⚠️ <b>Dados insuficientes</b>\n"
-                "Não encontrei lançamentos para gerar este gráfico.\n\n"
+                f"Não encontrei lançamentos em <b>{rotulo_periodo}</b> para gerar este gráfico.\n\n"
                 "💡 <i>Adicione alguns lançamentos primeiro!</i>",
                 reply_markup=InlineKeyboardMarkup([[
                     InlineKeyboardButton("↩️ Voltar ao Menu", callback_data="grafico_voltar")
@@ -226,17 +262,33 @@ async def chart_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
             )
             return ChartStates.CHART_MENU
 
-        # Gera o gráfico
-        grafico_buffer = services.gerar_grafico_dinamico(lancamentos, tipo_grafico, agrupar_por)
+        legenda = f"📊 <b>{nome_exibicao}</b> · {rotulo_periodo}\n<i>Gerado em {datetime.now().strftime('%d/%m/%Y às %H:%M')}</i>"
+        chat_id = query.message.chat.id
+
+        # Mesmo gráfico com os mesmos dados: reenvia pelo file_id, sem renderizar nem subir o PNG
+        digest = servico_graficos.digest_grafico(tipo_grafico, agrupar_por, dados)
+        file_id = servico_graficos.obter_file_id(digest)
+        if file_id:
+            try:
+                await context.bot.send_photo(chat_id=chat_id, photo=file_id, caption=legenda, parse_mode='HTML')
+                return await show_chart_menu(update, context)
+            except BadRequest as e:
+                logger.warning(f"file_id de gráfico recusado pelo Telegram ({e}). Renderizando novamente.")
+                servico_graficos.descartar_file_id(digest)
+
+        # Gera o gráfico no pool de processos, sem travar o event loop
+        grafico_buffer = await servico_graficos.renderizar_grafico_dinamico(dados, tipo_grafico, agrupar_por)
         
         if grafico_buffer:
-            # Envia o gráfico
-            await context.bot.send_photo(
-                chat_id=query.message.chat.id, 
+            # Envia o gráfico e guarda o file_id para os próximos pedidos iguais
+            mensagem = await context.bot.send_photo(
+                chat_id=chat_id, 
                 photo=grafico_buffer,
-                caption=f"📊 <b>{nome_exibicao}</b>\n<i>Gerado em {datetime.now().strftime('%d/%m/%Y às %H:%M')}</i>",
+                caption=legenda,
                 parse_mode='HTML'
             )
+            if mensagem.photo:
+                servico_graficos.registrar_file_id(digest, mensagem.photo[-1].file_id)
             
             # Retorna ao menu
             return await show_chart_menu(update, context)
@@ -306,6 +358,115 @@ async def chart_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
             
     return ChartStates.CHART_MENU
 
+async def dashboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    /dashboard [mes|trimestre|ano|DD/MM/AAAA DD/MM/AAAA]
+    Agrega os dados uma vez, renderiza todos os gráficos em paralelo no pool
+    e envia tudo num único álbum.
+    """
+    user_id = update.effective_user.id
+    args = context.args or []
+    intervalo = interpretar_intervalo(args)
+    if intervalo:
+        data_inicio, data_fim = intervalo
+        rotulo_periodo = rotulo_intervalo(data_inicio, data_fim)
+    else:
+        chave = args[0].lower() if args and args[0].lower() in PERIODOS_GRAFICO else PERIODO_PADRAO
+        data_inicio, data_fim = resolver_periodo(chave)
+        rotulo_periodo = PERIODOS_GRAFICO[chave]
+
+    aviso = await update.message.reply_text(
+        f"⏳ Montando seu dashboard de <b>{rotulo_periodo}</b>...", parse_mode='HTML'
+    )
+
+    try:
+        # Uma consulta por agregação distinta (a projeção é sempre do mês corrente)
+        periodo_por_grafico = {
+            acao: resolver_periodo("mes") if p["agrupar_por"] == "projecao" else (data_inicio, data_fim)
+            for acao, p in CHART_PARAMS.items()
+        }
+        consultas = {
+            (services.AGREGACAO_POR_AGRUPAMENTO[p["agrupar_por"]], *periodo_por_grafico[acao])
+            for acao, p in CHART_PARAMS.items()
+        }
+        consultas = list(consultas)
+        resultados = await asyncio.gather(*(get_cached_dados_grafico(user_id, *c) for c in consultas))
+        dados_por_consulta = dict(zip(consultas, resultados))
+
+        # Reaproveita file_ids já enviados e renderiza o resto ao mesmo tempo
+        itens = []
+        for acao, p in CHART_PARAMS.items():
+            dados = dados_por_consulta[(services.AGREGACAO_POR_AGRUPAMENTO[p["agrupar_por"]], *periodo_por_grafico[acao])]
+            if not dados:
+                continue
+            digest = servico_graficos.digest_grafico(p["tipo_grafico"], p["agrupar_por"], dados)
+            itens.append({"params": p, "dados": dados, "digest": digest, "file_id": servico_graficos.obter_file_id(digest)})
+
+        async def renderizar_pendentes():
+            pendentes = [item for item in itens if not item["file_id"]]
+            pngs = await asyncio.gather(*(
+                servico_graficos.renderizar_grafico_dinamico(item["dados"], item["params"]["tipo_grafico"], item["params"]["agrupar_por"])
+                for item in pendentes
+            ))
+            for item, png in zip(pendentes, pngs):
+                item["png"] = png
+
+        await renderizar_pendentes()
+        prontos = [item for item in itens if item["file_id"] or item.get("png")]
+
+        if not prontos:
+            await aviso.edit_text(
+                "⚠️ <b>Dados insuficientes</b>\n"
+                f"Não encontrei lançamentos em <b>{rotulo_periodo}</b> para montar o dashboard.\n\n"
+                "💡 <i>Adicione alguns lançamentos primeiro!</i>",
+                parse_mode='HTML'
+            )
+            return
+
+        cabecalho = f"📊 <b>Dashboard</b> · {rotulo_periodo}\n<i>Gerado em {datetime.now().strftime('%d/%m/%Y às %H:%M')}</i>"
+
+        chat_id = update.effective_chat.id
+
+        async def enviar():
+            legendas = [(f"{cabecalho}\n\n" if i == 0 else "") + f"<b>{item['params']['titulo']}</b>" for i, item in enumerate(prontos)]
+            if len(prontos) == 1:
+                # Álbuns exigem pelo menos duas mídias
+                item = prontos[0]
+                return [await context.bot.send_photo(chat_id=chat_id, photo=item["file_id"] or item["png"],
+                                                     caption=legendas[0], parse_mode='HTML')]
+            album = [
+                InputMediaPhoto(media=item["file_id"] or item["png"], caption=legenda, parse_mode='HTML')
+                for item, legenda in zip(prontos, legendas)
+            ]
+            return await context.bot.send_media_group(chat_id=chat_id, media=album)
+
+        try:
+            mensagens = await enviar()
+        except BadRequest as e:
+            if not any(item["file_id"] for item in prontos):
+                raise
+            # Algum file_id antigo foi recusado: renderiza tudo e tenta de novo
+            logger.warning(f"Álbum do dashboard recusado ({e}). Renderizando todos os gráficos novamente.")
+            for item in prontos:
+                if item["file_id"]:
+                    servico_graficos.descartar_file_id(item["digest"])
+                    item["file_id"] = None
+            await renderizar_pendentes()
+            prontos = [item for item in prontos if item.get("png")]
+            mensagens = await enviar()
+
+        for item, mensagem in zip(prontos, mensagens):
+            if not item["file_id"] and mensagem.photo:
+                servico_graficos.registrar_file_id(item["digest"], mensagem.photo[-1].file_id)
+        await aviso.delete()
+
+    except DatabaseError as e:
+        logger.error(f"Erro de banco de dados ao gerar dashboard: {e}", exc_info=True)
+        await aviso.edit_text("❌ Problema temporário com o banco de dados. Tente novamente em alguns instantes.")
+    except Exception as e:
+        logger.error(f"Erro inesperado ao gerar dashboard: {e}", exc_info=True)
+        await aviso.edit_text("❌ Ocorreu um problema ao montar o dashboard. Tente novamente.")
+
 async def cancel_chart(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Cancela a operação de gráfico com mensagem amigável."""
     if update.message:
@@ -324,11 +485,7 @@ def clear_user_cache(user_id: int) -> None:
     Args:
         user_id: ID do usuário para limpar cache
     """
-    if user_id in _cache_timestamps:
-        del _cache_timestamps[user_id]
-    
-    # Limpa todo o cache LRU (pode ser otimizado para limpar apenas o usuário específico)
-    get_cached_lancamentos.cache_clear()
+    cache_agregados.invalidar_usuario(user_id)
     logger.info(f"Cache limpo para usuário {user_id}")
 
 def get_cache_stats() -> Dict[str, Any]:
@@ -336,17 +493,9 @@ def get_cache_stats() -> Dict[str, Any]:
     Retorna estatísticas do cache para monitoramento.
     
     Returns:
-        Dict com estatísticas do cache
+        Dict com estatísticas do cache (globais e por entrada)
     """
-    cache_info = get_cached_lancamentos.cache_info()
-    return {
-        "hits": cache_info.hits,
-        "misses": cache_info.misses,
-        "maxsize": cache_info.maxsize,
-        "currsize": cache_info.currsize,
-        "active_users": len(_cache_timestamps),
-        "hit_rate": cache_info.hits / (cache_info.hits + cache_info.misses) if (cache_info.hits + cache_info.misses) > 0 else 0
-    }
+    return {**cache_agregados.get_cache_stats(), "graficos_enviados": servico_graficos.get_file_id_stats()}
 
 # ConversationHandler para os gráficos
 grafico_conv = ConversationHandler(
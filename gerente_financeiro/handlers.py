@@ -1,15 +1,21 @@
+import asyncio
+import html
 import json
 import logging
 import random
 import re
+import time
+from contextlib import aclosing
 from datetime import datetime, timedelta, timezone
 from dateutil.relativedelta import relativedelta
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Optional
 import os
 from .services import preparar_contexto_financeiro_completo
-import google.generativeai as genai
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.error import BadRequest, RetryAfter, TelegramError
 from telegram.ext import (
     CallbackQueryHandler, CommandHandler, ContextTypes, ConversationHandler,
     MessageHandler, filters
@@ -18,7 +24,7 @@ from telegram.ext import (
 # --- IMPORTS DO PROJETO ---
 
 import config
-from database.database import get_db, get_or_create_user, buscar_lancamentos_usuario
+from database.database import get_async_db, get_or_create_user, buscar_lancamentos_usuario
 from models import Categoria, Lancamento, Subcategoria, Usuario, ItemLancamento, Conta
 from .prompts import PROMPT_GERENTE_VDM, PROMPT_INSIGHT_FINAL, SUPER_PROMPT_MAESTRO_CONTEXTUAL
 
@@ -28,10 +34,14 @@ from .services import (
     buscar_lancamentos_com_relacionamentos,
     definir_perfil_investidor,
     detectar_intencao_e_topico,
+    get_category_emoji,
     obter_dados_externos,
     preparar_contexto_json
 )
 from . import services
+from . import gateway_ia
+from .filtros_lancamento import interpretar_filtros
+from .perguntas_rapidas import classificar_pergunta, pode_ser_rapida
 
 
 logger = logging.getLogger(__name__)
@@ -163,8 +173,27 @@ class AnalisadorIntencao:
 
 # --- FUNÇÕES UTILITÁRIAS MELHORADAS ---
 
+def _normalizar_texto_telegram(texto: str) -> str:
+    return texto.strip().replace('<br>', '\n').replace('<br/>', '\n')
+
+def _dividir_em_blocos(texto_limpo: str) -> List[str]:
+    """Quebra o texto em blocos de até 4096 caracteres, de preferência entre parágrafos."""
+    partes = []
+    while len(texto_limpo) > 0:
+        if len(texto_limpo) <= 4096:
+            partes.append(texto_limpo)
+            break
+        
+        corte = texto_limpo[:4096].rfind("\n\n")
+        if corte == -1: corte = texto_limpo[:4096].rfind("\n")
+        if corte == -1: corte = 4096
+        
+        partes.append(texto_limpo[:corte])
+        texto_limpo = texto_limpo[corte:].strip()
+    return partes
+
 async def enviar_texto_em_blocos(bot, chat_id, texto: str, reply_markup=None):
-    texto_limpo = texto.strip().replace('<br>', '\n').replace('<br/>', '\n')
+    texto_limpo = _normalizar_texto_telegram(texto)
     
     if len(texto_limpo) <= 4096:
         try:
@@ -181,19 +210,7 @@ async def enviar_texto_em_blocos(bot, chat_id, texto: str, reply_markup=None):
             await bot.send_message(chat_id=chat_id, text=re.sub('<[^<]+?>', '', texto_limpo), reply_markup=reply_markup)
             return
     
-    partes = []
-    while len(texto_limpo) > 0:
-        if len(texto_limpo) <= 4096:
-            partes.append(texto_limpo)
-            break
-        
-        corte = texto_limpo[:4096].rfind("\n\n")
-        if corte == -1: corte = texto_limpo[:4096].rfind("\n")
-        if corte == -1: corte = 4096
-        
-        partes.append(texto_limpo[:corte])
-        texto_limpo = texto_limpo[corte:].strip()
-    
+    partes = _dividir_em_blocos(texto_limpo)
     for i, parte in enumerate(partes):
         is_last_part = (i == len(partes) - 1)
         try:
@@ -245,6 +262,162 @@ def parse_action_buttons(text: str) -> tuple[str, InlineKeyboardMarkup | None]:
     
     return clean_text, None
 
+# --- RESPOSTA DA IA EM STREAMING ---
+
+TAMANHO_MAX_PREVIA = 4000
+CURSOR_STREAMING = " ▌"
+
+def _segundos(valor) -> float:
+    # RetryAfter.retry_after pode vir como int ou timedelta, conforme a versão do PTB
+    return valor.total_seconds() if isinstance(valor, timedelta) else float(valor)
+
+class MensagemProgressiva:
+    """
+    Uma mensagem do Telegram editada à medida que a resposta da IA chega.
+
+    As prévias vão como texto simples (HTML pela metade quebraria o parse do
+    Telegram) e com no máximo uma edição a cada IA_STREAMING_INTERVALO segundos.
+    `finalizar` troca a prévia pelo HTML completo e pelos botões de ação.
+    Respostas que começam como JSON (chamada de função) nunca são exibidas.
+    """
+
+    def __init__(self, bot, chat_id: int):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.mensagem = None
+        self.ultima_previa = ""
+        self.proxima_edicao = 0.0
+        self.e_chamada_de_funcao = False
+
+    @property
+    def iniciada(self) -> bool:
+        return self.mensagem is not None
+
+    def _previa(self, texto_bruto: str) -> Optional[str]:
+        texto = texto_bruto.lstrip()
+        if texto.startswith('`'):
+            if '\n' not in texto:
+                return None  # ainda não dá para saber se é ```json ou ```html
+            texto = texto.split('\n', 1)[1].lstrip()
+        if not texto:
+            return None
+        if texto.startswith('{'):
+            self.e_chamada_de_funcao = True
+            return None
+
+        texto = re.split(r'\[ACTION_BUTTONS', texto, maxsplit=1, flags=re.IGNORECASE)[0]
+        texto = re.sub(r'\[[A-Z_]*$', '', texto)           # início de [ACTION_BUTTONS ainda incompleto
+        texto = re.sub(r'```\s*$', '', texto)
+        texto = re.sub(r'<br\s*/?>', '\n', texto)
+        texto = re.sub(r'<[^<>]*>', '', texto)
+        texto = re.sub(r'<[^<>]*$', '', texto)              # tag ainda incompleta
+        texto = html.unescape(texto).strip()
+        if len(texto) > TAMANHO_MAX_PREVIA:
+            texto = texto[:TAMANHO_MAX_PREVIA].rstrip() + " …"
+        return texto or None
+
+    async def _aguardar_vez(self) -> None:
+        espera = self.proxima_edicao - time.monotonic()
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+    async def _enviar_ou_editar(self, texto: str, **kwargs) -> None:
+        if self.mensagem is None:
+            self.mensagem = await self.bot.send_message(
+                chat_id=self.chat_id, text=texto, disable_web_page_preview=True, **kwargs
+            )
+        else:
+            await self.mensagem.edit_text(texto, disable_web_page_preview=True, **kwargs)
+
+    async def atualizar(self, texto_bruto: str) -> None:
+        """Mostra o texto recebido até agora, se já for hora de editar a mensagem."""
+        if self.e_chamada_de_funcao or time.monotonic() < self.proxima_edicao:
+            return
+        previa = self._previa(texto_bruto)
+        if previa is None or previa == self.ultima_previa:
+            return
+        try:
+            await self._enviar_ou_editar(previa + CURSOR_STREAMING)
+            self.ultima_previa = previa
+        except RetryAfter as e:
+            self.proxima_edicao = time.monotonic() + _segundos(e.retry_after)
+            return
+        except TelegramError as e:
+            # Uma prévia perdida não é problema: a versão final é enviada em finalizar()
+            logger.warning(f"Falha ao atualizar a resposta em streaming para {self.chat_id}: {e}")
+        self.proxima_edicao = time.monotonic() + config.IA_STREAMING_INTERVALO
+
+    async def finalizar(self, texto: str, reply_markup=None) -> None:
+        """Substitui a prévia pelo texto final em HTML; o que passar de 4096 caracteres vai em novas mensagens."""
+        blocos = _dividir_em_blocos(_normalizar_texto_telegram(texto))
+        primeiro, resto = blocos[0], "\n\n".join(blocos[1:])
+        markup_primeiro = None if resto else reply_markup
+        for _ in range(2):
+            await self._aguardar_vez()
+            try:
+                try:
+                    await self._enviar_ou_editar(primeiro, parse_mode="HTML", reply_markup=markup_primeiro)
+                except BadRequest as e:
+                    if "not modified" in str(e).lower():
+                        break
+                    logger.error(f"HTML da resposta recusado pelo Telegram ({e}). Enviando sem formatação.")
+                    await self._enviar_ou_editar(re.sub('<[^<]+?>', '', primeiro), reply_markup=markup_primeiro)
+                break
+            except RetryAfter as e:
+                self.proxima_edicao = time.monotonic() + _segundos(e.retry_after)
+        if resto:
+            await enviar_texto_em_blocos(self.bot, self.chat_id, resto, reply_markup=reply_markup)
+
+    async def interromper(self) -> None:
+        """Marca a prévia exibida como incompleta quando o streaming cai no meio."""
+        if not self.iniciada:
+            return
+        try:
+            await self._aguardar_vez()
+            await self.mensagem.edit_text(f"{self.ultima_previa}\n\n⚠️ Resposta interrompida.")
+        except TelegramError as e:
+            logger.warning(f"Falha ao marcar a resposta interrompida para {self.chat_id}: {e}")
+
+async def gerar_resposta_gerente(bot, chat_id: int, prompt: str) -> Tuple[str, Optional[str]]:
+    """
+    Chama a IA para o /gerente e retorna (resposta_limpa, texto_exibido).
+
+    Com IA_STREAMING ligado, a resposta em texto já sai exibida e finalizada
+    (com os botões) e `texto_exibido` traz o que o usuário viu. Se for `None`,
+    nada foi enviado: a resposta é uma chamada de função ou o streaming está desligado.
+    """
+    if not config.IA_STREAMING:
+        return _limpar_resposta_ia(await gateway_ia.gerar_texto(prompt, usuario_id=chat_id)), None
+
+    mensagem = MensagemProgressiva(bot, chat_id)
+    recebido = []
+    inicio = time.monotonic()
+    try:
+        async with aclosing(gateway_ia.gerar_texto_em_partes(prompt, usuario_id=chat_id)) as trechos:
+            async for trecho in trechos:
+                if not recebido:
+                    logger.info(f"Primeiro trecho da IA para {chat_id} em {(time.monotonic() - inicio) * 1000:.0f} ms")
+                recebido.append(trecho)
+                await mensagem.atualizar("".join(recebido))
+    except gateway_ia.IAIndisponivelError:
+        await mensagem.interromper()
+        raise
+
+    resposta = _limpar_resposta_ia("".join(recebido))
+    if not resposta:
+        raise ValueError("A IA retornou uma resposta vazia.")
+    if mensagem.e_chamada_de_funcao:
+        return resposta, None
+    try:
+        json.loads(resposta)
+        if not mensagem.iniciada:
+            return resposta, None  # JSON curto que chegou antes de qualquer prévia
+    except json.JSONDecodeError:
+        pass
+    resposta_texto, reply_markup = parse_action_buttons(resposta)
+    await mensagem.finalizar(resposta_texto, reply_markup)
+    return resposta, resposta_texto
+
 def formatar_lancamento_detalhado(lanc: Lancamento) -> str:
     """
     Formata um lançamento no modelo de card "bonito" e padronizado.
@@ -262,114 +435,6 @@ def formatar_lancamento_detalhado(lanc: Lancamento) -> str:
     )
     return card
 
-async def handle_lista_lancamentos(chat_id: int, context: ContextTypes.DEFAULT_TYPE, parametros: dict):
-    """
-    Busca e exibe lançamentos com base nos parâmetros da IA, incluindo data.
-    """
-    logger.info(f"Executando handle_lista_lancamentos com parâmetros: {parametros}")
-    db = next(get_db())
-    try:
-        # Converte datas de string para objeto datetime, se existirem
-        if 'data_inicio' in parametros:
-            parametros['data_inicio'] = datetime.strptime(parametros['data_inicio'], '%Y-%m-%d')
-        if 'data_fim' in parametros:
-            parametros['data_fim'] = datetime.strptime(parametros['data_fim'], '%Y-%m-%d')
-
-        lancamentos = buscar_lancamentos_usuario(telegram_user_id=chat_id, **parametros)
-        
-        if not lancamentos:
-            await context.bot.send_message(chat_id, "Não encontrei nenhum lançamento com os critérios que você pediu. Tente outros filtros!")
-            return
-
-        resposta_final = f"Encontrei {len(lancamentos)} lançamento(s) com os critérios que você pediu:\n\n"
-        cards_formatados = [formatar_lancamento_detalhado(lanc) for lanc in lancamentos]
-        resposta_final += "\n\n".join(cards_formatados)
-
-        await enviar_texto_em_blocos(context.bot, chat_id, resposta_final)
-    finally:
-        db.close()
-
-async def handle_natural_language(update: Update, context: ContextTypes.DEFAULT_TYPE, custom_question: str = None) -> int:
-    """
-    Handler principal para o /gerente (V5).
-    """
-    is_callback = update.callback_query is not None
-    # ... (lógica para pegar a mensagem e o usuário, como na versão anterior) ...
-    if is_callback:
-        effective_message = update.callback_query.message
-        user_question = custom_question or ""
-        effective_user = update.callback_query.from_user
-    else:
-        effective_message = update.message
-        user_question = effective_message.text
-        effective_user = update.effective_user
-
-    chat_id = effective_message.chat_id
-    await context.bot.send_chat_action(chat_id=chat_id, action='typing')
-    
-    # ... (lógica do despachante de dados externos, como na versão anterior) ...
-    flag_dado_externo, topico_dado_externo = detectar_intencao_e_topico(user_question)
-    if flag_dado_externo:
-        logger.info(f"Intenção de dado externo detectada: {topico_dado_externo}")
-        dados = await obter_dados_externos(flag_dado_externo)
-        await enviar_texto_em_blocos(context.bot, chat_id, dados.get("texto_html", "Não encontrei a informação."))
-        return AWAIT_GERENTE_QUESTION
-
-    db = next(get_db())
-    try:
-        usuario_db = get_or_create_user(db, chat_id, effective_user.full_name)
-        
-        contexto_financeiro_str = preparar_contexto_financeiro_completo(db, usuario_db)
-        
-        # ... (lógica para chamar a IA com o prompt, como na versão anterior) ...
-        contexto_conversa = obter_contexto_usuario(context)
-        historico_conversa_str = contexto_conversa.get_contexto_formatado()
-        prompt_final = PROMPT_GERENTE_VDM.format(
-            user_name=usuario_db.nome_completo.split(' ')[0] if usuario_db.nome_completo else "você",
-            pergunta_usuario=user_question,
-            contexto_financeiro_completo=contexto_financeiro_str,
-            contexto_conversa=historico_conversa_str
-        )
-        model = genai.GenerativeModel(config.GEMINI_MODEL_NAME)
-        response = await model.generate_content_async(prompt_final)
-        resposta_ia = _limpar_resposta_ia(response.text)
-
-        # ... (lógica de decisão JSON vs Texto, como na versão anterior) ...
-        try:
-            dados_funcao = json.loads(resposta_ia)
-            if isinstance(dados_funcao, dict) and "funcao" in dados_funcao:
-                # ... (lógica de chamada de função, como na versão anterior) ...
-                nome_funcao = dados_funcao.get("funcao")
-                parametros = dados_funcao.get("parametros", {})
-                if nome_funcao == "listar_lancamentos":
-                    await handle_lista_lancamentos(chat_id, context, parametros)
-                else:
-                    await context.bot.send_message(chat_id, "A IA tentou uma ação que não conheço.")
-            else:
-                raise json.JSONDecodeError("Não é um JSON de função", resposta_ia, 0)
-        except json.JSONDecodeError:
-            # --- CORREÇÃO: Remove a tag [ACTION_BUTTONS] antes de enviar ---
-            resposta_texto, reply_markup = parse_action_buttons(resposta_ia)
-            # Remove a tag do texto para não ser exibida
-            resposta_final_sem_tag = re.sub(r'\[ACTION_BUTTONS.*?\]', '', resposta_texto).strip()
-
-            await enviar_texto_em_blocos(
-                context.bot, 
-                chat_id, 
-                resposta_final_sem_tag, 
-                reply_markup=reply_markup
-            )
-            contexto_conversa.adicionar_interacao(user_question, resposta_final_sem_tag, tipo="gerente_vdm_analise")
-
-    except Exception as e:
-        logger.error(f"Erro CRÍTICO em handle_natural_language (V5) para user {chat_id}: {e}", exc_info=True)
-        await enviar_resposta_erro(context.bot, chat_id)
-    finally:
-        db.close()
-    
-    return AWAIT_GERENTE_QUESTION
-
-
 def criar_teclado_colunas(botoes: list, colunas: int):
     if not botoes: return []
     return [botoes[i:i + colunas] for i in range(0, len(botoes), colunas)]
@@ -410,8 +475,10 @@ HELP_TEXTS = {
         "     - <i>\"Cotação do dólar hoje\"</i>\n\n"
         "📈  <code>/grafico</code>\n"
         "   • Gere gráficos visuais e interativos de despesas, fluxo de caixa e projeções.\n\n"
+        "🖼️  <code>/dashboard</code>\n"
+        "   • Receba <b>todos os gráficos de uma vez</b> num único álbum. Aceita <i>mes</i>, <i>trimestre</i>, <i>ano</i> ou um intervalo DD/MM/AAAA DD/MM/AAAA.\n\n"
         "📄  <code>/relatorio</code>\n"
-        "   • Gere um <b>relatório profissional em PDF</b> com o resumo completo do seu mês."
+        "   • Gere um <b>relatório profissional em PDF</b> com o resumo completo do seu mês. Aceita <i>passado</i>, <i>ano 2025</i> ou um intervalo DD/MM/AAAA DD/MM/AAAA."
     ),
     "planejamento": (
         "<b>🎯 Metas e Agendamentos</b>\n\n"
@@ -467,10 +534,12 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     Busca o nome do usuário para uma saudação personalizada.
     """
     user = update.effective_user
-    db = next(get_db())
     try:
         # Busca o nome do usuário no banco para personalizar a mensagem
-        usuario_db = db.query(Usuario).filter(Usuario.telegram_id == user.id).first()
+        async with get_async_db() as db:
+            usuario_db = (await db.execute(
+                select(Usuario).filter(Usuario.telegram_id == user.id)
+            )).scalars().first()
         # Se não encontrar no DB, usa o nome do Telegram como fallback
         user_name = usuario_db.nome_completo.split(' ')[0] if usuario_db and usuario_db.nome_completo else user.first_name
         
@@ -483,8 +552,6 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         logger.error(f"Erro no help_command para o usuário {user.id}: {e}", exc_info=True)
         # Mensagem de fallback caso ocorra um erro
         await update.message.reply_text("Olá! Sou seu Maestro Financeiro. Use os botões para explorar minhas funções.")
-    finally:
-        db.close()
 
 async def help_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
@@ -504,13 +571,12 @@ async def help_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             # Se a seção for a principal, personaliza com o nome do usuário novamente
             if section == "main":
                 user = query.from_user
-                db = next(get_db())
-                try:
-                    usuario_db = db.query(Usuario).filter(Usuario.telegram_id == user.id).first()
-                    user_name = usuario_db.nome_completo.split(' ')[0] if usuario_db and usuario_db.nome_completo else user.first_name
-                    text = text.format(user_name=user_name)
-                finally:
-                    db.close()
+                async with get_async_db() as db:
+                    usuario_db = (await db.execute(
+                        select(Usuario).filter(Usuario.telegram_id == user.id)
+                    )).scalars().first()
+                user_name = usuario_db.nome_completo.split(' ')[0] if usuario_db and usuario_db.nome_completo else user.first_name
+                text = text.format(user_name=user_name)
 
             keyboard = get_help_keyboard(section)
             
@@ -525,31 +591,24 @@ async def help_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         await query.answer("Ocorreu um erro ao carregar a ajuda. Tente novamente.", show_alert=True)
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    db = next(get_db())
-    try:
-        user = get_or_create_user(db, update.effective_user.id, update.effective_user.full_name)
-        if user and user.nome_completo:
-            await help_command(update, context)
-            return ConversationHandler.END
-        else:
-            await update.message.reply_text("Olá! Sou seu assistente financeiro. Para uma experiência mais personalizada, como posso te chamar?")
-            return ASK_NAME
-    finally:
-        db.close()
+    async with get_async_db() as db:
+        user = await get_or_create_user(db, update.effective_user.id, update.effective_user.full_name)
+    if user and user.nome_completo:
+        await help_command(update, context)
+        return ConversationHandler.END
+    else:
+        await update.message.reply_text("Olá! Sou seu assistente financeiro. Para uma experiência mais personalizada, como posso te chamar?")
+        return ASK_NAME
 
 async def receive_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_name = update.message.text.strip()
     user_info = update.effective_user
-    db = next(get_db())
-    try:
-        usuario_db = get_or_create_user(db, user_info.id, user_name)
+    async with get_async_db() as db:
+        usuario_db = await get_or_create_user(db, user_info.id, user_name)
         usuario_db.nome_completo = user_name
-        db.commit()
-        await update.message.reply_text(f"Prazer em conhecer, {user_name.split(' ')[0]}! 😊")
-        await help_command(update, context)
-    finally:
-        db.rollback()
-        db.close()
+        await db.commit()
+    await update.message.reply_text(f"Prazer em conhecer, {user_name.split(' ')[0]}! 😊")
+    await help_command(update, context)
     return ConversationHandler.END
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -565,34 +624,32 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 # --- HANDLER DE GERENTE FINANCEIRO (IA) - VERSÃO MELHORADA ---
 
 async def start_gerente(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    db = next(get_db())
-    try:
-        user = get_or_create_user(db, update.effective_user.id, update.effective_user.full_name)
-        user_name = user.nome_completo.split(' ')[0] if user.nome_completo else "você"
-        contexto = obter_contexto_usuario(context)
-        
-        if contexto.historico:
-            mensagem = f"E aí, {user_name}! 😊 O que vamos analisar hoje?"
-        else:
-            mensagem = f"""
+    async with get_async_db() as db:
+        user = await get_or_create_user(db, update.effective_user.id, update.effective_user.full_name)
+    user_name = user.nome_completo.split(' ')[0] if user.nome_completo else "você"
+    contexto = obter_contexto_usuario(context)
+    
+    if contexto.historico:
+        mensagem = f"E aí, {user_name}! 😊 O que vamos analisar hoje?"
+    else:
+        mensagem = f"""
 E aí, {user_name}! Tudo tranquilo? 🚀✨  
 Sou o <b>Maestro Financeiro</b> 🎩, seu super parceiro na aventura de organizar as finanças! 💰  
 Sinta-se à vontade para perguntar o que quiser: <i>"Quanto gastei no cartão?", "Qual é o saldo das minhas contas?", "O que está por vir?"</i>  
 Estou aqui para transformar sua vida financeira em uma experiência leve e inteligente! 🌟  
 <b>Pronto para desbravar o mundo das suas finanças hoje?</b>
 """
-                        
-        await update.message.reply_html(mensagem)
-        return AWAIT_GERENTE_QUESTION
-    finally:
-        db.close()
+                    
+    await update.message.reply_html(mensagem)
+    return AWAIT_GERENTE_QUESTION
 
 async def handle_natural_language(update: Update, context: ContextTypes.DEFAULT_TYPE, custom_question: str = None) -> int:
     """
     Handler principal para o /gerente (V4).
     1. Despacha para cotações externas.
-    2. Envia para a IA.
-    3. Executa funções com base na resposta da IA (JSON) ou envia a análise de texto.
+    2. Responde direto do banco as perguntas comuns (maior despesa, totais, resumo, lista).
+    3. Envia o restante para a IA.
+    4. Executa funções com base na resposta da IA (JSON) ou envia a análise de texto.
     """
     # --- Correção do Bug de Botão (AttributeError) ---
     is_callback = update.callback_query is not None
@@ -606,24 +663,30 @@ async def handle_natural_language(update: Update, context: ContextTypes.DEFAULT_
         effective_user = update.effective_user
 
     chat_id = effective_message.chat_id
-    await context.bot.send_chat_action(chat_id=chat_id, action='typing')
 
     # --- Despachante: Verifica primeiro se é uma cotação ---
     flag_dado_externo, topico_dado_externo = detectar_intencao_e_topico(user_question)
     if flag_dado_externo:
         logger.info(f"Intenção de dado externo detectada: {topico_dado_externo}")
+        await context.bot.send_chat_action(chat_id=chat_id, action='typing')
         dados = await obter_dados_externos(flag_dado_externo)
         await enviar_texto_em_blocos(context.bot, chat_id, dados.get("texto_html", "Não encontrei a informação."))
         return AWAIT_GERENTE_QUESTION
 
     # --- Se não for cotação, continua com a IA financeira ---
-    db = next(get_db())
     contexto_conversa = obter_contexto_usuario(context)
     
     try:
-        usuario_db = get_or_create_user(db, chat_id, effective_user.full_name)
-        
-        contexto_financeiro_str = preparar_contexto_financeiro_completo(db, usuario_db)
+        # A sessão fica aberta apenas durante a leitura dos dados, não durante a chamada à IA
+        async with get_async_db() as db:
+            usuario_db = await get_or_create_user(db, chat_id, effective_user.full_name)
+            resposta_rapida = await montar_resposta_rapida(db, user_question, usuario_db)
+            if resposta_rapida is None:
+                contexto_financeiro_str = await preparar_contexto_financeiro_completo(db, usuario_db)
+        if resposta_rapida is not None:
+            await enviar_resposta_rapida(context, chat_id, user_question, resposta_rapida)
+            return AWAIT_GERENTE_QUESTION
+        await context.bot.send_chat_action(chat_id=chat_id, action='typing')
         historico_conversa_str = contexto_conversa.get_contexto_formatado()
 
         prompt_final = PROMPT_GERENTE_VDM.format(
@@ -633,9 +696,8 @@ async def handle_natural_language(update: Update, context: ContextTypes.DEFAULT_
             contexto_conversa=historico_conversa_str
         )
         
-        model = genai.GenerativeModel(config.GEMINI_MODEL_NAME)
-        response = await model.generate_content_async(prompt_final)
-        resposta_ia = _limpar_resposta_ia(response.text) # Limpa a resposta
+        # Com IA_STREAMING, respostas em texto já chegam exibidas ao usuário (texto_exibido)
+        resposta_ia, texto_exibido = await gerar_resposta_gerente(context.bot, chat_id, prompt_final)
         
         # --- Lógica de Decisão: É uma chamada de função (JSON) ou uma análise (texto)? ---
         try:
@@ -655,16 +717,19 @@ async def handle_natural_language(update: Update, context: ContextTypes.DEFAULT_
                 raise json.JSONDecodeError("Não é um JSON de função", resposta_ia, 0)
 
         except json.JSONDecodeError:
-            # Se não for JSON, é uma análise de texto. Envia para o usuário.
-            resposta_texto, reply_markup = parse_action_buttons(resposta_ia)
-            await enviar_texto_em_blocos(context.bot, chat_id, resposta_texto, reply_markup=reply_markup)
+            # Se não for JSON, é uma análise de texto. Envia para o usuário (se o streaming ainda não enviou).
+            if texto_exibido is not None:
+                resposta_texto = texto_exibido
+            else:
+                resposta_texto, reply_markup = parse_action_buttons(resposta_ia)
+                await enviar_texto_em_blocos(context.bot, chat_id, resposta_texto, reply_markup=reply_markup)
             contexto_conversa.adicionar_interacao(user_question, resposta_texto, tipo="gerente_vdm_analise")
 
+    except gateway_ia.IAIndisponivelError:
+        await context.bot.send_message(chat_id, gateway_ia.MENSAGEM_INDISPONIVEL)
     except Exception as e:
         logger.error(f"Erro CRÍTICO em handle_natural_language (V4) para user {chat_id}: {e}", exc_info=True)
         await enviar_resposta_erro(context.bot, chat_id)
-    finally:
-        db.close()
     
     return AWAIT_GERENTE_QUESTION
 
@@ -679,76 +744,22 @@ async def handle_dados_externos(update, context, user_question, usuario_db, cont
         await enviar_texto_em_blocos(context.bot, usuario_db.telegram_id, resposta_texto, reply_markup=reply_markup)
         contexto.adicionar_interacao(user_question, resposta_texto, "dados_externos")
 
-def _parse_filtros_lancamento(texto: str, db: Session, user_id: int) -> dict:
+async def _contas_e_categorias(db: AsyncSession, user_id: int) -> Tuple[list, list]:
+    """(id, nome) das contas do usuário e nomes das categorias, para o interpretador de filtros."""
+    contas = (await db.execute(
+        select(Conta.id, Conta.nome).filter(Conta.id_usuario == user_id)
+    )).all()
+    categorias = (await db.execute(select(Categoria.nome))).scalars().all()
+    return contas, categorias
+
+async def _parse_filtros_lancamento(texto: str, db: AsyncSession, user_id: int) -> dict:
     """
-    Extrai filtros de tipo, categoria, conta/forma de pagamento e data de um texto.
+    Filtros da pergunta no formato de buscar_lancamentos_usuario (ver
+    filtros_lancamento.interpretar_filtros), usando as contas do usuário e as categorias do banco.
     """
-    filtros = {}
-    texto_lower = texto.lower()
-    
-    # --- CORREÇÃO: Definimos a lista no escopo principal da função ---
-    formas_pagamento_comuns = ['pix', 'crédito', 'debito', 'dinheiro']
-
-    # --- Filtro de TIPO ---
-    PALAVRAS_GASTOS = ['gastos', 'despesas', 'saídas', 'saidas', 'paguei']
-    PALAVRAS_RECEITAS = ['receitas', 'entradas', 'ganhei', 'recebi']
-
-    if any(palavra in texto_lower for palavra in PALAVRAS_GASTOS):
-        filtros['tipo'] = 'Saída'
-    elif any(palavra in texto_lower for palavra in PALAVRAS_RECEITAS):
-        filtros['tipo'] = 'Entrada'
-    
-    # --- Filtro de DATA ---
-    hoje = datetime.now()
-    if "mês passado" in texto_lower:
-        primeiro_dia_mes_passado = (hoje.replace(day=1) - timedelta(days=1)).replace(day=1)
-        ultimo_dia_mes_passado = hoje.replace(day=1) - timedelta(days=1)
-        filtros['data_inicio'] = primeiro_dia_mes_passado.replace(hour=0, minute=0, second=0)
-        filtros['data_fim'] = ultimo_dia_mes_passado.replace(hour=23, minute=59, second=59)
-    # ... (outros filtros de data)
-
-    # --- LÓGICA UNIFICADA PARA CONTA E FORMA DE PAGAMENTO ---
-    filtro_conta_encontrado = False
-    contas_usuario = db.query(Conta).filter(Conta.id_usuario == user_id).all()
-    
-    for conta in contas_usuario:
-        padrao_conta = r'\b' + re.escape(conta.nome.lower()) + r'\b'
-        if re.search(padrao_conta, texto_lower):
-            filtros['id_conta'] = conta.id
-            filtro_conta_encontrado = True
-            logging.info(f"Filtro de CONTA específica detectado: '{conta.nome}' (ID: {conta.id})")
-            break 
-    
-    if not filtro_conta_encontrado:
-        for fp in formas_pagamento_comuns: # Agora a variável já existe
-            padrao_fp = r'\b' + re.escape(fp) + r'\b'
-            if fp == 'crédito' and 'cartão' not in texto_lower:
-                continue
-            if re.search(padrao_fp, texto_lower):
-                filtros['forma_pagamento'] = fp
-                logging.info(f"Filtro de FORMA DE PAGAMENTO genérica detectado: '{fp}'")
-                break
-
-    # --- Filtro de CATEGORIA ---
-    categorias_comuns = ['lazer', 'alimentação', 'transporte', 'moradia', 'saúde', 'receitas', 'compras']
-    for cat in categorias_comuns:
-        padrao_cat = r'\b' + re.escape(cat) + r'\b'
-        if re.search(padrao_cat, texto_lower):
-            filtros['categoria_nome'] = cat
-            break
-            
-    # --- Filtro de busca por texto geral (QUERY) ---
-    match = re.search(r'com\s+([a-zA-Z0-9çãáéíóúâêô\s]+)', texto_lower)
-    if match:
-        termo_busca = match.group(1).strip()
-        # A variável 'formas_pagamento_comuns' agora está sempre acessível
-        eh_fp_ou_conta = any(fp in termo_busca for fp in formas_pagamento_comuns) or \
-                         any(conta.nome.lower() in termo_busca for conta in contas_usuario)
-        
-        if not eh_fp_ou_conta:
-             filtros['query'] = termo_busca
-             logging.info(f"Filtro de QUERY por texto detectado: '{termo_busca}'")
-
+    contas, categorias = await _contas_e_categorias(db, user_id)
+    filtros = interpretar_filtros(texto, contas=contas, categorias=categorias)
+    logger.info(f"Filtros interpretados de '{texto}': {filtros}")
     return filtros
 
 def _limpar_resposta_ia(texto: str) -> str:
@@ -775,25 +786,25 @@ async def handle_lista_lancamentos(chat_id: int, context: ContextTypes.DEFAULT_T
     Busca e exibe uma lista de lançamentos com base nos parâmetros recebidos da IA.
     """
     logger.info(f"Executando handle_lista_lancamentos com parâmetros: {parametros}")
-    db = next(get_db())
-    try:
-        # A função buscar_lancamentos_usuario já aceita esses parâmetros nomeados
-        lancamentos = buscar_lancamentos_usuario(telegram_user_id=chat_id, **parametros)
-        
-        if not lancamentos:
-            await context.bot.send_message(chat_id, "Não encontrei nenhum lançamento com os filtros que você pediu.")
-            return
+    # A IA manda as datas como texto (AAAA-MM-DD)
+    if 'data_inicio' in parametros:
+        parametros['data_inicio'] = datetime.strptime(parametros['data_inicio'], '%Y-%m-%d')
+    if 'data_fim' in parametros:
+        parametros['data_fim'] = datetime.strptime(parametros['data_fim'], '%Y-%m-%d')
+    # A função buscar_lancamentos_usuario já aceita esses parâmetros nomeados
+    lancamentos = await buscar_lancamentos_usuario(telegram_user_id=chat_id, **parametros)
+    
+    if not lancamentos:
+        await context.bot.send_message(chat_id, "Não encontrei nenhum lançamento com os filtros que você pediu.")
+        return
 
-        limit = parametros.get('limit', len(lancamentos))
-        resposta_final = f"Encontrei {len(lancamentos)} lançamento(s) com os critérios que você pediu:\n\n"
-        
-        cards_formatados = [formatar_lancamento_detalhado(lanc) for lanc in lancamentos]
-        resposta_final += "\n\n".join(cards_formatados)
+    limit = parametros.get('limit', len(lancamentos))
+    resposta_final = f"Encontrei {len(lancamentos)} lançamento(s) com os critérios que você pediu:\n\n"
+    
+    cards_formatados = [formatar_lancamento_detalhado(lanc) for lanc in lancamentos]
+    resposta_final += "\n\n".join(cards_formatados)
 
-        await enviar_texto_em_blocos(context.bot, chat_id, resposta_final)
-        
-    finally:
-        db.close()
+    await enviar_texto_em_blocos(context.bot, chat_id, resposta_final)
 
 async def handle_action_button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Processa cliques em botões de ação gerados pela IA."""
@@ -851,35 +862,228 @@ async def handle_conversacional(update: Update, context: ContextTypes.DEFAULT_TY
     await update.message.reply_text(resposta_final)
     contexto.adicionar_interacao(user_question, resposta_final, "conversacional")
 
-async def handle_maior_despesa(update, context, user_question, usuario_db, contexto, db):
-    """Encontra e exibe o maior gasto em um período."""
-    filtros = _parse_filtros_lancamento(user_question)
-    
-    # Força o tipo para 'Saída' e limita a 1 resultado
-    filtros['tipo'] = 'Saída'
-    
-    # A busca agora é por valor, não por data
-    maior_gasto = db.query(Lancamento).filter(
-        Lancamento.id_usuario == usuario_db.id,
-        Lancamento.tipo == 'Saída'
+async def _maiores_despesas(db: AsyncSession, usuario_db: Usuario, filtros: dict, limite: int) -> List[Lancamento]:
+    """Os gastos de maior valor que atendem aos filtros."""
+    consulta = _aplicar_filtros_lancamento(
+        select(Lancamento).options(joinedload(Lancamento.categoria))
+        .outerjoin(Categoria, Lancamento.id_categoria == Categoria.id)
+        .filter(Lancamento.id_usuario == usuario_db.id),
+        {**filtros, 'tipo': 'Saída'}
     )
-    if filtros.get('data_inicio'):
-        maior_gasto = maior_gasto.filter(Lancamento.data_transacao >= filtros['data_inicio'])
-    if filtros.get('data_fim'):
-        maior_gasto = maior_gasto.filter(Lancamento.data_transacao <= filtros['data_fim'])
-
-    maior_gasto = maior_gasto.order_by(Lancamento.valor.desc()).first()
+    return (await db.execute(
+        consulta.order_by(func.abs(Lancamento.valor).desc()).limit(limite)
+    )).scalars().all()
 
+async def _texto_maior_despesa(db: AsyncSession, usuario_db: Usuario, filtros: dict) -> str:
+    """Texto com o maior gasto do período (e categoria/conta, se citadas)."""
+    maior_gasto = await _maiores_despesas(db, usuario_db, filtros, 1)
     if not maior_gasto:
-        await update.message.reply_text("Não encontrei nenhuma despesa para o período que você pediu.")
-        return
+        return "Não encontrei nenhuma despesa para o período que você pediu."
 
-    resposta_texto = (
+    return (
         f"Sua maior despesa no período foi:\n\n"
-        f"{formatar_lancamento_detalhado(maior_gasto)}"
+        f"{formatar_lancamento_detalhado(maior_gasto[0])}"
     )
+
+async def _texto_maiores_despesas(db: AsyncSession, usuario_db: Usuario, filtros: dict) -> str:
+    """Ranking dos gastos de maior valor, do maior para o menor."""
+    gastos = await _maiores_despesas(db, usuario_db, filtros, filtros['limit'])
+    if not gastos:
+        return "Não encontrei nenhuma despesa para o período que você pediu."
+    rotulo = _rotulo_periodo_filtros(filtros) if filtros.get('data_inicio') else "de todo o histórico"
+    cards_formatados = [formatar_lancamento_detalhado(lanc) for lanc in gastos]
+    return f"🏆 Seus {len(gastos)} maiores gastos {rotulo}:\n\n" + "\n\n".join(cards_formatados)
+
+async def handle_maior_despesa(update, context, user_question, usuario_db, contexto, db):
+    """Encontra e exibe o maior gasto em um período."""
+    filtros = await _parse_filtros_lancamento(user_question, db, usuario_db.id)
+    resposta_texto = await _texto_maior_despesa(db, usuario_db, filtros)
     await enviar_texto_em_blocos(context.bot, usuario_db.telegram_id, resposta_texto)
-    contexto.adicionar_interacao(user_question, f"Mostrou maior despesa: {maior_gasto.descricao}", "maior_despesa")
+    contexto.adicionar_interacao(user_question, resposta_texto, "maior_despesa")
+
+
+# --- RESPOSTAS RÁPIDAS (DIRETO DO BANCO, SEM IA) ---
+# As perguntas mais frequentes do /gerente (maior despesa, "quanto gastei", resumo,
+# últimos lançamentos) têm resposta exata em uma consulta agregada. Quais perguntas
+# entram aqui é decidido por perguntas_rapidas.classificar_pergunta; o resto, inclusive
+# o que for ambíguo, vai para a IA com o contexto financeiro completo.
+
+LIMITE_CATEGORIAS_RESPOSTA = 5
+
+def _aplicar_filtros_lancamento(consulta, filtros: dict):
+    """Aplica os filtros de _parse_filtros_lancamento (a consulta já deve ter o join com Categoria)."""
+    if filtros.get('tipo'):
+        consulta = consulta.filter(Lancamento.tipo == filtros['tipo'])
+    if filtros.get('data_inicio'):
+        consulta = consulta.filter(Lancamento.data_transacao >= filtros['data_inicio'])
+    if filtros.get('data_fim'):
+        consulta = consulta.filter(Lancamento.data_transacao <= filtros['data_fim'])
+    if filtros.get('id_conta'):
+        consulta = consulta.filter(Lancamento.id_conta == filtros['id_conta'])
+    if filtros.get('forma_pagamento'):
+        consulta = consulta.filter(Lancamento.forma_pagamento.ilike(f"%{filtros['forma_pagamento']}%"))
+    if filtros.get('categoria_nome'):
+        consulta = consulta.filter(Categoria.nome.ilike(f"%{filtros['categoria_nome']}%"))
+    if filtros.get('query'):
+        consulta = consulta.filter(
+            (Lancamento.descricao.ilike(f"%{filtros['query']}%")) |
+            (Lancamento.itens.any(ItemLancamento.nome_item.ilike(f"%{filtros['query']}%")))
+        )
+    if filtros.get('valor_minimo') is not None:
+        consulta = consulta.filter(func.abs(Lancamento.valor) >= filtros['valor_minimo'])
+    if filtros.get('valor_maximo') is not None:
+        consulta = consulta.filter(func.abs(Lancamento.valor) <= filtros['valor_maximo'])
+    return consulta
+
+def _rotulo_periodo_filtros(filtros: dict) -> str:
+    inicio, fim = filtros.get('data_inicio'), filtros.get('data_fim')
+    if inicio and fim:
+        if inicio.date() == fim.date():
+            return f"em {inicio.strftime('%d/%m/%Y')}"
+        return f"de {inicio.strftime('%d/%m')} a {fim.strftime('%d/%m/%Y')}"
+    if inicio:
+        hoje = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        if inicio == hoje:
+            return "hoje"
+        if inicio == hoje.replace(day=1):
+            return "neste mês"
+        if inicio == hoje.replace(month=1, day=1):
+            return "neste ano"
+        return f"desde {inicio.strftime('%d/%m/%Y')}"
+    return "no total"
+
+async def _totais_por_categoria(db: AsyncSession, usuario_id: int, filtros: dict) -> List[Tuple[str, str, float, int]]:
+    """(tipo, categoria, total, quantidade) dos lançamentos filtrados, sem transferências, do maior total ao menor."""
+    eh_transferencia = func.coalesce(func.lower(Categoria.nome) == 'transferência', False)
+    categoria_nome = func.coalesce(Categoria.nome, 'Sem Categoria')
+    total = func.sum(Lancamento.valor)
+    consulta = _aplicar_filtros_lancamento(
+        select(Lancamento.tipo, categoria_nome, total, func.count(Lancamento.id))
+        .outerjoin(Categoria, Lancamento.id_categoria == Categoria.id)
+        .filter(Lancamento.id_usuario == usuario_id, ~eh_transferencia),
+        filtros
+    )
+    resultado = await db.execute(consulta.group_by(Lancamento.tipo, categoria_nome).order_by(total.desc()))
+    return [(tipo, cat, float(soma or 0), qtd) for tipo, cat, soma, qtd in resultado.all()]
+
+def _linhas_categorias(linhas: List[Tuple[str, str, float, int]], total: float) -> str:
+    partes = []
+    for _, cat, valor, _ in linhas[:LIMITE_CATEGORIAS_RESPOSTA]:
+        percentual = f" ({valor / total * 100:.0f}%)" if total > 0 else ""
+        partes.append(f"{get_category_emoji(cat)} {cat}: <code>R$ {valor:.2f}</code>{percentual}")
+    if len(linhas) > LIMITE_CATEGORIAS_RESPOSTA:
+        restante = sum(valor for _, _, valor, _ in linhas[LIMITE_CATEGORIAS_RESPOSTA:])
+        partes.append(f"🏷️ Outras: <code>R$ {restante:.2f}</code>")
+    return "\n".join(partes)
+
+async def _texto_total(db: AsyncSession, usuario_db: Usuario, filtros: dict) -> str:
+    linhas = await _totais_por_categoria(db, usuario_db.id, filtros)
+    rotulo = _rotulo_periodo_filtros(filtros)
+    eh_gasto = filtros['tipo'] == 'Saída'
+    if not linhas:
+        return f"Não encontrei {'despesas' if eh_gasto else 'receitas'} {rotulo} com esses critérios."
+
+    total = sum(valor for _, _, valor, _ in linhas)
+    quantidade = sum(qtd for _, _, _, qtd in linhas)
+    verbo = "gastou" if eh_gasto else "recebeu"
+    detalhes = []
+    if filtros.get('categoria_nome'):
+        detalhes.append(f"em <b>{filtros['categoria_nome'].capitalize()}</b>")
+    if filtros.get('query'):
+        detalhes.append(f"com <b>{filtros['query']}</b>")
+    if filtros.get('forma_pagamento'):
+        detalhes.append(f"no <b>{filtros['forma_pagamento']}</b>")
+    if filtros.get('valor_minimo') is not None:
+        detalhes.append(f"acima de R$ {filtros['valor_minimo']:.2f}")
+    if filtros.get('valor_maximo') is not None:
+        detalhes.append(f"até R$ {filtros['valor_maximo']:.2f}")
+    texto = (
+        f"{'💸' if eh_gasto else '💰'} Você {verbo} <code>R$ {total:.2f}</code> {' '.join(detalhes + [rotulo])}.\n"
+        f"<i>{quantidade} lançamento(s)</i>"
+    )
+    if len(linhas) > 1:
+        texto += f"\n\n<b>Por categoria:</b>\n{_linhas_categorias(linhas, total)}"
+    return texto
+
+async def _texto_resumo(db: AsyncSession, usuario_db: Usuario, filtros: dict) -> str:
+    filtros = {chave: valor for chave, valor in filtros.items() if chave != 'tipo'}
+    linhas = await _totais_por_categoria(db, usuario_db.id, filtros)
+    rotulo = _rotulo_periodo_filtros(filtros)
+    if not linhas:
+        return f"Não encontrei lançamentos {rotulo}."
+
+    gastos = [linha for linha in linhas if linha[0] == 'Saída']
+    receitas = sum(valor for tipo, _, valor, _ in linhas if tipo == 'Entrada')
+    despesas = sum(valor for _, _, valor, _ in gastos)
+    saldo = receitas - despesas
+    texto = (
+        f"📊 <b>Resumo {rotulo}</b>\n"
+        f"━━━━━━━━━━━━━━━━━━\n"
+        f"🟢 <b>Receitas:</b> <code>R$ {receitas:.2f}</code>\n"
+        f"🔴 <b>Despesas:</b> <code>R$ {despesas:.2f}</code>\n"
+        f"{'💰' if saldo >= 0 else '⚠️'} <b>Saldo:</b> <code>R$ {saldo:.2f}</code>"
+    )
+    if receitas > 0:
+        texto += f"\n🏦 <b>Taxa de poupança:</b> {saldo / receitas * 100:.1f}%"
+    if gastos:
+        texto += f"\n\n<b>Onde mais você gastou:</b>\n{_linhas_categorias(gastos, despesas)}"
+    return texto
+
+async def _texto_ultimos_lancamentos(db: AsyncSession, usuario_db: Usuario, filtros: dict) -> str:
+    limite = filtros['limit']
+    consulta = _aplicar_filtros_lancamento(
+        select(Lancamento).options(joinedload(Lancamento.categoria))
+        .outerjoin(Categoria, Lancamento.id_categoria == Categoria.id)
+        .filter(Lancamento.id_usuario == usuario_db.id),
+        filtros
+    )
+    lancamentos = (await db.execute(
+        consulta.order_by(Lancamento.data_transacao.desc()).limit(limite)
+    )).scalars().all()
+    if not lancamentos:
+        return "Não encontrei nenhum lançamento com os filtros que você pediu."
+    cards_formatados = [formatar_lancamento_detalhado(lanc) for lanc in lancamentos]
+    return f"Encontrei {len(lancamentos)} lançamento(s) com os critérios que você pediu:\n\n" + "\n\n".join(cards_formatados)
+
+async def _resposta_rapida(db: AsyncSession, user_question: str, usuario_db: Usuario) -> Optional[Tuple[str, str]]:
+    # Perguntas longas ou de opinião nem consultam contas e categorias
+    if not pode_ser_rapida(user_question):
+        return None
+    contas, categorias = await _contas_e_categorias(db, usuario_db.id)
+    classificacao = classificar_pergunta(user_question, contas=contas, categorias=categorias)
+    if classificacao is None:
+        return None
+
+    intencao, filtros = classificacao
+    logger.info(f"Pergunta rápida '{user_question}': {intencao} {filtros}")
+    if intencao == 'maior_despesa':
+        return await _texto_maior_despesa(db, usuario_db, filtros), "maior_despesa"
+    if intencao == 'maiores_despesas':
+        return await _texto_maiores_despesas(db, usuario_db, filtros), "maior_despesa"
+    if intencao == 'lista':
+        return await _texto_ultimos_lancamentos(db, usuario_db, filtros), "lista_lancamentos"
+    if intencao == 'resumo':
+        return await _texto_resumo(db, usuario_db, filtros), "resumo_completo"
+    return await _texto_total(db, usuario_db, filtros), "pergunta_especifica"
+
+async def montar_resposta_rapida(db: AsyncSession, user_question: str, usuario_db: Usuario) -> Optional[Tuple[str, str]]:
+    """
+    Responde direto do banco as perguntas mais comuns do /gerente.
+    Retorna (texto_html, tipo_interacao), ou None quando a pergunta precisa da IA.
+    """
+    inicio = time.perf_counter()
+    resposta = await _resposta_rapida(db, user_question, usuario_db)
+    if resposta is not None:
+        logger.info(
+            f"Resposta rápida ({resposta[1]}) para user {usuario_db.telegram_id} "
+            f"em {(time.perf_counter() - inicio) * 1000:.0f}ms"
+        )
+    return resposta
+
+async def enviar_resposta_rapida(context, chat_id: int, user_question: str, resposta: Tuple[str, str]) -> None:
+    texto, tipo_interacao = resposta
+    await enviar_texto_em_blocos(context.bot, chat_id, texto)
+    obter_contexto_usuario(context).adicionar_interacao(user_question, texto, tipo_interacao)
 
 
 async def handle_analise_geral(update, context, user_question, usuario_db, contexto, db):
@@ -890,12 +1094,13 @@ async def handle_analise_geral(update, context, user_question, usuario_db, conte
         tipo_filtro = 'Entrada'
 
     # --- MUDANÇA: APLICAMOS O FILTRO DE CONTA AQUI TAMBÉM ---
-    filtros_iniciais = _parse_filtros_lancamento(user_question, db, usuario_db.id)
+    filtros_iniciais = await _parse_filtros_lancamento(user_question, db, usuario_db.id)
+    filtros_iniciais.pop('limit', None)  # a análise usa o próprio limite abaixo
     if tipo_filtro:
         filtros_iniciais['tipo'] = tipo_filtro
 
     # Buscamos todos os lançamentos que correspondem aos filtros iniciais
-    lancamentos = buscar_lancamentos_usuario(
+    lancamentos = await buscar_lancamentos_usuario(
         telegram_user_id=usuario_db.telegram_id,
         limit=200, # Pegamos um limite alto para a análise
         **filtros_iniciais
@@ -934,26 +1139,25 @@ async def handle_analise_geral(update, context, user_question, usuario_db, conte
 
 async def gerar_resposta_ia(update, context, prompt, user_question, usuario_db, contexto, tipo_interacao):
     try:
-        model = genai.GenerativeModel(config.GEMINI_MODEL_NAME)
-        response = await model.generate_content_async(prompt)
+        resposta_texto = await gateway_ia.gerar_texto(prompt, usuario_id=usuario_db.telegram_id)
         
         # --- NOVA LÓGICA DE PROCESSAMENTO JSON (MAIS SEGURA) ---
         
         # 1. Tenta encontrar o bloco JSON na resposta da IA
-        json_match = re.search(r'\{.*\}', response.text, re.DOTALL)
+        json_match = re.search(r'\{.*\}', resposta_texto, re.DOTALL)
         
         # 2. Se NÃO encontrar um JSON, trata o erro elegantemente
         if not json_match:
-            logger.error(f"A IA não retornou um JSON válido. Resposta recebida: {response.text}")
+            logger.error(f"A IA não retornou um JSON válido. Resposta recebida: {resposta_texto}")
             # Usa a resposta em texto livre da IA como um fallback, se fizer sentido
             # ou envia uma mensagem de erro padrão.
             await update.message.reply_text(
                 "Hmm, não consegui estruturar a resposta. Aqui está o que a IA disse:\n\n"
-                f"<i>{response.text}</i>",
+                f"<i>{resposta_texto}</i>",
                 parse_mode='HTML'
             )
             # Adiciona ao contexto para não perder o histórico
-            contexto.adicionar_interacao(user_question, response.text, tipo_interacao)
+            contexto.adicionar_interacao(user_question, resposta_texto, tipo_interacao)
             return # Sai da função
 
         # 3. Se encontrou um JSON, tenta decodificá-lo
@@ -1010,6 +1214,8 @@ async def gerar_resposta_ia(update, context, prompt, user_question, usuario_db,
         )
         contexto.adicionar_interacao(user_question, mensagem_formatada, tipo_interacao)
         
+    except gateway_ia.IAIndisponivelError:
+        await context.bot.send_message(usuario_db.telegram_id, gateway_ia.MENSAGEM_INDISPONIVEL)
     except Exception as e:
         logger.error(f"Erro geral e inesperado em gerar_resposta_ia: {e}", exc_info=True)
         await enviar_resposta_erro(context.bot, usuario_db.telegram_id)
@@ -1030,10 +1236,12 @@ async def handle_analise_impacto_callback(update: Update, context: ContextTypes.
     
     tipo_dado = callback_data.replace("analise_", "")
     
-    db = next(get_db())
     try:
         user_info = query.from_user
-        usuario_db = get_or_create_user(db, user_info.id, user_info.full_name)
+        async with get_async_db() as db:
+            usuario_db = await get_or_create_user(db, user_info.id, user_info.full_name)
+            # Busca o contexto financeiro do usuário
+            lancamentos = await buscar_lancamentos_com_relacionamentos(db, usuario_db.telegram_id)
         
         # Edita a mensagem para dar feedback ao usuário
         await query.edit_message_text("Analisando o impacto para você... 🧠")
@@ -1042,8 +1250,6 @@ async def handle_analise_impacto_callback(update: Update, context: ContextTypes.
         dados_externos = await obter_dados_externos(tipo_dado)
         informacao_externa = dados_externos.get("texto_html", "Informação não disponível")
         
-        # Busca o contexto financeiro do usuário
-        lancamentos = buscar_lancamentos_com_relacionamentos(db, usuario_db.telegram_id)
         contexto_json = services.preparar_contexto_json(lancamentos)
         
         # Monta o prompt para a IA
@@ -1055,9 +1261,7 @@ async def handle_analise_impacto_callback(update: Update, context: ContextTypes.
         )
         
         # Chama a IA para gerar a análise
-        model = genai.GenerativeModel(config.GEMINI_MODEL_NAME)
-        response = await model.generate_content_async(prompt_impacto)
-        resposta_bruta = response.text
+        resposta_bruta = await gateway_ia.gerar_texto(prompt_impacto, usuario_id=user_info.id)
         resposta_limpa = _limpar_resposta_ia(resposta_bruta)
         
         
@@ -1068,6 +1272,8 @@ async def handle_analise_impacto_callback(update: Update, context: ContextTypes.
             disable_web_page_preview=True
         )
         
+    except gateway_ia.IAIndisponivelError:
+        await query.edit_message_text(text=gateway_ia.MENSAGEM_INDISPONIVEL)
     except Exception as e:
         logger.error(f"Erro na análise de impacto: {e}", exc_info=True)
         # Envia uma mensagem de erro amigável se algo der errado
@@ -1075,8 +1281,6 @@ async def handle_analise_impacto_callback(update: Update, context: ContextTypes.
             text="😅 Ops! Não consegui gerar a análise de impacto. Tente novamente mais tarde.",
             parse_mode='HTML'
         )
-    finally:
-        db.close()
 
 
         
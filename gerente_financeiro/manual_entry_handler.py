@@ -8,8 +8,11 @@ from telegram.ext import (
 # --- CORREÇÃO: Importamos as funções do ocr_handler, mas não os estados ---
 from .ocr_handler import ocr_iniciar_como_subprocesso, ocr_action_processor
 from .handlers import cancel
+from . import contexto_cache
 
-from database.database import get_db, get_or_create_user
+from sqlalchemy import select
+
+from database.database import get_async_db, get_or_create_user
 from models import Categoria, Subcategoria, Lancamento, Conta, Usuario
 from .states import (
     AWAITING_LAUNCH_ACTION, ASK_DESCRIPTION, ASK_VALUE, ASK_CONTA,
@@ -105,10 +108,11 @@ def criar_teclado_colunas(botoes: list, colunas: int):
 async def ask_value(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     try:
         context.user_data['novo_lancamento']['valor'] = float(update.message.text.replace(',', '.'))
-        db = next(get_db())
-        user_db = db.query(Usuario).filter(Usuario.telegram_id == update.effective_user.id).first()
-        contas = db.query(Conta).filter(Conta.id_usuario == user_db.id).all()
-        db.close()
+        async with get_async_db() as db:
+            resultado = await db.execute(
+                select(Conta).join(Usuario).filter(Usuario.telegram_id == update.effective_user.id)
+            )
+            contas = resultado.scalars().all()
 
         if not contas:
             await update.message.reply_text("Você não tem nenhuma conta ou cartão cadastrado. Use /configurar para adicionar. Lançamento cancelado.")
@@ -126,14 +130,12 @@ async def ask_conta(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
     conta_id = int(query.data.split('_')[-1])
-    db = next(get_db())
-    conta_obj = db.query(Conta).filter(Conta.id == conta_id).first()
+    async with get_async_db() as db:
+        conta_obj = await db.get(Conta, conta_id)
+        categorias = (await db.execute(select(Categoria).order_by(Categoria.nome))).scalars().all()
     context.user_data['novo_lancamento']['id_conta'] = conta_id
     context.user_data['novo_lancamento']['forma_pagamento'] = conta_obj.nome
     
-    categorias = db.query(Categoria).order_by(Categoria.nome).all()
-    db.close()
-    
     botoes = [InlineKeyboardButton(c.nome, callback_data=f"manual_cat_{c.id}") for c in categorias]
     teclado = criar_teclado_colunas(botoes, 2)
     teclado.append([InlineKeyboardButton("🏷️ Sem Categoria", callback_data="manual_cat_0")])
@@ -151,9 +153,11 @@ async def ask_category(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
         return await ask_data_entry_point(update, context)
 
     context.user_data['novo_lancamento']['id_categoria'] = category_id
-    db = next(get_db())
-    subcategorias = db.query(Subcategoria).filter(Subcategoria.id_categoria == category_id).order_by(Subcategoria.nome).all()
-    db.close()
+    async with get_async_db() as db:
+        resultado = await db.execute(
+            select(Subcategoria).filter(Subcategoria.id_categoria == category_id).order_by(Subcategoria.nome)
+        )
+        subcategorias = resultado.scalars().all()
 
     if not subcategorias:
         context.user_data['novo_lancamento']['id_subcategoria'] = None
@@ -193,23 +197,20 @@ async def save_manual_lancamento_and_return(update: Update, context: ContextType
         await update.message.reply_text("⚠️ Formato de data inválido. Use DD/MM/AAAA ou 'hoje'.")
         return ASK_DATA
 
-    db = next(get_db())
     try:
-        # ... (código de salvar no banco, exatamente como antes) ...
         user_info = update.effective_user
-        usuario_db = get_or_create_user(db, user_info.id, user_info.full_name)
         dados = context.user_data['novo_lancamento']
-        
-        novo_lancamento = Lancamento(id_usuario=usuario_db.id, **dados)
-        db.add(novo_lancamento)
-        db.commit()
+        async with get_async_db() as db:
+            usuario_db = await get_or_create_user(db, user_info.id, user_info.full_name)
+            novo_lancamento = Lancamento(id_usuario=usuario_db.id, **dados)
+            db.add(novo_lancamento)
+            await db.commit()
+        contexto_cache.registrar_lancamentos(user_info.id, [novo_lancamento])
         await update.message.reply_text("✅ Lançamento manual registrado com sucesso!")
     except Exception as e:
-        db.rollback()
         logger.error(f"Erro ao salvar lançamento manual: {e}", exc_info=True)
         await update.message.reply_text("❌ Erro ao salvar o lançamento.")
     finally:
-        db.close()
         context.user_data.pop('novo_lancamento', None)
 
     # Volta para o menu principal
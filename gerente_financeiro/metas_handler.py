@@ -68,7 +68,7 @@ async def save_objetivo_e_finaliza(update: Update, context: ContextTypes.DEFAULT
         if meses_restantes <= 0: meses_restantes = 1
         economia_mensal = valor_meta / meses_restantes
 
-        resultado = criar_novo_objetivo(user_id, descricao, valor_meta, data_final)
+        resultado = await criar_novo_objetivo(user_id, descricao, valor_meta, data_final)
         
         if isinstance(resultado, Objetivo):
             mensagem_final = (
@@ -95,7 +95,7 @@ async def save_objetivo_e_finaliza(update: Update, context: ContextTypes.DEFAULT
 async def listar_metas_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Comando para listar as metas ativas do usuário com botão de remoção."""
     user_id = update.effective_user.id
-    objetivos = listar_objetivos_usuario(user_id)
+    objetivos = await listar_objetivos_usuario(user_id)
     
     if not objetivos:
         await update.message.reply_text("Você não tem nenhuma meta ativa no momento. Que tal criar uma com o comando /novameta?")
@@ -131,7 +131,7 @@ async def deletar_meta_callback(update: Update, context: ContextTypes.DEFAULT_TY
         objetivo_id = int(query.data.split('_')[-1])
         user_id = query.from_user.id
 
-        sucesso = deletar_objetivo_por_id(objetivo_id, user_id)
+        sucesso = await deletar_objetivo_por_id(objetivo_id, user_id)
 
         if sucesso:
             await query.edit_message_text(text=f"✅ Meta removida com sucesso.", reply_markup=None)
@@ -188,7 +188,7 @@ async def ask_edit_prazo_and_save(update: Update, context: ContextTypes.DEFAULT_
         user_id = update.effective_user.id
 
         # Usa a nova função do database.py para atualizar
-        objetivo_atualizado = atualizar_objetivo_por_id(objetivo_id, user_id, novo_valor, nova_data_final)
+        objetivo_atualizado = await atualizar_objetivo_por_id(objetivo_id, user_id, novo_valor, nova_data_final)
 
         if objetivo_atualizado:
             # 1. Envia uma mensagem de sucesso simples e temporária.
@@ -5,17 +5,18 @@ from datetime import datetime, timedelta
 import io
 
 from pdf2image import convert_from_bytes
-import google.generativeai as genai
 from google.cloud import vision
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
-from sqlalchemy.orm import Session, joinedload # Adicionando o import que faltava
-from sqlalchemy import and_, func # Adicionando o import que faltava
+from sqlalchemy.orm import selectinload
+from sqlalchemy import and_, func, select
 
-import config
-from database.database import get_or_create_user, get_db
+from database.database import get_or_create_user, get_async_db
 from models import Lancamento, ItemLancamento, Categoria, Subcategoria, Usuario
 from .states import OCR_CONFIRMATION_STATE
+from . import contexto_cache
+from . import gateway_ia
+from .cache_respostas_ia import gerar_texto_em_cache
 
 logger = logging.getLogger(__name__)
 
@@ -159,22 +160,18 @@ async def ocr_iniciar_como_subprocesso(update: Update, context: ContextTypes.DEF
             return ConversationHandler.END
 
         await message.edit_text("📚 Buscando categorias para análise...")
-        db: Session = next(get_db())
-        try:
-            categorias_db = db.query(Categoria).options(joinedload(Categoria.subcategorias)).all()
-            categorias_formatadas = [
-                f"- {cat.nome}: ({', '.join(sub.nome for sub in cat.subcategorias)})" for cat in categorias_db
-            ]
-            categorias_contexto = "\n".join(categorias_formatadas)
-        finally:
-            db.close()
+        async with get_async_db() as db:
+            categorias_db = (await db.execute(
+                select(Categoria).options(selectinload(Categoria.subcategorias))
+            )).scalars().all()
+        categorias_formatadas = [
+            f"- {cat.nome}: ({', '.join(sub.nome for sub in cat.subcategorias)})" for cat in categorias_db
+        ]
+        categorias_contexto = "\n".join(categorias_formatadas)
 
         await message.edit_text("🧠 Texto extraído! Analisando com a IA...")
-        model = genai.GenerativeModel(config.GEMINI_MODEL_NAME)
         prompt = PROMPT_IA_OCR.format(texto_ocr=texto_ocr, categorias_disponiveis=categorias_contexto)
-        ia_response = await model.generate_content_async(prompt)
-
-        response_text = ia_response.text
+        response_text = await gerar_texto_em_cache("ocr", prompt, usuario_id=update.effective_user.id)
         json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
         if not json_match:
             logger.error(f"Nenhum JSON válido foi encontrado na resposta da IA: {response_text}")
@@ -202,6 +199,9 @@ async def ocr_iniciar_como_subprocesso(update: Update, context: ContextTypes.DEF
         # AQUI ESTÁ A MUDANÇA CRUCIAL
         return OCR_CONFIRMATION_STATE
 
+    except gateway_ia.IAIndisponivelError:
+        await message.edit_text(gateway_ia.MENSAGEM_INDISPONIVEL)
+        return ConversationHandler.END
     except Exception as e:
         logger.error(f"Erro CRÍTICO no fluxo de OCR (ocr_iniciar_como_subprocesso): {e}", exc_info=True)
         try:
@@ -230,76 +230,81 @@ async def ocr_action_processor(update: Update, context: ContextTypes.DEFAULT_TYP
 
     if action == "ocr_salvar":
         await query.edit_message_text("💾 Verificando e salvando no banco de dados...")
-        db: Session = next(get_db())
         try:
-            # Lógica de verificação de duplicidade e salvamento (sem alterações)
-            user_info = query.from_user
-            usuario_db = get_or_create_user(db, user_info.id, user_info.full_name)
-            data_str = dados.get('data', datetime.now().strftime('%d/%m/%Y'))
-            hora_str = dados.get('hora', '00:00:00')
-            try:
-                data_obj = datetime.strptime(f"{data_str} {hora_str}", '%d/%m/%Y %H:%M:%S')
-            except ValueError:
-                data_obj = datetime.strptime(data_str, '%d/%m/%Y')
-            doc_fiscal = re.sub(r'\D', '', str(dados.get('documento_fiscal', ''))) or None
-            time_window_start = data_obj - timedelta(minutes=5)
-            time_window_end = data_obj + timedelta(minutes=5)
-            existing_lancamento = db.query(Lancamento).filter(
-                and_(
-                    Lancamento.id_usuario == usuario_db.id,
-                    Lancamento.valor == dados.get('valor_total'),
-                    Lancamento.documento_fiscal == doc_fiscal,
-                    Lancamento.data_transacao.between(time_window_start, time_window_end)
+            async with get_async_db() as db:
+                # Lógica de verificação de duplicidade e salvamento (sem alterações)
+                user_info = query.from_user
+                usuario_db = await get_or_create_user(db, user_info.id, user_info.full_name)
+                data_str = dados.get('data', datetime.now().strftime('%d/%m/%Y'))
+                hora_str = dados.get('hora', '00:00:00')
+                try:
+                    data_obj = datetime.strptime(f"{data_str} {hora_str}", '%d/%m/%Y %H:%M:%S')
+                except ValueError:
+                    data_obj = datetime.strptime(data_str, '%d/%m/%Y')
+                doc_fiscal = re.sub(r'\D', '', str(dados.get('documento_fiscal', ''))) or None
+                time_window_start = data_obj - timedelta(minutes=5)
+                time_window_end = data_obj + timedelta(minutes=5)
+                existing_lancamento = (await db.execute(
+                    select(Lancamento).filter(
+                        and_(
+                            Lancamento.id_usuario == usuario_db.id,
+                            Lancamento.valor == dados.get('valor_total'),
+                            Lancamento.documento_fiscal == doc_fiscal,
+                            Lancamento.data_transacao.between(time_window_start, time_window_end)
+                        )
+                    )
+                )).scalars().first()
+                if existing_lancamento:
+                    await query.edit_message_text("⚠️ Transação Duplicada! Operação cancelada.", parse_mode='Markdown')
+                    return
+
+                # Lógica de encontrar categoria/subcategoria (sem alterações)
+                id_categoria, id_subcategoria = None, None
+                if cat_sugerida := dados.get('categoria_sugerida'):
+                    categoria_obj = (await db.execute(
+                        select(Categoria).filter(func.lower(Categoria.nome) == func.lower(cat_sugerida))
+                    )).scalars().first()
+                    if categoria_obj:
+                        id_categoria = categoria_obj.id
+                if sub_sugerida := dados.get('subcategoria_sugerida'):
+                    if id_categoria:
+                        subcategoria_obj = (await db.execute(
+                            select(Subcategoria).filter(and_(Subcategoria.id_categoria == id_categoria, func.lower(Subcategoria.nome) == func.lower(sub_sugerida)))
+                        )).scalars().first()
+                        if subcategoria_obj:
+                            id_subcategoria = subcategoria_obj.id
+
+                # Criação do lançamento e itens (sem alterações)
+                novo_lancamento = Lancamento(
+                    id_usuario=usuario_db.id,
+                    data_transacao=data_obj,
+                    descricao=dados.get('nome_estabelecimento'),
+                    valor=dados.get('valor_total'),
+                    tipo=dados.get('tipo_transacao', 'Saída'),
+                    forma_pagamento=dados.get('forma_pagamento'),
+                    documento_fiscal=doc_fiscal,
+                    id_categoria=id_categoria,
+                    id_subcategoria=id_subcategoria
                 )
-            ).first()
-            if existing_lancamento:
-                await query.edit_message_text("⚠️ Transação Duplicada! Operação cancelada.", parse_mode='Markdown')
-                return
-
-            # Lógica de encontrar categoria/subcategoria (sem alterações)
-            id_categoria, id_subcategoria = None, None
-            if cat_sugerida := dados.get('categoria_sugerida'):
-                categoria_obj = db.query(Categoria).filter(func.lower(Categoria.nome) == func.lower(cat_sugerida)).first()
-                if categoria_obj:
-                    id_categoria = categoria_obj.id
-            if sub_sugerida := dados.get('subcategoria_sugerida'):
-                if id_categoria:
-                    subcategoria_obj = db.query(Subcategoria).filter(and_(Subcategoria.id_categoria == id_categoria, func.lower(Subcategoria.nome) == func.lower(sub_sugerida))).first()
-                    if subcategoria_obj:
-                        id_subcategoria = subcategoria_obj.id
-
-            # Criação do lançamento e itens (sem alterações)
-            novo_lancamento = Lancamento(
-                id_usuario=usuario_db.id,
-                data_transacao=data_obj,
-                descricao=dados.get('nome_estabelecimento'),
-                valor=dados.get('valor_total'),
-                tipo=dados.get('tipo_transacao', 'Saída'),
-                forma_pagamento=dados.get('forma_pagamento'),
-                documento_fiscal=doc_fiscal,
-                id_categoria=id_categoria,
-                id_subcategoria=id_subcategoria
-            )
-            for item_data in dados.get('itens', []):
-                valor_unit_str = str(item_data.get('valor_unitario', '0')).replace(',', '.')
-                valor_unit = float(valor_unit_str) if valor_unit_str else 0.0
-                qtd_str = str(item_data.get('quantidade', '1')).replace(',', '.')
-                qtd = float(qtd_str) if qtd_str else 1.0
-                novo_item = ItemLancamento(
-                    nome_item=item_data.get('nome_item', 'Item desconhecido'),
-                    quantidade=qtd,
-                    valor_unitario=valor_unit
-                )
-                novo_lancamento.itens.append(novo_item)
-
-            db.add(novo_lancamento)
-            db.commit()
-
-            # Mensagem de sucesso será enviada pelo handler principal
+                for item_data in dados.get('itens', []):
+                    valor_unit_str = str(item_data.get('valor_unitario', '0')).replace(',', '.')
+                    valor_unit = float(valor_unit_str) if valor_unit_str else 0.0
+                    qtd_str = str(item_data.get('quantidade', '1')).replace(',', '.')
+                    qtd = float(qtd_str) if qtd_str else 1.0
+                    novo_item = ItemLancamento(
+                        nome_item=item_data.get('nome_item', 'Item desconhecido'),
+                        quantidade=qtd,
+                        valor_unitario=valor_unit
+                    )
+                    novo_lancamento.itens.append(novo_item)
+
+                db.add(novo_lancamento)
+                await db.commit()
+                contexto_cache.registrar_lancamentos(user_info.id, [novo_lancamento])
+
+                # Mensagem de sucesso será enviada pelo handler principal
         except Exception as e:
-            db.rollback()
             logger.error(f"Erro ao salvar no banco (ocr_action_handler): {e}", exc_info=True)
             await query.edit_message_text("❌ Falha ao salvar no banco de dados. O erro foi registrado.")
         finally:
-            db.close()
             context.user_data.pop('dados_ocr', None)
\ No newline at end of file
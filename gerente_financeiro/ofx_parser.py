@@ -0,0 +1,123 @@
+# gerente_financeiro/ofx_parser.py
+"""
+Leitor nativo de arquivos OFX (1.x SGML e 2.x XML).
+
+Percorre o arquivo tag a tag, sem montar árvore, e emite cada <STMTTRN> já no
+formato de transação usado pelo fluxo de extratos. Não depende da IA: ela só é
+usada depois, para categorizar as descrições.
+"""
+import html
+import logging
+import re
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# <TAG>valor, </TAG> ou <TAG/>; no SGML as tags-folha não têm fechamento
+_PADRAO_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)\s*/?>([^<]*)')
+_PADRAO_CHARSET_SGML = re.compile(rb'CHARSET:\s*(\d+|[\w-]+)', re.IGNORECASE)
+_PADRAO_ENCODING_XML = re.compile(rb'<\?xml[^>]*encoding=["\']([\w-]+)["\']', re.IGNORECASE)
+
+_CAMPOS_TRANSACAO = {'TRNTYPE', 'DTPOSTED', 'DTUSER', 'TRNAMT', 'FITID', 'CHECKNUM', 'REFNUM', 'NAME', 'MEMO', 'PAYEE'}
+
+
+def _detectar_encoding(file_bytes: bytes) -> str:
+    cabecalho = file_bytes[:1024]
+    if match := _PADRAO_ENCODING_XML.search(cabecalho):
+        return match.group(1).decode('ascii')
+    if match := _PADRAO_CHARSET_SGML.search(cabecalho):
+        charset = match.group(1).decode('ascii')
+        if charset.isdigit():
+            return f"cp{charset}"
+        if charset.upper() not in ('NONE', 'ISO-8859-1'):
+            return charset
+    return 'latin-1'
+
+
+def decodificar_ofx(file_bytes: bytes) -> str:
+    """Decodifica o arquivo respeitando o CHARSET/encoding declarado no cabeçalho."""
+    encoding = _detectar_encoding(file_bytes)
+    try:
+        return file_bytes.decode(encoding, errors='replace')
+    except LookupError:
+        logger.warning(f"Encoding OFX desconhecido '{encoding}'. Usando latin-1.")
+        return file_bytes.decode('latin-1', errors='replace')
+
+
+def _converter_data(valor: str) -> Optional[str]:
+    """DTPOSTED vem como AAAAMMDD[HHMMSS[.XXX]][[-3:BRT]]; devolve DD/MM/AAAA."""
+    digitos = valor[:8]
+    if len(digitos) != 8 or not digitos.isdigit():
+        return None
+    return f"{digitos[6:8]}/{digitos[4:6]}/{digitos[0:4]}"
+
+
+def _converter_valor(valor: str) -> Optional[Decimal]:
+    texto = valor.strip().replace(' ', '')
+    if ',' in texto and texto.rfind(',') > texto.rfind('.'):
+        # Alguns bancos brasileiros exportam TRNAMT com vírgula decimal (e ponto de milhar)
+        texto = texto.replace('.', '').replace(',', '.')
+    elif ',' in texto:
+        texto = texto.replace(',', '')
+    try:
+        return Decimal(texto)
+    except InvalidOperation:
+        return None
+
+
+def _montar_transacao(campos: Dict[str, str]) -> Optional[Dict]:
+    data = _converter_data(campos.get('DTPOSTED') or campos.get('DTUSER', ''))
+    valor = _converter_valor(campos.get('TRNAMT', ''))
+    if not data or valor is None or valor == 0:
+        logger.debug(f"STMTTRN ignorada por dados incompletos: {campos}")
+        return None
+
+    nome = (campos.get('NAME') or campos.get('PAYEE') or '').strip()
+    memo = (campos.get('MEMO') or '').strip()
+    if nome and memo and memo.lower() not in nome.lower():
+        descricao = f"{nome} - {memo}"
+    else:
+        descricao = nome or memo or campos.get('TRNTYPE', 'Transação OFX')
+
+    return {
+        "data": data,
+        "descricao": descricao,
+        "valor": float(abs(valor)),
+        "tipo_transacao": "Entrada" if valor > 0 else "Saída",
+        "fitid": campos.get('FITID') or None,
+    }
+
+
+def iterar_transacoes_ofx(texto_ofx: str) -> Iterator[Dict]:
+    """
+    Gera as transações do OFX na ordem do arquivo, descartando FITIDs repetidos.
+    """
+    fitids_vistos = set()
+    campos: Optional[Dict[str, str]] = None
+
+    for match in _PADRAO_TAG.finditer(texto_ofx):
+        fechamento, tag, valor = match.group(1), match.group(2).upper(), match.group(3)
+
+        if tag == 'STMTTRN':
+            if fechamento:
+                if campos is not None and (transacao := _montar_transacao(campos)):
+                    fitid = transacao["fitid"]
+                    if fitid and fitid in fitids_vistos:
+                        logger.info(f"FITID duplicado no arquivo OFX ignorado: {fitid}")
+                    else:
+                        if fitid:
+                            fitids_vistos.add(fitid)
+                        yield transacao
+                campos = None
+            else:
+                campos = {}
+            continue
+
+        if campos is not None and not fechamento and tag in _CAMPOS_TRANSACAO:
+            campos[tag] = html.unescape(valor.strip())
+
+
+def extrair_transacoes_ofx(file_bytes: bytes) -> List[Dict]:
+    """Decodifica e extrai todas as transações de um arquivo OFX."""
+    return list(iterar_transacoes_ofx(decodificar_ofx(file_bytes)))
@@ -6,7 +6,9 @@ from telegram.ext import (
     ContextTypes, ConversationHandler, CommandHandler, CallbackQueryHandler, MessageHandler, filters
 )
 
-from database.database import get_db, get_or_create_user # <-- Importação adicionada
+from sqlalchemy import select
+
+from database.database import get_async_db, get_or_create_user # <-- Importação adicionada
 from models import Usuario, Conta
 from .handlers import cancel
 
@@ -30,12 +32,11 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if query:
         effective_user = query.from_user
     
-    db = next(get_db())
-    # Usamos get_or_create_user para garantir que o usuário sempre exista
-    user_db = get_or_create_user(db, effective_user.id, effective_user.full_name)
+    async with get_async_db() as db:
+        # Usamos get_or_create_user para garantir que o usuário sempre exista
+        user_db = await get_or_create_user(db, effective_user.id, effective_user.full_name)
     horario_atual = user_db.horario_notificacao.strftime('%H:%M') if user_db.horario_notificacao else "09:00"
     perfil_atual = user_db.perfil_investidor if user_db.perfil_investidor else "Não definido"
-    db.close()
 
     text = (
         f"⚙️ <b>Painel de Configuração</b>\n\n"
@@ -64,9 +65,8 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def configurar_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Inicia o fluxo de configuração/onboarding."""
     # Garante que o usuário exista no banco de dados ANTES de qualquer outra coisa
-    db = next(get_db())
-    get_or_create_user(db, update.effective_user.id, update.effective_user.full_name)
-    db.close()
+    async with get_async_db() as db:
+        await get_or_create_user(db, update.effective_user.id, update.effective_user.full_name)
     
     await update.message.reply_html(
         "👋 Olá! Para que eu possa ser seu melhor assistente financeiro, vamos configurar seu ecossistema. "
@@ -171,15 +171,16 @@ async def finalizar_perfil(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     elif total_pontos <= 7: perfil = 'Moderado'
     else: perfil = 'Arrojado'
     
-    db = next(get_db())
     try:
-        # A consulta agora vai funcionar, pois o usuário foi criado no início
-        user_db = db.query(Usuario).filter(Usuario.telegram_id == query.from_user.id).first()
-        user_db.perfil_investidor = perfil
-        db.commit()
+        async with get_async_db() as db:
+            # A consulta agora vai funcionar, pois o usuário foi criado no início
+            user_db = (await db.execute(
+                select(Usuario).filter(Usuario.telegram_id == query.from_user.id)
+            )).scalars().first()
+            user_db.perfil_investidor = perfil
+            await db.commit()
         await query.edit_message_text(f"✅ Perfil definido como: <b>{perfil}</b>!\n\nRetornando ao menu...", parse_mode='HTML', reply_markup=None)
     finally:
-        db.close()
         context.user_data.pop('perfil_pontos', None)
     
     import asyncio
@@ -190,29 +191,27 @@ async def finalizar_perfil(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 
 async def add_conta_nome(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     nome_conta = update.message.text
-    db = next(get_db())
-    try:
-        usuario_db = db.query(Usuario).filter(Usuario.telegram_id == update.effective_user.id).first()
+    async with get_async_db() as db:
+        usuario_db = (await db.execute(
+            select(Usuario).filter(Usuario.telegram_id == update.effective_user.id)
+        )).scalars().first()
         nova_conta = Conta(id_usuario=usuario_db.id, nome=nome_conta, tipo="Conta")
         db.add(nova_conta)
-        db.commit()
-        # Em vez de voltar ao menu, perguntamos se o usuário quer adicionar outra conta.
-        keyboard = [
-            [InlineKeyboardButton("➕ Sim, adicionar outra", callback_data="add_another_conta_sim")],
-            [InlineKeyboardButton("⬅️ Não, voltar ao menu", callback_data="add_another_conta_nao")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_html(
-            f"✅ Conta '<b>{nome_conta}</b>' adicionada!\n\nDeseja adicionar outra conta?",
-            reply_markup=reply_markup
-        )
+        await db.commit()
 
-        
-        return ASK_ADD_ANOTHER_CONTA
- 
-    finally:
-        db.close()
+    # Em vez de voltar ao menu, perguntamos se o usuário quer adicionar outra conta.
+    keyboard = [
+        [InlineKeyboardButton("➕ Sim, adicionar outra", callback_data="add_another_conta_sim")],
+        [InlineKeyboardButton("⬅️ Não, voltar ao menu", callback_data="add_another_conta_nao")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    await update.message.reply_html(
+        f"✅ Conta '<b>{nome_conta}</b>' adicionada!\n\nDeseja adicionar outra conta?",
+        reply_markup=reply_markup
+    )
+
+    return ASK_ADD_ANOTHER_CONTA
 
 async def add_cartao_nome(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     context.user_data['novo_cartao_nome'] = update.message.text
@@ -233,15 +232,17 @@ async def add_cartao_vencimento(update: Update, context: ContextTypes.DEFAULT_TY
         dia_vencimento = int(update.message.text)
         nome_cartao = context.user_data['novo_cartao_nome']
         dia_fechamento = context.user_data['novo_cartao_fechamento']
-        db = next(get_db())
         try:
-            usuario_db = db.query(Usuario).filter(Usuario.telegram_id == update.effective_user.id).first()
-            novo_cartao = Conta(
-                id_usuario=usuario_db.id, nome=nome_cartao, tipo="Cartão de Crédito",
-                dia_fechamento=dia_fechamento, dia_vencimento=dia_vencimento
-            )
-            db.add(novo_cartao)
-            db.commit()
+            async with get_async_db() as db:
+                usuario_db = (await db.execute(
+                    select(Usuario).filter(Usuario.telegram_id == update.effective_user.id)
+                )).scalars().first()
+                novo_cartao = Conta(
+                    id_usuario=usuario_db.id, nome=nome_cartao, tipo="Cartão de Crédito",
+                    dia_fechamento=dia_fechamento, dia_vencimento=dia_vencimento
+                )
+                db.add(novo_cartao)
+                await db.commit()
             # Em vez de voltar ao menu, perguntamos se o usuário quer adicionar outro cartão.
             keyboard = [
                 [InlineKeyboardButton("➕ Sim, adicionar outro", callback_data="add_another_cartao_sim")],
@@ -257,7 +258,6 @@ async def add_cartao_vencimento(update: Update, context: ContextTypes.DEFAULT_TY
             return ASK_ADD_ANOTHER_CARTAO
 
         finally:
-            db.close()
             context.user_data.clear()
 
     except (ValueError, TypeError):
@@ -295,14 +295,13 @@ async def handle_add_another_conta(update: Update, context: ContextTypes.DEFAULT
 async def save_horario(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     try:
         novo_horario_obj = time.fromisoformat(update.message.text)
-        db = next(get_db())
-        try:
-            user_db = db.query(Usuario).filter(Usuario.telegram_id == update.effective_user.id).first()
+        async with get_async_db() as db:
+            user_db = (await db.execute(
+                select(Usuario).filter(Usuario.telegram_id == update.effective_user.id)
+            )).scalars().first()
             user_db.horario_notificacao = novo_horario_obj
-            db.commit()
-            await update.message.reply_html(f"✅ Horário de lembretes atualizado para <b>{update.message.text}</b>.")
-        finally:
-            db.close()
+            await db.commit()
+        await update.message.reply_html(f"✅ Horário de lembretes atualizado para <b>{update.message.text}</b>.")
         return await show_main_menu(update, context)
     except ValueError:
         await update.message.reply_text("⚠️ Formato inválido. Use HH:MM (ex: 09:00).")
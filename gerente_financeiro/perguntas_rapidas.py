@@ -0,0 +1,126 @@
+# gerente_financeiro/perguntas_rapidas.py
+"""
+Decide quais perguntas do /gerente podem ser respondidas direto do banco.
+
+`classificar_pergunta` só devolve uma intenção quando ela e os filtros são
+inequívocos: a pergunta casa com exatamente um tipo de resposta e toda palavra
+que o interpretador de filtros não consumiu é vocabulário conhecido. Qualquer
+sobra ("quanto gastei com comida no fim de semana") faz a pergunta seguir
+para a IA, que erra menos do que uma resposta exata para a pergunta errada.
+
+É puro (sem banco nem I/O), como filtros_lancamento.
+"""
+import re
+from datetime import datetime
+from typing import Iterable, Optional, Sequence, Tuple
+
+from .filtros_lancamento import PALAVRAS_VAZIAS, interpretar_pergunta, sem_acentos
+
+# Pedidos de opinião ou explicação sempre vão para a IA
+PALAVRAS_ANALISE_ABERTA = (
+    'por que', 'porque', 'por qu', 'como posso', 'como faco', 'como fazer', 'dica', 'conselho',
+    'sugest', 'recomend', 'analis', 'devo', 'deveria', 'vale a pena', 'compar',
+    'previs', 'planej', 'invest', 'economizar', 'reduzir', 'melhorar', 'e se',
+)
+TAMANHO_MAX_PERGUNTA = 120   # perguntas longas costumam trazer contexto que só a IA aproveita
+LIMITE_PADRAO_LISTA = 10
+LIMITE_PADRAO_RANKING = 5
+
+# Os padrões trabalham sobre o texto em minúsculas e sem acentos
+RE_MAIOR_DESPESA = re.compile(r'\bmaior (?:despesa|gasto|compra)\b')
+RE_MAIORES_DESPESAS = re.compile(r'\bmaiores (?:despesas|gastos|compras)\b')
+RE_RESUMO = re.compile(
+    r'\b(?:resumo|balanco|saldo|panorama|como estou)\b|\bquanto (?:eu )?(?:sobrou|economizei)\b'
+)
+RE_TOTAL_GASTOS = re.compile(
+    r'\bquanto\b(?: eu)? (?:gastei|gasto|paguei)\b|\btotal (?:de |dos |das |com )?(?:gastos|despesas)\b'
+)
+RE_TOTAL_RECEITAS = re.compile(
+    r'\bquanto\b(?: eu)? (?:recebi|ganhei)\b|\btotal (?:de |das |dos )?(?:receitas|entradas)\b'
+)
+RE_LISTA = re.compile(
+    r'\b(?:lancamentos?|transac(?:ao|oes)|movimentac(?:ao|oes)|extrato)\b'
+    r'|\b(?:liste|listar|lista|mostre|mostra|mostrar|ver|quais foram)\b.*\b(?:gastos|despesas|compras|receitas|entradas)\b'
+)
+
+# Palavras que podem sobrar na pergunta sem torná-la ambígua
+VOCABULARIO = PALAVRAS_VAZIAS | {
+    'quanto', 'quanta', 'eu', 'me', 'foi', 'foram', 'tive', 'fiz', 'tenho', 'todos', 'todas',
+    'por', 'favor', 'quero', 'gostaria', 'saber', 'ver', 'mostre', 'mostra', 'mostrar',
+    'liste', 'listar', 'lista', 'total', 'valor', 'ate', 'agora',
+    'gastei', 'gasto', 'gastos', 'paguei', 'despesa', 'despesas', 'compra', 'compras',
+    'recebi', 'ganhei', 'receita', 'receitas', 'entrada', 'entradas', 'saida', 'saidas',
+    'lancamento', 'lancamentos', 'transacao', 'transacoes', 'movimentacao', 'movimentacoes', 'extrato',
+    'ultimo', 'ultima', 'ultimos', 'ultimas', 'maior', 'maiores',
+    'resumo', 'balanco', 'saldo', 'panorama', 'como', 'estou', 'sobrou', 'economizei',
+    'mes',   # "resumo do mês": sem outro período, totais e resumos já são do mês atual
+}
+
+
+def _inicio_do_mes(hoje: datetime) -> datetime:
+    return hoje.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def pode_ser_rapida(texto: str) -> bool:
+    """Triagem barata, antes de buscar contas e categorias: descarta perguntas longas ou de opinião."""
+    normalizado = sem_acentos(texto or "").strip()
+    if not normalizado or len(normalizado) > TAMANHO_MAX_PERGUNTA:
+        return False
+    return not any(palavra in normalizado for palavra in PALAVRAS_ANALISE_ABERTA)
+
+
+def classificar_pergunta(
+    texto: str,
+    contas: Sequence[Tuple[int, str]] = (),
+    categorias: Optional[Iterable[str]] = None,
+    hoje: Optional[datetime] = None,
+) -> Optional[Tuple[str, dict]]:
+    """
+    (intenção, filtros) para perguntas com resposta exata no banco, ou None.
+
+    Intenções: 'maior_despesa', 'maiores_despesas', 'resumo', 'total' (tipo em
+    filtros['tipo']) e 'lista'. Os filtros seguem buscar_lancamentos_usuario; totais
+    e resumos sem período referem-se ao mês atual.
+    """
+    if not pode_ser_rapida(texto):
+        return None
+    hoje = hoje or datetime.now()
+    normalizado = sem_acentos(texto).strip()
+
+    filtros, resto = interpretar_pergunta(texto, contas, categorias, hoje)
+    if any(palavra not in VOCABULARIO for palavra in re.findall(r'[a-z0-9]+', resto)):
+        return None
+
+    if RE_MAIORES_DESPESAS.search(normalizado):
+        filtros['tipo'] = 'Saída'
+        filtros.setdefault('limit', LIMITE_PADRAO_RANKING)
+        return 'maiores_despesas', filtros
+    if RE_MAIOR_DESPESA.search(normalizado):
+        filtros['tipo'] = 'Saída'
+        filtros.pop('limit', None)
+        return 'maior_despesa', filtros
+
+    candidatas = [
+        intencao for intencao, padrao in (
+            ('resumo', RE_RESUMO), ('gastos', RE_TOTAL_GASTOS),
+            ('receitas', RE_TOTAL_RECEITAS), ('lista', RE_LISTA),
+        ) if padrao.search(normalizado)
+    ]
+    if not candidatas and 'limit' in filtros:
+        candidatas = ['lista']   # "últimos 5 gastos"
+    if len(candidatas) != 1:
+        return None
+
+    intencao = candidatas[0]
+    if intencao == 'lista':
+        filtros.setdefault('limit', LIMITE_PADRAO_LISTA)
+        return 'lista', filtros
+
+    if 'limit' in filtros:
+        return None   # "quanto gastei nos últimos 5 lançamentos" não é um total por período
+    filtros.setdefault('data_inicio', _inicio_do_mes(hoje))
+    if intencao == 'resumo':
+        filtros.pop('tipo', None)
+        return 'resumo', filtros
+    filtros['tipo'] = 'Saída' if intencao == 'gastos' else 'Entrada'
+    return 'total', filtros
@@ -295,4 +295,28 @@ PROMPT_ANALISE_EXTRATO = """
 }}
 TEXTO EXTRAÍDO DO EXTRATO PARA ANÁLISE:
 {texto_extrato}
+"""
+
+PROMPT_CATEGORIZAR_DESCRICOES = """
+**TAREFA:** Você receberá uma lista numerada de descrições de transações bancárias já extraídas de um arquivo estruturado. Sua única tarefa é sugerir a categoria e a subcategoria de cada uma.
+
+**REGRAS INQUEBRÁVEIS:**
+- **SUA RESPOSTA DEVE SER APENAS O CÓDIGO JSON.** Não inclua explicações ou qualquer texto fora do bloco JSON.
+- Use **somente** as categorias e subcategorias listadas abaixo. Se nenhuma servir, use "Outros".
+- Retorne exatamente um item para cada número recebido.
+
+**CONTEXTO DE CATEGORIAS DISPONÍVEIS:**
+{categorias_disponiveis}
+
+**FORMATO DA SAÍDA JSON (OBRIGATÓRIO):**
+```json
+{{
+  "categorias": [
+    {{"i": 0, "categoria_sugerida": "Nome da Categoria", "subcategoria_sugerida": "Nome da Subcategoria"}}
+  ]
+}}
+```
+
+**DESCRIÇÕES:**
+{descricoes}
 """
\ No newline at end of file
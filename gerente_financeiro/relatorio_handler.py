@@ -1,69 +1,27 @@
 # gerente_financeiro/relatorio_handler.py
 
+import asyncio
 import logging
 from datetime import datetime
 from io import BytesIO
-import os
+from typing import List, Optional, Tuple, Union
 from dateutil.relativedelta import relativedelta
 import re
-import base64
 
-from telegram import Update, InputFile
+from telegram import Bot, Update, InputFile
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes, CommandHandler
-from jinja2 import Environment, FileSystemLoader
-from weasyprint import HTML, CSS
 
-from database.database import get_db
-from .services import gerar_contexto_relatorio, gerar_grafico_para_relatorio
-
-logger = logging.getLogger(__name__)
-
-
-# =============================================================================
-#  CONFIGURAÇÃO DO AMBIENTE JINJA2 E FILTROS CUSTOMIZADOS
-#  (Esta seção deve ser executada apenas uma vez, quando o módulo é importado)
-# =============================================================================
-
-def nl2br_filter(s):
-    """Filtro Jinja2 para converter quebras de linha em tags <br>."""
-    if s is None:
-        return ""
-    return re.sub(r'\r\n|\r|\n', '<br>\n', str(s))
-
-def color_palette_filter(index):
-    """Filtro Jinja2 que retorna uma cor de uma paleta predefinida baseado no índice."""
-    colors = ["#3498db", "#e74c3c", "#2ecc71", "#f1c40f", "#9b59b6", "#1abc9c", "#e67e22"]
-    return colors[int(index) % len(colors)]
-
-def safe_float_filter(value, default=0.0):
-    """Filtro Jinja2 para converter valores para float de forma segura."""
-    try:
-        return float(value) if value is not None else default
-    except (ValueError, TypeError):
-        return default
-
-def safe_format_currency(value):
-    """Filtro Jinja2 para formatar valores monetários de forma segura."""
-    try:
-        return "%.2f" % float(value) if value is not None else "0.00"
-    except (ValueError, TypeError):
-        return "0.00"
-
-# Define os caminhos para as pastas de templates e arquivos estáticos
-templates_path = os.path.join(os.path.dirname(__file__), '..', 'templates')
-static_path = os.path.join(os.path.dirname(__file__), '..', 'static')
-
-# Cria e configura o ambiente do Jinja2
-env = Environment(
-    loader=FileSystemLoader(templates_path),
-    autoescape=True  # Ativa o autoescaping para segurança
+from database.database import (
+    get_async_db, calcular_assinatura_relatorio, buscar_relatorio_pronto, carregar_pdf_relatorio,
+    salvar_relatorio_pronto, registrar_file_id_relatorio, PERIODOS_ANTERIORES_RELATORIO
 )
+from .services import gerar_contexto_relatorio
+from .graficos import interpretar_intervalo, rotulo_intervalo
+from .relatorio_pdf import VERSAO_ATIVOS, contexto_para_template, gerar_pdf_relatorio
+from .fila_relatorios import enfileirar, executar_no_pool, posicao_na_fila
 
-# Adiciona os filtros customizados ao ambiente
-env.filters['nl2br'] = nl2br_filter
-env.filters['color_palette'] = color_palette_filter
-env.filters['safe_float'] = safe_float_filter
-env.filters['safe_currency'] = safe_format_currency
+logger = logging.getLogger(__name__)
 
 
 # =============================================================================
@@ -75,14 +33,24 @@ def validar_e_completar_contexto(contexto_dados):
     
     # Campos obrigatórios com valores padrão
     campos_padrao = {
-        'mes_nome': 'Mês Atual',
-        'ano': datetime.now().year,
+        'titulo_periodo': 'Mês Atual',
+        'unidade_periodo': 'mês',
+        'unidade_periodo_plural': 'meses',
+        'dias_periodo': 30,
         'receita_total': 0.0,
         'despesa_total': 0.0,
         'saldo_mes': 0.0,
         'taxa_poupanca': 0.0,
         'gastos_agrupados': [],
         'gastos_por_categoria_dict': {},
+        'evolucao_periodos': [],
+        'tendencia_receita_percent': None,
+        'tendencia_despesa_percent': None,
+        'media_receitas_anteriores': 0.0,
+        'media_despesas_anteriores': 0.0,
+        'media_saldo_anteriores': 0.0,
+        'periodos_anteriores_com_dados': 0,
+        'periodos_anteriores': PERIODOS_ANTERIORES_RELATORIO,
         'metas': [],
         'analise_ia': None,
         'has_data': False
@@ -148,7 +116,7 @@ def debug_contexto(contexto_dados):
     """Função para debug - registra informações do contexto no log."""
     logger.info("=== DEBUG CONTEXTO RELATÓRIO ===")
     logger.info(f"Has data: {contexto_dados.get('has_data', False)}")
-    logger.info(f"Mês/Ano: {contexto_dados.get('mes_nome', 'N/A')} {contexto_dados.get('ano', 'N/A')}")
+    logger.info(f"Período: {contexto_dados.get('titulo_periodo', 'N/A')}")
     logger.info(f"Receita: R$ {contexto_dados.get('receita_total', 0):.2f}")
     logger.info(f"Despesa: R$ {contexto_dados.get('despesa_total', 0):.2f}")
     logger.info(f"Saldo: R$ {contexto_dados.get('saldo_mes', 0):.2f}")
@@ -156,7 +124,7 @@ def debug_contexto(contexto_dados):
     logger.info(f"Categorias: {len(contexto_dados.get('gastos_agrupados', []))}")
     logger.info(f"Metas: {len(contexto_dados.get('metas', []))}")
     logger.info(f"Análise IA: {'Sim' if contexto_dados.get('analise_ia') else 'Não'}")
-    logger.info(f"Gráfico: {'Sim' if contexto_dados.get('grafico_pizza_base64') else 'Não'}")
+    logger.info(f"Períodos na evolução: {len(contexto_dados.get('evolucao_periodos', []))}")
     logger.info("===============================")
 
 
@@ -164,113 +132,167 @@ def debug_contexto(contexto_dados):
 #  HANDLER DO COMANDO /relatorio
 # =============================================================================
 
-async def gerar_relatorio_comando(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Gera e envia um relatório financeiro detalhado em PDF."""
-    
-    hoje = datetime.now()
-    
-    # Determina o período do relatório (mês atual ou passado)
-    if context.args and context.args[0].lower() in ['passado', 'anterior']:
-        data_alvo = hoje - relativedelta(months=1)
-        periodo_str = f"do mês passado ({data_alvo.strftime('%B de %Y')})"
+def periodo_do_comando(args: List[str], hoje: Optional[datetime] = None) -> Optional[Tuple[datetime, datetime, str]]:
+    """
+    Interpreta os argumentos do /relatorio e retorna (início, fim exclusivo, descrição):
+      (nenhum)                   mês atual
+      passado | anterior         mês passado
+      ano [AAAA]                 ano inteiro (o atual, se omitido)
+      DD/MM/AAAA DD/MM/AAAA      intervalo livre, datas inclusivas
+    Retorna None se os argumentos não forem reconhecidos.
+    """
+    hoje = hoje or datetime.now()
+    inicio_mes = hoje.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if not args:
+        return inicio_mes, inicio_mes + relativedelta(months=1), "deste mês"
+
+    chave = args[0].lower()
+    if chave in ['passado', 'anterior'] and len(args) == 1:
+        inicio = inicio_mes - relativedelta(months=1)
+        return inicio, inicio_mes, f"do mês passado ({inicio.strftime('%B de %Y')})"
+    if chave == 'ano' and len(args) <= 2:
+        if len(args) == 2 and not re.fullmatch(r'\d{4}', args[1]):
+            return None
+        ano = int(args[1]) if len(args) == 2 else hoje.year
+        return datetime(ano, 1, 1), datetime(ano + 1, 1, 1), f"de {ano}"
+
+    intervalo = interpretar_intervalo(args)
+    if intervalo:
+        inicio, fim = intervalo
+        return inicio, fim, f"de {rotulo_intervalo(inicio, fim)}"
+    return None
+
+
+def mes_fechado(data_inicio: datetime, data_fim: datetime) -> Optional[Tuple[int, int]]:
+    """
+    (mês, ano) se o período for exatamente um mês já encerrado. Só o relatório
+    desses meses é guardado e reaproveitado (ver relatorios_mensais).
+    """
+    if data_inicio != data_inicio.replace(day=1, hour=0, minute=0, second=0, microsecond=0):
+        return None
+    if data_fim != data_inicio + relativedelta(months=1) or data_fim > datetime.now():
+        return None
+    return data_inicio.month, data_inicio.year
+
+
+def _nome_arquivo_pdf(nome_completo: Optional[str], data_inicio: datetime, data_fim: datetime) -> str:
+    primeiro_nome = (nome_completo or "Usuario").split(' ')[0]
+    # Remove caracteres especiais do nome para o arquivo
+    primeiro_nome = re.sub(r'[^\w\-_]', '', primeiro_nome) or "Usuario"
+    if data_fim == data_inicio + relativedelta(months=1) and data_inicio.day == 1:
+        periodo = data_inicio.strftime('%Y-%m')
+    elif data_fim == data_inicio + relativedelta(years=1) and (data_inicio.day, data_inicio.month) == (1, 1):
+        periodo = data_inicio.strftime('%Y')
     else:
-        data_alvo = hoje
-        periodo_str = "deste mês"
-        
-    mes_alvo = data_alvo.month
-    ano_alvo = data_alvo.year
+        periodo = f"{data_inicio.strftime('%Y-%m-%d')}_a_{(data_fim - relativedelta(days=1)).strftime('%Y-%m-%d')}"
+    return f"Relatorio_{periodo}_{primeiro_nome}.pdf"
+
 
-    await update.message.reply_text(f"Gerando seu relatório {periodo_str}... 🎥\nIsso pode levar alguns segundos.")
+async def _enviar_pdf(bot: Bot, user_id: int, documento: Union[bytes, str], nome_arquivo: str,
+                      periodo_str: str) -> Optional[str]:
+    """Envia o PDF (bytes ou file_id do Telegram) e retorna o file_id do documento enviado."""
+    if isinstance(documento, bytes):
+        pdf_buffer = BytesIO(documento)
+        pdf_buffer.name = nome_arquivo
+        documento = InputFile(pdf_buffer)
+    mensagem = await bot.send_document(
+        chat_id=user_id,
+        document=documento,
+        caption=f"✅ Aqui está o seu relatório financeiro {periodo_str}!"
+    )
+    return mensagem.document.file_id if mensagem.document else None
+
+
+async def gerar_relatorio_pdf(user_id: int, data_inicio: datetime,
+                              data_fim: datetime) -> Tuple[Optional[dict], Optional[bytes], Optional[int]]:
+    """
+    Monta o contexto, desenha o gráfico e gera o PDF num worker do pool de relatórios.
+    Retorna (contexto, pdf, id_guardado): contexto None se o usuário não existe e pdf None
+    se não há dados no período. O PDF de um mês fechado é guardado para os próximos pedidos.
+    """
+    mes_ano = mes_fechado(data_inicio, data_fim)
+    assinatura = None
+    if mes_ano:
+        # Calculada antes de ler os dados: uma gravação durante a geração deixa o PDF marcado como velho
+        assinatura = await calcular_assinatura_relatorio(user_id, *mes_ano, VERSAO_ATIVOS)
+
+    # 1. Obter todos os dados necessários do backend
+    logger.info(f"Iniciando geração de relatório para usuário {user_id}, período {data_inicio:%d/%m/%Y} a {data_fim:%d/%m/%Y}")
+    async with get_async_db() as db:
+        contexto_dados = await gerar_contexto_relatorio(db, user_id, data_inicio, data_fim)
     
-    db = next(get_db())
-    user_id = update.effective_user.id
+    if not contexto_dados:
+        return None, None, None
     
+    # 2. Validar e completar contexto
+    contexto_dados = validar_e_completar_contexto(contexto_dados)
+    
+    # 3. Debug do contexto (pode ser removido em produção)
+    debug_contexto(contexto_dados)
+    
+    if not contexto_dados.get("has_data"):
+        return contexto_para_template(contexto_dados), None, None
+
+    # 4. Desenhar os gráficos (SVG), renderizar o template e gerar o PDF num worker do pool de relatórios
+    logger.info("Gerando PDF...")
+    contexto_template = contexto_para_template(contexto_dados)
     try:
-        # 1. Obter todos os dados necessários do backend
-        logger.info(f"Iniciando geração de relatório para usuário {user_id}, mês {mes_alvo}, ano {ano_alvo}")
-        contexto_dados = gerar_contexto_relatorio(db, user_id, mes_alvo, ano_alvo)
-        
-        if not contexto_dados:
-            await update.message.reply_text("Não foi possível encontrar seu usuário. Tente usar o bot uma vez para se registrar.")
-            return
-        
-        # 2. Validar e completar contexto
-        contexto_dados = validar_e_completar_contexto(contexto_dados)
-        
-        # 3. Debug do contexto (pode ser removido em produção)
-        debug_contexto(contexto_dados)
-        
-        if not contexto_dados.get("has_data"):
-            await update.message.reply_text(f"Não encontrei dados suficientes para {periodo_str} para gerar um relatório.")
-            return
+        pdf_bytes, tempos = await executar_no_pool(gerar_pdf_relatorio, contexto_template)
+        logger.info("Etapas do PDF: " + ", ".join(f"{etapa}={segundos * 1000:.0f}ms" for etapa, segundos in tempos.items()))
+    except Exception as e:
+        logger.error(f"Erro ao gerar PDF: {e}", exc_info=True)
+        raise
+
+    relatorio_id = None
+    if assinatura:
+        relatorio_id = await salvar_relatorio_pronto(user_id, *mes_ano, assinatura, pdf_bytes)
+    return contexto_template, pdf_bytes, relatorio_id
+
 
-        # 4. Gerar o gráfico de pizza dinamicamente
-        logger.info("Gerando gráfico de pizza...")
+async def _enviar_relatorio_pronto(bot: Bot, user_id: int, data_inicio: datetime, data_fim: datetime,
+                                   periodo_str: str) -> bool:
+    """Envia o PDF guardado do mês, se ainda estiver atual. Retorna False se for preciso gerá-lo."""
+    pronto = await buscar_relatorio_pronto(user_id, data_inicio.month, data_inicio.year, VERSAO_ATIVOS)
+    if not pronto:
+        return False
+    nome_arquivo = _nome_arquivo_pdf(pronto['nome_completo'], data_inicio, data_fim)
+
+    if pronto['telegram_file_id']:
         try:
-            grafico_buffer = gerar_grafico_para_relatorio(contexto_dados.get("gastos_por_categoria_dict", {}))
-            
-            if grafico_buffer:
-                grafico_base64 = base64.b64encode(grafico_buffer.getvalue()).decode('utf-8')
-                contexto_dados["grafico_pizza_base64"] = grafico_base64
-                logger.info("Gráfico gerado com sucesso")
-            else:
-                contexto_dados["grafico_pizza_base64"] = None
-                logger.warning("Falha ao gerar gráfico")
-        except Exception as e:
-            logger.error(f"Erro ao gerar gráfico: {e}")
-            contexto_dados["grafico_pizza_base64"] = None
+            await _enviar_pdf(bot, user_id, pronto['telegram_file_id'], nome_arquivo, periodo_str)
+            return True
+        except BadRequest as e:
+            logger.warning(f"file_id do relatório {pronto['id']} recusado pelo Telegram ({e}). Reenviando o PDF.")
+
+    pdf_bytes = await carregar_pdf_relatorio(pronto['id'])
+    if pdf_bytes is None:
+        return False
+    file_id = await _enviar_pdf(bot, user_id, pdf_bytes, nome_arquivo, periodo_str)
+    await registrar_file_id_relatorio(pronto['id'], file_id)
+    return True
+
+
+async def _gerar_e_enviar_relatorio(bot: Bot, user_id: int, data_inicio: datetime, data_fim: datetime,
+                                    periodo_str: str) -> None:
+    """Tarefa da fila: gera o PDF e envia ao usuário."""
+    try:
+        contexto_template, pdf_bytes, relatorio_id = await gerar_relatorio_pdf(user_id, data_inicio, data_fim)
         
-        # 5. Renderizar o template HTML com os dados
-        logger.info("Renderizando template HTML...")
-        try:
-            template = env.get_template('relatorio.html')
-            html_renderizado = template.render(contexto_dados)
-            logger.info(f"Template renderizado. Tamanho: {len(html_renderizado)} caracteres")
-            
-            # Debug: salva HTML temporariamente para verificação (apenas em desenvolvimento)
-            # Descomente as linhas abaixo se precisar verificar o HTML gerado
-            # with open(f"debug_relatorio_{user_id}.html", "w", encoding="utf-8") as f:
-            #     f.write(html_renderizado)
-            # logger.info("HTML de debug salvo")
-            
-        except Exception as e:
-            logger.error(f"Erro ao renderizar template: {e}", exc_info=True)
-            raise
+        if contexto_template is None:
+            await bot.send_message(chat_id=user_id, text="Não foi possível encontrar seu usuário. Tente usar o bot uma vez para se registrar.")
+            return
         
-        # 6. Carregar o CSS e gerar o PDF
-        logger.info("Gerando PDF...")
-        try:
-            caminho_css = os.path.join(static_path, 'relatorio.css')
-            
-            # Verifica se o arquivo CSS existe
-            if not os.path.exists(caminho_css):
-                logger.warning(f"Arquivo CSS não encontrado: {caminho_css}")
-                # Gera PDF sem CSS se necessário
-                pdf_bytes = HTML(string=html_renderizado, base_url=static_path).write_pdf()
-            else:
-                css = CSS(caminho_css)
-                pdf_bytes = HTML(string=html_renderizado, base_url=static_path).write_pdf(stylesheets=[css])
-            
-            logger.info(f"PDF gerado. Tamanho: {len(pdf_bytes)} bytes")
-            
-        except Exception as e:
-            logger.error(f"Erro ao gerar PDF: {e}", exc_info=True)
-            raise
+        if pdf_bytes is None:
+            await bot.send_message(chat_id=user_id, text=f"Não encontrei dados suficientes para {periodo_str} para gerar um relatório.")
+            return
         
-        # 7. Preparar e enviar o arquivo PDF para o usuário
+        # 6. Enviar o arquivo PDF para o usuário
         logger.info("Enviando PDF...")
         try:
-            pdf_buffer = BytesIO(pdf_bytes)
-            nome_usuario_safe = contexto_dados['usuario'].nome_completo.split(' ')[0] if hasattr(contexto_dados.get('usuario'), 'nome_completo') else "Usuario"
-            # Remove caracteres especiais do nome para o arquivo
-            nome_usuario_safe = re.sub(r'[^\w\-_]', '', nome_usuario_safe)
-            pdf_buffer.name = f"Relatorio_{data_alvo.strftime('%Y-%m')}_{nome_usuario_safe}.pdf"
-            
-            await context.bot.send_document(
-                chat_id=user_id,
-                document=InputFile(pdf_buffer),
-                caption=f"✅ Aqui está o seu relatório financeiro {periodo_str}!"
-            )
+            nome_arquivo = _nome_arquivo_pdf(contexto_template['usuario']['nome_completo'], data_inicio, data_fim)
+            file_id = await _enviar_pdf(bot, user_id, pdf_bytes, nome_arquivo, periodo_str)
+            if relatorio_id and file_id:
+                await registrar_file_id_relatorio(relatorio_id, file_id)
             
             logger.info(f"Relatório enviado com sucesso para usuário {user_id}")
             
@@ -280,9 +302,56 @@ async def gerar_relatorio_comando(update: Update, context: ContextTypes.DEFAULT_
 
     except Exception as e:
         logger.error(f"Erro geral ao gerar relatório para o usuário {user_id}: {e}", exc_info=True)
-        await update.message.reply_text("❌ Ops! Ocorreu um erro ao gerar seu relatório. A equipe de filmagem já foi notificada.")
-    finally:
-        db.close()
+        await bot.send_message(chat_id=user_id, text="❌ Ops! Ocorreu um erro ao gerar seu relatório. A equipe de filmagem já foi notificada.")
+
+
+async def gerar_relatorio_comando(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Coloca o pedido de relatório na fila; o PDF é enviado quando ficar pronto."""
+    
+    periodo = periodo_do_comando(context.args or [])
+    if periodo is None:
+        await update.message.reply_text(
+            "Não entendi o período. Use:\n"
+            "• /relatorio — mês atual\n"
+            "• /relatorio passado — mês passado\n"
+            "• /relatorio ano 2025 — ano inteiro\n"
+            "• /relatorio 01/03/2025 15/04/2025 — intervalo de datas"
+        )
+        return
+    data_inicio, data_fim, periodo_str = periodo
+    user_id = update.effective_user.id
+    chave = (user_id, data_inicio, data_fim)
+
+    # Meses fechados normalmente já foram gerados pelo job noturno: envio imediato, sem fila
+    if mes_fechado(data_inicio, data_fim):
+        try:
+            if await _enviar_relatorio_pronto(context.bot, user_id, data_inicio, data_fim, periodo_str):
+                return
+        except Exception as e:
+            logger.error(f"Erro ao enviar relatório pronto para o usuário {user_id}: {e}", exc_info=True)
+
+    # Pedidos repetidos do mesmo relatório não ocupam a fila de novo
+    posicao = posicao_na_fila(chave)
+    if posicao == 0:
+        await update.message.reply_text(f"⏳ Seu relatório {periodo_str} já está sendo gerado. Ele chega em instantes!")
+        return
+    if posicao is not None:
+        await update.message.reply_text(f"⏳ Seu relatório {periodo_str} já está na fila (posição {posicao}).")
+        return
+
+    tarefa = lambda: _gerar_e_enviar_relatorio(context.bot, user_id, data_inicio, data_fim, periodo_str)
+    try:
+        posicao = enfileirar(chave, tarefa)
+    except asyncio.QueueFull:
+        await update.message.reply_text("🚦 Estou gerando muitos relatórios agora. Tente novamente em alguns minutos, por favor.")
+        return
+
+    if posicao == 1:
+        texto = f"Gerando seu relatório {periodo_str}... 🎥\nEu envio o PDF aqui assim que ficar pronto."
+    else:
+        texto = (f"📥 Seu relatório {periodo_str} entrou na fila (posição {posicao}).\n"
+                 "Eu envio o PDF aqui assim que ficar pronto.")
+    await update.message.reply_text(texto)
         
 
 # Cria o handler para ser importado no bot.py
@@ -0,0 +1,276 @@
+# gerente_financeiro/relatorio_pdf.py
+"""
+Renderização do relatório mensal (Jinja2 + WeasyPrint).
+
+É código puramente de CPU e roda nos workers da fila de relatórios
+(fila_relatorios), nunca no event loop do bot. Por isso recebe apenas um
+dicionário de tipos simples, sem objetos do ORM.
+
+As folhas de estilo (incluindo os @import de fontes remotas), a configuração
+de fontes e o template são carregados uma vez por processo e reaproveitados
+por todos os relatórios gerados naquele worker.
+"""
+import hashlib
+import logging
+import math
+import os
+import re
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from jinja2 import Environment, FileSystemLoader, Template
+from markupsafe import Markup, escape
+from weasyprint import HTML, CSS
+from weasyprint.text.fonts import FontConfiguration
+
+logger = logging.getLogger(__name__)
+
+
+# =============================================================================
+#  CONFIGURAÇÃO DO AMBIENTE JINJA2 E FILTROS CUSTOMIZADOS
+#  (Esta seção deve ser executada apenas uma vez, quando o módulo é importado)
+# =============================================================================
+
+def nl2br_filter(s):
+    """Filtro Jinja2 para converter quebras de linha em tags <br>."""
+    if s is None:
+        return ""
+    return re.sub(r'\r\n|\r|\n', '<br>\n', str(s))
+
+CORES_CATEGORIAS = ["#3498db", "#e74c3c", "#2ecc71", "#f1c40f", "#9b59b6", "#1abc9c", "#e67e22"]
+
+def color_palette_filter(index):
+    """Filtro Jinja2 que retorna uma cor de uma paleta predefinida baseado no índice."""
+    return CORES_CATEGORIAS[int(index) % len(CORES_CATEGORIAS)]
+
+def safe_float_filter(value, default=0.0):
+    """Filtro Jinja2 para converter valores para float de forma segura."""
+    try:
+        return float(value) if value is not None else default
+    except (ValueError, TypeError):
+        return default
+
+def safe_format_currency(value):
+    """Filtro Jinja2 para formatar valores monetários de forma segura."""
+    try:
+        return "%.2f" % float(value) if value is not None else "0.00"
+    except (ValueError, TypeError):
+        return "0.00"
+
+# Define os caminhos para as pastas de templates e arquivos estáticos
+templates_path = os.path.join(os.path.dirname(__file__), '..', 'templates')
+static_path = os.path.join(os.path.dirname(__file__), '..', 'static')
+
+# Cria e configura o ambiente do Jinja2
+env = Environment(
+    loader=FileSystemLoader(templates_path),
+    autoescape=True  # Ativa o autoescaping para segurança
+)
+
+# Adiciona os filtros customizados ao ambiente
+env.filters['nl2br'] = nl2br_filter
+env.filters['color_palette'] = color_palette_filter
+env.filters['safe_float'] = safe_float_filter
+env.filters['safe_currency'] = safe_format_currency
+
+
+# =============================================================================
+#  GRÁFICOS VETORIAIS (SVG) EMBUTIDOS NO HTML
+# =============================================================================
+
+MAX_FATIAS_DONUT = 6  # acima disso, as menores categorias viram "Outros"
+
+
+def _ponto(cx: float, cy: float, raio: float, angulo: float) -> str:
+    # Ângulo 0 no topo, crescendo no sentido horário
+    return f"{cx + raio * math.sin(angulo):.2f},{cy - raio * math.cos(angulo):.2f}"
+
+
+def _fatia(cx: float, cy: float, raio: float, raio_interno: float, inicio: float, fim: float) -> str:
+    arco_grande = 1 if fim - inicio > math.pi else 0
+    return (
+        f"M{_ponto(cx, cy, raio, inicio)} "
+        f"A{raio},{raio} 0 {arco_grande} 1 {_ponto(cx, cy, raio, fim)} "
+        f"L{_ponto(cx, cy, raio_interno, fim)} "
+        f"A{raio_interno},{raio_interno} 0 {arco_grande} 0 {_ponto(cx, cy, raio_interno, inicio)} Z"
+    )
+
+
+def gerar_donut_svg(gastos_agrupados: Sequence[Tuple[str, float]]) -> Optional[Markup]:
+    """
+    Donut da distribuição de despesas como SVG inline, com legenda e total no centro.
+    Usa as mesmas cores, na mesma ordem, da tabela de gastos por categoria.
+    """
+    fatias = [(str(nome), float(valor)) for nome, valor in gastos_agrupados if valor and float(valor) > 0]
+    if not fatias:
+        return None
+    fatias.sort(key=lambda fatia: fatia[1], reverse=True)
+    if len(fatias) > MAX_FATIAS_DONUT:
+        fatias = fatias[:MAX_FATIAS_DONUT - 1] + [("Outros", sum(valor for _, valor in fatias[MAX_FATIAS_DONUT - 1:]))]
+    total = sum(valor for _, valor in fatias)
+
+    cx, cy, raio, raio_interno = 100, 100, 90, 58
+    partes = ['<svg class="grafico-svg" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 380 200" width="380" height="200">']
+    if len(fatias) == 1:
+        cor = CORES_CATEGORIAS[0]
+        partes.append(f'<circle cx="{cx}" cy="{cy}" r="{(raio + raio_interno) / 2}" fill="none" '
+                      f'stroke="{cor}" stroke-width="{raio - raio_interno}"/>')
+    else:
+        angulo = 0.0
+        for indice, (_, valor) in enumerate(fatias):
+            fim = angulo + 2 * math.pi * valor / total
+            partes.append(f'<path d="{_fatia(cx, cy, raio, raio_interno, angulo, fim)}" '
+                          f'fill="{color_palette_filter(indice)}" stroke="#FFFFFF" stroke-width="1.5"/>')
+            angulo = fim
+
+    partes.append(f'<text x="{cx}" y="{cy - 4}" text-anchor="middle" font-size="10" fill="#6C757D">Total</text>')
+    partes.append(f'<text x="{cx}" y="{cy + 12}" text-anchor="middle" font-size="13" font-weight="bold" '
+                  f'fill="#343A40">R$ {total:,.0f}</text>'.replace(",", "."))
+
+    topo_legenda = cy - (len(fatias) * 24) / 2
+    for indice, (nome, valor) in enumerate(fatias):
+        y = topo_legenda + indice * 24
+        nome_curto = nome if len(nome) <= 16 else nome[:15] + "…"
+        partes.append(f'<rect x="212" y="{y + 3:.1f}" width="11" height="11" rx="2" fill="{color_palette_filter(indice)}"/>')
+        partes.append(f'<text x="230" y="{y + 13:.1f}" font-size="11" fill="#343A40">{escape(nome_curto)}</text>')
+        partes.append(f'<text x="378" y="{y + 13:.1f}" text-anchor="end" font-size="11" font-weight="bold" '
+                      f'fill="#343A40">{valor / total * 100:.1f}%</text>')
+    partes.append('</svg>')
+    return Markup("".join(partes))
+
+
+def gerar_barras_svg(evolucao_periodos: Sequence[dict]) -> Optional[Markup]:
+    """Barras agrupadas de receitas e despesas por período como SVG inline."""
+    if not evolucao_periodos:
+        return None
+    maior_valor = max(max(p['receitas'], p['despesas']) for p in evolucao_periodos)
+    if maior_valor <= 0:
+        return None
+
+    largura, altura = 380, 200
+    esquerda, base, topo = 10, 170, 28
+    largura_grupo = (largura - 2 * esquerda) / len(evolucao_periodos)
+    largura_barra = min(28.0, largura_grupo * 0.32)
+
+    partes = [f'<svg class="grafico-svg" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {largura} {altura}" '
+              f'width="{largura}" height="{altura}">']
+    for cor, rotulo, x in (("#2ecc71", "Receitas", 10), ("#e74c3c", "Despesas", 90)):
+        partes.append(f'<rect x="{x}" y="4" width="11" height="11" rx="2" fill="{cor}"/>')
+        partes.append(f'<text x="{x + 16}" y="14" font-size="11" fill="#343A40">{rotulo}</text>')
+    partes.append(f'<line x1="{esquerda}" y1="{base}" x2="{largura - esquerda}" y2="{base}" stroke="#DEE2E6" stroke-width="1"/>')
+
+    for indice, periodo in enumerate(evolucao_periodos):
+        centro = esquerda + largura_grupo * (indice + 0.5)
+        for deslocamento, chave, cor in ((-largura_barra - 1, 'receitas', "#2ecc71"), (1, 'despesas', "#e74c3c")):
+            altura_barra = max(periodo[chave], 0) / maior_valor * (base - topo)
+            partes.append(f'<rect x="{centro + deslocamento:.1f}" y="{base - altura_barra:.1f}" '
+                          f'width="{largura_barra:.1f}" height="{altura_barra:.1f}" rx="2" fill="{cor}"/>')
+        # O período do relatório (o último) fica em destaque
+        peso = ' font-weight="bold"' if indice == len(evolucao_periodos) - 1 else ''
+        partes.append(f'<text x="{centro:.1f}" y="{base + 16}" text-anchor="middle" font-size="10" '
+                      f'fill="#343A40"{peso}>{escape(periodo["rotulo"])}</text>')
+    partes.append('</svg>')
+    return Markup("".join(partes))
+
+
+def contexto_para_template(contexto_dados: dict) -> dict:
+    """Reduz o contexto do relatório a tipos simples (serializáveis para o worker)."""
+    contexto = dict(contexto_dados)
+    usuario = contexto_dados.get('usuario')
+    contexto['usuario'] = {'nome_completo': getattr(usuario, 'nome_completo', None) or 'Usuário'}
+    return contexto
+
+
+# =============================================================================
+#  CACHE DE ATIVOS DO RELATÓRIO (por processo)
+# =============================================================================
+
+CAMINHO_CSS = os.path.join(static_path, 'relatorio.css')
+URL_FONT_AWESOME = "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css"
+
+
+def _calcular_versao_ativos() -> str:
+    """Hash do template e do CSS: PDFs guardados com outra versão são gerados de novo."""
+    resumo = hashlib.sha1()
+    for caminho in (os.path.join(templates_path, 'relatorio.html'), CAMINHO_CSS, __file__):
+        if os.path.exists(caminho):
+            with open(caminho, 'rb') as arquivo:
+                resumo.update(arquivo.read())
+    return resumo.hexdigest()[:12]
+
+
+VERSAO_ATIVOS = _calcular_versao_ativos()
+
+
+class AtivosRelatorio(NamedTuple):
+    template: Template
+    folhas_de_estilo: List[CSS]
+    font_config: FontConfiguration
+
+
+_ativos: Optional[AtivosRelatorio] = None
+
+
+def carregar_ativos() -> AtivosRelatorio:
+    """Compila o template e interpreta as folhas de estilo na primeira chamada do processo."""
+    global _ativos
+    if _ativos is not None:
+        return _ativos
+
+    # A mesma FontConfiguration precisa ser usada no CSS e no write: é ela que guarda os @font-face
+    font_config = FontConfiguration()
+    folhas_de_estilo = []
+    if os.path.exists(CAMINHO_CSS):
+        folhas_de_estilo.append(CSS(filename=CAMINHO_CSS, font_config=font_config))
+    else:
+        logger.warning(f"Arquivo CSS não encontrado: {CAMINHO_CSS}")
+    try:
+        folhas_de_estilo.append(CSS(url=URL_FONT_AWESOME, font_config=font_config))
+    except Exception as e:
+        # Sem os ícones o relatório continua legível; não vale falhar por isso
+        logger.warning(f"Não foi possível carregar o Font Awesome: {e}")
+
+    _ativos = AtivosRelatorio(env.get_template('relatorio.html'), folhas_de_estilo, font_config)
+    logger.info(f"Ativos do relatório carregados ({len(folhas_de_estilo)} folhas de estilo).")
+    return _ativos
+
+
+def gerar_pdf_relatorio(contexto: dict) -> Tuple[bytes, Dict[str, float]]:
+    """
+    Renderiza o template HTML com o contexto e converte para PDF.
+    Retorna os bytes do PDF e o tempo (em segundos) de cada etapa.
+    """
+    tempos: Dict[str, float] = {}
+    inicio = time.perf_counter()
+
+    def marcar(etapa: str) -> None:
+        nonlocal inicio
+        agora = time.perf_counter()
+        tempos[etapa] = agora - inicio
+        inicio = agora
+
+    ativos = carregar_ativos()
+    marcar('ativos')
+
+    # 1. Desenhar os gráficos vetoriais (SVG inline, sem rasterização)
+    contexto = dict(
+        contexto,
+        grafico_pizza_svg=gerar_donut_svg(contexto.get('gastos_agrupados') or []),
+        grafico_evolucao_svg=gerar_barras_svg(contexto.get('evolucao_periodos') or []),
+    )
+    marcar('graficos')
+
+    # 2. Renderizar o template HTML com os dados
+    html_renderizado = ativos.template.render(contexto)
+    marcar('template')
+
+    # 3. Interpretar o HTML, calcular o layout com os estilos já carregados e gerar o PDF
+    documento_html = HTML(string=html_renderizado, base_url=static_path)
+    marcar('html')
+    documento = documento_html.render(stylesheets=ativos.folhas_de_estilo, font_config=ativos.font_config)
+    marcar('layout')
+    pdf_bytes = documento.write_pdf()
+    marcar('pdf')
+
+    logger.info(f"PDF gerado. Tamanho: {len(pdf_bytes)} bytes, HTML: {len(html_renderizado)} caracteres")
+    return pdf_bytes, tempos
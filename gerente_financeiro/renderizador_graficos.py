@@ -0,0 +1,286 @@
+# gerente_financeiro/renderizador_graficos.py
+"""
+Desenho dos gráficos do bot, sem o estado global do pyplot.
+
+Cada gráfico cria a sua própria `Figure` com um canvas Agg e recebe o estilo
+de dicionários pré-compilados aplicados diretamente nos artistas, em vez de
+`plt.style.use`/`plt.rcParams.update` a cada chamada. Nada aqui escreve em
+estado global do matplotlib, então vários gráficos podem ser desenhados ao
+mesmo tempo em threads do mesmo processo.
+
+As funções recebem os totais já agregados no banco (ver
+services.agregar_dados_grafico) e devolvem os bytes do PNG.
+"""
+import io
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import matplotlib
+import matplotlib.dates as mdates
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.patches import Circle
+from PIL import Image
+from scipy.interpolate import make_interp_spline
+
+logger = logging.getLogger(__name__)
+
+# --- ESTILOS PRÉ-COMPILADOS ---
+# Equivalentes a 'seaborn-v0_8-darkgrid' / 'seaborn-v0_8-whitegrid' com os ajustes do bot
+
+_FONTE = {'family': ['Arial', 'Helvetica', 'DejaVu Sans']}
+
+ESTILO_DARKGRID = {
+    "dpi": 120,
+    "figura": {"facecolor": "white"},
+    "eixos": {"facecolor": "#EAEAF2", "axisbelow": True},
+    "grade": {"color": "white", "linestyle": "-", "linewidth": 1.0},
+    "borda": {"color": "#cccccc", "linewidth": 0.0},
+    "ticks": {"colors": "#333333", "length": 0, "labelsize": 10},
+    "titulo": {"color": "#1a2b4c", "fontweight": "bold", "fontsize": 18, **_FONTE},
+    "rotulo": {"color": "#333333", **_FONTE},
+    "legenda": {"frameon": False},
+}
+
+ESTILO_WHITEGRID = {
+    "dpi": 100,
+    "figura": {"facecolor": "white"},
+    "eixos": {"facecolor": "white", "axisbelow": True},
+    "grade": {"color": "#cccccc", "linestyle": "-", "linewidth": 0.8},
+    "borda": {"color": "#cccccc", "linewidth": 1.0},
+    "ticks": {"colors": "#262626", "length": 0, "labelsize": 10},
+    "titulo": {"color": "#262626", "fontweight": "bold", "fontsize": 16, **_FONTE},
+    "rotulo": {"color": "#262626", **_FONTE},
+    "legenda": {"frameon": False},
+}
+
+_CORES_SET2 = matplotlib.colormaps["Set2"]
+
+# Gráficos têm poucas cores chapadas: uma paleta de 256 cores deixa o PNG ~3x
+# menor sem diferença visível, o que encurta o upload para o Telegram.
+PNG_CORES = 256
+
+
+def _nova_figura(estilo: dict, figsize: tuple):
+    """Cria Figure + canvas Agg próprios e aplica o estilo nos eixos."""
+    fig = Figure(figsize=figsize, dpi=estilo["dpi"], **estilo["figura"])
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.set(**estilo["eixos"])
+    ax.grid(True, **estilo["grade"])
+    for borda in ax.spines.values():
+        borda.set(**estilo["borda"])
+    ax.tick_params(**estilo["ticks"])
+    return fig, ax
+
+
+def _para_png(fig: Figure, estilo: dict, pad: float = 1.08) -> bytes:
+    fig.tight_layout(pad=pad)
+    bruto = io.BytesIO()
+    # Compressão mínima aqui: a imagem é recodificada logo abaixo
+    fig.savefig(bruto, format='png', bbox_inches='tight', dpi=estilo["dpi"], pil_kwargs={"compress_level": 1})
+    bruto.seek(0)
+    with Image.open(bruto) as imagem:
+        paleta = imagem.convert('RGB').quantize(PNG_CORES, method=Image.Quantize.FASTOCTREE)
+    buffer = io.BytesIO()
+    paleta.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def _donut(ax, estilo: dict, raio: float = 0.70) -> None:
+    ax.add_artist(Circle((0, 0), raio, fc=estilo["figura"]["facecolor"]))
+
+
+def preparar_dados_para_grafico(dados: List[tuple], agrupar_por: str):
+    """
+    Monta o DataFrame do gráfico a partir dos totais agregados:
+    [(grupo, total)] para categoria/forma de pagamento e
+    [(data, entradas, saidas)] para os gráficos por data.
+    """
+    if not dados: return pd.DataFrame(), False
+    if agrupar_por in ['categoria', 'forma_pagamento']:
+        df_agrupado = pd.DataFrame(dados, columns=['grupo', 'valor']).sort_values('valor', ascending=False)
+        if len(df_agrupado) > 7:
+            top_7 = df_agrupado.iloc[:6].copy()
+            outros_valor = df_agrupado.iloc[6:]['valor'].sum()
+            outros_df = pd.DataFrame([{'grupo': 'Outros', 'valor': outros_valor}])
+            df_agrupado = pd.concat([top_7, outros_df], ignore_index=True)
+        return df_agrupado, not df_agrupado.empty
+    elif agrupar_por in ['data', 'fluxo_caixa', 'projecao']:
+        df_agrupado = pd.DataFrame(dados, columns=['data', 'Entrada', 'Saída']).sort_values('data')
+        if agrupar_por == 'data':
+            df_agrupado['Saldo'] = df_agrupado['Entrada'] - df_agrupado['Saída']
+            df_agrupado['Saldo Acumulado'] = df_agrupado['Saldo'].cumsum()
+        if agrupar_por == 'projecao' and df_agrupado['Saída'].sum() == 0:
+            return pd.DataFrame(), False
+        return df_agrupado, len(df_agrupado) >= 1
+    return pd.DataFrame(), False
+
+
+def gerar_grafico_dinamico(dados: List[tuple], tipo_grafico: str, agrupar_por: str) -> Optional[bytes]:
+    """
+    Gera os gráficos do menu /grafico com um design aprimorado e profissional.
+    """
+    estilo = ESTILO_DARKGRID
+    try:
+        df, tem_dados_suficientes = preparar_dados_para_grafico(dados, agrupar_por)
+        if not tem_dados_suficientes:
+            return None
+
+        fig, ax = _nova_figura(estilo, (12, 7))
+        titulo = estilo["titulo"]
+        rotulo = estilo["rotulo"]
+
+        # --- GRÁFICOS DE CATEGORIA E FORMA DE PAGAMENTO ---
+        if agrupar_por in ['categoria', 'forma_pagamento']:
+
+            # GRÁFICO DE PIZZA (DONUT)
+            if tipo_grafico == 'pizza':
+                ax.set_title(f'Distribuição de Despesas por {agrupar_por.replace("_", " ").title()}', pad=20, **titulo)
+
+                # Set2 é boa para categorias distintas
+                colors = _CORES_SET2(np.linspace(0, 1, len(df['grupo'])))
+                explode = [0.05] * len(df['grupo'])
+
+                wedges, texts, autotexts = ax.pie(
+                    df['valor'],
+                    autopct='%1.1f%%',
+                    startangle=90,
+                    colors=colors,
+                    pctdistance=0.85,
+                    explode=explode,
+                    wedgeprops={'edgecolor': 'white', 'linewidth': 2}
+                )
+                for autotext in autotexts:
+                    autotext.set(size=12, weight="bold", color="white")
+                _donut(ax, estilo)
+
+                legend_labels = [f"{label}: R$ {valor:.2f}" for label, valor in zip(df['grupo'], df['valor'])]
+                ax.legend(wedges, legend_labels, title="Valores", loc="center left", bbox_to_anchor=(1, 0, 0.5, 1),
+                          fontsize=11, **estilo["legenda"])
+                ax.axis('equal')
+
+            # GRÁFICO DE BARRAS HORIZONTAIS
+            elif tipo_grafico == 'barra_h':
+                ax.set_title(f'Total de Despesas por {agrupar_por.replace("_", " ").title()}', pad=20, **titulo)
+                df = df.sort_values('valor', ascending=True)
+
+                palette = sns.color_palette("viridis_r", len(df))
+                bars = ax.barh(df['grupo'], df['valor'], color=palette, edgecolor='black', linewidth=0.7)
+
+                ax.set_xlabel('Valor Gasto (R$)', fontsize=12, **rotulo)
+                ax.set_ylabel('')
+                ax.grid(axis='y', linestyle='', alpha=0)  # Remove linhas de grade horizontais
+
+                for bar in bars:
+                    width = bar.get_width()
+                    ax.text(width + 50, bar.get_y() + bar.get_height()/2, f'R$ {width:,.2f}'.replace(',', '.'),
+                            va='center', ha='left', fontsize=11, weight='bold', color=bar.get_facecolor())
+
+        # --- GRÁFICOS BASEADOS EM DATA ---
+        elif agrupar_por in ['data', 'fluxo_caixa', 'projecao']:
+            df['data'] = pd.to_datetime(df['data'])
+
+            # GRÁFICO DE EVOLUÇÃO DO SALDO (LINHA)
+            if agrupar_por == 'data':
+                if len(df) < 3: return None  # Precisa de pelo menos 3 pontos para suavizar
+                ax.set_title('Evolução do Saldo Financeiro', pad=20, **titulo)
+
+                x_smooth = np.linspace(df['data'].astype(np.int64).min(), df['data'].astype(np.int64).max(), 300)
+                x_smooth_dt = pd.to_datetime(x_smooth)
+                spl = make_interp_spline(df['data'].astype(np.int64), df['Saldo Acumulado'], k=2)
+                y_smooth = spl(x_smooth)
+
+                ax.plot(x_smooth_dt, y_smooth, label='Saldo Acumulado (suave)', color='#3498db', linewidth=3)
+                ax.fill_between(x_smooth_dt, y_smooth, alpha=0.15, color='#3498db')
+
+                pico_max = df.loc[df['Saldo Acumulado'].idxmax()]
+                pico_min = df.loc[df['Saldo Acumulado'].idxmin()]
+
+                ax.scatter(pico_max['data'], pico_max['Saldo Acumulado'], color='#2ecc71', s=150, zorder=5, label='Pico Máximo', edgecolor='white')
+                ax.scatter(pico_min['data'], pico_min['Saldo Acumulado'], color='#e74c3c', s=150, zorder=5, label='Pico Mínimo', edgecolor='white')
+
+                ax.text(pico_max['data'], pico_max['Saldo Acumulado'] + 500, f'{pico_max["Saldo Acumulado"]:.0f}', ha='center', fontsize=12, weight='bold', color='black', backgroundcolor=(1,1,1,0.6))
+                ax.text(pico_min['data'], pico_min['Saldo Acumulado'] - 1000, f'{pico_min["Saldo Acumulado"]:.0f}', ha='center', fontsize=12, weight='bold', color='black', backgroundcolor=(1,1,1,0.6))
+
+                ax.legend(fontsize=12, **estilo["legenda"])
+
+            # GRÁFICO DE PROJEÇÃO (BARRAS HORIZONTAIS)
+            elif agrupar_por == 'projecao':
+                today = datetime.now()
+                start_of_month = today.replace(day=1, hour=0, minute=0, second=0).date()
+                df_mes_atual = df[(df['data'].dt.date >= start_of_month) & (df['data'].dt.date <= today.date())]
+                if df_mes_atual.empty or df_mes_atual['Saída'].sum() == 0: return None
+
+                gasto_acumulado = df_mes_atual['Saída'].sum()
+                dias_no_mes = (today.replace(month=today.month % 12 + 1 if today.month != 12 else 1, day=1) - timedelta(days=1)).day
+                dias_passados = today.day
+                gasto_medio_diario = gasto_acumulado / dias_passados
+                gasto_projetado = gasto_medio_diario * dias_no_mes
+
+                ax.set_title(f'Projeção de Gastos para {today.strftime("%B")}', pad=20, **titulo)
+
+                bars = ax.barh(['Gasto Atual', 'Projeção para o Mês'], [gasto_acumulado, gasto_projetado],
+                               color=['#1f77b4', '#ff7f0e'], edgecolor='black', linewidth=0.8)
+                ax.invert_yaxis()  # Gasto atual em cima
+
+                ax.set_xlabel('Valor (R$)', fontsize=12, **rotulo)
+                ax.bar_label(bars, fmt='R$ %.2f', padding=5, fontsize=12, weight='bold')
+
+                ax.text(gasto_projetado * 0.95, 1, f'Gasto médio diário: R$ {gasto_medio_diario:.2f}',
+                        va='center', ha='right', fontsize=11, style='italic',
+                        bbox=dict(boxstyle='round,pad=0.5', fc='khaki', alpha=0.7))
+
+            # GRÁFICO DE FLUXO DE CAIXA
+            elif agrupar_por == 'fluxo_caixa':
+                if df['Entrada'].sum() == 0 and df['Saída'].sum() == 0: return None
+                ax.bar(df['data'], df['Entrada'], color='#2ecc71', label='Receitas', width=timedelta(days=0.8))
+                ax.bar(df['data'], -df['Saída'], color='#e74c3c', label='Despesas', width=timedelta(days=0.8))
+                ax.axhline(0, color='black', linewidth=0.8)
+                ax.set_title('Fluxo de Caixa (Receitas vs. Despesas)', pad=20, **titulo)
+                ax.legend(**estilo["legenda"])
+
+            ax.set_ylabel('Valor (R$)', fontsize=12, **rotulo)
+            fig.autofmt_xdate(rotation=30)
+            ax.xaxis.set_major_formatter(mdates.DateFormatter('%d/%m'))
+
+        else:
+            return None
+
+        return _para_png(fig, estilo, pad=1.5)
+    except Exception as e:
+        logger.error(f"Erro CRÍTICO ao gerar gráfico: {e}", exc_info=True)
+        return None
+
+
+def gerar_grafico_evolucao_mensal(dados_diarios: List[tuple]) -> Optional[bytes]:
+    """Receitas vs. despesas por mês a partir dos totais diários [(data, entradas, saidas)]."""
+    if not dados_diarios:
+        return None
+
+    estilo = ESTILO_WHITEGRID
+    try:
+        df = pd.DataFrame(dados_diarios, columns=['data', 'Entrada', 'Saída'])
+        df['mes_ano'] = pd.to_datetime(df['data']).dt.to_period('M')
+
+        df_agrupado = df.groupby('mes_ano')[['Entrada', 'Saída']].sum().sort_index()
+        df_agrupado.index = df_agrupado.index.strftime('%b/%y')
+
+        fig, ax = _nova_figura(estilo, (10, 5))
+
+        ax.plot(df_agrupado.index, df_agrupado['Entrada'], marker='o', linestyle='-', color='#2ecc71', label='Receitas')
+        ax.plot(df_agrupado.index, df_agrupado['Saída'], marker='o', linestyle='-', color='#e74c3c', label='Despesas')
+
+        ax.set_title('Receitas vs. Despesas (Últimos 6 Meses)', **estilo["titulo"])
+        ax.set_ylabel('Valor (R$)', **estilo["rotulo"])
+        ax.grid(True, which='both', linestyle='--', linewidth=0.5)
+        ax.legend(**estilo["legenda"])
+
+        return _para_png(fig, estilo)
+    except Exception as e:
+        logger.error(f"Erro ao gerar gráfico de evolução: {e}", exc_info=True)
+        return None
@@ -3,27 +3,23 @@
 import base64
 import logging
 import re
-import io
 import pandas as pd
-from models import Conta, Objetivo, Agendamento
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-import seaborn as sns
+from models import Agendamento
 from datetime import datetime, timedelta, timezone
 from typing import List, Optional, Dict, Any
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, and_, extract
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy import case, func, and_, extract, select
+from sqlalchemy.ext.asyncio import AsyncSession
 import asyncio
 import json # <-- Importação necessária para a nova função
-import google.generativeai as genai
 from .prompts import PROMPT_ANALISE_RELATORIO
-from database.database import listar_objetivos_usuario
+from database.database import listar_objetivos_usuario, PERIODOS_ANTERIORES_RELATORIO
 from models import Categoria, Lancamento, Usuario, Subcategoria
 import config
 from . import external_data
+from . import contexto_cache
+from . import gateway_ia
 from dateutil.relativedelta import relativedelta
-import numpy as np 
-from scipy.interpolate import make_interp_spline
 logger = logging.getLogger(__name__)
 
 CSE_ID  = config.GOOGLE_CSE_ID
@@ -75,139 +71,169 @@ def preparar_contexto_json(lancamentos: List[Lancamento]) -> str:
 #  RESTANTE DO ARQUIVO services.py (SEM ALTERAÇÕES)
 # =========================================================================
 
-def gerar_grafico_para_relatorio(gastos_por_categoria: dict) -> io.BytesIO | None:
-    """Gera um gráfico de pizza a partir de um dicionário de gastos por categoria."""
-    if not gastos_por_categoria:
-        return None
+def _eh_inicio_de_mes(data: datetime) -> bool:
+    return data == data.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
 
-    try:
-        plt.style.use('seaborn-v0_8-whitegrid')
-        
-        df = pd.DataFrame(list(gastos_por_categoria.items()), columns=['Categoria', 'Valor']).sort_values('Valor', ascending=False)
-        
-        if len(df) > 6:
-            top_5 = df.iloc[:5].copy()
-            outros_valor = df.iloc[5:]['Valor'].sum()
-            outros_df = pd.DataFrame([{'Categoria': 'Outros', 'Valor': outros_valor}])
-            df = pd.concat([top_5, outros_df], ignore_index=True)
-
-        fig, ax = plt.subplots(figsize=(8, 5), dpi=100)
-        
-        colors = sns.color_palette("viridis_r", len(df))
-        
-        wedges, _, autotexts = ax.pie(
-            df['Valor'], 
-            autopct='%1.1f%%', 
-            startangle=140, 
-            pctdistance=0.85, 
-            colors=colors, 
-            wedgeprops={'edgecolor': 'white', 'linewidth': 1.5}
-        )
-        plt.setp(autotexts, size=10, weight="bold", color="white")
-        
-        centre_circle = plt.Circle((0,0),0.70,fc='white')
-        fig.gca().add_artist(centre_circle)
-        
-        ax.set_title('Distribuição de Despesas', fontsize=16, pad=15, weight='bold')
-        ax.axis('equal')
-
-        plt.tight_layout()
-        buffer = io.BytesIO()
-        plt.savefig(buffer, format='png', bbox_inches='tight')
-        buffer.seek(0)
-        return buffer
-    except Exception as e:
-        logger.error(f"Erro CRÍTICO ao gerar gráfico para relatório: {e}", exc_info=True)
-        return None
-    finally:
-        plt.close('all')
+def inicios_periodos_relatorio(data_inicio: datetime, data_fim: datetime,
+                               quantidade: int = PERIODOS_ANTERIORES_RELATORIO) -> List[datetime]:
+    """
+    Início do período do relatório seguido do início dos `quantidade` períodos anteriores.
+    Períodos de meses inteiros recuam em meses (o anterior de março é fevereiro, mais
+    curto); intervalos arbitrários recuam o mesmo número de dias.
+    """
+    if _eh_inicio_de_mes(data_inicio) and _eh_inicio_de_mes(data_fim):
+        passo = relativedelta(months=(data_fim.year - data_inicio.year) * 12 + data_fim.month - data_inicio.month)
+    else:
+        passo = data_fim - data_inicio
+    return [data_inicio - passo * k for k in range(quantidade + 1)]
+
+def descrever_periodo_relatorio(data_inicio: datetime, data_fim: datetime) -> Dict[str, Any]:
+    """Título e unidade ('mês', 'ano' ou 'período') usados nos textos do relatório."""
+    if _eh_inicio_de_mes(data_inicio) and data_fim == data_inicio + relativedelta(months=1):
+        titulo = f"{data_inicio.strftime('%B').capitalize()} de {data_inicio.year}"
+        unidade, unidade_plural = "mês", "meses"
+    elif _eh_inicio_de_mes(data_inicio) and data_inicio.month == 1 and data_fim == data_inicio + relativedelta(years=1):
+        titulo = f"Ano de {data_inicio.year}"
+        unidade, unidade_plural = "ano", "anos"
+    else:
+        titulo = f"{data_inicio.strftime('%d/%m/%Y')} a {(data_fim - timedelta(days=1)).strftime('%d/%m/%Y')}"
+        unidade, unidade_plural = "período", "períodos"
+    return {
+        "titulo_periodo": titulo,
+        "unidade_periodo": unidade,
+        "unidade_periodo_plural": unidade_plural,
+        "dias_periodo": max((data_fim - data_inicio).days, 1),
+    }
+
+def _rotulo_periodo(inicio: datetime, fim: datetime) -> str:
+    """Rótulo curto de um período para o eixo do gráfico de evolução."""
+    if _eh_inicio_de_mes(inicio) and fim == inicio + relativedelta(months=1):
+        return inicio.strftime('%b/%y').capitalize()
+    if _eh_inicio_de_mes(inicio) and inicio.month == 1 and fim == inicio + relativedelta(years=1):
+        return str(inicio.year)
+    return inicio.strftime('%d/%m')
 
-def gerar_contexto_relatorio(db: Session, telegram_id: int, mes: int, ano: int):
+def _tendencias_por_categoria(gastos_por_categoria_periodo: Dict[str, Dict[int, float]]) -> Dict[str, Dict[str, Any]]:
     """
-    Coleta e processa dados detalhados para o relatório avançado, ignorando
+    A partir da matriz categoria × período (0 = período do relatório, 1.. = anteriores),
+    calcula para cada categoria com gastos no período a variação contra o período
+    anterior (None se não houve gasto nele) e a média dos PERIODOS_ANTERIORES_RELATORIO
+    períodos anteriores (períodos sem gasto contam como zero).
+    """
+    tendencias = {}
+    for cat, por_periodo in gastos_por_categoria_periodo.items():
+        if 0 not in por_periodo:
+            continue
+        atual = por_periodo[0]
+        anterior = por_periodo.get(1, 0.0)
+        tendencias[cat] = {
+            "periodo_anterior": anterior,
+            "variacao_percent": ((atual - anterior) / anterior * 100) if anterior > 0 else None,
+            "media_anteriores": sum(
+                por_periodo.get(k, 0.0) for k in range(1, PERIODOS_ANTERIORES_RELATORIO + 1)
+            ) / PERIODOS_ANTERIORES_RELATORIO,
+        }
+    return tendencias
+
+async def gerar_contexto_relatorio(db: AsyncSession, telegram_id: int, data_inicio: datetime, data_fim: datetime):
+    """
+    Coleta e processa dados detalhados para o relatório avançado do intervalo
+    [data_inicio, data_fim) — um mês, um ano ou datas livres —, ignorando
     transações da categoria 'Transferência' para os cálculos financeiros.
+    Todos os números vêm de uma única consulta agregada (período × categoria × tipo),
+    sem carregar os lançamentos: o custo não cresce com a duração do período.
     """
     
-    usuario_q = db.query(Usuario).filter(Usuario.telegram_id == telegram_id).first()
+    usuario_q = (await db.execute(
+        select(Usuario).filter(Usuario.telegram_id == telegram_id)
+    )).scalars().first()
     if not usuario_q: 
         logging.warning(f"Usuário com telegram_id {telegram_id} não encontrado para gerar relatório.")
         return None
 
-    data_alvo = datetime(ano, mes, 1)
-    periodo_alvo = pd.Period(data_alvo, freq='M')
-    data_inicio_historico = data_alvo - relativedelta(months=5)
-
-    def buscar_dados_periodo(data_inicio, data_fim):
-        # A busca já otimiza carregando a categoria junto
-        return db.query(Lancamento).filter(
-            and_(
-                Lancamento.id_usuario == usuario_q.id,
-                Lancamento.data_transacao >= data_inicio,
-                Lancamento.data_transacao < data_fim
-            )
-        ).options(joinedload(Lancamento.categoria)).all()
-
-    # Busca todos os lançamentos do período, incluindo transferências
-    lancamentos_mes_atual = buscar_dados_periodo(data_alvo, data_alvo + relativedelta(months=1))
-    lancamentos_historico_6m = buscar_dados_periodo(data_inicio_historico, data_alvo + relativedelta(months=1))
-
-    mes_nome_str = data_alvo.strftime("%B").capitalize()
-
-    if not lancamentos_mes_atual:
-        return {"has_data": False, "usuario": usuario_q, "mes_nome": mes_nome_str, "ano": ano, "now": datetime.now}
-    
-    # --- CORREÇÃO APLICADA: FILTRAGEM DE TRANSFERÊNCIAS ---
-    # Cria uma nova lista contendo apenas lançamentos que NÃO são transferências
-    lancamentos_financeiros = [
-        l for l in lancamentos_mes_atual 
-        if not (l.categoria and l.categoria.nome.lower() == 'transferência')
-    ]
-
-    # Todos os cálculos de receita, despesa e saldo agora usam a lista filtrada
-    receitas_atual = sum(float(l.valor) for l in lancamentos_financeiros if l.tipo == 'Entrada')
-    despesas_atual = sum(float(l.valor) for l in lancamentos_financeiros if l.tipo == 'Saída')
+    descricao_periodo = descrever_periodo_relatorio(data_inicio, data_fim)
+    inicios = inicios_periodos_relatorio(data_inicio, data_fim)
+
+    # Transferências entre contas não são receita nem despesa: ficam fora de todos os totais
+    eh_transferencia = func.coalesce(func.lower(Categoria.nome) == 'transferência', False)
+    financeiro = ~eh_transferencia
+    # 0 para o período do relatório, 1.. para os anteriores
+    indice_periodo = case(*[(Lancamento.data_transacao >= inicio, k) for k, inicio in enumerate(inicios)])
+    categoria_nome = func.coalesce(Categoria.nome, "Sem Categoria")
+
+    # O cubo período × categoria × tipo. 'total' conta todos os lançamentos (inclusive
+    # transferências) para saber se o período tem dados; as somas ignoram transferências.
+    resultado = await db.execute(
+        select(
+            indice_periodo,
+            categoria_nome,
+            Lancamento.tipo,
+            func.count(Lancamento.id),
+            func.count(Lancamento.id).filter(financeiro),
+            func.coalesce(func.sum(Lancamento.valor).filter(financeiro), 0),
+            func.coalesce(func.sum(Lancamento.valor).filter(financeiro, Lancamento.valor > 0), 0),
+        )
+        .outerjoin(Categoria, Lancamento.id_categoria == Categoria.id)
+        .filter(
+            Lancamento.id_usuario == usuario_q.id,
+            Lancamento.data_transacao >= inicios[-1],
+            Lancamento.data_transacao < data_fim,
+        )
+        .group_by(indice_periodo, categoria_nome, Lancamento.tipo)
+    )
+    totais_por_periodo: Dict[int, Dict[str, float]] = {}
+    gastos_por_categoria_periodo: Dict[str, Dict[int, float]] = {}
+    lancamentos_periodo = 0
+    for periodo, cat, tipo, total, financeiros, soma, soma_positiva in resultado.all():
+        if periodo == 0:
+            lancamentos_periodo += total
+        if financeiros:
+            por_tipo = totais_por_periodo.setdefault(periodo, {})
+            por_tipo[tipo] = por_tipo.get(tipo, 0.0) + float(soma)
+        if tipo == 'Saída' and soma_positiva > 0:
+            gastos_por_categoria_periodo.setdefault(cat, {})[periodo] = float(soma_positiva)
+
+    if not lancamentos_periodo:
+        return {"has_data": False, "usuario": usuario_q, "now": datetime.now, **descricao_periodo}
+
+    totais_atual = totais_por_periodo.get(0, {})
+    receitas_atual = totais_atual.get('Entrada', 0.0)
+    despesas_atual = totais_atual.get('Saída', 0.0)
     saldo_atual = receitas_atual - despesas_atual
     taxa_poupanca_atual = (saldo_atual / receitas_atual) * 100 if receitas_atual > 0 else 0
 
-    # O agrupamento de gastos também usa a lista filtrada
-    gastos_por_categoria_atual = {}
-    for l in lancamentos_financeiros:
-        if l.tipo == 'Saída' and l.valor > 0:
-            cat_nome = l.categoria.nome if l.categoria else "Sem Categoria"
-            gastos_por_categoria_atual[cat_nome] = gastos_por_categoria_atual.get(cat_nome, 0) + float(l.valor)
-    
-    gastos_agrupados_final = sorted([(cat, val) for cat, val in gastos_por_categoria_atual.items()], key=lambda i: i[1], reverse=True)
-
-    # A análise histórica pode continuar usando todos os dados, se desejado, ou também pode ser filtrada
-    df_historico = pd.DataFrame([
-        {'data': l.data_transacao, 'valor': float(l.valor), 'tipo': l.tipo} 
-        for l in lancamentos_historico_6m 
-        if not (l.categoria and l.categoria.nome.lower() == 'transferência') # Filtrando aqui também
-    ])
-    
-    if not df_historico.empty:
-        df_historico['mes_ano'] = df_historico['data'].dt.to_period('M')
-        dados_mensais = df_historico.groupby(['mes_ano', 'tipo'])['valor'].sum().unstack(fill_value=0)
-    else:
-        dados_mensais = pd.DataFrame()
-        
-    if 'Entrada' not in dados_mensais.columns: dados_mensais['Entrada'] = 0
-    if 'Saída' not in dados_mensais.columns: dados_mensais['Saída'] = 0
-
-    periodo_3m = dados_mensais.index[dados_mensais.index < periodo_alvo][-3:]
-    media_3m = dados_mensais.loc[periodo_3m].mean() if not periodo_3m.empty else pd.Series(dtype=float)
-    media_receitas_3m = media_3m.get('Entrada', 0.0)
-    media_despesas_3m = media_3m.get('Saída', 0.0)
-
-    periodo_anterior = periodo_alvo - 1
-    if periodo_anterior in dados_mensais.index:
-        receitas_anterior = dados_mensais.loc[periodo_anterior, 'Entrada']
-        despesas_anterior = dados_mensais.loc[periodo_anterior, 'Saída']
-        tendencia_receita_percent = ((receitas_atual - receitas_anterior) / receitas_anterior * 100) if receitas_anterior > 0 else 0
-        tendencia_despesa_percent = ((despesas_atual - despesas_anterior) / despesas_anterior * 100) if despesas_anterior > 0 else 0
+    gastos_por_categoria_atual = {
+        cat: por_periodo[0] for cat, por_periodo in gastos_por_categoria_periodo.items() if 0 in por_periodo
+    }
+    gastos_agrupados_final = sorted(gastos_por_categoria_atual.items(), key=lambda i: i[1], reverse=True)
+    tendencias_categorias = _tendencias_por_categoria(gastos_por_categoria_periodo)
+
+    # Médias dos períodos anteriores que tiveram movimentação
+    periodos_anteriores = [k for k in range(1, len(inicios)) if k in totais_por_periodo]
+    if periodos_anteriores:
+        media_receitas = sum(totais_por_periodo[k].get('Entrada', 0.0) for k in periodos_anteriores) / len(periodos_anteriores)
+        media_despesas = sum(totais_por_periodo[k].get('Saída', 0.0) for k in periodos_anteriores) / len(periodos_anteriores)
     else:
-        tendencia_receita_percent = 0
-        tendencia_despesa_percent = 0
+        media_receitas = 0.0
+        media_despesas = 0.0
+
+    # Variação contra o período anterior; None quando não há base para comparar
+    totais_anterior = totais_por_periodo.get(1, {})
+    receitas_anterior = totais_anterior.get('Entrada', 0.0)
+    despesas_anterior = totais_anterior.get('Saída', 0.0)
+    tendencia_receita_percent = ((receitas_atual - receitas_anterior) / receitas_anterior * 100) if receitas_anterior > 0 else None
+    tendencia_despesa_percent = ((despesas_atual - despesas_anterior) / despesas_anterior * 100) if despesas_anterior > 0 else None
+
+    # Receitas e despesas de cada período, do mais antigo ao do relatório
+    fins = [data_fim] + inicios[:-1]
+    evolucao_periodos = [
+        {
+            "rotulo": _rotulo_periodo(inicios[k], fins[k]),
+            "receitas": totais_por_periodo.get(k, {}).get('Entrada', 0.0),
+            "despesas": totais_por_periodo.get(k, {}).get('Saída', 0.0),
+        }
+        for k in reversed(range(len(inicios)))
+    ]
 
     # Placeholders para futuras implementações
     analise_ia = "Análise inteligente do Maestro aparecerá aqui."
@@ -215,71 +241,28 @@ def gerar_contexto_relatorio(db: Session, telegram_id: int, mes: int, ano: int):
 
     contexto = {
         "has_data": True, "now": datetime.now, "usuario": usuario_q,
-        "mes_nome": mes_nome_str, "ano": ano,
+        **descricao_periodo,
         "receita_total": receitas_atual,
         "despesa_total": despesas_atual,
         "saldo_mes": saldo_atual,
         "taxa_poupanca": taxa_poupanca_atual,
         "gastos_agrupados": gastos_agrupados_final,
         "gastos_por_categoria_dict": gastos_por_categoria_atual,
-        "lancamentos_historico": lancamentos_historico_6m, # Mantém o histórico completo para referência
+        "tendencias_categorias": tendencias_categorias,
+        "evolucao_periodos": evolucao_periodos,
         "tendencia_receita_percent": tendencia_receita_percent,
         "tendencia_despesa_percent": tendencia_despesa_percent,
-        "media_receitas_3m": media_receitas_3m,
-        "media_despesas_3m": media_despesas_3m,
-        "media_saldo_3m": media_receitas_3m - media_despesas_3m,
+        "media_receitas_anteriores": media_receitas,
+        "media_despesas_anteriores": media_despesas,
+        "media_saldo_anteriores": media_receitas - media_despesas,
+        "periodos_anteriores": PERIODOS_ANTERIORES_RELATORIO,
+        "periodos_anteriores_com_dados": len(periodos_anteriores),
         "analise_ia": analise_ia,
         "metas": metas_com_progresso,
     }
     
     return contexto
 
-def gerar_grafico_evolucao_mensal(lancamentos_historico: list) -> io.BytesIO | None:
-    if not lancamentos_historico:
-        return None
-
-    try:
-        dados = []
-        for l in lancamentos_historico:
-            dados.append({
-                'data': l.data_transacao,
-                'valor': float(l.valor),
-                'tipo': l.tipo
-            })
-        
-        df = pd.DataFrame(dados)
-        df['mes_ano'] = df['data'].dt.to_period('M')
-
-        df_agrupado = df.groupby(['mes_ano', 'tipo'])['valor'].sum().unstack(fill_value=0)
-        
-        if 'Entrada' not in df_agrupado.columns: df_agrupado['Entrada'] = 0
-        if 'Saída' not in df_agrupado.columns: df_agrupado['Saída'] = 0
-        
-        df_agrupado = df_agrupado.sort_index()
-        
-        df_agrupado.index = df_agrupado.index.strftime('%b/%y')
-
-        fig, ax = plt.subplots(figsize=(10, 5), dpi=100)
-        
-        ax.plot(df_agrupado.index, df_agrupado['Entrada'], marker='o', linestyle='-', color='#2ecc71', label='Receitas')
-        ax.plot(df_agrupado.index, df_agrupado['Saída'], marker='o', linestyle='-', color='#e74c3c', label='Despesas')
-
-        ax.set_title('Receitas vs. Despesas (Últimos 6 Meses)', fontsize=16, weight='bold')
-        ax.set_ylabel('Valor (R$)')
-        ax.grid(True, which='both', linestyle='--', linewidth=0.5)
-        ax.legend()
-        
-        plt.tight_layout()
-        buffer = io.BytesIO()
-        plt.savefig(buffer, format='png', bbox_inches='tight')
-        buffer.seek(0)
-        return buffer
-    except Exception as e:
-        logger.error(f"Erro ao gerar gráfico de evolução: {e}", exc_info=True)
-        return None
-    finally:
-        plt.close('all')
-
 def detectar_intencao_e_topico(pergunta: str) -> Optional[tuple[str, str]]:
     pergunta_lower = pergunta.lower()
     for topico_base, padrao in INTENT_PATTERNS.items():
@@ -355,10 +338,9 @@ async def obter_contexto_macroeconomico() -> str:
 
 async def gerar_analise_personalizada(info: str, perfil: str) -> str:
     try:
-        model = genai.GenerativeModel("gemini-1.5-flash")
         prompt = f"Em uma frase, explique o impacto desta notícia/dado para um investidor de perfil {perfil}: {info}"
-        resposta = await model.generate_content_async(prompt)
-        return resposta.text.strip()
+        resposta = await gateway_ia.gerar_texto(prompt, modelo="gemini-1.5-flash")
+        return resposta.strip()
     except Exception as e:
         logger.error(f"Erro ao gerar análise personalizada com Gemini: {e}")
         return "(Não foi possível gerar a análise.)"
@@ -372,17 +354,78 @@ def get_category_emoji(category_name: str) -> str:
     }
     return emoji_map.get(category_name, '💸')
 
-def buscar_lancamentos_com_relacionamentos(db: Session, telegram_id: int) -> List[Lancamento]:
+async def buscar_lancamentos_com_relacionamentos(db: AsyncSession, telegram_id: int) -> List[Lancamento]:
     logger.info(f"Buscando lançamentos com relacionamentos para telegram_id: {telegram_id}")
-    lancamentos = db.query(Lancamento).join(Usuario).options(
-        joinedload(Lancamento.categoria),
-        joinedload(Lancamento.subcategoria)
-    ).filter(
-        Usuario.telegram_id == telegram_id
-    ).order_by(Lancamento.data_transacao.desc()).limit(200).all()
+    resultado = await db.execute(
+        select(Lancamento).join(Usuario).options(
+            joinedload(Lancamento.categoria),
+            joinedload(Lancamento.subcategoria),
+            selectinload(Lancamento.itens)  # preparar_contexto_json lê os itens depois que a sessão fecha
+        ).filter(
+            Usuario.telegram_id == telegram_id
+        ).order_by(Lancamento.data_transacao.desc()).limit(200)
+    )
+    lancamentos = resultado.scalars().all()
     logger.info(f"Consulta ao DB finalizada. Encontrados {len(lancamentos)} lançamentos para o telegram_id: {telegram_id}")
     return lancamentos
 
+# Agrupamento do menu de gráficos -> agregação SQL que o alimenta
+AGREGACAO_POR_AGRUPAMENTO = {
+    "categoria": "categoria",
+    "forma_pagamento": "forma_pagamento",
+    "data": "dia",
+    "fluxo_caixa": "dia",
+    "projecao": "dia",
+}
+
+async def agregar_dados_grafico(db: AsyncSession, telegram_id: int, agregacao: str,
+                                data_inicio: datetime, data_fim: datetime) -> List[tuple]:
+    """
+    Agrega os lançamentos do período no próprio banco (GROUP BY) e devolve
+    apenas os totais que o gráfico precisa:
+      - 'categoria' / 'forma_pagamento': [(grupo, total_despesas)] do maior para o menor
+      - 'dia': [(data, entradas, saidas)] em ordem cronológica
+    O intervalo é fechado no início e aberto no fim: [data_inicio, data_fim).
+    """
+    id_usuario = select(Usuario.id).filter(Usuario.telegram_id == telegram_id).scalar_subquery()
+    no_periodo = and_(
+        Lancamento.id_usuario == id_usuario,
+        Lancamento.data_transacao >= data_inicio,
+        Lancamento.data_transacao < data_fim,
+    )
+
+    if agregacao in ("categoria", "forma_pagamento"):
+        if agregacao == "categoria":
+            grupo = func.coalesce(Categoria.nome, "Sem Categoria")
+            base = select(grupo, func.sum(Lancamento.valor)).outerjoin(Categoria, Lancamento.id_categoria == Categoria.id)
+        else:
+            grupo = func.coalesce(func.nullif(Lancamento.forma_pagamento, ""), "Não Especificado")
+            base = select(grupo, func.sum(Lancamento.valor))
+        stmt = (
+            base.filter(no_periodo, Lancamento.tipo == "Saída")
+            .group_by(grupo)
+            .order_by(func.sum(Lancamento.valor).desc())
+        )
+        resultado = await db.execute(stmt)
+        return [(nome, float(total)) for nome, total in resultado.all()]
+
+    if agregacao == "dia":
+        dia = func.date(Lancamento.data_transacao)
+        stmt = (
+            select(
+                dia,
+                func.sum(case((Lancamento.tipo == "Entrada", Lancamento.valor), else_=0)),
+                func.sum(case((Lancamento.tipo == "Saída", Lancamento.valor), else_=0)),
+            )
+            .filter(no_periodo)
+            .group_by(dia)
+            .order_by(dia)
+        )
+        resultado = await db.execute(stmt)
+        return [(data, float(entradas), float(saidas)) for data, entradas, saidas in resultado.all()]
+
+    raise ValueError(f"Agregação desconhecida: {agregacao}")
+
 def analisar_comportamento_financeiro(lancamentos: List[Lancamento]) -> Dict[str, Any]:
     if not lancamentos:
         return {"has_data": False}
@@ -457,264 +500,12 @@ def definir_perfil_investidor(respostas: dict) -> str:
     elif pontos <= 5: return 'Moderado'
     else: return 'Arrojado'
 
-def preparar_dados_para_grafico(lancamentos: List[Lancamento], agrupar_por: str):
-    if not lancamentos: return pd.DataFrame(), False
-    dados_base = []
-    if agrupar_por in ['categoria', 'forma_pagamento']:
-        lista_base = [l for l in lancamentos if l.tipo == 'Saída']
-        if not lista_base: return pd.DataFrame(), False
-        for l in lista_base:
-            grupo = ""
-            if agrupar_por == 'categoria':
-                grupo = l.categoria.nome if l.categoria else "Sem Categoria"
-            elif agrupar_por == 'forma_pagamento':
-                grupo = l.forma_pagamento or "Não Especificado"
-            dados_base.append({'grupo': grupo, 'valor': float(l.valor)})
-        if not dados_base: return pd.DataFrame(), False
-        df = pd.DataFrame(dados_base)
-        df_agrupado = df.groupby('grupo')['valor'].sum().reset_index().sort_values('valor', ascending=False)
-        if len(df_agrupado) > 7:
-            top_7 = df_agrupado.iloc[:6].copy()
-            outros_valor = df_agrupado.iloc[6:]['valor'].sum()
-            outros_df = pd.DataFrame([{'grupo': 'Outros', 'valor': outros_valor}])
-            df_agrupado = pd.concat([top_7, outros_df], ignore_index=True)
-        return df_agrupado, not df_agrupado.empty
-    elif agrupar_por in ['data', 'fluxo_caixa', 'projecao']:
-        for l in lancamentos:
-            dados_base.append({'data': l.data_transacao.date(), 'valor': float(l.valor), 'tipo': l.tipo})
-        if not dados_base: return pd.DataFrame(), False
-        df = pd.DataFrame(dados_base)
-        df_agrupado = df.groupby(['data', 'tipo'])['valor'].sum().unstack(fill_value=0)
-        if 'Entrada' not in df_agrupado.columns: df_agrupado['Entrada'] = 0
-        if 'Saída' not in df_agrupado.columns: df_agrupado['Saída'] = 0
-        df_agrupado = df_agrupado.reset_index().sort_values('data')
-        if agrupar_por == 'data':
-            df_agrupado['Saldo'] = df_agrupado['Entrada'] - df_agrupado['Saída']
-            df_agrupado['Saldo Acumulado'] = df_agrupado['Saldo'].cumsum()
-        if agrupar_por == 'projecao' and df_agrupado['Saída'].sum() == 0:
-            return pd.DataFrame(), False
-        return df_agrupado, len(df_agrupado) >= 1
-    return pd.DataFrame(), False
-
-def gerar_grafico_dinamico(lancamentos: List[Lancamento], tipo_grafico: str, agrupar_por: str) -> Optional[io.BytesIO]:
-    """
-    Gera gráficos financeiros dinâmicos com um design aprimorado e profissional.
-    """
-    try:
-        # --- ESTILO GLOBAL PARA TODOS OS GRÁFICOS ---
-        plt.style.use('seaborn-v0_8-darkgrid')
-        plt.rcParams.update({
-            'font.family': 'sans-serif',
-            'font.sans-serif': ['Arial', 'Helvetica', 'DejaVu Sans'], # Fallback de fontes
-            'axes.labelcolor': '#333333',
-            'xtick.color': '#333333',
-            'ytick.color': '#333333',
-            'axes.titlecolor': '#1a2b4c',
-            'axes.edgecolor': '#cccccc',
-            'axes.titleweight': 'bold',
-            'axes.titlesize': 18,
-            'figure.dpi': 120
-        })
-
-        df, tem_dados_suficientes = preparar_dados_para_grafico(lancamentos, agrupar_por)
-        if not tem_dados_suficientes:
-            return None
-            
-        fig, ax = plt.subplots(figsize=(12, 7))
-
-        # --- GRÁFICOS DE CATEGORIA E FORMA DE PAGAMENTO ---
-        if agrupar_por in ['categoria', 'forma_pagamento']:
-            
-            # GRÁFICO DE PIZZA (AGORA DONUT CHART)
-            if tipo_grafico == 'pizza':
-                ax.set_title(f'Distribuição de Despesas por {agrupar_por.replace("_", " ").title()}', pad=20)
-                
-                # Paleta de cores mais bonita (Set2 é boa para categorias distintas)
-                colors = plt.cm.Set2(np.linspace(0, 1, len(df['grupo'])))
-                
-                # Explode as fatias para melhor visualização
-                explode = [0.05] * len(df['grupo'])
-                
-                wedges, texts, autotexts = ax.pie(
-                    df['valor'], 
-                    autopct='%1.1f%%', 
-                    startangle=90, 
-                    colors=colors, 
-                    pctdistance=0.85,
-                    explode=explode,
-                    wedgeprops={'edgecolor': 'white', 'linewidth': 2}
-                )
-                plt.setp(autotexts, size=12, weight="bold", color="white")
-                
-                # Desenha o círculo no centro para criar o efeito DONUT
-                centre_circle = plt.Circle((0,0), 0.70, fc='white')
-                fig.gca().add_artist(centre_circle)
-                
-                # Legenda limpa e organizada
-                legend_labels = [f"{label}: R$ {valor:.2f}" for label, valor in zip(df['grupo'], df['valor'])]
-                ax.legend(wedges, legend_labels, title="Valores", loc="center left", bbox_to_anchor=(1, 0, 0.5, 1), fontsize=11)
-                ax.axis('equal')
-
-            # GRÁFICO DE BARRAS HORIZONTAIS
-            elif tipo_grafico == 'barra_h':
-                ax.set_title(f'Total de Despesas por {agrupar_por.replace("_", " ").title()}', pad=20)
-                df = df.sort_values('valor', ascending=True) # Ordena do menor para o maior
-                
-                palette = sns.color_palette("viridis_r", len(df))
-                bars = ax.barh(df['grupo'], df['valor'], color=palette, edgecolor='black', linewidth=0.7)
-                
-                ax.set_xlabel('Valor Gasto (R$)', fontsize=12)
-                ax.set_ylabel('')
-                ax.grid(axis='y', linestyle='', alpha=0) # Remove linhas de grade horizontais
-                
-                # Rótulos de valor inteligentes
-                for bar in bars:
-                    width = bar.get_width()
-                    ax.text(width + 50, bar.get_y() + bar.get_height()/2, f'R$ {width:,.2f}'.replace(',', '.'),
-                            va='center', ha='left', fontsize=11, weight='bold', color=bar.get_facecolor())
-
-        # --- GRÁFICOS BASEADOS EM DATA ---
-        elif agrupar_por in ['data', 'fluxo_caixa', 'projecao']:
-            df['data'] = pd.to_datetime(df['data'])
-            
-            # GRÁFICO DE EVOLUÇÃO DO SALDO (LINHA)
-            if agrupar_por == 'data':
-                if len(df) < 3: return None # Precisa de pelo menos 3 pontos para suavizar
-                ax.set_title('Evolução do Saldo Financeiro', pad=20)
-                
-                # Suavização da linha
-                x_smooth = np.linspace(df['data'].astype(np.int64).min(), df['data'].astype(np.int64).max(), 300)
-                x_smooth_dt = pd.to_datetime(x_smooth)
-                spl = make_interp_spline(df['data'].astype(np.int64), df['Saldo Acumulado'], k=2)
-                y_smooth = spl(x_smooth)
-                
-                ax.plot(x_smooth_dt, y_smooth, label='Saldo Acumulado (suave)', color='#3498db', linewidth=3)
-                ax.fill_between(x_smooth_dt, y_smooth, alpha=0.15, color='#3498db')
-                
-                # Destaque do pico máximo e mínimo
-                pico_max = df.loc[df['Saldo Acumulado'].idxmax()]
-                pico_min = df.loc[df['Saldo Acumulado'].idxmin()]
-                
-                ax.scatter(pico_max['data'], pico_max['Saldo Acumulado'], color='#2ecc71', s=150, zorder=5, label='Pico Máximo', edgecolor='white')
-                ax.scatter(pico_min['data'], pico_min['Saldo Acumulado'], color='#e74c3c', s=150, zorder=5, label='Pico Mínimo', edgecolor='white')
-                
-                # Anotações nos picos
-                ax.text(pico_max['data'], pico_max['Saldo Acumulado'] + 500, f'{pico_max["Saldo Acumulado"]:.0f}', ha='center', fontsize=12, weight='bold', color='black', backgroundcolor=(1,1,1,0.6))
-                ax.text(pico_min['data'], pico_min['Saldo Acumulado'] - 1000, f'{pico_min["Saldo Acumulado"]:.0f}', ha='center', fontsize=12, weight='bold', color='black', backgroundcolor=(1,1,1,0.6))
-
-                ax.legend(fontsize=12)
-
-            # GRÁFICO DE PROJEÇÃO (BARRAS HORIZONTAIS)
-            elif agrupar_por == 'projecao':
-                today = datetime.now()
-                start_of_month = today.replace(day=1, hour=0, minute=0, second=0).date()
-                df_mes_atual = df[(df['data'].dt.date >= start_of_month) & (df['data'].dt.date <= today.date())]
-                if df_mes_atual.empty or df_mes_atual['Saída'].sum() == 0: return None
-                
-                gasto_acumulado = df_mes_atual['Saída'].sum()
-                dias_no_mes = (today.replace(month=today.month % 12 + 1 if today.month != 12 else 1, day=1) - timedelta(days=1)).day
-                dias_passados = today.day
-                gasto_medio_diario = gasto_acumulado / dias_passados
-                gasto_projetado = gasto_medio_diario * dias_no_mes
-                
-                ax.set_title(f'Projeção de Gastos para {today.strftime("%B")}', pad=20)
-                
-                data_proj = {'Label': ['Gasto Atual', 'Projeção para o Mês'], 'Valor': [gasto_acumulado, gasto_projetado]}
-                df_proj = pd.DataFrame(data_proj)
-
-                bars = ax.barh(df_proj['Label'], df_proj['Valor'], color=['#1f77b4', '#ff7f0e'], edgecolor='black', linewidth=0.8)
-                ax.invert_yaxis() # Gasto atual em cima
-                
-                ax.set_xlabel('Valor (R$)', fontsize=12)
-                ax.bar_label(bars, fmt='R$ %.2f', padding=5, fontsize=12, weight='bold')
-
-                # Caixa de anotação para o gasto médio
-                ax.text(gasto_projetado * 0.95, 1, f'Gasto médio diário: R$ {gasto_medio_diario:.2f}',
-                        va='center', ha='right', fontsize=11, style='italic',
-                        bbox=dict(boxstyle='round,pad=0.5', fc='khaki', alpha=0.7))
-
-            # GRÁFICO DE FLUXO DE CAIXA (Ainda mantido, mas menos focado)
-            elif agrupar_por == 'fluxo_caixa':
-                # (Lógica original mantida, pois não havia referência de melhoria)
-                if df['Entrada'].sum() == 0 and df['Saída'].sum() == 0: return None
-                ax.bar(df['data'], df['Entrada'], color='#2ecc71', label='Receitas', width=timedelta(days=0.8))
-                ax.bar(df['data'], -df['Saída'], color='#e74c3c', label='Despesas', width=timedelta(days=0.8))
-                ax.axhline(0, color='black', linewidth=0.8)
-                ax.set_title('Fluxo de Caixa (Receitas vs. Despesas)', pad=20)
-                ax.legend()
-            
-            ax.set_ylabel('Valor (R$)', fontsize=12)
-            fig.autofmt_xdate(rotation=30)
-            ax.xaxis.set_major_formatter(mdates.DateFormatter('%d/%m'))
-
-        else:
-            return None
-        
-        plt.tight_layout(pad=1.5)
-        buffer = io.BytesIO()
-        plt.savefig(buffer, format='png', bbox_inches='tight')
-        buffer.seek(0)
-        plt.close(fig) # Garante que a figura seja fechada para liberar memória
-        return buffer
-    except Exception as e:
-        logger.error(f"Erro CRÍTICO ao gerar gráfico: {e}", exc_info=True)
-        plt.close('all') # Fecha todas as figuras em caso de erro
-        return None
-    
-def preparar_contexto_financeiro_completo(db: Session, usuario: Usuario) -> str:
+async def preparar_contexto_financeiro_completo(db: AsyncSession, usuario: Usuario) -> str:
     """
     Coleta e formata um resumo completo do ecossistema financeiro do usuário.
     VERSÃO 3.0 - Inclui a lista COMPLETA de transações para cálculos detalhados.
-    """
-    lancamentos = db.query(Lancamento).filter(Lancamento.id_usuario == usuario.id).options(
-        joinedload(Lancamento.categoria)
-    ).order_by(Lancamento.data_transacao.asc()).all()
-    
-    if not lancamentos:
-        return json.dumps({"resumo": "Nenhum dado financeiro encontrado."}, indent=2, ensure_ascii=False)
 
-    # ... (A lógica de resumo mensal e metadados continua a mesma) ...
-    data_minima = lancamentos[0].data_transacao.strftime('%d/%m/%Y')
-    data_maxima = lancamentos[-1].data_transacao.strftime('%d/%m/%Y')
-    resumo_mensal = {}
-    for l in lancamentos:
-        mes_ano = l.data_transacao.strftime('%Y-%m')
-        if mes_ano not in resumo_mensal:
-            resumo_mensal[mes_ano] = {'receitas': 0.0, 'despesas': 0.0}
-        if l.tipo == 'Entrada':
-            resumo_mensal[mes_ano]['receitas'] += float(l.valor)
-        else:
-            resumo_mensal[mes_ano]['despesas'] += float(l.valor)
-    for mes, valores in resumo_mensal.items():
-        valores['receitas'] = f"R$ {valores['receitas']:.2f}"
-        valores['despesas'] = f"R$ {valores['despesas']:.2f}"
-
-    contas_db = db.query(Conta).filter(Conta.id_usuario == usuario.id).all()
-    metas_db = db.query(Objetivo).filter(Objetivo.id_usuario == usuario.id).all()
-    metas_financeiras = [
-        {"descricao": o.descricao, "valor_meta": f"R$ {o.valor_meta:.2f}", "valor_atual": f"R$ {o.valor_atual:.2f}"}
-        for o in metas_db
-    ]
-    
-    # --- MUDANÇA CRUCIAL: Adicionamos a lista completa de lançamentos ---
-    contexto_completo = {
-        "informacoes_gerais": {
-            "data_atual": datetime.now().strftime('%d/%m/%Y'),
-            "periodo_disponivel": f"{data_minima} a {data_maxima}",
-            "contas_cadastradas": [c.nome for c in contas_db],
-            "metas_financeiras": metas_financeiras
-        },
-        "resumo_por_mes": resumo_mensal,
-        "todos_lancamentos": [ # A IA agora tem a lista completa para cálculos
-            {
-                "data": l.data_transacao.strftime('%Y-%m-%d'), # Formato ISO para facilitar o parse
-                "descricao": l.descricao,
-                "valor": float(l.valor),
-                "tipo": l.tipo,
-                "categoria": l.categoria.nome if l.categoria else "Sem Categoria",
-                "conta": l.forma_pagamento
-            } for l in lancamentos
-        ]
-    }
-
-    return json.dumps(contexto_completo, indent=2, ensure_ascii=False)
\ No newline at end of file
+    Os lançamentos vêm do snapshot em `contexto_cache`, que é montado uma vez e
+    atualizado incrementalmente quando lançamentos são criados, editados ou apagados.
+    """
+    return await contexto_cache.obter_contexto_financeiro(db, usuario)
\ No newline at end of file
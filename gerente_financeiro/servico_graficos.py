@@ -0,0 +1,120 @@
+# gerente_financeiro/servico_graficos.py
+"""
+Serviço de renderização de gráficos fora do event loop.
+
+Matplotlib/seaborn/scipy são puramente CPU e seguram o GIL: desenhar um
+gráfico dentro de um handler congela o bot para todos os usuários. Aqui os
+gráficos são desenhados num pool de processos com workers "quentes" (backend
+Agg, estilos e fontes já carregados) e os handlers só aguardam os bytes do PNG.
+
+Os workers recebem apenas os totais já agregados no banco (listas curtas de
+tuplas), nunca objetos do ORM, para que a serialização entre processos seja barata.
+"""
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date
+from typing import Dict, List, Optional
+
+import config
+from . import renderizador_graficos
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+# Digest do gráfico -> file_id do Telegram da primeira vez que ele foi enviado.
+# Reenviar o mesmo gráfico vira um sendPhoto com file_id, sem renderizar nem subir bytes.
+MAX_FILE_IDS = 5000
+_file_ids: "OrderedDict[str, str]" = OrderedDict()
+_file_id_contadores = {"reaproveitados": 0, "renderizados": 0, "descartados": 0}
+
+
+def _inicializar_worker() -> None:
+    """Roda uma vez em cada worker: importa o renderizador e aquece o cache de fontes."""
+    # Um desenho descartável carrega o Agg e resolve as fontes (o font_manager guarda o resultado)
+    renderizador_graficos.gerar_grafico_dinamico([("aquecimento", 1.0)], "pizza", "categoria")
+
+
+def _obter_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # 'spawn' evita herdar por fork as conexões abertas do pool do banco
+        _pool = ProcessPoolExecutor(
+            max_workers=config.GRAFICOS_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_inicializar_worker,
+        )
+        logger.info(f"Pool de renderização de gráficos iniciado com {config.GRAFICOS_WORKERS} workers.")
+    return _pool
+
+
+async def _executar(funcao, *args) -> Optional[bytes]:
+    global _pool
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_obter_pool(), funcao, *args)
+    except BrokenProcessPool:
+        # Um worker morreu (ex.: falta de memória): recria o pool e tenta uma vez mais
+        logger.error("Pool de gráficos quebrado. Recriando workers...", exc_info=True)
+        _pool = None
+        return await loop.run_in_executor(_obter_pool(), funcao, *args)
+
+
+async def renderizar_grafico_dinamico(dados: List[tuple], tipo_grafico: str, agrupar_por: str) -> Optional[bytes]:
+    """PNG do gráfico do menu /grafico, ou None se não houver dados suficientes."""
+    return await _executar(renderizador_graficos.gerar_grafico_dinamico, dados, tipo_grafico, agrupar_por)
+
+
+def digest_grafico(tipo_grafico: str, agrupar_por: str, dados: List[tuple]) -> str:
+    """Identifica o gráfico pelo tipo e pelos dados agregados que ele desenha."""
+    partes = [tipo_grafico, agrupar_por, repr(dados)]
+    if agrupar_por == "projecao":
+        # A projeção depende do dia atual (dias passados/restantes no mês)
+        partes.append(date.today().isoformat())
+    return hashlib.sha1("|".join(partes).encode("utf-8")).hexdigest()
+
+
+def obter_file_id(digest: str) -> Optional[str]:
+    file_id = _file_ids.get(digest)
+    if file_id is not None:
+        _file_ids.move_to_end(digest)
+        _file_id_contadores["reaproveitados"] += 1
+    return file_id
+
+
+def registrar_file_id(digest: str, file_id: str) -> None:
+    _file_ids[digest] = file_id
+    _file_ids.move_to_end(digest)
+    _file_id_contadores["renderizados"] += 1
+    while len(_file_ids) > MAX_FILE_IDS:
+        _file_ids.popitem(last=False)
+
+
+def descartar_file_id(digest: str) -> None:
+    """Esquece um file_id recusado pelo Telegram."""
+    if _file_ids.pop(digest, None) is not None:
+        _file_id_contadores["descartados"] += 1
+
+
+def get_file_id_stats() -> Dict[str, int]:
+    return {"file_ids": len(_file_ids), "max_file_ids": MAX_FILE_IDS, **_file_id_contadores}
+
+
+def aquecer_pool_graficos() -> None:
+    """Sobe os workers antecipadamente para que o primeiro gráfico não pague a inicialização."""
+    pool = _obter_pool()
+    for _ in range(config.GRAFICOS_WORKERS):
+        pool.submit(int)
+
+
+def encerrar_pool_graficos() -> None:
+    """Encerra os workers (chamado no desligamento do bot)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -1,11 +1,19 @@
+import asyncio
 import logging
 from datetime import datetime, timedelta, time
 from dateutil.relativedelta import relativedelta
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import or_
+from sqlalchemy.orm import selectinload
+from sqlalchemy import or_, select
 
-from database.database import get_db
+import config
+from database.database import (
+    get_async_db, obter_metricas_pool, listar_usuarios_sem_relatorio, remover_relatorios_antigos
+)
 from models import Agendamento, Lancamento, Usuario
+from gerente_financeiro import contexto_cache
+from gerente_financeiro.relatorio_handler import gerar_relatorio_pdf
+from gerente_financeiro.gateway_ia import get_gateway_stats
+from gerente_financeiro import cache_respostas_ia
 
 logger = logging.getLogger(__name__)
 
@@ -18,16 +26,19 @@ async def agendar_notificacoes_diarias(context):
     logger.info("JOB MESTRE: Iniciando agendamento de notificações individuais para o dia.")
     hoje = datetime.now().date()
     
-    db: Session = next(get_db())
     try:
         # Query para encontrar todos os usuários que têm agendamentos ativos para hoje ou amanhã
-        usuarios_com_agendamentos = db.query(Usuario).join(Agendamento).filter(
-            Agendamento.ativo == True,
-            or_(
-                Agendamento.proxima_data_execucao == hoje,
-                Agendamento.proxima_data_execucao == hoje + timedelta(days=1)
+        async with get_async_db() as db:
+            resultado = await db.execute(
+                select(Usuario).join(Agendamento).filter(
+                    Agendamento.ativo == True,
+                    or_(
+                        Agendamento.proxima_data_execucao == hoje,
+                        Agendamento.proxima_data_execucao == hoje + timedelta(days=1)
+                    )
+                ).distinct()
             )
-        ).distinct().all()
+            usuarios_com_agendamentos = resultado.scalars().all()
 
         if not usuarios_com_agendamentos:
             logger.info("JOB MESTRE: Nenhum usuário com agendamentos para hoje ou amanhã. Encerrando.")
@@ -55,8 +66,6 @@ async def agendar_notificacoes_diarias(context):
 
     except Exception as e:
         logger.error(f"Erro CRÍTICO no job mestre de agendamento: {e}", exc_info=True)
-    finally:
-        db.close()
 
 async def enviar_notificacoes_e_processar_agendamentos(context):
     """
@@ -68,57 +77,142 @@ async def enviar_notificacoes_e_processar_agendamentos(context):
     
     hoje = datetime.now().date()
     amanha = hoje + timedelta(days=1)
+    # (chat_id, texto) enviados só depois do commit, com a sessão já devolvida ao pool
+    mensagens = []
     
-    db: Session = next(get_db())
-    try:
-        # Busca os agendamentos relevantes APENAS para este usuário
-        agendamentos_do_usuario = db.query(Agendamento).filter(
-            Agendamento.id_usuario == user_id,
-            Agendamento.ativo == True
-        ).all()
-
-        for ag in agendamentos_do_usuario:
-            # 1. Enviar lembrete de amanhã
-            if ag.proxima_data_execucao == amanha:
-                tipo_str = "receber" if ag.tipo == "Entrada" else "pagar"
-                msg = f"🔔 Lembrete: Amanhã é o dia de {tipo_str} '{ag.descricao}' no valor de R$ {ag.valor:.2f}."
-                await context.bot.send_message(chat_id=ag.usuario.telegram_id, text=msg)
-
-            # 2. Enviar lembrete e EXECUTAR o de hoje
-            if ag.proxima_data_execucao == hoje:
-                tipo_str_hoje = "Recebimento" if ag.tipo == "Entrada" else "Pagamento"
-                msg_hoje = f"⏰ Hoje é o dia do seu agendamento: {tipo_str_hoje} de '{ag.descricao}' (R$ {ag.valor:.2f})."
-                await context.bot.send_message(chat_id=ag.usuario.telegram_id, text=msg_hoje)
-
-                # Cria o lançamento real
-                novo_lancamento = Lancamento(
-                    id_usuario=ag.id_usuario,
-                    descricao=f"{ag.descricao} (Agendado)",
-                    valor=ag.valor,
-                    tipo=ag.tipo,
-                    data_transacao=datetime.combine(hoje, time.min),
-                    forma_pagamento="Agendado",
-                    id_categoria=ag.id_categoria,
-                    id_subcategoria=ag.id_subcategoria
-                )
-                db.add(novo_lancamento)
-                
-                # Atualiza o agendamento
-                ag.parcela_atual += 1
-                if ag.total_parcelas and ag.parcela_atual >= ag.total_parcelas:
-                    ag.ativo = False
-                else:
-                    if ag.frequencia == 'mensal':
-                        ag.proxima_data_execucao += relativedelta(months=1)
-                    elif ag.frequencia == 'semanal':
-                        ag.proxima_data_execucao += timedelta(weeks=1)
-                    elif ag.frequencia == 'unico':
+    async with get_async_db() as db:
+        try:
+            # Busca os agendamentos relevantes APENAS para este usuário
+            resultado = await db.execute(
+                select(Agendamento).filter(
+                    Agendamento.id_usuario == user_id,
+                    Agendamento.ativo == True
+                ).options(selectinload(Agendamento.usuario))
+            )
+            agendamentos_do_usuario = resultado.scalars().all()
+            lancamentos_criados = []
+
+            for ag in agendamentos_do_usuario:
+                # 1. Enviar lembrete de amanhã
+                if ag.proxima_data_execucao == amanha:
+                    tipo_str = "receber" if ag.tipo == "Entrada" else "pagar"
+                    msg = f"🔔 Lembrete: Amanhã é o dia de {tipo_str} '{ag.descricao}' no valor de R$ {ag.valor:.2f}."
+                    mensagens.append((ag.usuario.telegram_id, msg))
+
+                # 2. Enviar lembrete e EXECUTAR o de hoje
+                if ag.proxima_data_execucao == hoje:
+                    tipo_str_hoje = "Recebimento" if ag.tipo == "Entrada" else "Pagamento"
+                    msg_hoje = f"⏰ Hoje é o dia do seu agendamento: {tipo_str_hoje} de '{ag.descricao}' (R$ {ag.valor:.2f})."
+                    mensagens.append((ag.usuario.telegram_id, msg_hoje))
+
+                    # Cria o lançamento real
+                    novo_lancamento = Lancamento(
+                        id_usuario=ag.id_usuario,
+                        descricao=f"{ag.descricao} (Agendado)",
+                        valor=ag.valor,
+                        tipo=ag.tipo,
+                        data_transacao=datetime.combine(hoje, time.min),
+                        forma_pagamento="Agendado",
+                        id_categoria=ag.id_categoria,
+                        id_subcategoria=ag.id_subcategoria
+                    )
+                    db.add(novo_lancamento)
+                    lancamentos_criados.append(novo_lancamento)
+                    
+                    # Atualiza o agendamento
+                    ag.parcela_atual += 1
+                    if ag.total_parcelas and ag.parcela_atual >= ag.total_parcelas:
                         ag.ativo = False
-        
-        db.commit()
-        logger.info(f"JOB INDIVIDUAL: Processamento concluído para o usuário ID: {user_id}")
+                    else:
+                        if ag.frequencia == 'mensal':
+                            ag.proxima_data_execucao += relativedelta(months=1)
+                        elif ag.frequencia == 'semanal':
+                            ag.proxima_data_execucao += timedelta(weeks=1)
+                        elif ag.frequencia == 'unico':
+                            ag.ativo = False
+            
+            await db.commit()
+            if lancamentos_criados:
+                contexto_cache.registrar_lancamentos(agendamentos_do_usuario[0].usuario.telegram_id, lancamentos_criados)
+            logger.info(f"JOB INDIVIDUAL: Processamento concluído para o usuário ID: {user_id}")
+        except Exception as e:
+            logger.error(f"Erro no job individual para o usuário {user_id}: {e}", exc_info=True)
+            await db.rollback()
+            return
+
+    for chat_id, texto in mensagens:
+        try:
+            await context.bot.send_message(chat_id=chat_id, text=texto)
+        except Exception as e:
+            logger.error(f"Erro ao enviar notificação de agendamento para {chat_id}: {e}")
+
+
+async def registrar_metricas_pool(context):
+    """Job periódico que registra no log o estado do pool de conexões assíncrono, do gateway e do cache da IA."""
+    logger.info(f"POOL DB: {obter_metricas_pool()}")
+    logger.info(f"GATEWAY IA: {get_gateway_stats()}")
+    logger.info(f"CACHE IA: {cache_respostas_ia.get_cache_stats()}")
+
+async def podar_cache_respostas_ia(context):
+    """Job diário que tira do banco as respostas da IA vencidas ou além do limite de registros."""
+    try:
+        removidas = await cache_respostas_ia.podar_cache()
+        logger.info(f"CACHE IA: {removidas} respostas removidas na poda diária.")
     except Exception as e:
-        logger.error(f"Erro no job individual para o usuário {user_id}: {e}", exc_info=True)
-        db.rollback()
-    finally:
-        db.close()
\ No newline at end of file
+        logger.error(f"CACHE IA: erro na poda diária: {e}", exc_info=True)
+
+
+
+def _dentro_da_janela_noturna() -> bool:
+    agora = datetime.now(config.RELATORIO_PRE_RENDER_FUSO)
+    return config.RELATORIO_PRE_RENDER_INICIO <= agora.hour < config.RELATORIO_PRE_RENDER_FIM
+
+async def pre_renderizar_relatorios_mensais(context):
+    """
+    Job noturno que gera e guarda o PDF do mês fechado de cada usuário com lançamentos,
+    para que o /relatorio passado do início do mês seja respondido na hora.
+    É retomável: quem já tem o PDF guardado é pulado, e o que não couber na janela
+    da madrugada fica para a noite seguinte.
+    """
+    agora = datetime.now(config.RELATORIO_PRE_RENDER_FUSO).replace(tzinfo=None)
+    fim = agora.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    inicio = fim - relativedelta(months=1)
+    mes, ano = inicio.month, inicio.year
+
+    if not _dentro_da_janela_noturna():
+        logger.warning(
+            f"PRÉ-RENDER: disparado às {agora:%H:%M}, fora da janela "
+            f"{config.RELATORIO_PRE_RENDER_INICIO}h-{config.RELATORIO_PRE_RENDER_FIM}h "
+            f"({config.RELATORIO_PRE_RENDER_FUSO.key}). Nada será gerado."
+        )
+        return
+
+    try:
+        removidos = await remover_relatorios_antigos()
+        if removidos:
+            logger.info(f"PRÉ-RENDER: {removidos} relatórios antigos removidos.")
+        pendentes = await listar_usuarios_sem_relatorio(mes, ano)
+    except Exception as e:
+        logger.error(f"PRÉ-RENDER: erro ao listar usuários pendentes: {e}", exc_info=True)
+        return
+
+    if not pendentes:
+        logger.info(f"PRÉ-RENDER: nenhum relatório de {mes:02d}/{ano} pendente.")
+        return
+
+    logger.info(f"PRÉ-RENDER: {len(pendentes)} relatórios de {mes:02d}/{ano} pendentes.")
+    gerados = 0
+    for indice, telegram_id in enumerate(pendentes):
+        if not _dentro_da_janela_noturna():
+            logger.info(f"PRÉ-RENDER: fim da janela noturna. {len(pendentes) - indice} relatórios ficam para a próxima noite.")
+            break
+        try:
+            _, pdf_bytes, relatorio_id = await gerar_relatorio_pdf(telegram_id, inicio, fim)
+            if pdf_bytes and relatorio_id:
+                gerados += 1
+        except Exception as e:
+            logger.error(f"PRÉ-RENDER: erro no relatório do usuário {telegram_id}: {e}", exc_info=True)
+        # Um relatório por vez e com pausa: o job não disputa CPU nem banco com quem usa o bot
+        await asyncio.sleep(config.RELATORIO_PRE_RENDER_INTERVALO)
+
+    logger.info(f"PRÉ-RENDER: {gerados} relatórios de {mes:02d}/{ano} gerados nesta execução.")
@@ -1,12 +1,19 @@
 # models.py
 from datetime import datetime, timezone, time
 from sqlalchemy import (
-    Column, Integer, String, Numeric, DateTime, ForeignKey, BigInteger, Boolean, Date, Time
+    Column, Integer, String, Numeric, DateTime, ForeignKey, BigInteger, Boolean, Date, Time, JSON, UniqueConstraint,
+    LargeBinary, Text
 )
 from sqlalchemy.orm import relationship, declarative_base
 
 Base = declarative_base()
 
+
+def _agora_utc() -> datetime:
+    """Horário atual em UTC sem tzinfo (as colunas são TIMESTAMP WITHOUT TIME ZONE e o asyncpg
+    não converte datetimes com fuso automaticamente)."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 class Usuario(Base):
     __tablename__ = 'usuarios'
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -18,12 +25,14 @@ class Usuario(Base):
     # --- NOVA COLUNA PARA O "GUARDIÃO DE METAS" ---
     alerta_gastos_ativo = Column(Boolean, default=True)
     
-    criado_em = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    criado_em = Column(DateTime, default=_agora_utc)
     
     lancamentos = relationship("Lancamento", back_populates="usuario", cascade="all, delete-orphan")
     contas = relationship("Conta", back_populates="usuario", cascade="all, delete-orphan")
     objetivos = relationship("Objetivo", back_populates="usuario", cascade="all, delete-orphan")
     agendamentos = relationship("Agendamento", back_populates="usuario", cascade="all, delete-orphan")
+    perfis_csv = relationship("PerfilImportacaoCSV", back_populates="usuario", cascade="all, delete-orphan")
+    relatorios_mensais = relationship("RelatorioMensal", back_populates="usuario", cascade="all, delete-orphan")
 
 class Objetivo(Base):
     __tablename__ = 'objetivos'
@@ -33,7 +42,7 @@ class Objetivo(Base):
     valor_meta = Column(Numeric(12, 2), nullable=False)
     valor_atual = Column(Numeric(12, 2), default=0.0)
     data_meta = Column(Date, nullable=True)
-    criado_em = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    criado_em = Column(DateTime, default=_agora_utc)
 
     usuario = relationship("Usuario", back_populates="objetivos")
 
@@ -75,9 +84,11 @@ class Lancamento(Base):
     descricao = Column(String)
     valor = Column(Numeric(10, 2), nullable=False)
     tipo = Column(String, nullable=False)
-    data_transacao = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    data_transacao = Column(DateTime, default=_agora_utc)
     forma_pagamento = Column(String) # Será preenchido com o nome da conta/cartão
     documento_fiscal = Column(String, nullable=True)
+    id_externo = Column(String, nullable=True) # Identificador do banco (FITID do OFX), usado contra importações duplicadas
+    fingerprint = Column(String(40), nullable=True) # Hash do conteúdo para deduplicar importações (índice único parcial)
     
     id_usuario = Column(Integer, ForeignKey('usuarios.id'), nullable=False)
     id_conta = Column(Integer, ForeignKey('contas.id'), nullable=True) # Link para a conta/cartão usado
@@ -120,8 +131,49 @@ class Agendamento(Base):
     proxima_data_execucao = Column(Date, nullable=False, index=True)
     ativo = Column(Boolean, default=True, index=True)
     
-    criado_em = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    criado_em = Column(DateTime, default=_agora_utc)
 
     usuario = relationship("Usuario", back_populates="agendamentos")
     categoria = relationship("Categoria")
-    subcategoria = relationship("Subcategoria")
\ No newline at end of file
+    subcategoria = relationship("Subcategoria")
+
+class PerfilImportacaoCSV(Base):
+    """Mapeamento de colunas de um CSV de banco, identificado pela assinatura do cabeçalho."""
+    __tablename__ = 'perfis_importacao_csv'
+    __table_args__ = (UniqueConstraint('id_usuario', 'assinatura', name='uq_perfil_csv_usuario_assinatura'),)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    id_usuario = Column(Integer, ForeignKey('usuarios.id'), nullable=False)
+    assinatura = Column(String(64), nullable=False, index=True)
+    mapeamento = Column(JSON, nullable=False)
+    usos = Column(Integer, default=1)
+    atualizado_em = Column(DateTime, default=_agora_utc, onupdate=_agora_utc)
+
+    usuario = relationship("Usuario", back_populates="perfis_csv")
+
+class RelatorioMensal(Base):
+    """PDF do relatório de um mês fechado, pré-renderizado pelo job noturno ou no primeiro pedido."""
+    __tablename__ = 'relatorios_mensais'
+    __table_args__ = (UniqueConstraint('id_usuario', 'ano', 'mes', name='uq_relatorio_mensal_usuario_periodo'),)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    id_usuario = Column(Integer, ForeignKey('usuarios.id'), nullable=False)
+    ano = Column(Integer, nullable=False)
+    mes = Column(Integer, nullable=False)
+    # Resumo dos dados e do template usados; se mudar, o PDF guardado está desatualizado
+    assinatura = Column(String(40), nullable=False)
+    pdf = Column(LargeBinary, nullable=False)
+    telegram_file_id = Column(String, nullable=True)
+    gerado_em = Column(DateTime, default=_agora_utc)
+
+    usuario = relationship("Usuario", back_populates="relatorios_mensais")
+
+class RespostaIACache(Base):
+    """Resposta da IA para um prompt determinístico (OCR, fatura, extrato), endereçada pelo hash do pedido."""
+    __tablename__ = 'respostas_ia_cache'
+    # sha256 de tarefa + versão da tarefa + modelo + prompt completo
+    chave = Column(String(64), primary_key=True)
+    tarefa = Column(String(40), nullable=False)
+    modelo = Column(String, nullable=False)
+    resposta = Column(Text, nullable=False)
+    criado_em = Column(DateTime, default=_agora_utc, index=True)
+    ultimo_acesso = Column(DateTime, default=_agora_utc, index=True)
+    acessos = Column(Integer, default=0)
\ No newline at end of file
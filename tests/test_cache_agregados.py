@@ -0,0 +1,85 @@
+# tests/test_cache_agregados.py
+import asyncio
+from collections import OrderedDict
+
+import pytest
+
+from gerente_financeiro import cache_agregados
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    """Cache vazio, com relógio controlado pelo teste."""
+    monkeypatch.setattr(cache_agregados, '_entradas', OrderedDict())
+    monkeypatch.setattr(cache_agregados, '_chaves_por_usuario', {})
+    monkeypatch.setattr(cache_agregados, '_geracao', {})
+    monkeypatch.setattr(cache_agregados, '_total_bytes', 0)
+    monkeypatch.setattr(cache_agregados, '_contadores', dict.fromkeys(cache_agregados._contadores, 0))
+    relogio = Relogio()
+    monkeypatch.setattr(cache_agregados.time, 'monotonic', relogio)
+    return relogio
+
+
+def test_entrada_expira_depois_do_ttl(relogio):
+    cache_agregados.guardar(1, 'categoria', [('Mercado', 10.0)])
+    relogio.agora += cache_agregados.CACHE_TTL_SEGUNDOS - 1
+    assert cache_agregados.obter(1, 'categoria') == [('Mercado', 10.0)]
+    relogio.agora += 1
+    assert cache_agregados.obter(1, 'categoria') is None
+    assert cache_agregados._contadores['expiradas'] == 1
+    assert cache_agregados._total_bytes == 0
+
+
+def test_lru_descarta_a_menos_usada_recentemente(relogio, monkeypatch):
+    monkeypatch.setattr(cache_agregados, 'CACHE_MAX_ENTRADAS', 2)
+    cache_agregados.guardar(1, 'a', [1])
+    cache_agregados.guardar(1, 'b', [2])
+    cache_agregados.obter(1, 'a')            # 'a' passa a ser a mais recente
+    cache_agregados.guardar(2, 'c', [3])
+    assert cache_agregados.obter(1, 'b') is None
+    assert cache_agregados.obter(1, 'a') == [1]
+    assert cache_agregados.obter(2, 'c') == [3]
+    assert cache_agregados._contadores['evictions'] == 1
+
+
+def test_limite_de_bytes(relogio, monkeypatch):
+    pequeno, grande = [1], list(range(1000))
+    monkeypatch.setattr(cache_agregados, 'CACHE_MAX_BYTES', cache_agregados._estimar_tamanho(grande) + 10)
+    cache_agregados.guardar(1, 'pequeno', pequeno)
+    cache_agregados.guardar(1, 'grande', grande)
+    assert cache_agregados.obter(1, 'pequeno') is None
+    assert cache_agregados.obter(1, 'grande') == grande
+    assert cache_agregados._total_bytes == cache_agregados._estimar_tamanho(grande)
+
+
+def test_invalidar_atinge_so_o_usuario(relogio):
+    cache_agregados.guardar(1, 'a', [1])
+    cache_agregados.guardar(1, 'b', [2])
+    cache_agregados.guardar(2, 'a', [3])
+    cache_agregados.invalidar_usuario(1)
+    assert cache_agregados.obter(1, 'a') is None
+    assert cache_agregados.obter(1, 'b') is None
+    assert cache_agregados.obter(2, 'a') == [3]
+
+
+def test_calculo_invalidado_durante_a_consulta_nao_e_guardado(relogio):
+    async def calcular():
+        cache_agregados.invalidar_usuario(1)   # lançamento gravado enquanto a consulta rodava
+        return [42]
+
+    assert asyncio.run(cache_agregados.obter_ou_calcular(1, 'a', calcular)) == [42]
+    assert cache_agregados.obter(1, 'a') is None
+
+    async def calcular_de_novo():
+        return [43]
+
+    assert asyncio.run(cache_agregados.obter_ou_calcular(1, 'a', calcular_de_novo)) == [43]
+    assert cache_agregados.obter(1, 'a') == [43]
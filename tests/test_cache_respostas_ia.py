@@ -0,0 +1,100 @@
+# tests/test_cache_respostas_ia.py
+import asyncio
+from collections import OrderedDict
+
+import pytest
+
+import config
+from gerente_financeiro import cache_respostas_ia
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1_000_000.0
+
+    def __call__(self):
+        return self.agora
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    """Memória vazia, com relógio controlado pelo teste."""
+    monkeypatch.setattr(cache_respostas_ia, '_memoria', OrderedDict())
+    monkeypatch.setattr(cache_respostas_ia, '_contadores', dict.fromkeys(cache_respostas_ia._contadores, 0))
+    relogio = Relogio()
+    monkeypatch.setattr(cache_respostas_ia.time, 'time', relogio)
+    return relogio
+
+
+@pytest.fixture
+def servicos(monkeypatch):
+    """Banco e gateway falsos: registram as chamadas em vez de sair do processo."""
+    chamadas = {'banco': {}, 'gemini': []}
+
+    async def buscar(chave, validade):
+        return chamadas['banco'].get(chave)
+
+    async def salvar(chave, tarefa, modelo, resposta):
+        chamadas['banco'][chave] = resposta
+
+    async def gerar_texto(prompt, **kwargs):
+        chamadas['gemini'].append(prompt)
+        return chamadas.get('resposta', '{"transacoes": []}')
+
+    monkeypatch.setattr(cache_respostas_ia, 'buscar_resposta_ia_cache', buscar)
+    monkeypatch.setattr(cache_respostas_ia, 'salvar_resposta_ia_cache', salvar)
+    monkeypatch.setattr(cache_respostas_ia.gateway_ia, 'gerar_texto', gerar_texto)
+    return chamadas
+
+
+def test_chave_depende_de_tarefa_versao_modelo_e_prompt(monkeypatch):
+    chave = cache_respostas_ia.calcular_chave('ocr', 'modelo-a', 'prompt')
+    assert chave == cache_respostas_ia.calcular_chave('ocr', 'modelo-a', 'prompt')
+    assert chave != cache_respostas_ia.calcular_chave('fatura', 'modelo-a', 'prompt')
+    assert chave != cache_respostas_ia.calcular_chave('ocr', 'modelo-b', 'prompt')
+    assert chave != cache_respostas_ia.calcular_chave('ocr', 'modelo-a', 'prompt ')
+    monkeypatch.setitem(cache_respostas_ia.VERSOES_TAREFA, 'ocr', 2)
+    assert chave != cache_respostas_ia.calcular_chave('ocr', 'modelo-a', 'prompt')
+
+
+def test_memoria_expira_depois_do_ttl(relogio):
+    cache_respostas_ia._guardar_em_memoria('k', '{"a": 1}')
+    relogio.agora += config.IA_CACHE_TTL_HORAS * 3600
+    assert cache_respostas_ia._buscar_em_memoria('k') == '{"a": 1}'
+    relogio.agora += 1
+    assert cache_respostas_ia._buscar_em_memoria('k') is None
+    assert 'k' not in cache_respostas_ia._memoria
+
+
+def test_memoria_descarta_a_menos_usada_recentemente(relogio, monkeypatch):
+    monkeypatch.setattr(config, 'IA_CACHE_MAX_MEMORIA', 2)
+    cache_respostas_ia._guardar_em_memoria('a', '1')
+    cache_respostas_ia._guardar_em_memoria('b', '2')
+    cache_respostas_ia._buscar_em_memoria('a')
+    cache_respostas_ia._guardar_em_memoria('c', '3')
+    assert list(cache_respostas_ia._memoria) == ['a', 'c']
+
+
+def test_segunda_chamada_nao_vai_ao_gemini(relogio, servicos):
+    primeira = asyncio.run(cache_respostas_ia.gerar_texto_em_cache('ocr', 'cupom 123', modelo='m'))
+    segunda = asyncio.run(cache_respostas_ia.gerar_texto_em_cache('ocr', 'cupom 123', modelo='m'))
+    assert primeira == segunda
+    assert servicos['gemini'] == ['cupom 123']
+    assert cache_respostas_ia._contadores['hits_memoria'] == 1
+
+
+def test_resposta_do_banco_volta_para_a_memoria(relogio, servicos):
+    servicos['banco'][cache_respostas_ia.calcular_chave('fatura', 'm', 'fatura 9')] = '{"ok": true}'
+    assert asyncio.run(cache_respostas_ia.gerar_texto_em_cache('fatura', 'fatura 9', modelo='m')) == '{"ok": true}'
+    assert servicos['gemini'] == []
+    assert cache_respostas_ia._contadores['hits_banco'] == 1
+    assert len(cache_respostas_ia._memoria) == 1
+
+
+def test_resposta_sem_json_valido_nao_e_guardada(relogio, servicos):
+    servicos['resposta'] = 'Desculpe, não consegui ler o cupom.'
+    asyncio.run(cache_respostas_ia.gerar_texto_em_cache('ocr', 'cupom borrado', modelo='m'))
+    asyncio.run(cache_respostas_ia.gerar_texto_em_cache('ocr', 'cupom borrado', modelo='m'))
+    assert len(servicos['gemini']) == 2
+    assert servicos['banco'] == {}
+    assert cache_respostas_ia._contadores['descartadas'] == 2
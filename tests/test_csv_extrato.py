@@ -0,0 +1,78 @@
+# tests/test_csv_extrato.py
+import pytest
+
+from gerente_financeiro.csv_extrato import (
+    aplicar_mapeamento, assinatura_cabecalho, inferir_mapeamento, ler_csv
+)
+
+
+def _importar(conteudo: str, encoding: str = 'utf-8'):
+    cabecalho, linhas = ler_csv(conteudo.encode(encoding))
+    mapeamento = inferir_mapeamento(cabecalho, linhas)
+    return mapeamento, (aplicar_mapeamento(linhas, mapeamento) if mapeamento else None)
+
+
+def test_layout_iso_com_ponto_decimal():
+    mapeamento, transacoes = _importar(
+        "Data,Valor,Identificador,Descrição\n"
+        "2026-09-05,-45.90,a1b2,Mercado Extra\n"
+        "2026-09-06,3000.00,c3d4,Salário\n"
+    )
+    assert mapeamento == {
+        "versao": 1, "data": 0, "formato_data": '%Y-%m-%d', "valor": 1, "decimal": '.', "descricao": 3,
+    }
+    assert transacoes == [
+        {"data": "05/09/2026", "descricao": "Mercado Extra", "valor": 45.9, "tipo_transacao": "Saída"},
+        {"data": "06/09/2026", "descricao": "Salário", "valor": 3000.0, "tipo_transacao": "Entrada"},
+    ]
+
+
+def test_preambulo_virgula_decimal_e_coluna_de_saldo():
+    mapeamento, transacoes = _importar(
+        "Extrato Conta Corrente\n"
+        "Agência 1234;Conta 56789-0\n"
+        "Data;Lançamento;Valor (R$);Saldo (R$)\n"
+        "05/09/2026;PIX ENVIADO FULANO;-1.234,56;8.765,44\n"
+        "06/09/2026;SALARIO;5.000,00;13.765,44\n"
+        "06/09/2026;SALDO DO DIA;;13.765,44\n",
+        encoding='cp1252',
+    )
+    assert (mapeamento["valor"], mapeamento["decimal"], mapeamento["descricao"]) == (2, ',', 1)
+    assert transacoes == [
+        {"data": "05/09/2026", "descricao": "PIX ENVIADO FULANO", "valor": 1234.56, "tipo_transacao": "Saída"},
+        {"data": "06/09/2026", "descricao": "SALARIO", "valor": 5000.0, "tipo_transacao": "Entrada"},
+    ]
+
+
+def test_colunas_de_debito_e_credito():
+    mapeamento, transacoes = _importar(
+        "Data;Histórico;Débito;Crédito\n"
+        "05/09/2026;Conta de luz;150,00;\n"
+        "06/09/2026;Depósito;;300,00\n"
+    )
+    assert (mapeamento["debito"], mapeamento["credito"]) == (2, 3)
+    assert [(t["valor"], t["tipo_transacao"]) for t in transacoes] == [(150.0, "Saída"), (300.0, "Entrada")]
+
+
+def test_coluna_de_tipo_d_c():
+    mapeamento, transacoes = _importar(
+        "Data;Descrição;Valor;D/C\n"
+        "05/09/2026;Compra;50,00;D\n"
+        "06/09/2026;Estorno;20,00;C\n"
+    )
+    assert mapeamento["tipo"] == 3
+    assert [(t["valor"], t["tipo_transacao"]) for t in transacoes] == [(50.0, "Saída"), (20.0, "Entrada")]
+
+
+@pytest.mark.parametrize("conteudo", [
+    "Descrição;Valor\nMercado;10,00\nPadaria;5,00\n",        # sem coluna de data
+    "Data;Descrição;Observação\n05/09/2026;Mercado;ok\n",    # sem valor
+])
+def test_layout_nao_reconhecido(conteudo):
+    mapeamento, _ = _importar(conteudo)
+    assert mapeamento is None
+
+
+def test_assinatura_ignora_acentos_caixa_e_espacos():
+    assert assinatura_cabecalho(['Data', 'Descrição', 'Valor']) == assinatura_cabecalho(['DATA ', 'descricao', ' valor'])
+    assert assinatura_cabecalho(['Data', 'Descrição', 'Valor']) != assinatura_cabecalho(['Data', 'Valor', 'Descrição'])
@@ -0,0 +1,69 @@
+# tests/test_filtros_lancamento.py
+from datetime import datetime
+
+import pytest
+
+from gerente_financeiro.filtros_lancamento import interpretar_filtros
+
+HOJE = datetime(2026, 10, 17, 15, 30)
+CONTAS = [(1, 'Nubank'), (2, 'Itaú')]
+FIM = dict(hour=23, minute=59, second=59, microsecond=999999)
+
+CASOS = [
+    ("quanto gastei mês passado", {
+        'tipo': 'Saída', 'data_inicio': datetime(2026, 9, 1), 'data_fim': datetime(2026, 9, 30, **FIM),
+    }),
+    ("gastos dos últimos 15 dias", {'tipo': 'Saída', 'data_inicio': datetime(2026, 10, 3)}),
+    ("gastos em março", {
+        'tipo': 'Saída', 'data_inicio': datetime(2026, 3, 1), 'data_fim': datetime(2026, 3, 31, **FIM),
+    }),
+    ("gastos entre 10 e 20/05", {
+        'tipo': 'Saída', 'data_inicio': datetime(2026, 5, 10), 'data_fim': datetime(2026, 5, 20, **FIM),
+    }),
+    ("compras no Nubank", {'id_conta': 1, 'categoria_nome': 'Compras'}),
+    ("despesas acima de 100 reais", {'tipo': 'Saída', 'valor_minimo': 100.0}),
+    ("últimos 5 lançamentos", {'limit': 5}),
+    ("lancamentos no pix entre 50 e 200 reais", {
+        'forma_pagamento': 'Pix', 'valor_minimo': 50.0, 'valor_maximo': 200.0,
+    }),
+    ("quanto gastei com uber esse mês", {'tipo': 'Saída', 'data_inicio': datetime(2026, 10, 1), 'query': 'uber'}),
+    ("maior despesa de 2025", {
+        'tipo': 'Saída', 'data_inicio': datetime(2025, 1, 1), 'data_fim': datetime(2025, 12, 31, **FIM),
+    }),
+    # Preposições que sobravam dos trechos interpretados viravam termo de busca
+    ("quanto gastei em alimentação em setembro", {
+        'tipo': 'Saída', 'categoria_nome': 'Alimentação',
+        'data_inicio': datetime(2026, 9, 1), 'data_fim': datetime(2026, 9, 30, **FIM),
+    }),
+    ("quanto gastei em lazer no mês passado", {
+        'tipo': 'Saída', 'categoria_nome': 'Lazer',
+        'data_inicio': datetime(2026, 9, 1), 'data_fim': datetime(2026, 9, 30, **FIM),
+    }),
+    ("lançamentos de ontem no pix", {
+        'forma_pagamento': 'Pix', 'data_inicio': datetime(2026, 10, 16), 'data_fim': datetime(2026, 10, 16, **FIM),
+    }),
+    ("meus gastos de março no nubank", {
+        'tipo': 'Saída', 'id_conta': 1,
+        'data_inicio': datetime(2026, 3, 1), 'data_fim': datetime(2026, 3, 31, **FIM),
+    }),
+    ("gastos no mercado em março", {
+        'tipo': 'Saída', 'query': 'mercado',
+        'data_inicio': datetime(2026, 3, 1), 'data_fim': datetime(2026, 3, 31, **FIM),
+    }),
+]
+
+
+@pytest.mark.parametrize("pergunta, esperado", CASOS)
+def test_interpretar_filtros(pergunta, esperado):
+    assert interpretar_filtros(pergunta, contas=CONTAS, hoje=HOJE) == esperado
+
+
+@pytest.mark.parametrize("pergunta", [
+    "quanto gastei em alimentação em setembro",
+    "quanto gastei em lazer no mês passado",
+    "lançamentos de ontem no pix",
+    "meus gastos de março no nubank",
+    "quais os meus gastos de hoje",
+])
+def test_preposicao_solta_nao_vira_termo_de_busca(pergunta):
+    assert 'query' not in interpretar_filtros(pergunta, contas=CONTAS, hoje=HOJE)
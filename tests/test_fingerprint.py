@@ -0,0 +1,50 @@
+# tests/test_fingerprint.py
+from datetime import datetime
+from decimal import Decimal
+
+from database.database import atribuir_fingerprints, calcular_fingerprint
+
+
+def _linha(descricao='PADARIA CENTRAL', valor=Decimal('12.50'), data=datetime(2024, 3, 5, 10, 0),
+           id_conta=7, id_externo=None, id_usuario=1):
+    # Mesma ordem de COLUNAS_LANCAMENTO_LOTE
+    return (id_usuario, descricao, valor, 'Saída', data, 'Débito', id_conta, None, None, id_externo)
+
+
+def test_repeticoes_no_mesmo_arquivo_recebem_ocorrencias_distintas():
+    linhas = atribuir_fingerprints([_linha(), _linha(), _linha(descricao='MERCADO')])
+    fingerprints = [linha[-1] for linha in linhas]
+    assert len(set(fingerprints)) == 3
+    assert fingerprints[0] == calcular_fingerprint(1, 7, datetime(2024, 3, 5), Decimal('12.50'), 'PADARIA CENTRAL', 0)
+    assert fingerprints[1] == calcular_fingerprint(1, 7, datetime(2024, 3, 5), Decimal('12.50'), 'PADARIA CENTRAL', 1)
+
+
+def test_reimportar_o_mesmo_arquivo_gera_os_mesmos_fingerprints():
+    arquivo = [_linha(), _linha(), _linha(valor=Decimal('3.00'))]
+    assert atribuir_fingerprints(arquivo) == atribuir_fingerprints(list(arquivo))
+
+
+def test_fingerprint_ignora_hora_acentos_e_pontuacao():
+    base = calcular_fingerprint(1, 7, datetime(2024, 3, 5, 8, 0), Decimal('12.5'), 'Pão de Açúcar - Loja 12')
+    assert base == calcular_fingerprint(1, 7, datetime(2024, 3, 5, 23, 59), 12.50, '  PAO DE ACUCAR LOJA 12 ')
+
+
+def test_fingerprint_separa_usuario_conta_dia_e_valor():
+    base = calcular_fingerprint(1, 7, datetime(2024, 3, 5), Decimal('12.50'), 'PADARIA')
+    assert base != calcular_fingerprint(2, 7, datetime(2024, 3, 5), Decimal('12.50'), 'PADARIA')
+    assert base != calcular_fingerprint(1, 8, datetime(2024, 3, 5), Decimal('12.50'), 'PADARIA')
+    assert base != calcular_fingerprint(1, 7, datetime(2024, 3, 6), Decimal('12.50'), 'PADARIA')
+    assert base != calcular_fingerprint(1, 7, datetime(2024, 3, 5), Decimal('12.51'), 'PADARIA')
+
+
+def test_fitid_tem_precedencia_sobre_o_conteudo():
+    com_fitid = calcular_fingerprint(1, 7, datetime(2024, 3, 5), Decimal('12.50'), 'PADARIA', id_externo='ABC1')
+    assert com_fitid == calcular_fingerprint(1, 7, datetime(2024, 4, 1), Decimal('99.00'), 'OUTRA', 3, 'ABC1')
+    assert com_fitid != calcular_fingerprint(1, 7, datetime(2024, 3, 5), Decimal('12.50'), 'PADARIA', id_externo='ABC2')
+
+
+def test_linhas_iguais_com_fitids_diferentes_nao_contam_como_repeticao():
+    linhas = atribuir_fingerprints([_linha(id_externo='A'), _linha(id_externo='B')])
+    assert linhas[0][-1] == calcular_fingerprint(1, 7, datetime(2024, 3, 5), Decimal('12.50'), 'PADARIA', id_externo='A')
+    assert linhas[1][-1] == calcular_fingerprint(1, 7, datetime(2024, 3, 5), Decimal('12.50'), 'PADARIA', id_externo='B')
+    assert linhas[0][:-1] == _linha(id_externo='A')
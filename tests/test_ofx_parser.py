@@ -0,0 +1,74 @@
+# tests/test_ofx_parser.py
+from gerente_financeiro.ofx_parser import decodificar_ofx, extrair_transacoes_ofx
+
+CABECALHO_SGML = (
+    "OFXHEADER:100\r\nDATA:OFXSGML\r\nVERSION:102\r\nSECURITY:NONE\r\n"
+    "ENCODING:USASCII\r\nCHARSET:{charset}\r\nCOMPRESSION:NONE\r\n\r\n"
+)
+
+
+def _ofx_sgml(transacoes: str, charset: str = '1252') -> str:
+    return (
+        CABECALHO_SGML.format(charset=charset)
+        + "<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>"
+        + transacoes
+        + "</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>"
+    )
+
+
+def _stmttrn(fitid: str, data: str, valor: str, nome: str, memo: str = '') -> str:
+    # SGML: tags-folha sem fechamento
+    return (
+        f"<STMTTRN>\n<TRNTYPE>DEBIT\n<DTPOSTED>{data}[-3:BRT]\n<TRNAMT>{valor}\n"
+        f"<FITID>{fitid}\n<NAME>{nome}\n" + (f"<MEMO>{memo}\n" if memo else "") + "</STMTTRN>\n"
+    )
+
+
+def test_charset_sgml_numerico_vira_codepage():
+    arquivo = _ofx_sgml(_stmttrn('1', '20260905', '-10.00', 'Padaria São João')).encode('cp1252')
+    assert 'Padaria São João' in decodificar_ofx(arquivo)
+
+
+def test_encoding_declarado_no_xml():
+    arquivo = (
+        '<?xml version="1.0" encoding="UTF-8"?><?OFX OFXHEADER="200" VERSION="211"?>'
+        '<OFX><STMTTRN><TRNTYPE>CREDIT</TRNTYPE><DTPOSTED>20260901</DTPOSTED>'
+        '<TRNAMT>1500.00</TRNAMT><FITID>X1</FITID><NAME>Salário Ação</NAME></STMTTRN></OFX>'
+    ).encode('utf-8')
+    assert extrair_transacoes_ofx(arquivo) == [{
+        "data": "01/09/2026", "descricao": "Salário Ação", "valor": 1500.0,
+        "tipo_transacao": "Entrada", "fitid": "X1",
+    }]
+
+
+def test_charset_none_cai_para_latin1():
+    arquivo = _ofx_sgml(_stmttrn('1', '20260905', '-10.00', 'Açaí'), charset='NONE').encode('latin-1')
+    assert extrair_transacoes_ofx(arquivo)[0]["descricao"] == 'Açaí'
+
+
+def test_fitid_repetido_no_arquivo_e_descartado():
+    arquivo = _ofx_sgml(
+        _stmttrn('A1', '20260905', '-10.00', 'Mercado')
+        + _stmttrn('A1', '20260905', '-10.00', 'Mercado')
+        + _stmttrn('A2', '20260905', '-10.00', 'Mercado')
+    ).encode('cp1252')
+    assert [t["fitid"] for t in extrair_transacoes_ofx(arquivo)] == ['A1', 'A2']
+
+
+def test_sem_fitid_mantem_transacoes_identicas():
+    sem_fitid = "<STMTTRN>\n<DTPOSTED>20260905\n<TRNAMT>-4.50\n<NAME>Café\n</STMTTRN>\n"
+    transacoes = extrair_transacoes_ofx(_ofx_sgml(sem_fitid * 2).encode('cp1252'))
+    assert len(transacoes) == 2
+    assert all(t["fitid"] is None for t in transacoes)
+
+
+def test_campos_da_transacao():
+    arquivo = _ofx_sgml(
+        _stmttrn('B1', '20260912093000', '-1.234,56', 'PIX ENVIADO', 'Aluguel')
+        + _stmttrn('B2', '20260913', '0.00', 'Estorno zerado')
+        + _stmttrn('B3', '2026091', '-5.00', 'Data inválida')
+    ).encode('cp1252')
+    assert extrair_transacoes_ofx(arquivo) == [{
+        "data": "12/09/2026", "descricao": "PIX ENVIADO - Aluguel", "valor": 1234.56,
+        "tipo_transacao": "Saída", "fitid": "B1",
+    }]
@@ -0,0 +1,53 @@
+# tests/test_perguntas_rapidas.py
+from datetime import datetime
+
+import pytest
+
+from gerente_financeiro.perguntas_rapidas import classificar_pergunta
+
+HOJE = datetime(2026, 10, 17, 15, 30)
+CONTAS = [(1, 'Nubank'), (2, 'Itaú')]
+FIM = dict(hour=23, minute=59, second=59, microsecond=999999)
+SETEMBRO = {'data_inicio': datetime(2026, 9, 1), 'data_fim': datetime(2026, 9, 30, **FIM)}
+OUTUBRO = {'data_inicio': datetime(2026, 10, 1)}
+
+RESPONDIDAS_NO_BANCO = [
+    ("quanto gastei em alimentação em setembro", 'total', {'tipo': 'Saída', 'categoria_nome': 'Alimentação', **SETEMBRO}),
+    ("quanto gastei em lazer no mês passado", 'total', {'tipo': 'Saída', 'categoria_nome': 'Lazer', **SETEMBRO}),
+    ("quanto gastei com uber esse mês", 'total', {'tipo': 'Saída', 'query': 'uber', **OUTUBRO}),
+    ("quanto eu gastei hoje?", 'total', {'tipo': 'Saída', 'data_inicio': datetime(2026, 10, 17)}),
+    ("quanto recebi em setembro", 'total', {'tipo': 'Entrada', **SETEMBRO}),
+    ("quanto gastei no nubank", 'total', {'tipo': 'Saída', 'id_conta': 1, **OUTUBRO}),
+    ("lançamentos de ontem no pix", 'lista', {
+        'forma_pagamento': 'Pix', 'limit': 10,
+        'data_inicio': datetime(2026, 10, 16), 'data_fim': datetime(2026, 10, 16, **FIM),
+    }),
+    ("últimos 5 lançamentos", 'lista', {'limit': 5}),
+    ("últimos 5 gastos", 'lista', {'tipo': 'Saída', 'limit': 5}),
+    ("quais meus maiores gastos?", 'maiores_despesas', {'tipo': 'Saída', 'limit': 5}),
+    ("qual foi minha maior despesa do mês passado?", 'maior_despesa', {'tipo': 'Saída', **SETEMBRO}),
+    ("resumo do mês", 'resumo', OUTUBRO),
+    ("como estou este mês?", 'resumo', OUTUBRO),
+    ("quanto sobrou no mês passado", 'resumo', SETEMBRO),
+]
+
+ENVIADAS_PARA_IA = [
+    "meus gastos",                                  # lista ou total? ambíguo
+    "meus gastos de março no nubank",
+    "gastos no mercado em março",
+    "quanto gastei com comida no fim de semana",    # "fim de semana" não é entendido
+    "como posso economizar com transporte?",
+    "devo investir em CDB?",
+    "oi tudo bem",
+    "",
+]
+
+
+@pytest.mark.parametrize("pergunta, intencao, filtros", RESPONDIDAS_NO_BANCO)
+def test_pergunta_respondida_no_banco(pergunta, intencao, filtros):
+    assert classificar_pergunta(pergunta, contas=CONTAS, hoje=HOJE) == (intencao, filtros)
+
+
+@pytest.mark.parametrize("pergunta", ENVIADAS_PARA_IA)
+def test_pergunta_ambigua_vai_para_a_ia(pergunta):
+    assert classificar_pergunta(pergunta, contas=CONTAS, hoje=HOJE) is None
@@ -0,0 +1,47 @@
+# tests/test_periodos_relatorio.py
+from datetime import datetime
+
+import pytest
+
+from gerente_financeiro.services import (
+    _tendencias_por_categoria, descrever_periodo_relatorio, inicios_periodos_relatorio
+)
+
+
+@pytest.mark.parametrize("inicio, fim, esperado", [
+    # Mês: recua mês a mês, mesmo que o anterior seja mais curto
+    (datetime(2026, 3, 1), datetime(2026, 4, 1),
+     [datetime(2026, 3, 1), datetime(2026, 2, 1), datetime(2026, 1, 1), datetime(2025, 12, 1)]),
+    # Ano: compara com os anos anteriores inteiros
+    (datetime(2026, 1, 1), datetime(2027, 1, 1),
+     [datetime(2026, 1, 1), datetime(2025, 1, 1), datetime(2024, 1, 1), datetime(2023, 1, 1)]),
+    # Intervalo livre: recua o mesmo número de dias
+    (datetime(2026, 9, 10), datetime(2026, 9, 25),
+     [datetime(2026, 9, 10), datetime(2026, 8, 26), datetime(2026, 8, 11), datetime(2026, 7, 27)]),
+])
+def test_inicios_periodos_relatorio(inicio, fim, esperado):
+    assert inicios_periodos_relatorio(inicio, fim) == esperado
+
+
+@pytest.mark.parametrize("inicio, fim, unidade, plural, dias", [
+    (datetime(2026, 2, 1), datetime(2026, 3, 1), 'mês', 'meses', 28),
+    (datetime(2026, 1, 1), datetime(2027, 1, 1), 'ano', 'anos', 365),
+    (datetime(2026, 9, 10), datetime(2026, 9, 25), 'período', 'períodos', 15),
+    # Trimestre fechado não é mês nem ano
+    (datetime(2026, 1, 1), datetime(2026, 4, 1), 'período', 'períodos', 90),
+])
+def test_descrever_periodo_relatorio(inicio, fim, unidade, plural, dias):
+    descricao = descrever_periodo_relatorio(inicio, fim)
+    assert (descricao['unidade_periodo'], descricao['unidade_periodo_plural'], descricao['dias_periodo']) == (unidade, plural, dias)
+
+
+def test_tendencias_por_categoria():
+    tendencias = _tendencias_por_categoria({
+        'Mercado': {0: 150.0, 1: 100.0, 2: 200.0},
+        'Lazer': {0: 50.0, 2: 30.0},      # sem gasto no período anterior
+        'Viagem': {1: 900.0},             # sem gasto no período do relatório
+    })
+    assert tendencias == {
+        'Mercado': {'periodo_anterior': 100.0, 'variacao_percent': 50.0, 'media_anteriores': 100.0},
+        'Lazer': {'periodo_anterior': 0.0, 'variacao_percent': None, 'media_anteriores': 10.0},
+    }